@@ -1,12 +1,13 @@
 import dataclasses
 import functools
+import itertools
 import logging
 import os
 import stat
 import time
 from concurrent.futures import Future
 from pathlib import Path
-from typing import List, Optional, Dict, Set, ContextManager, Iterable
+from typing import List, Optional, Dict, Set, ContextManager, Iterable, Callable, NamedTuple, TypeVar
 from typing import Tuple
 
 from typing_extensions import override
@@ -19,8 +20,10 @@ from prime_backup.action.helpers.blob_pre_calc_result import BlobPrecalculateRes
 from prime_backup.action.helpers.blob_recorder import BlobRecorder
 from prime_backup.action.helpers.create_backup_utils import CreateBackupTimeCostKey, SourceFileNotFoundWrapper
 from prime_backup.action.helpers.pack_writer import PackWriter
+from prime_backup.action.helpers.source_snapshot import SourceSnapshot
 from prime_backup.db import schema
 from prime_backup.db.access import DbAccess
+from prime_backup.db.rows import FileRow
 from prime_backup.db.session import DbSession
 from prime_backup.db.values import FileRole, BlobStorageMethod
 from prime_backup.exceptions import UnsupportedFileFormat
@@ -31,10 +34,11 @@ from prime_backup.types.chunk_method import ChunkMethod
 from prime_backup.types.chunker import PrettyChunk
 from prime_backup.types.operator import Operator
 from prime_backup.types.units import ByteCount
-from prime_backup.utils import sqlalchemy_utils
 from prime_backup.utils.thread_pool import FailFastBlockingThreadPool
 from prime_backup.utils.time_cost_stats import TimeCostStats
 
+_T = TypeVar('_T')
+
 
 @dataclasses.dataclass(frozen=True)
 class _ScanResultEntry:
@@ -61,18 +65,44 @@ class _ScanResult:
 		return sum(entry.stat.st_size for entry in self.all_files if entry.is_file())
 
 
+class _StatCacheKey(NamedTuple):
+	size: int
+	mtime_ns: int
+	ctime_ns: int
+	inode: int
+
+	@classmethod
+	def of(cls, st: os.stat_result) -> '_StatCacheKey':
+		inode = st.st_ino
+		if inode >= 2 ** 63:  # stored as int64 in the db
+			inode -= 2 ** 64
+		return cls(st.st_size, st.st_mtime_ns, st.st_ctime_ns, inode)
+
+
 @dataclasses.dataclass(frozen=True)
 class _PreCalculationResult:
 	stats: Dict[Path, os.stat_result] = dataclasses.field(default_factory=dict)  # real-world path
 	hashes_and_chunks: Dict[Path, BlobPrecalculateResult] = dataclasses.field(default_factory=dict)  # real-world path
-	stat_unchanged_files: Dict[Path, schema.File] = dataclasses.field(default_factory=dict)  # real-world path -> unchanged File in old backup
-	reused_files: Dict[Path, schema.File] = dataclasses.field(default_factory=dict)  # real-world path
-	previous_backup_files: Dict[str, schema.File] = dataclasses.field(default_factory=dict)  # db path, relative to source_path
+	stat_unchanged_files: Dict[Path, FileRow] = dataclasses.field(default_factory=dict)  # real-world path -> unchanged File in old backup
+	reused_files: Dict[Path, FileRow] = dataclasses.field(default_factory=dict)  # real-world path
+	previous_backup_files: Dict[str, FileRow] = dataclasses.field(default_factory=dict)  # db path, relative to source_path
 	previous_file_chunks: Dict[Path, List[PrettyChunk]] = dataclasses.field(default_factory=dict)  # real-world path
+	stat_cache_keys: Dict[str, _StatCacheKey] = dataclasses.field(default_factory=dict)  # db path, relative to source_path
+	stat_cached_blobs: Dict[Path, schema.Blob] = dataclasses.field(default_factory=dict)  # real-world path
 
 
 class CreateBackupAction(Action[BackupInfo]):
-	def __init__(self, creator: Operator, comment: str, *, tags: Optional[BackupTags] = None, source_path: Optional[Path] = None):
+	def __init__(
+			self, creator: Operator, comment: str, *,
+			tags: Optional[BackupTags] = None, source_path: Optional[Path] = None,
+			snapshot_done_callback: Optional[Callable[[], None]] = None,
+	):
+		"""
+		:param snapshot_done_callback: If provided, the scanned source files that need to be read will be copied into a snapshot
+			in the temp directory first, and the backup will be created from the snapshot. Files with known content, i.e. reused
+			stat-unchanged files and stat cache hits, are not copied. The callback is invoked right after the snapshot is created,
+			i.e. the source files are no longer needed since then
+		"""
 		super().__init__()
 		if tags is None:
 			tags = BackupTags()
@@ -83,6 +113,8 @@ class CreateBackupAction(Action[BackupInfo]):
 
 		self.__run_called = False
 		self.__source_path: Path = source_path or self.config.source_path
+		self.__snapshot_done_callback = snapshot_done_callback
+		self.__source_snapshot: Optional[SourceSnapshot] = None
 		self.__time_costs: TimeCostStats[CreateBackupTimeCostKey] = TimeCostStats()
 		self.__pre_calc_result = _PreCalculationResult()
 		self.__new_blob_storage_delta = BlobDeltaSummary.zero()
@@ -172,7 +204,7 @@ class CreateBackupAction(Action[BackupInfo]):
 			return
 
 		with self.__time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_db):
-			for file in session.get_backup_files(backup):
+			for file in session.get_backup_file_rows(backup):
 				previous_backup_files[file.path] = file
 
 	def __collect_stat_unchanged_files(self, scan_result: _ScanResult):
@@ -218,6 +250,75 @@ class CreateBackupAction(Action[BackupInfo]):
 				return True
 		return False
 
+	def __collect_stat_cache_keys(self, scan_result: _ScanResult):
+		stat_cache_keys = self.__pre_calc_result.stat_cache_keys
+		stat_cache_keys.clear()
+		mutating_patterns_spec = self.config.backup.mutating_file_patterns_spec
+		for file_entry in scan_result.all_files:
+			if not file_entry.is_file():
+				continue
+			rel_path = file_entry.path.relative_to(self.__source_path)
+			if mutating_patterns_spec.match_file(rel_path):
+				continue
+
+			stat_cache_keys[rel_path.as_posix()] = _StatCacheKey.of(file_entry.stat)
+
+	def __lookup_stat_cache(self, session: DbSession, scan_result: _ScanResult):
+		stat_cache_keys = self.__pre_calc_result.stat_cache_keys
+		stat_cached_blobs = self.__pre_calc_result.stat_cached_blobs
+		stat_cached_blobs.clear()
+
+		candidates: Dict[str, Path] = {}  # db path -> real-world path
+		for file_entry in scan_result.all_files:
+			db_path = self.__file_path_to_db_path(file_entry.path)
+			if db_path in stat_cache_keys and file_entry.path not in self.__pre_calc_result.reused_files:
+				candidates[db_path] = file_entry.path
+		if len(candidates) == 0:
+			return
+
+		with self.__time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_db):
+			caches = session.get_file_stat_caches_by_paths(list(candidates.keys()))
+		matched_hashes: Dict[Path, str] = {}  # real-world path -> blob hash
+		for db_path, fscs in caches.items():
+			key = stat_cache_keys[db_path]
+			for fsc in fscs:
+				if _StatCacheKey(fsc.size, fsc.mtime_ns, fsc.ctime_ns, fsc.inode) == key:
+					matched_hashes[candidates[db_path]] = fsc.blob_hash
+					break
+		if len(matched_hashes) == 0:
+			return
+
+		with self.__time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_db):
+			blobs = session.get_blobs_by_hashes_opt(list(set(matched_hashes.values())))
+		for path, blob_hash in matched_hashes.items():
+			# the blob might have been deleted with its backups, then the file needs to be read again
+			if (blob := blobs[blob_hash]) is not None and blob.raw_size == self.__pre_calc_result.stats[path].st_size:
+				stat_cached_blobs[path] = blob
+
+	def __update_stat_cache(self, session: DbSession, files: List[schema.File]):
+		stat_cache_keys = self.__pre_calc_result.stat_cache_keys
+		# files with known content, i.e. stat cache hits and reused files, have their caches stored already
+		known_paths: Set[str] = {
+			self.__file_path_to_db_path(path)
+			for path in itertools.chain(self.__pre_calc_result.stat_cached_blobs.keys(), self.__pre_calc_result.reused_files.keys())
+		}
+		rows: List[DbSession.CreateFileStatCacheKwargs] = []
+		for file in files:
+			if file.path in known_paths:
+				continue
+			if file.blob_hash is not None and (key := stat_cache_keys.get(file.path)) is not None and file.blob_raw_size == key.size:
+				rows.append(DbSession.CreateFileStatCacheKwargs(
+					path=file.path,
+					size=key.size,
+					mtime_ns=key.mtime_ns,
+					ctime_ns=key.ctime_ns,
+					inode=key.inode,
+					blob_hash=file.blob_hash,
+				))
+
+		with self.__time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_db):
+			session.replace_file_stat_caches(rows)
+
 	def __cache_previous_chunks_for_fixed_auto(self, session: DbSession, scan_result: _ScanResult):
 		previous_file_chunks = self.__pre_calc_result.previous_file_chunks
 		previous_file_chunks.clear()
@@ -229,7 +330,7 @@ class CreateBackupAction(Action[BackupInfo]):
 
 		wanted_file_blobs: List[Tuple[Path, int]] = []  # list of (file path, blob id)
 		for file_entry in scan_result.all_files:
-			if not file_entry.is_file() or file_entry.path in self.__pre_calc_result.reused_files:
+			if not file_entry.is_file() or file_entry.path in self.__pre_calc_result.reused_files or file_entry.path in self.__pre_calc_result.stat_cached_blobs:
 				continue
 
 			rel_path = file_entry.path.relative_to(self.__source_path)
@@ -282,6 +383,7 @@ class CreateBackupAction(Action[BackupInfo]):
 			for file_entry in scan_result.all_files
 			if file_entry.is_file()
 			and file_entry.path not in self.__pre_calc_result.reused_files
+			and file_entry.path not in self.__pre_calc_result.stat_cached_blobs
 			and not mutating_patterns_spec.match_file(file_entry.path.relative_to(self.__source_path))
 		]
 
@@ -312,6 +414,49 @@ class CreateBackupAction(Action[BackupInfo]):
 					if result is not None:
 						hashes_and_chunks[path] = result
 
+	def __snapshot_source_files(self, scan_result: _ScanResult) -> _ScanResult:
+		pre_calc_result = self.__pre_calc_result
+
+		def needs_read(entry: _ScanResultEntry) -> bool:
+			return not entry.is_file() or (entry.path not in pre_calc_result.reused_files and entry.path not in pre_calc_result.stat_cached_blobs)
+
+		snapshot = SourceSnapshot(self.__source_path, self.__temp_path, self.__time_costs)
+		self.__source_snapshot = snapshot
+		snapshot_entries = snapshot.create([(file_entry.path, file_entry.stat) for file_entry in scan_result.all_files if needs_read(file_entry)])
+		snapshot_stats: Dict[Path, os.stat_result] = {entry.path: entry.stat for entry in snapshot_entries}
+
+		# from now on, the snapshot is the source. Files with known content keep their original stats, they will not be read
+		path_mapping: Dict[Path, Path] = {}  # real-world path -> snapshot path
+		all_files: List[_ScanResultEntry] = []
+		for file_entry in scan_result.all_files:
+			rel_path = file_entry.path.relative_to(self.__source_path)
+			new_path = snapshot.path / rel_path
+			if not needs_read(file_entry):
+				all_files.append(_ScanResultEntry(new_path, file_entry.stat))
+			elif (new_st := snapshot_stats.get(new_path)) is not None:
+				all_files.append(_ScanResultEntry(new_path, new_st))
+				if file_entry.is_file() and (file_entry.stat.st_size, file_entry.stat.st_mtime_ns) != (new_st.st_size, new_st.st_mtime_ns):
+					# the source file was changed before it's copied, so the stat cache key of it is no longer valid
+					pre_calc_result.stat_cache_keys.pop(rel_path.as_posix(), None)
+			else:
+				continue  # missing file, skipped by config
+			path_mapping[file_entry.path] = new_path
+
+		def remap(d: Dict[Path, _T]):
+			items = list(d.items())
+			d.clear()
+			d.update((path_mapping[path], value) for path, value in items if path in path_mapping)
+
+		pre_calc_result.stats.clear()
+		pre_calc_result.stats.update((entry.path, entry.stat) for entry in all_files)
+		remap(pre_calc_result.stat_unchanged_files)
+		remap(pre_calc_result.reused_files)
+		remap(pre_calc_result.stat_cached_blobs)
+
+		self.logger.info('Created source snapshot with {} / {} files at {!r}'.format(len(snapshot_entries), len(scan_result.all_files), snapshot.path.as_posix()))
+		self.__source_path = snapshot.path
+		return _ScanResult(all_files=all_files, root_targets=scan_result.root_targets)
+
 	@functools.cached_property
 	def __temp_path(self) -> Path:
 		p = self.config.temp_path
@@ -322,20 +467,20 @@ class CreateBackupAction(Action[BackupInfo]):
 		if (reused_file := self.__pre_calc_result.reused_files.get(path)) is not None:
 			# make a copy
 			return session.create_file(
-				path=sqlalchemy_utils.mapped_cast(reused_file.path),
+				path=reused_file.path,
 				role=FileRole.unknown.value,
-				mode=sqlalchemy_utils.mapped_cast(reused_file.mode),
-				content=sqlalchemy_utils.mapped_cast(reused_file.content),
-				blob_id=sqlalchemy_utils.mapped_cast(reused_file.blob_id),
-				blob_storage_method=sqlalchemy_utils.mapped_cast(reused_file.blob_storage_method),
-				blob_hash=sqlalchemy_utils.mapped_cast(reused_file.blob_hash),
-				blob_compress=sqlalchemy_utils.mapped_cast(reused_file.blob_compress),
-				blob_raw_size=sqlalchemy_utils.mapped_cast(reused_file.blob_raw_size),
-				blob_stored_size=sqlalchemy_utils.mapped_cast(reused_file.blob_stored_size),
-				uid=sqlalchemy_utils.mapped_cast(reused_file.uid),
-				gid=sqlalchemy_utils.mapped_cast(reused_file.gid),
-				mtime=sqlalchemy_utils.mapped_cast(reused_file.mtime),
-				mtime_ns_part=sqlalchemy_utils.mapped_cast(reused_file.mtime_ns_part),
+				mode=reused_file.mode,
+				content=reused_file.content,
+				blob_id=reused_file.blob_id,
+				blob_storage_method=reused_file.blob_storage_method,
+				blob_hash=reused_file.blob_hash,
+				blob_compress=reused_file.blob_compress,
+				blob_raw_size=reused_file.blob_raw_size,
+				blob_stored_size=reused_file.blob_stored_size,
+				uid=reused_file.uid,
+				gid=reused_file.gid,
+				mtime=reused_file.mtime,
+				mtime_ns_part=reused_file.mtime_ns_part,
 			)
 
 		if (st := self.__pre_calc_result.stats.pop(path, None)) is None:
@@ -345,9 +490,15 @@ class CreateBackupAction(Action[BackupInfo]):
 		blob: Optional[schema.Blob] = None
 		content: Optional[bytes] = None
 		if stat.S_ISREG(st.st_mode):
-			goc_result = yield from blob_allocator.get_or_create_blob(path, st)
-			blob = goc_result.blob
-			st = goc_result.st
+			if (cached_blob := self.__pre_calc_result.stat_cached_blobs.get(path)) is not None:
+				blob = cached_blob
+			else:
+				goc_result = yield from blob_allocator.get_or_create_blob(path, st)
+				blob = goc_result.blob
+				if _StatCacheKey.of(goc_result.st) != _StatCacheKey.of(st):
+					# the file was changed during the backup, its stat cannot tell the content
+					self.__pre_calc_result.stat_cache_keys.pop(self.__file_path_to_db_path(path), None)
+				st = goc_result.st
 			# notes: st.st_size might be incorrect, use blob.raw_size instead if needed
 		elif stat.S_ISDIR(st.st_mode):
 			pass
@@ -398,16 +549,6 @@ class CreateBackupAction(Action[BackupInfo]):
 			def is_stat_unchanged_file(self, src_path: Path) -> bool:  # real-world path
 				return src_path in pre_calc_result.stat_unchanged_files
 
-		blob_allocator = BlobAllocator(
-			session=session,
-			time_costs=self.__time_costs,
-			blob_recorder=blob_recorder,
-			source_path=self.__source_path,
-			temp_path=self.__temp_path,
-			file_lookup=FileLookup(),
-			pack_writer=pack_writer,
-		)
-
 		self.logger.info('Scanning file for backup creation at path {!r}, targets: {}'.format(
 			self.__source_path.as_posix(), self.config.backup.targets,
 		))
@@ -440,6 +581,26 @@ class CreateBackupAction(Action[BackupInfo]):
 			self.logger.info('Reused {} / {} stat unchanged files'.format(len(self.__pre_calc_result.reused_files), len(scan_result.all_files)))
 		else:
 			self.logger.debug('Found {} / {} stat unchanged files'.format(len(self.__pre_calc_result.stat_unchanged_files), len(scan_result.all_files)))
+		if self.config.backup.stat_cache_enabled:
+			with self.__time_costs.measure_time_cost(CreateBackupTimeCostKey.stage_reuse_unchanged_files):
+				self.__collect_stat_cache_keys(scan_result)
+				self.__lookup_stat_cache(session, scan_result)
+			self.logger.info('Found {} / {} files with known content in the stat cache'.format(len(self.__pre_calc_result.stat_cached_blobs), len(scan_result.all_files)))
+		if self.__snapshot_done_callback is not None:
+			with self.__time_costs.measure_time_cost(CreateBackupTimeCostKey.stage_snapshot_source):
+				scan_result = self.__snapshot_source_files(scan_result)
+			self.__snapshot_done_callback()
+
+		blob_allocator = BlobAllocator(
+			session=session,
+			time_costs=self.__time_costs,
+			blob_recorder=blob_recorder,
+			source_path=self.__source_path,
+			temp_path=self.__temp_path,
+			file_lookup=FileLookup(),
+			pack_writer=pack_writer,
+		)
+
 		self.__cache_previous_chunks_for_fixed_auto(session, scan_result)
 		if self.config.get_effective_concurrency() > 1:
 			with self.__time_costs.measure_time_cost(CreateBackupTimeCostKey.stage_pre_calculate_hash):
@@ -453,9 +614,17 @@ class CreateBackupAction(Action[BackupInfo]):
 				self.__create_file(session, blob_allocator, file_entry.path)
 				for file_entry in scan_result.all_files
 			], scan_result.all_file_size_sum)
+		if self.config.backup.adaptive_compress_enabled:
+			probe_stats = blob_allocator.get_compress_probe_stats()
+			self.logger.info('Adaptive compression: {} / {} ({:.1f}%) probed blobs and chunks are incompressible, stored {} uncompressed'.format(
+				probe_stats.incompressible_count, probe_stats.probe_count, 100.0 * probe_stats.get_hit_rate(),
+				ByteCount(probe_stats.incompressible_raw_size).auto_str(),
+			))
 
 		with self.__time_costs.measure_time_cost(CreateBackupTimeCostKey.stage_finalize):
 			BackupFinalizer(session).finalize_files_and_backup(backup, files)
+			if self.config.backup.stat_cache_enabled:
+				self.__update_stat_cache(session, files)
 			pack_writer.close()
 			info = BackupInfo.of(backup)
 
@@ -485,6 +654,9 @@ class CreateBackupAction(Action[BackupInfo]):
 			if blob_recorder is not None:
 				blob_recorder.apply_file_rollback()
 			raise e
+		finally:
+			if self.__source_snapshot is not None:
+				self.__source_snapshot.remove()
 
 		bds = blob_recorder.get_blob_storage_delta()
 		self.logger.info('Create backup #{} done, added {} blobs, {} chunks and {} packs (size {} / {})'.format(
@@ -1,18 +1,17 @@
 import dataclasses
-from typing import List, Set
+from typing import List, Collection
 
 from typing_extensions import override
 
 from prime_backup.action import Action
 from prime_backup.action.delete_blob_action import DeleteOrphanBlobsAction
-from prime_backup.action.shrink_base_fileset_action import ShrinkBaseFilesetAction
-from prime_backup.db import schema
+from prime_backup.action.shrink_base_fileset_action import ShrinkBaseFilesetsAction
 from prime_backup.db.access import DbAccess
-from prime_backup.exceptions import FilesetNotFound
+from prime_backup.exceptions import BackupNotFound
 from prime_backup.types.backup_info import BackupInfo
 from prime_backup.types.blob_info import BlobDeltaSummary
 from prime_backup.types.units import ByteCount
-from prime_backup.utils import misc_utils
+from prime_backup.utils import misc_utils, collection_utils
 
 
 @dataclasses.dataclass(frozen=True)
@@ -21,49 +20,78 @@ class DeleteBackupResult:
 	delta: BlobDeltaSummary
 
 
-class DeleteBackupAction(Action[DeleteBackupResult]):
-	def __init__(self, backup_id: int):
+@dataclasses.dataclass(frozen=True)
+class DeleteBackupsResult:
+	backups: List[BackupInfo]
+	missing_backup_ids: List[int]
+	delta: BlobDeltaSummary
+
+
+class DeleteBackupsAction(Action[DeleteBackupsResult]):
+	"""
+	Deletes multiple backups in one transaction, with bulk deletes of their orphan filesets and files,
+	and a single orphan blob / chunk group / chunk / pack cleanup pass at the end
+	"""
+
+	def __init__(self, backup_ids: Collection[int], *, raise_if_not_found: bool = False):
 		super().__init__()
-		self.backup_id = misc_utils.ensure_type(backup_id, int)
+		self.backup_ids = collection_utils.deduplicated_list(backup_ids)
+		self.raise_if_not_found = raise_if_not_found
 
 	@override
-	def run(self) -> DeleteBackupResult:
-		self.logger.info('Deleting backup #{}'.format(self.backup_id))
-		base_fileset_alive = True
+	def run(self) -> DeleteBackupsResult:
+		self.logger.info('Deleting {} backups: {}'.format(len(self.backup_ids), self.backup_ids))
 		with DbAccess.open_session() as session:
-			backup = session.get_backup(self.backup_id)
-			backup_info = BackupInfo.of(backup)
-			filesets_to_check: List[schema.Fileset] = list(session.get_filesets([backup.fileset_id_base, backup.fileset_id_delta]).values())
-			session.delete_backup(backup)
-
-			# delete fileset
-			deleted_file_hashes: Set[str] = set()
-			for fileset in filesets_to_check:
-				ref_cnt = session.get_fileset_associated_backup_count(fileset.id)
-				self.logger.info('Pruning fileset {}, ref_cnt={}{}'.format(fileset.id, ref_cnt, ', delete it' if ref_cnt <= 0 else ''))
-				if ref_cnt <= 0:
-					if fileset.id == backup_info.fileset_id_base:
-						base_fileset_alive = False
-					for file in session.get_fileset_files(fileset.id):
-						if file.blob_hash is not None:
-							deleted_file_hashes.add(file.blob_hash)
-						session.delete_file(file)
-					session.delete_fileset(fileset)
+			backups: List[BackupInfo] = []
+			missing_backup_ids: List[int] = []
+			for backup_id, backup in session.get_backups_opt(self.backup_ids).items():
+				if backup is not None:
+					backups.append(BackupInfo.of(backup))
+				elif self.raise_if_not_found:
+					raise BackupNotFound(backup_id)
+				else:
+					self.logger.warning('Backup #{} does not exist'.format(backup_id))
+					missing_backup_ids.append(backup_id)
+
+			fileset_ids = collection_utils.deduplicated_list(
+				fileset_id
+				for backup in backups
+				for fileset_id in [backup.fileset_id_base, backup.fileset_id_delta]
+			)
+			session.delete_backups_by_ids([backup.id for backup in backups])
+
+			orphan_fileset_ids = session.filtered_orphan_fileset_ids(fileset_ids)
+			self.logger.info('Pruning filesets, {} / {} of them are no longer referenced, delete them: {}'.format(len(orphan_fileset_ids), len(fileset_ids), orphan_fileset_ids))
+			deleted_file_hashes = session.get_blob_hashes_by_fileset_ids(orphan_fileset_ids)
+			session.delete_files_by_fileset_ids(orphan_fileset_ids)
+			session.delete_filesets_by_ids(orphan_fileset_ids)
 
 			orphan_blob_cleaner = DeleteOrphanBlobsAction(deleted_file_hashes)
 			bds = orphan_blob_cleaner.run(session=session)
 
-		if base_fileset_alive:
-			self.logger.debug('Shrinking base fileset {} since it''s still alive'.format(backup_info.fileset_id_base))
-			sbf_action = ShrinkBaseFilesetAction(backup_info.fileset_id_base)
-			try:
-				sbf_result = sbf_action.run()
-				bds += sbf_result.blob_summary
-			except FilesetNotFound as e:
-				self.logger.warning('Base fileset {} not found during shrink (concurrent deletion?), skipped: {}'.format(backup_info.fileset_id_base, e))
-
-		self.logger.info('Deleted backup #{} done, removed {} blobs, {} chunks and changed {} packs (freed disk {} / raw {})'.format(
-			backup_info.id, bds.blob_count, bds.chunk_count,
+		orphan_fileset_ids_set = set(orphan_fileset_ids)
+		alive_base_fileset_ids = collection_utils.deduplicated_list(
+			backup.fileset_id_base
+			for backup in backups
+			if backup.fileset_id_base not in orphan_fileset_ids_set
+		)
+		if len(alive_base_fileset_ids) > 0:
+			# base filesets might be deleted concurrently, skip them
+			bds += ShrinkBaseFilesetsAction(alive_base_fileset_ids, skip_bad_fileset=True).run().blob_summary
+
+		self.logger.info('Deleted {} backups done, removed {} blobs, {} chunks and changed {} packs (freed disk {} / raw {})'.format(
+			len(backups), bds.blob_count, bds.chunk_count,
 			bds.packs.changed_pack_count, ByteCount(bds.freed_disk_size).auto_str(), ByteCount(bds.raw_size).auto_str(),
 		))
-		return DeleteBackupResult(backup_info, bds)
+		return DeleteBackupsResult(backups, missing_backup_ids, bds)
+
+
+class DeleteBackupAction(Action[DeleteBackupResult]):
+	def __init__(self, backup_id: int):
+		super().__init__()
+		self.backup_id = misc_utils.ensure_type(backup_id, int)
+
+	@override
+	def run(self) -> DeleteBackupResult:
+		result = DeleteBackupsAction([self.backup_id], raise_if_not_found=True).run()
+		return DeleteBackupResult(result.backups[0], result.delta)
@@ -65,7 +65,7 @@ class DeleteBlobsAction(Action[BlobDeltaSummary]):
 			if len(all_to_delete_blobs) > 0:
 				# 1. delete Blob-ChunkGroup bindings
 				# 2. delete blobs
-				# 3. check orphan chunk groups
+				# 3. check orphan chunk groups, and orphan chunks of packed blobs
 				affected_chunk_group_ids: Dict[int, None] = {}  # ordered set
 				chunked_blob_ids: List[int] = [
 					blob.id for blob in all_to_delete_blobs.values()
@@ -76,10 +76,18 @@ class DeleteBlobsAction(Action[BlobDeltaSummary]):
 					for bcg in bindings:
 						affected_chunk_group_ids[bcg.chunk_group_id] = None
 					session.delete_blob_chunk_group_bindings_for_blobs(chunked_blob_ids)
+				packed_blob_hashes: List[str] = [
+					blob.hash for blob in all_to_delete_blobs.values()
+					if blob.storage_method == BlobStorageMethod.packed
+				]
+				packed_blob_chunk_ids: List[int] = []
+				if len(packed_blob_hashes) > 0:
+					packed_blob_chunk_ids = [chunk.id for chunk in session.get_chunks_by_hashes_opt(packed_blob_hashes).values() if chunk is not None]
 
+				session.delete_file_stat_caches_by_blob_hashes([blob.hash for blob in all_to_delete_blobs.values()])
 				session.delete_blobs_by_ids(list(all_to_delete_blobs.keys()))
-				if len(affected_chunk_group_ids) > 0:
-					action = DeleteOrphanChunkGroupsAction(ids=affected_chunk_group_ids.keys())
+				if len(affected_chunk_group_ids) > 0 or len(packed_blob_chunk_ids) > 0:
+					action = DeleteOrphanChunkGroupsAction(ids=affected_chunk_group_ids.keys(), extra_chunk_ids_to_check=packed_blob_chunk_ids)
 					chunk_group_summary = action.run(session=session)
 				else:
 					session.commit()
@@ -147,7 +155,11 @@ class DeleteOrphanBlobsAction(Action[BlobDeltaSummary]):
 			if session is None:
 				session = es.enter_context(DbAccess.open_session())
 
-			orphan_blob_hashes = session.filtered_orphan_blob_hashes(self.blob_hashes_to_check)
+			# the reference counts narrow down the candidates, and the ground truth check makes sure nothing alive gets deleted
+			unreferenced_blob_hashes = session.filtered_unreferenced_blob_hashes(self.blob_hashes_to_check)
+			orphan_blob_hashes = session.filtered_orphan_blob_hashes(unreferenced_blob_hashes)
+			if len(orphan_blob_hashes) != len(unreferenced_blob_hashes):
+				self.logger.warning('Found {} blobs with bad reference counts, run database validation for more details'.format(len(unreferenced_blob_hashes) - len(orphan_blob_hashes)))
 			self.logger.debug('Found {}/{} orphan blobs to delete'.format(len(orphan_blob_hashes), len(self.blob_hashes_to_check)))
 
 			if len(orphan_blob_hashes) > 0:
@@ -143,7 +143,11 @@ class DeleteOrphanChunksAction(Action[ChunkListSummary]):
 			if session is None:
 				session = es.enter_context(DbAccess.open_session())
 
-			orphan_chunk_ids = session.filtered_orphan_chunk_ids(self.chunk_ids_to_check)
+			# the reference counts narrow down the candidates, and the ground truth check makes sure nothing alive gets deleted
+			unreferenced_chunk_ids = session.filtered_unreferenced_chunk_ids(self.chunk_ids_to_check)
+			orphan_chunk_ids = session.filtered_orphan_chunk_ids(unreferenced_chunk_ids)
+			if len(orphan_chunk_ids) != len(unreferenced_chunk_ids):
+				self.logger.warning('Found {} chunks with bad reference counts, run database validation for more details'.format(len(unreferenced_chunk_ids) - len(orphan_chunk_ids)))
 			self.logger.debug('Found {}/{} orphan chunks to delete'.format(len(orphan_chunk_ids), len(self.chunk_ids_to_check)))
 
 			if len(orphan_chunk_ids) > 0:
@@ -14,10 +14,14 @@ from prime_backup.utils import collection_utils
 
 
 class DeleteChunkGroupsAction(Action[ChunkGroupListSummary]):
-	def __init__(self, *, ids: Collection[int] = (), hashes: Collection[str] = (), raise_if_not_found: bool = True):
+	def __init__(self, *, ids: Collection[int] = (), hashes: Collection[str] = (), extra_chunk_ids_to_check: Collection[int] = (), raise_if_not_found: bool = True):
+		"""
+		:param extra_chunk_ids_to_check: Extra chunks to be checked and deleted if they become orphan, e.g. chunks of deleted packed blobs
+		"""
 		super().__init__()
 		self.chunk_group_ids = collection_utils.deduplicated_list(ids)
 		self.chunk_group_hashes = collection_utils.deduplicated_list(hashes)
+		self.extra_chunk_ids_to_check = collection_utils.deduplicated_list(extra_chunk_ids_to_check)
 		self.raise_if_not_found = raise_if_not_found
 
 	@override
@@ -39,10 +43,13 @@ class DeleteChunkGroupsAction(Action[ChunkGroupListSummary]):
 				# 3. check orphan chunks
 				bindings = session.get_chunk_group_chunk_bindings_for_chunk_groups(all_to_delete_chunk_group_ids)
 				affected_chunk_ids = {cgc.chunk_id: None for cgc in bindings}  # ordered set
+				affected_chunk_ids.update((chunk_id, None) for chunk_id in self.extra_chunk_ids_to_check)
 				session.delete_chunk_group_chunk_bindings_for_chunk_groups(all_to_delete_chunk_group_ids)
 
 				session.delete_chunk_groups_by_ids(all_to_delete_chunk_group_ids)
 				summary.chunk_summary = DeleteOrphanChunksAction(ids=affected_chunk_ids.keys()).run(session=session)
+			elif len(self.extra_chunk_ids_to_check) > 0:
+				summary.chunk_summary = DeleteOrphanChunksAction(ids=self.extra_chunk_ids_to_check).run(session=session)
 			else:
 				session.commit()
 		self.logger.debug('Deleted {} chunk groups'.format(summary.count))
@@ -81,9 +88,10 @@ class DeleteChunkGroupsAction(Action[ChunkGroupListSummary]):
 
 
 class DeleteOrphanChunkGroupsAction(Action[ChunkGroupListSummary]):
-	def __init__(self, *, ids: Collection[int]):
+	def __init__(self, *, ids: Collection[int], extra_chunk_ids_to_check: Collection[int] = ()):
 		super().__init__()
 		self.chunk_ids_to_check = collection_utils.deduplicated_list(ids)
+		self.extra_chunk_ids_to_check = collection_utils.deduplicated_list(extra_chunk_ids_to_check)
 
 	@override
 	def run(self, *, session: Optional[DbSession] = None) -> ChunkGroupListSummary:
@@ -95,11 +103,15 @@ class DeleteOrphanChunkGroupsAction(Action[ChunkGroupListSummary]):
 			if session is None:
 				session = es.enter_context(DbAccess.open_session())
 
-			orphan_chunk_group_ids = session.filtered_orphan_chunk_group_ids(self.chunk_ids_to_check)
+			# the reference counts narrow down the candidates, and the ground truth check makes sure nothing alive gets deleted
+			unreferenced_chunk_group_ids = session.filtered_unreferenced_chunk_group_ids(self.chunk_ids_to_check)
+			orphan_chunk_group_ids = session.filtered_orphan_chunk_group_ids(unreferenced_chunk_group_ids)
+			if len(orphan_chunk_group_ids) != len(unreferenced_chunk_group_ids):
+				self.logger.warning('Found {} chunk groups with bad reference counts, run database validation for more details'.format(len(unreferenced_chunk_group_ids) - len(orphan_chunk_group_ids)))
 			self.logger.debug('Found {}/{} orphan chunk groups to delete'.format(len(orphan_chunk_group_ids), len(self.chunk_ids_to_check)))
 
-			if len(orphan_chunk_group_ids) > 0:
-				s = DeleteChunkGroupsAction(ids=orphan_chunk_group_ids, raise_if_not_found=False).run(session=session)
+			if len(orphan_chunk_group_ids) > 0 or len(self.extra_chunk_ids_to_check) > 0:
+				s = DeleteChunkGroupsAction(ids=orphan_chunk_group_ids, extra_chunk_ids_to_check=self.extra_chunk_ids_to_check, raise_if_not_found=False).run(session=session)
 			else:
 				session.commit()
 				s = ChunkGroupListSummary.zero()
@@ -1,11 +1,13 @@
 import dataclasses
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
 
 from typing_extensions import override
 
 from prime_backup.action import Action
 from prime_backup.db.access import DbAccess
+from prime_backup.db.rows import FileRow
 from prime_backup.db.session import DbSession
+from prime_backup.db.values import FileRole
 from prime_backup.types.file_info import FileInfo
 
 
@@ -28,18 +30,35 @@ class DiffBackupAction(Action[DiffResult]):
 		self.compare_status = compare_status
 
 	@classmethod
-	def __get_files_from_backup(cls, session: DbSession, backup_id: int) -> Dict[str, FileInfo]:
-		files = {}
-		for file in session.get_backup_files(backup_id):
-			files[file.path] = FileInfo.of(file)
-		return files
+	def __get_files_from_backup(cls, session: DbSession, backup_id: int) -> Dict[str, FileRow]:
+		return {file.path: file for file in session.get_backup_file_rows(backup_id)}
 
-	def __compare_files(self, a: FileInfo, b: FileInfo) -> bool:
+	@classmethod
+	def __get_files_from_shared_base(cls, session: DbSession, fileset_id_base: int, fileset_id_delta_old: int, fileset_id_delta_new: int) -> Tuple[Dict[str, FileRow], Dict[str, FileRow]]:
+		"""
+		Files outside both delta filesets come from the same base fileset, so they are the same in both backups.
+		Only paths that appear in either delta fileset need to be resolved
+		"""
+		deltas_old = {file.path: file for file in session.get_fileset_file_rows(fileset_id_delta_old)}
+		deltas_new = {file.path: file for file in session.get_fileset_file_rows(fileset_id_delta_new)}
+		base_files = session.get_fileset_file_rows_by_paths(fileset_id_base, list(deltas_old.keys() | deltas_new.keys()))
+
+		def resolve(deltas: Dict[str, FileRow]) -> Dict[str, FileRow]:
+			files = {}
+			for path in deltas_old.keys() | deltas_new.keys():
+				file: Optional[FileRow] = deltas.get(path, base_files.get(path))
+				if file is not None and file.role != FileRole.delta_remove.value:
+					files[path] = file
+			return files
+
+		return resolve(deltas_old), resolve(deltas_new)
+
+	def __compare_files(self, a: FileRow, b: FileRow) -> bool:
 		return (
 				True
 				and a.path == b.path
 				and a.mode == b.mode
-				and getattr(a.blob, 'hash', None) == getattr(b.blob, 'hash', None)
+				and a.blob_hash == b.blob_hash
 				and a.content == b.content
 				and (not self.compare_status or (
 						True
@@ -52,18 +71,23 @@ class DiffBackupAction(Action[DiffResult]):
 	@override
 	def run(self) -> DiffResult:
 		with DbAccess.open_session() as session:
-			files_old = self.__get_files_from_backup(session, self.backup_id_old)
-			files_new = self.__get_files_from_backup(session, self.backup_id_new)
+			backup_old = session.get_backup(self.backup_id_old)
+			backup_new = session.get_backup(self.backup_id_new)
+			if backup_old.fileset_id_base == backup_new.fileset_id_base:
+				files_old, files_new = self.__get_files_from_shared_base(session, backup_old.fileset_id_base, backup_old.fileset_id_delta, backup_new.fileset_id_delta)
+			else:
+				files_old = self.__get_files_from_backup(session, self.backup_id_old)
+				files_new = self.__get_files_from_backup(session, self.backup_id_new)
 
+		# only the differences are converted into FileInfo
 		result = DiffResult()
 		for path, file in files_old.items():
-			if path in files_new:
-				new_file = files_new[path]
+			if (new_file := files_new.get(path)) is not None:
 				if not self.__compare_files(file, new_file):
-					result.changed.append((file, new_file))
+					result.changed.append((FileInfo.of(file), FileInfo.of(new_file)))
 			else:
-				result.deleted.append(file)
+				result.deleted.append(FileInfo.of(file))
 		for path, file in files_new.items():
 			if path not in files_old:
-				result.added.append(file)
+				result.added.append(FileInfo.of(file))
 		return result
@@ -1,10 +1,14 @@
 from abc import abstractmethod, ABC
+from concurrent.futures import Future
+from typing import List, Generator, Tuple, Optional
 
 from typing_extensions import override, TypedDict, NotRequired
 
 from prime_backup.action import Action
 from prime_backup.action.helpers.blob_exporter import BlobExporter, BlobChunksGetter
+from prime_backup.action.helpers.blob_prefetcher import BlobPrefetcher
 from prime_backup.db import schema
+from prime_backup.db.rows import FileRow
 from prime_backup.db.access import DbAccess
 from prime_backup.db.session import DbSession
 from prime_backup.exceptions import PrimeBackupError, VerificationError
@@ -57,18 +61,31 @@ class _ExportBackupActionBase(Action[ExportFailures], ABC):
 			raise RuntimeError('calling _create_meta_buf() with create_meta set to False')
 		return BackupInfo.of(backup).create_meta_buf()
 
-	def _create_blob_exporter(self, blob_chunks_getter: BlobChunksGetter, file: schema.File) -> BlobExporter:
+	def _create_blob_exporter(self, blob_chunks_getter: BlobChunksGetter, file: FileRow) -> BlobExporter:
 		file_info = FileInfo.of(file)
 		if file_info.blob is None:
 			raise AssertionError('file {!r} has no blob'.format(file))
 		return BlobExporter(blob_chunks_getter, file_info.blob, file_path=file.path, verify_blob=self.verify_blob)
 
+	def _iterate_files_with_prefetch(self, name: str, blob_chunks_getter: BlobChunksGetter, files: List[FileRow]) -> Generator[Tuple[FileRow, Optional['Future[bytes]']], None, None]:
+		"""
+		For exporters with a single writer. With concurrency > 1, upcoming blobs are read ahead by a thread pool,
+		see :class:`BlobPrefetcher`. The returned future is None if the blob of the file is not prefetched
+		"""
+		concurrency = self.config.get_effective_concurrency()
+		if concurrency <= 1:
+			for file in files:
+				yield file, None
+		else:
+			prefetcher = BlobPrefetcher(name, lambda f: self._create_blob_exporter(blob_chunks_getter, f), concurrency)
+			yield from prefetcher.iterate(files)
+
 	@classmethod
-	def _on_unsupported_file_mode(cls, file: schema.File):
+	def _on_unsupported_file_mode(cls, file: FileRow):
 		raise NotImplementedError('file at {!r} with mode={} ({} or {}) is not supported yet'.format(file.path, file.mode, hex(file.mode), oct(file.mode)))
 
 	@classmethod
-	def _verify_exported_blob(cls, file: schema.File, written_size: int, written_hash: str):
+	def _verify_exported_blob(cls, file: FileRow, written_size: int, written_hash: str):
 		if file.blob_hash is None:
 			raise AssertionError('File {!r} has no blob_hash'.format(file))
 		if written_size != file.blob_raw_size:
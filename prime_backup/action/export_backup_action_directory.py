@@ -8,7 +8,7 @@ import stat
 import threading
 import time
 from pathlib import Path
-from typing import Optional, List, Dict, Tuple
+from typing import Optional, List, Dict, Tuple, Set
 
 from typing_extensions import override, Unpack
 
@@ -18,9 +18,10 @@ from prime_backup.action.helpers.blob_exporter import BlobChunksGetter, ThreadSa
 from prime_backup.action.helpers.progress_reporter import SizeProgressReporter
 from prime_backup.constants import constants
 from prime_backup.db import schema
+from prime_backup.db.rows import FileRow
 from prime_backup.db.session import DbSession
 from prime_backup.types.export_failure import ExportFailures
-from prime_backup.utils import file_utils, path_utils, collection_utils, pathspec_utils
+from prime_backup.utils import file_utils, path_utils, collection_utils, pathspec_utils, hash_utils
 from prime_backup.utils.thread_pool import FailFastBlockingThreadPool
 
 
@@ -153,13 +154,15 @@ class _ExportTempDirectory:
 class ExportBackupToDirectoryAction(_ExportBackupActionBase):
 	@dataclasses.dataclass(frozen=True)
 	class _ExportItem:
-		file: schema.File
+		file: FileRow
 		path: Path  # path to export, related to self.output_path
 		path_posix: str
 
 	def __init__(
 			self, backup_id: int, output_path: Path, *,
 			restore_mode: bool = False,
+			incremental: bool = False,
+			incremental_hash_check: bool = False,
 			child_to_export: Optional[Path] = None,
 			recursively_export_child: bool = False,
 			retain_patterns: Optional[List[str]] = None,
@@ -167,19 +170,26 @@ class ExportBackupToDirectoryAction(_ExportBackupActionBase):
 	):
 		"""
 		:param restore_mode: recover what it was like -- delete all backup targets before export
+		:param incremental: restore mode only. Instead of deleting all backup targets, only rewrite files that differ from the existing ones,
+			and only delete extra files. Existing regular files with the same size, mtime and mode are considered unchanged
+		:param incremental_hash_check: incremental restore only. Also check the hash of the unchanged files
 		"""
 		super().__init__(backup_id, **kwargs)
 		self.output_path = output_path
 		self.restore_mode = restore_mode
+		self.incremental = incremental
+		self.incremental_hash_check = incremental_hash_check
 		self.child_to_export = child_to_export
 		self.recursively_export_child = recursively_export_child
 		self.retain_patterns: List[str] = retain_patterns or []
 
 		if self.restore_mode and self.child_to_export is not None:
 			raise ValueError('restore mode does not support exporting child')
+		if self.incremental and not self.restore_mode:
+			raise ValueError('incremental export requires restore mode')
 
 	@classmethod
-	def __set_attrs(cls, file: schema.File, file_path: Path):
+	def __set_attrs(cls, file: FileRow, file_path: Path):
 		# reference: tarfile.TarFile.extractall, tarfile.TarFile._extract_member
 
 		is_link = stat.S_ISLNK(file.mode)
@@ -208,7 +218,78 @@ class ExportBackupToDirectoryAction(_ExportBackupActionBase):
 			trash_bin.add(file_path, item.path)
 		file_path.parent.mkdir(parents=True, exist_ok=True)
 
-	def __export_file(self, blob_chunks_getter: BlobChunksGetter, item: _ExportItem, exported_directories: 'queue.Queue[Tuple[schema.File, Path]]'):
+	@classmethod
+	def __is_stat_unchanged(cls, file: FileRow, st: os.stat_result) -> bool:
+		if file.mode != st.st_mode or file.mtime is None or file.mtime_unix_ns != st.st_mtime_ns:
+			return False
+		if _i_am_root() and (file.uid != st.st_uid or file.gid != st.st_gid):
+			return False
+		return stat.S_ISREG(file.mode) and file.blob_raw_size == st.st_size
+
+	def __collect_incremental_export_items(self, backup: schema.Backup, export_items: List[_ExportItem], trash_bin: _TrashBin) -> List[_ExportItem]:
+		"""
+		Compares the existing files with the backup, moves the changed and the extra files into the trash bin
+		:return: the items that need to be exported
+		"""
+		existing_stats: Dict[str, os.stat_result] = {}  # posix path, related to self.output_path
+		for target in backup.targets:
+			target_path = self.output_path / target
+			if not os.path.lexists(target_path):
+				continue
+			existing_stats[Path(target).as_posix()] = target_st = target_path.lstat()
+			if not stat.S_ISDIR(target_st.st_mode):
+				continue
+			for dir_path, dir_names, file_names in os.walk(target_path):
+				for name in dir_names + file_names:
+					path = Path(dir_path) / name
+					existing_stats[path.relative_to(self.output_path).as_posix()] = path.lstat()
+
+		items_by_path: Dict[str, ExportBackupToDirectoryAction._ExportItem] = {item.path_posix: item for item in export_items}
+		unchanged_paths: Set[str] = set()
+		for path_posix, item in items_by_path.items():
+			if (st := existing_stats.get(path_posix)) is not None and self.__is_stat_unchanged(item.file, st):
+				unchanged_paths.add(path_posix)
+
+		if self.incremental_hash_check and len(unchanged_paths) > 0:
+			hash_mismatched_paths: List[str] = []
+
+			def check_hash(path_posix_: str):
+				if hash_utils.calc_file_hash(self.output_path / path_posix_) != items_by_path[path_posix_].file.blob_hash:
+					hash_mismatched_paths.append(path_posix_)
+
+			with FailFastBlockingThreadPool('restore_hash') as pool:
+				for unchanged_path in unchanged_paths:
+					pool.submit(check_hash, unchanged_path)
+			self.logger.info('Found {} / {} stat-unchanged files with mismatched hash'.format(len(hash_mismatched_paths), len(unchanged_paths)))
+			unchanged_paths.difference_update(hash_mismatched_paths)
+
+		items_to_export: List[ExportBackupToDirectoryAction._ExportItem] = []
+		trash_count = 0
+		# parent first, so if a parent is moved into the trash bin, its children will not exist anymore
+		for path_posix in sorted(existing_stats.keys() | items_by_path.keys(), key=lambda p: Path(p).parts):
+			file_path = self.output_path / path_posix
+			item = items_by_path.get(path_posix)
+			if not os.path.lexists(file_path):
+				if item is not None:
+					items_to_export.append(item)
+				continue
+			if path_posix in unchanged_paths:
+				continue
+			if item is not None and stat.S_ISDIR(item.file.mode) and stat.S_ISDIR(existing_stats[path_posix].st_mode):
+				items_to_export.append(item)  # keep the existing directory, only its attrs will be updated
+				continue
+
+			trash_bin.add(file_path, Path(path_posix))
+			trash_count += 1
+			if item is not None:
+				items_to_export.append(item)
+
+		self.logger.info('Incremental restore: {} unchanged files kept, {} existing files removed, {} / {} files to be exported'.format(
+			len(unchanged_paths), trash_count, len(items_to_export), len(export_items),
+		))
+		return items_to_export
+
+	def __export_file(self, blob_chunks_getter: BlobChunksGetter, item: _ExportItem, exported_directories: 'queue.Queue[Tuple[FileRow, Path]]'):
 		file = item.file
 		file_path = self.output_path / item.path
 
@@ -242,7 +323,7 @@ class ExportBackupToDirectoryAction(_ExportBackupActionBase):
 
 		# 1. collect export item
 
-		def add_export_item(file_: schema.File, export_path: Path):
+		def add_export_item(file_: FileRow, export_path: Path):
 			for t in backup.targets:
 				if path_utils.is_relative_to(Path(file_.path), t):
 					export_items.append(self._ExportItem(file_, export_path, export_path.as_posix()))
@@ -252,11 +333,11 @@ class ExportBackupToDirectoryAction(_ExportBackupActionBase):
 		export_items: List[ExportBackupToDirectoryAction._ExportItem] = []
 		if self.child_to_export is None:
 			self.logger.info('Exporting {} to directory {}'.format(backup, self.output_path))
-			for file in session.get_backup_files(backup):
+			for file in session.get_backup_file_rows(backup):
 				add_export_item(file, Path(file.path))
 		else:
 			self.logger.info('Exporting child {!r} in {} to directory {}, recursively = {}'.format(self.child_to_export.as_posix(), backup, self.output_path, self.recursively_export_child))
-			for file in session.get_backup_files(backup):
+			for file in session.get_backup_file_rows(backup):
 				try:
 					rel_path = Path(file.path).relative_to(self.child_to_export)
 				except ValueError:
@@ -273,22 +354,28 @@ class ExportBackupToDirectoryAction(_ExportBackupActionBase):
 		if export_temp_dir.retainer is not None:
 			export_temp_dir.retainer.move_away()
 		try:
-			if self.restore_mode:
-				# in restore mode, recover what it was like
-				# if the backup does not have the target, don't keep the target
-				for target in backup.targets:
-					target_path = self.output_path / target
-					if os.path.lexists(target_path):
-						export_temp_dir.trash_bin.add(target_path, Path(target))
-
-			# parent dir first, so the parent will be added to trash-bin first
-			export_items.sort(key=lambda ei: ei.path_posix)
-			for item in export_items:
-				with failures.handling_exception(item.file):
-					self.__prepare_for_export(item, export_temp_dir.trash_bin)
+			if self.restore_mode and self.incremental:
+				export_items = self.__collect_incremental_export_items(backup, export_items, export_temp_dir.trash_bin)
+				for item in export_items:
+					with failures.handling_exception(item.file):
+						(self.output_path / item.path).parent.mkdir(parents=True, exist_ok=True)
+			else:
+				if self.restore_mode:
+					# in restore mode, recover what it was like
+					# if the backup does not have the target, don't keep the target
+					for target in backup.targets:
+						target_path = self.output_path / target
+						if os.path.lexists(target_path):
+							export_temp_dir.trash_bin.add(target_path, Path(target))
+
+				# parent dir first, so the parent will be added to trash-bin first
+				export_items.sort(key=lambda ei: ei.path_posix)
+				for item in export_items:
+					with failures.handling_exception(item.file):
+						self.__prepare_for_export(item, export_temp_dir.trash_bin)
 
 			ts_bcg = ThreadSafeBlobChunksGetter(session)
-			directories: 'queue.Queue[Tuple[schema.File, Path]]' = queue.Queue()
+			directories: 'queue.Queue[Tuple[FileRow, Path]]' = queue.Queue()
 			progress = SizeProgressReporter('Backup file export', total_count=len(export_items), total_size=sum(item.file.blob_raw_size or 0 for item in export_items))
 
 			with contextlib.ExitStack() as es:
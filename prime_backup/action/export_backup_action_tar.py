@@ -2,9 +2,10 @@ import contextlib
 import stat
 import tarfile
 import time
+from concurrent.futures import Future
 from io import BytesIO
 from pathlib import Path
-from typing import Union, BinaryIO, Generator
+from typing import Union, BinaryIO, Generator, Optional
 
 from typing_extensions import override, Unpack
 
@@ -14,6 +15,7 @@ from prime_backup.action.helpers.progress_reporter import SizeProgressReporter
 from prime_backup.compressors import Compressor
 from prime_backup.constants.constants import BACKUP_META_FILE_NAME
 from prime_backup.db import schema
+from prime_backup.db.rows import FileRow
 from prime_backup.types.export_failure import ExportFailures
 from prime_backup.types.tar_format import TarFormat
 from prime_backup.utils import platform_utils
@@ -39,12 +41,12 @@ class ExportBackupToTarAction(_ExportBackupActionBase):
 			else:
 				f = self.output_dest
 
-			compressor = Compressor.create(self.tar_format.value.compress_method)
+			compressor = Compressor.create(self.tar_format.value.compress_method, threads=self.config.backup.compress_threads)
 			with compressor.compress_stream(f) as f_compressed:
 				with tarfile.open(fileobj=f_compressed, mode=self.tar_format.value.mode_w) as tar:
 					yield tar
 
-	def __export_file(self, blob_chunks_getter: BlobChunksGetter, tar: tarfile.TarFile, file: schema.File):
+	def __export_file(self, blob_chunks_getter: BlobChunksGetter, tar: tarfile.TarFile, file: FileRow, prefetched: Optional['Future[bytes]']):
 		info = tarfile.TarInfo(name=file.path)
 		info.mode = file.mode
 
@@ -66,10 +68,14 @@ class ExportBackupToTarAction(_ExportBackupActionBase):
 			info.type = tarfile.REGTYPE
 			info.size = file.blob_raw_size
 
-			def reader_csm(reader: SupportsReadBytes):
-				tar.addfile(tarinfo=info, fileobj=reader)
+			if prefetched is not None:
+				# already decompressed and verified, nothing can go wrong in the middle of the tar entry
+				tar.addfile(tarinfo=info, fileobj=BytesIO(prefetched.result()))
+			else:
+				def reader_csm(reader: SupportsReadBytes):
+					tar.addfile(tarinfo=info, fileobj=reader)
 
-			self._create_blob_exporter(blob_chunks_getter, file).export_as_reader(reader_csm)
+				self._create_blob_exporter(blob_chunks_getter, file).export_as_reader(reader_csm)
 		elif stat.S_ISDIR(file.mode):
 			if self.LOG_FILE_CREATION:
 				self.logger.debug('add dir {} to tarfile'.format(file.path))
@@ -105,16 +111,16 @@ class ExportBackupToTarAction(_ExportBackupActionBase):
 		ts_bcg = ThreadSafeBlobChunksGetter(session)
 		try:
 			with self.__open_tar() as tar:
-				files = session.get_backup_files(backup)
+				files = session.get_backup_file_rows(backup)
 				progress = SizeProgressReporter('Backup tar export', total_count=len(files), total_size=backup.file_raw_size_sum or 0)
-				for file in files:
+				for file, prefetched in self._iterate_files_with_prefetch('export_tar', ts_bcg, files):
 					if self.is_interrupted.is_set():
 						self.logger.info('Export to tarfile interrupted')
 						raise self._ExportInterrupted()
 
 					with failures.handling_exception(file):
 						try:
-							self.__export_file(ts_bcg, tar, file)
+							self.__export_file(ts_bcg, tar, file, prefetched)
 						except Exception as e:
 							output_dest_str = str(self.output_dest) if isinstance(self.output_dest, Path) else str(type(self.output_dest))
 							self.logger.error('Export file {!r} to tar {} failed: {}'.format(file.path, output_dest_str, e))
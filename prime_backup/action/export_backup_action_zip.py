@@ -3,8 +3,9 @@ import os
 import stat
 import time
 import zipfile
+from concurrent.futures import Future
 from pathlib import Path
-from typing import Union, BinaryIO, Generator
+from typing import Union, BinaryIO, Generator, Optional
 
 from typing_extensions import override, Unpack
 
@@ -13,6 +14,7 @@ from prime_backup.action.helpers.blob_exporter import BlobChunksGetter, ThreadSa
 from prime_backup.action.helpers.progress_reporter import SizeProgressReporter
 from prime_backup.constants.constants import BACKUP_META_FILE_NAME
 from prime_backup.db import schema
+from prime_backup.db.rows import FileRow
 from prime_backup.types.export_failure import ExportFailures
 from prime_backup.utils import file_utils
 from prime_backup.utils.io_types import SupportsReadBytes
@@ -32,7 +34,7 @@ class ExportBackupToZipAction(_ExportBackupActionBase):
 		with zipfile.ZipFile(self.output_dest, 'w', zipfile.ZIP_DEFLATED) as zipf:
 			yield zipf
 
-	def __export_file(self, blob_chunks_getter: BlobChunksGetter, zipf: zipfile.ZipFile, file: schema.File):
+	def __export_file(self, blob_chunks_getter: BlobChunksGetter, zipf: zipfile.ZipFile, file: FileRow, prefetched: Optional['Future[bytes]']):
 		# reference: zipf.writestr -> zipfile.ZipInfo.from_file
 		if file.mtime is not None:
 			date_time = time.localtime(file.mtime_unix_sec)
@@ -55,11 +57,16 @@ class ExportBackupToZipAction(_ExportBackupActionBase):
 				raise AssertionError('file {!r} with ISREG mode has no blob_raw_size'.format(file))
 			info.file_size = file.blob_raw_size
 
-			def reader_csm(reader: SupportsReadBytes):
+			if prefetched is not None:
+				data = prefetched.result()
 				with zipf.open(info, 'w') as zip_item_:
-					file_utils.copy_file_obj_fast(reader, zip_item_, estimate_read_size=file.blob_raw_size or 0)
+					zip_item_.write(data)
+			else:
+				def reader_csm(reader: SupportsReadBytes):
+					with zipf.open(info, 'w') as zip_item_:
+						file_utils.copy_file_obj_fast(reader, zip_item_, estimate_read_size=file.blob_raw_size or 0)
 
-			self._create_blob_exporter(blob_chunks_getter, file).export_as_reader(reader_csm)
+				self._create_blob_exporter(blob_chunks_getter, file).export_as_reader(reader_csm)
 		elif stat.S_ISDIR(file.mode):
 			if self.LOG_FILE_CREATION:
 				self.logger.debug('add dir {} to zipfile'.format(file.path))
@@ -86,16 +93,16 @@ class ExportBackupToZipAction(_ExportBackupActionBase):
 		ts_bcg = ThreadSafeBlobChunksGetter(session)
 		try:
 			with self.__open_zipf() as zipf:
-				files = session.get_backup_files(backup)
+				files = session.get_backup_file_rows(backup)
 				progress = SizeProgressReporter('Backup zip export', total_count=len(files), total_size=backup.file_raw_size_sum or 0)
-				for file in files:
+				for file, prefetched in self._iterate_files_with_prefetch('export_zip', ts_bcg, files):
 					if self.is_interrupted.is_set():
 						self.logger.info('Export to zipfile interrupted')
 						raise self._ExportInterrupted()
 
 					with failures.handling_exception(file):
 						try:
-							self.__export_file(ts_bcg, zipf, file)
+							self.__export_file(ts_bcg, zipf, file, prefetched)
 						except Exception as e:
 							output_dest_str = str(self.output_dest) if isinstance(self.output_dest, Path) else str(type(self.output_dest))
 							self.logger.error('Export file {!r} to zip {} failed: {}'.format(file.path, output_dest_str, e))
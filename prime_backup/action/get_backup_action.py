@@ -17,6 +17,6 @@ class GetBackupAction(Action[BackupInfo]):
 		with DbAccess.open_session() as session:
 			backup = session.get_backup(self.backup_id)
 			if self.with_files:
-				return BackupInfo.of(backup, backup_files=session.get_backup_files(backup))
+				return BackupInfo.of(backup, backup_files=session.get_backup_file_rows(backup))
 			else:
 				return BackupInfo.of(backup)
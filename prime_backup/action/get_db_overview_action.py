@@ -15,6 +15,7 @@ class DbOverviewResult:
 	blob_count: int
 	direct_blob_count: int
 	chunked_blob_count: int
+	packed_blob_count: int
 	chunk_count: int
 	chunk_group_count: int
 	chunk_group_chunk_binding_count: int
@@ -32,6 +33,8 @@ class DbOverviewResult:
 	chunked_blob_stored_size_sum: int  # stored size of chunked blobs (sum of unique chunk stored sizes)
 	chunked_blob_raw_size_sum: int     # raw size of chunked blobs
 	chunked_blob_chunk_count: int      # total chunk references across all chunked blobs, shared chunks won't be deduplicated
+	packed_blob_stored_size_sum: int   # stored size of packed blobs (stored size of their chunks)
+	packed_blob_raw_size_sum: int      # raw size of packed blobs
 
 	chunk_raw_size_sum: int     # total raw size of all unique chunks
 	chunk_stored_size_sum: int  # total on-disk stored size of all unique chunks
@@ -62,6 +65,7 @@ class GetDbOverviewAction(Action[DbOverviewResult]):
 				blob_count=sum(stats.count for stats in blob_stats.values()),
 				direct_blob_count=blob_stats[BlobStorageMethod.direct].count,
 				chunked_blob_count=blob_stats[BlobStorageMethod.chunked].count,
+				packed_blob_count=blob_stats[BlobStorageMethod.packed].count,
 				chunk_count=chunk_stats.count,
 				chunk_group_count=session.get_chunk_group_count(),
 				chunk_group_chunk_binding_count=session.get_chunk_group_chunk_binding_count(),
@@ -79,6 +83,8 @@ class GetDbOverviewAction(Action[DbOverviewResult]):
 				chunked_blob_stored_size_sum=blob_stats[BlobStorageMethod.chunked].stored_size,
 				chunked_blob_raw_size_sum=blob_stats[BlobStorageMethod.chunked].raw_size,
 				chunked_blob_chunk_count=session.get_chunked_blob_chunk_count(),
+				packed_blob_stored_size_sum=blob_stats[BlobStorageMethod.packed].stored_size,
+				packed_blob_raw_size_sum=blob_stats[BlobStorageMethod.packed].raw_size,
 				chunk_raw_size_sum=chunk_stats.raw_size_sum,
 				chunk_stored_size_sum=chunk_stats.stored_size_sum,
 				pack_count=pack_stats.pack_count,
@@ -63,7 +63,7 @@ class GetBackupFilesAction(Action[Dict[str, FileInfo]]):
 	@override
 	def run(self) -> Dict[str, FileInfo]:
 		with DbAccess.open_session() as session:
-			files = session.get_backup_files(self.backup_id)
+			files = session.get_backup_file_rows(self.backup_id)
 			return {file.path: FileInfo.of(file) for file in files}
 
 
@@ -98,7 +98,7 @@ class GetFilesetFilesAction(Action[Dict[str, FileInfo]]):
 	@override
 	def run(self) -> Dict[str, FileInfo]:
 		with DbAccess.open_session() as session:
-			files = session.get_fileset_files(self.fileset_id)
+			files = session.get_fileset_file_rows(self.fileset_id)
 			return {file.path: FileInfo.of(file) for file in files}
 
 
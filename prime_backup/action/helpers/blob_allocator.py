@@ -1,25 +1,31 @@
 import collections
+import contextlib
 import dataclasses
 import hashlib
 import logging
 import os
+import queue
 import time
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import List, Optional, Callable, Dict, Set, Deque, TYPE_CHECKING, Union
+from typing import List, Optional, Callable, Dict, Set, Deque, TYPE_CHECKING, Union, Generator
 
 from typing_extensions import override
 
 from prime_backup.action.helpers.blob_creator_chunked import ChunkedBlobCreator
-from prime_backup.action.helpers.blob_creator_common import BlobCreateContext, BlobCreateFileLookup, BlobFileChanged, VolatileBlobFile, LookupBlobBySizeRequest, LookupBlobByHashRequest, BlobLookupRequest, BlobLookupRoutine
+from prime_backup.action.helpers.blob_creator_common import BlobCreateContext, BlobCreateFileLookup, BlobFileChanged, VolatileBlobFile, LookupBlobBySizeRequest, LookupBlobByHashRequest, LookupChunkByHashRequest, WaitBlobWriteRequest, BlobLookupRequest, BlobLookupRoutine
 from prime_backup.action.helpers.blob_creator_direct import DirectBlobCreator
+from prime_backup.action.helpers.blob_creator_packed import PackedBlobCreator
 from prime_backup.action.helpers.blob_recorder import BlobRecorder
+from prime_backup.action.helpers.chunk_grouper import ChunkGrouper
+from prime_backup.action.helpers.compress_prober import CompressProber, CompressProbeStats
 from prime_backup.action.helpers.create_backup_utils import CreateBackupTimeCostKey, SourceFileNotFoundWrapper
 from prime_backup.action.helpers.progress_reporter import SizeProgressReporter
 from prime_backup.db import schema
 from prime_backup.db.session import DbSession
 from prime_backup.types.chunk_method import ChunkMethod
 from prime_backup.utils import blob_utils, file_utils, misc_utils, pack_utils
+from prime_backup.utils.thread_pool import FailFastBlockingThreadPool
 from prime_backup.utils.time_cost_stats import TimeCostStats
 
 if TYPE_CHECKING:
@@ -118,26 +124,96 @@ class BlobByHashFetcher(BatchFetcherBase):
 		self.__hashes.clear()
 
 
+class ChunkByHashFetcher(BatchFetcherBase):
+	def __init__(self, session: DbSession, max_batch_size: int, result_store: Dict[str, ChunkGrouper.ChunkLike], time_costs: TimeCostStats[CreateBackupTimeCostKey]):
+		super().__init__(session, max_batch_size, time_costs)
+		self.__callbacks: List[_FetchCallback] = []
+		self.__hashes: Set[str] = set()
+		self.__result_store = result_store
+
+	def query(self, query: LookupChunkByHashRequest, callback: _FetchCallback):
+		self.__callbacks.append(callback)
+		self.__hashes.add(query.hash)
+		self._post_query()
+
+	@override
+	def _task_count(self) -> int:
+		return len(self.__callbacks)
+
+	@override
+	def _batch_run(self):
+		with self.time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_db):
+			chunks = self.session.get_chunks_by_hashes_opt(list(self.__hashes))
+		for chunk_hash, chunk in chunks.items():
+			if chunk is not None:
+				self.__result_store[chunk_hash] = ChunkGrouper.ChunkLike.of(chunk)
+		# reverse since we want to keep the file order, and collections.deque.appendleft is FILO
+		for callback in reversed(self.__callbacks):
+			callback()
+		self.__callbacks.clear()
+		self.__hashes.clear()
+
+
 class BatchLookupManager:
-	def __init__(self, session: DbSession, size_result_store: Dict[int, bool], hash_result_store: Dict[str, schema.Blob], time_costs: TimeCostStats[CreateBackupTimeCostKey], *, max_batch_size: int = 100):
+	def __init__(
+			self, session: DbSession,
+			size_result_store: Dict[int, bool], hash_result_store: Dict[str, schema.Blob], chunk_result_store: Dict[str, ChunkGrouper.ChunkLike],
+			time_costs: TimeCostStats[CreateBackupTimeCostKey], *, max_batch_size: int = 100,
+	):
 		self.fetcher_size = BlobBySizeFetcher(session, max_batch_size, size_result_store, time_costs)
 		self.fetcher_hash = BlobByHashFetcher(session, max_batch_size, hash_result_store, time_costs)
+		self.fetcher_chunk = ChunkByHashFetcher(session, max_batch_size, chunk_result_store, time_costs)
 
 	def query(self, query: BlobLookupRequest, callback: _FetchCallback):
 		if isinstance(query, LookupBlobBySizeRequest):
 			self.fetcher_size.query(query, callback)
 		elif isinstance(query, LookupBlobByHashRequest):
 			self.fetcher_hash.query(query, callback)
+		elif isinstance(query, LookupChunkByHashRequest):
+			self.fetcher_chunk.query(query, callback)
 		else:
 			raise TypeError('unexpected query: {!r} {!r}'.format(type(query), query))
 
 	def flush_if_needed(self):
 		self.fetcher_size.flush_if_needed()
 		self.fetcher_hash.flush_if_needed()
+		self.fetcher_chunk.flush_if_needed()
 
 	def flush(self):
 		self.fetcher_size.flush()
 		self.fetcher_hash.flush()
+		self.fetcher_chunk.flush()
+
+
+class BlobWriteWaiter:
+	"""
+	Wakes up generators that are waiting for blob write jobs in the blob write pool
+	"""
+
+	def __init__(self):
+		self.__done_callbacks: 'queue.Queue[_FetchCallback]' = queue.Queue()
+		self.__waiting_count = 0
+
+	def wait(self, request: WaitBlobWriteRequest, callback: _FetchCallback):
+		self.__waiting_count += 1
+		request.future.add_done_callback(lambda _: self.__done_callbacks.put(callback))
+
+	def has_waiting(self) -> bool:
+		return self.__waiting_count > 0
+
+	def resume_done(self, *, block: bool):
+		callbacks: List[_FetchCallback] = []
+		if block and self.__waiting_count > 0:
+			callbacks.append(self.__done_callbacks.get())
+		while True:
+			try:
+				callbacks.append(self.__done_callbacks.get_nowait())
+			except queue.Empty:
+				break
+		self.__waiting_count -= len(callbacks)
+		# reverse since we want to keep the file order, and collections.deque.appendleft is FILO
+		for callback in reversed(callbacks):
+			callback()
 
 
 @dataclasses.dataclass(frozen=True)
@@ -167,7 +243,10 @@ class BlobAllocator:
 		self.__source_path = source_path
 		self.__blob_by_size_cache: Dict[int, bool] = {}
 		self.__blob_by_hash_cache: Dict[str, schema.Blob] = {}
-		self.__batch_lookup_manager = BatchLookupManager(session, self.__blob_by_size_cache, self.__blob_by_hash_cache, time_costs)
+		self.__chunk_by_hash_cache: Dict[str, ChunkGrouper.ChunkLike] = {}
+		self.__batch_lookup_manager = BatchLookupManager(session, self.__blob_by_size_cache, self.__blob_by_hash_cache, self.__chunk_by_hash_cache, time_costs)
+		self.__blob_write_waiter = BlobWriteWaiter()
+		self.__compress_prober = CompressProber()
 
 		self.__ctx = BlobCreateContext(
 			session=session,
@@ -178,52 +257,64 @@ class BlobAllocator:
 			pack_writer=pack_writer,
 			blob_by_size_cache=self.__blob_by_size_cache,
 			blob_by_hash_cache=self.__blob_by_hash_cache,
+			chunk_by_hash_cache=self.__chunk_by_hash_cache,
+			compress_prober=self.__compress_prober,
 		)
 
+	def get_compress_probe_stats(self) -> CompressProbeStats:
+		return self.__compress_prober.get_stats()
+
+	def __get_rel_path(self, file_path: Path) -> Optional[Path]:
+		try:
+			return file_path.relative_to(self.__source_path)
+		except ValueError:
+			self.logger.error("Path {!r} is not inside the source path {!r}".format(str(file_path), str(self.__source_path)))
+			return None
+
 	def __should_skip_missing_source_file(self, src_file_path: Path) -> bool:
 		if self.config.backup.creation_skip_missing_file:
-			try:
-				rel_path = src_file_path.relative_to(self.__source_path)
-			except ValueError:
-				self.logger.error("Path {!r} is not inside the source path {!r}".format(str(src_file_path), str(self.__source_path)))
-			else:
+			if (rel_path := self.__get_rel_path(src_file_path)) is not None:
 				return self.config.backup.creation_skip_missing_file_patterns_spec.match_file(rel_path)
 		return False
 
-	def __get_chunk_method(self, file_path: Path, file_size: int) -> Optional[ChunkMethod]:
-		try:
-			rel_path = file_path.relative_to(self.__source_path)
-		except ValueError:
-			self.logger.error("Path {!r} is not inside the source path {!r}".format(str(file_path), str(self.__source_path)))
+	def __get_chunk_method(self, rel_path: Optional[Path], file_size: int) -> Optional[ChunkMethod]:
+		if rel_path is None:
 			return None
-		else:
-			return ChunkMethod.get_for_file(rel_path, file_size)
+		return ChunkMethod.get_for_file(rel_path, file_size)
 
 	def __is_mutating_file(self, file_path: Path) -> bool:
-		try:
-			rel_path = file_path.relative_to(self.__source_path)
-		except ValueError:
-			self.logger.error("Path {!r} is not inside the source path {!r}".format(str(file_path), str(self.__source_path)))
+		if (rel_path := self.__get_rel_path(file_path)) is None:
 			return False
-		else:
-			return self.config.backup.mutating_file_patterns_spec.match_file(rel_path)
+		return self.config.backup.mutating_file_patterns_spec.match_file(rel_path)
 
 	def __try_get_or_create_blob_once(self, src_path: Path, src_path_md5: str, st: os.stat_result, last_chance: bool, is_mutating_file: bool) -> BlobLookupRoutine[schema.Blob]:
-		chunk_method = self.__get_chunk_method(src_path, st.st_size)
-		creator: Union[ChunkedBlobCreator, DirectBlobCreator]
+		rel_path = self.__get_rel_path(src_path)
+		chunk_method = self.__get_chunk_method(rel_path, st.st_size)
+		creator: Union[ChunkedBlobCreator, PackedBlobCreator, DirectBlobCreator]
 		if chunk_method is not None:
 			creator = ChunkedBlobCreator(self.__ctx, ChunkedBlobCreator.Args(
 				src_path=src_path,
 				src_path_md5=src_path_md5,
+				rel_path=rel_path,
 				st=st,
 				chunk_method=chunk_method,
 				last_chance=last_chance,
 				is_mutating_file=is_mutating_file,
 			))
+		elif self.config.backup.should_pack_blob(st.st_size):
+			creator = PackedBlobCreator(self.__ctx, PackedBlobCreator.Args(
+				src_path=src_path,
+				rel_path=rel_path,
+				st=st,
+				max_size=self.config.backup.blob_pack_threshold,
+				last_chance=last_chance,
+				is_mutating_file=is_mutating_file,
+			))
 		else:
 			creator = DirectBlobCreator(self.__ctx, DirectBlobCreator.Args(
 				src_path=src_path,
 				src_path_md5=src_path_md5,
+				rel_path=rel_path,
 				st=st,
 				last_chance=last_chance,
 				is_mutating_file=is_mutating_file,
@@ -271,7 +362,27 @@ class BlobAllocator:
 			self.__ctx.blob_store_st = bs_path.stat()
 			self.__ctx.blob_store_in_cow_fs = file_utils.does_fs_support_cow(bs_path)
 
+	@contextlib.contextmanager
+	def __blob_write_pool(self) -> Generator[None, None, None]:
+		if self.config.get_effective_concurrency() <= 1:
+			yield
+			return
+
+		# compress and write new direct blobs in parallel, while the scheduler keeps doing the lookups
+		with FailFastBlockingThreadPool(name='blob_writer') as pool:
+			self.__ctx.blob_write_pool = pool
+			try:
+				yield
+			finally:
+				self.__ctx.blob_write_pool = None
+				self.__ctx.pending_blob_writes_by_hash.clear()
+				self.__ctx.pending_blob_writes_by_size.clear()
+
 	def schedule_loop(self, gen_list: List[BlobLookupRoutine[schema.File]], total_blob_raw_size: int) -> List[schema.File]:
+		with self.__blob_write_pool():
+			return self.__schedule_loop(gen_list, total_blob_raw_size)
+
+	def __schedule_loop(self, gen_list: List[BlobLookupRoutine[schema.File]], total_blob_raw_size: int) -> List[schema.File]:
 		files: List[schema.File] = []
 
 		schedule_queue: Deque[BlobLookupRoutine[schema.File]] = collections.deque()
@@ -280,14 +391,22 @@ class BlobAllocator:
 		gen_count = len(schedule_queue)
 		progress = SizeProgressReporter('Backup file creation', total_count=gen_count, total_size=total_blob_raw_size)
 
-		while len(schedule_queue) > 0:
+		while len(schedule_queue) > 0 or self.__blob_write_waiter.has_waiting():
+			if len(schedule_queue) == 0:
+				# nothing to do but waiting for the blob write pool
+				self.__blob_write_waiter.resume_done(block=True)
+				continue
+
 			scheduled = schedule_queue.popleft()
 			try:
 				def callback(g: BlobLookupRoutine[schema.File] = scheduled):
 					schedule_queue.appendleft(g)
 
 				query_req = scheduled.send(None)
-				self.__batch_lookup_manager.query(query_req, callback)
+				if isinstance(query_req, WaitBlobWriteRequest):
+					self.__blob_write_waiter.wait(query_req, callback)
+				else:
+					self.__batch_lookup_manager.query(query_req, callback)
 			except StopIteration as e:
 				file = misc_utils.ensure_type(e.value, schema.File)
 				files.append(file)
@@ -299,6 +418,7 @@ class BlobAllocator:
 					raise
 
 			self.__batch_lookup_manager.flush_if_needed()
+			self.__blob_write_waiter.resume_done(block=False)
 			if len(schedule_queue) == 0:
 				self.__batch_lookup_manager.flush()
 
@@ -6,7 +6,7 @@ import os
 import time
 from concurrent.futures import Future
 from pathlib import Path
-from typing import BinaryIO, Dict, List, Optional, Union
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar, Union
 
 from prime_backup.action.helpers.blob_creator_common import BlobLookupRoutine, BlobCreateContext, BlobCreatorBase
 from prime_backup.action.helpers.blob_pre_calc_result import BlobPrecalculateResult
@@ -17,7 +17,7 @@ from prime_backup.db import schema
 from prime_backup.db.session import DbSession
 from prime_backup.db.values import BlobStorageMethod
 from prime_backup.types.chunk_method import ChunkMethod
-from prime_backup.types.chunker import PrettyChunk, PrettyChunkSequence, SimplePrettyChunkSequence
+from prime_backup.types.chunker import PrettyChunk, PrettyChunkSequence, PrettyChunkWithData, SimplePrettyChunkSequence
 from prime_backup.types.units import ByteCount
 from prime_backup.utils import chunk_utils, file_utils, hash_utils, misc_utils
 from prime_backup.utils.thread_pool import FailFastBlockingThreadPool
@@ -25,7 +25,7 @@ from prime_backup.utils.thread_pool import FailFastBlockingThreadPool
 
 class _ChunkedBlobCreatePolicy(enum.Enum):
 	copy_hash = enum.auto()  # files that keep changing: copy to temp file, calc hash, compress to blob  |  read 2x, write 2x. need more spaces
-	default = enum.auto()    # default policy: hash+chunking and check, then chunking+compress+hash to blob store          |  read 2x, write 1x
+	default = enum.auto()    # default policy: chunking+hash+compress to blob store in a single pass     |  read 1x (2x with pre-calculated chunks), write 1x
 
 
 @dataclasses.dataclass(frozen=True)
@@ -34,11 +34,15 @@ class _ChunkedBlobPlan:
 	pre_cal_result: Optional[BlobPrecalculateResult]
 
 
+_T = TypeVar('_T')
+
+
 @dataclasses.dataclass(frozen=True)
 class _ChunkedBlobSnapshot:
 	chunks: PrettyChunkSequence
 	blob_hash: str
 	blob_size: int
+	write_result: Optional['_ChunkWriteResult'] = None  # not None if the new chunks are already written in the single pass
 
 
 @dataclasses.dataclass
@@ -72,6 +76,7 @@ class _PendingChunk:
 @dataclasses.dataclass(frozen=True)
 class _CompressedChunk:
 	chunk: _PendingChunk
+	compress: str
 	data: bytes
 
 
@@ -88,6 +93,25 @@ class _CompressedChunkWriteState:
 		return force or len(self.futures) >= self.max_pending_chunks or self.pending_bytes >= self.max_pending_bytes
 
 
+@dataclasses.dataclass
+class _ChunkWriteBatch:
+	chunks: List[Tuple[PrettyChunk, bytes]] = dataclasses.field(default_factory=list)
+	total_bytes: int = 0
+	max_chunks: int = 256
+	max_bytes: int = 16 * 1024 * 1024
+
+	def add(self, chunk: PrettyChunk, data: bytes):
+		self.chunks.append((chunk, data))
+		self.total_bytes += len(data)
+
+	def is_full(self) -> bool:
+		return len(self.chunks) >= self.max_chunks or self.total_bytes >= self.max_bytes
+
+	def clear(self):
+		self.chunks.clear()
+		self.total_bytes = 0
+
+
 @dataclasses.dataclass(frozen=True)
 class _ChunkWriteResult:
 	offset_to_chunk: Dict[int, Union[schema.Chunk, _PendingChunk]]
@@ -102,6 +126,7 @@ class ChunkedBlobCreator(BlobCreatorBase):
 	class Args:
 		src_path: Path
 		src_path_md5: str
+		rel_path: Optional[Path]  # relative to the source path
 		st: os.stat_result
 		chunk_method: ChunkMethod
 		last_chance: bool
@@ -130,12 +155,15 @@ class ChunkedBlobCreator(BlobCreatorBase):
 			# if any yield is done, ensure to check blob_by_hash_cache again
 			process_start_time = time.time()
 
-			# large files that need to be chunked already contain quite a few chunks,
-			# so it's efficient enough to directly query for chunks from DB here
-			with self.ctx.time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_db):
-				known_db_chunks = self.ctx.session.get_chunks_by_hashes_opt(list(snapshot.chunks.iter_hashes()))
+			if snapshot.write_result is not None:
+				write_result = snapshot.write_result
+			else:
+				# large files that need to be chunked already contain quite a few chunks,
+				# so it's efficient enough to directly query for chunks from DB here
+				with self.ctx.time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_db):
+					known_db_chunks = self.ctx.session.get_chunks_by_hashes_opt(list(snapshot.chunks.iter_hashes()))
 
-			write_result = self.__create_missing_chunks(actual_path_to_read, snapshot, known_db_chunks)
+				write_result = self.__create_missing_chunks(actual_path_to_read, snapshot, known_db_chunks)
 
 		if self.logger.isEnabledFor(logging.DEBUG):
 			self.logger.debug('Chunked file {} in {:.2f}s, compressed size {}/{}, chunk count: {} (+{}, {:.1f}%)'.format(
@@ -197,14 +225,14 @@ class ChunkedBlobCreator(BlobCreatorBase):
 					self.logger.debug('Cut and hashed file {} with size {} into {} chunks using {} (precalc)'.format(
 						src_path_str, ByteCount(blob_size).auto_str(), len(chunks), self.args.chunk_method.name,
 					))
-				if (cache := (yield from self.query_cached_blob(pre_calc_blob_hash))) is not None:
+				if (cache := (yield from self.query_cached_blob(pre_calc_blob_hash, blob_size))) is not None:
 					if self.logger.isEnabledFor(logging.DEBUG):
 						self.logger.debug('Chunked file {} (hash {}) already exists in DB'.format(src_path_str, pre_calc_blob_hash))
 					return cache
 				return _ChunkedBlobSnapshot(chunks, pre_calc_blob_hash, blob_size)
 
-		if pre_calc_blob_hash is not None:
-			if (cache := (yield from self.query_cached_blob(pre_calc_blob_hash))) is not None:
+		if pre_cal_result is not None and pre_calc_blob_hash is not None:
+			if (cache := (yield from self.query_cached_blob(pre_calc_blob_hash, pre_cal_result.size))) is not None:
 				if self.logger.isEnabledFor(logging.DEBUG):
 					self.logger.debug('Chunked file {} (hash {}) already exists in DB'.format(src_path_str, pre_calc_blob_hash))
 				return cache
@@ -226,30 +254,149 @@ class ChunkedBlobCreator(BlobCreatorBase):
 					src_path_str, ByteCount(sah.size).auto_str(), hash_cost(),
 					ByteCount(sah.size / hash_cost() if hash_cost() > 0 else 0).auto_str(),
 				))
-			if (cache := (yield from self.query_cached_blob(pre_calc_blob_hash))) is not None:
+			if (cache := (yield from self.query_cached_blob(pre_calc_blob_hash, sah.size))) is not None:
 				if self.logger.isEnabledFor(logging.DEBUG):
 					self.logger.debug('Chunked file {} (hash {}) already exists in DB'.format(src_path_str, pre_calc_blob_hash))
 				return cache
 
+		# cut, hash, compress and write the new chunks in a single pass
+		process_start_time = time.time()
+		snapshot = self.__cut_and_write_chunks(actual_path_to_read, pre_calc_blob_hash)
+		if self.logger.isEnabledFor(logging.DEBUG):
+			cost = time.time() - process_start_time
+			self.logger.debug('Cut and hashed file {} with size {} into {} chunks using {} in {:.2f}s ({}/s) in a single pass'.format(
+				src_path_str, ByteCount(snapshot.blob_size).auto_str(), len(snapshot.chunks), self.args.chunk_method.name, cost,
+				ByteCount(snapshot.blob_size / cost if cost > 0 else 0).auto_str(),
+			))
+		if pre_calc_blob_hash is None:
+			write_result = misc_utils.ensure_type(snapshot.write_result, _ChunkWriteResult)
+			try:
+				cache = yield from self.query_cached_blob(snapshot.blob_hash, snapshot.blob_size)
+			except BaseException:
+				self.__discard_written_chunks(write_result.new_chunks)
+				raise
+			if cache is not None:
+				if self.logger.isEnabledFor(logging.DEBUG):
+					self.logger.debug('Chunked file {} (hash {}) already exists in DB, discard {} written chunks'.format(src_path_str, snapshot.blob_hash, len(write_result.new_chunks)))
+				self.__discard_written_chunks(write_result.new_chunks)
+				return cache
+			# other generators might have created some of the new chunks during the yield above
+			snapshot = dataclasses.replace(snapshot, write_result=self.__drop_new_chunks_created_by_others(write_result))
+		return snapshot
+
+	def __cut_and_write_chunks(self, actual_path_to_read: Path, expected_blob_hash: Optional[str]) -> _ChunkedBlobSnapshot:
+		"""
+		Cut the file into chunks, and compress and write the new chunks to the packs as soon as they are cut,
+		so the file is only read once. The written chunks are not inserted into the DB yet.
+		If anything goes wrong, the written chunks are discarded
+
+		notes: this method cannot be interrupted (yield), since the chunk existence in DB is checked here
+		"""
 		previous_chunks = self.ctx.file_lookup.get_previous_chunks(self.args.src_path) if self.args.chunk_method.needs_previous_chunks() else None
 		chunker = self.args.chunk_method.create_file_chunker(actual_path_to_read, need_entire_file_hash=True, previous_chunks=previous_chunks)
-		with self.ctx.time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_io_read) as chunking_cost:
-			chunks = SimplePrettyChunkSequence(chunker.cut_all())
-		blob_hash = chunker.get_entire_file_hash()
-		blob_size = chunker.get_read_file_size()
-		if pre_calc_blob_hash is not None and pre_calc_blob_hash != blob_hash:
-			self.log_and_raise_blob_file_changed('Blob hash mismatch, pre calc {}, chunked {}'.format(pre_calc_blob_hash, blob_hash), self.args.last_chance)
 
-		if self.logger.isEnabledFor(logging.DEBUG):
-			self.logger.debug('Cut and hashed file {} with size {} into {} chunks using {} in {:.2f}s ({}/s)'.format(
-				src_path_str, ByteCount(blob_size).auto_str(), len(chunks), self.args.chunk_method.name, chunking_cost(),
-				ByteCount(blob_size / chunking_cost() if chunking_cost() > 0 else 0).auto_str(),
-			))
-		if pre_calc_blob_hash is None and (cache := (yield from self.query_cached_blob(blob_hash))) is not None:
-			if self.logger.isEnabledFor(logging.DEBUG):
-				self.logger.debug('Chunked file {} (hash {}) already exists in DB'.format(src_path_str, blob_hash))
-			return cache
-		return _ChunkedBlobSnapshot(chunks, blob_hash, blob_size)
+		chunks: List[PrettyChunk] = []
+		known_chunks: Dict[str, Optional[Union[schema.Chunk, _PendingChunk]]] = {}
+		new_chunks: List[_PendingChunk] = []
+		offset_to_chunk: Dict[int, Union[schema.Chunk, _PendingChunk]] = {}
+		write_state = _CompressedChunkWriteState()
+		batch = _ChunkWriteBatch()
+
+		def flush_batch():
+			unknown_hashes = list({chunk.hash for chunk, _ in batch.chunks if chunk.hash not in known_chunks})
+			if len(unknown_hashes) > 0:
+				with self.ctx.time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_db):
+					known_chunks.update(self.ctx.session.get_chunks_by_hashes_opt(unknown_hashes))
+			for chunk, chunk_buf in batch.chunks:
+				db_chunk = known_chunks[chunk.hash]
+				if db_chunk is None:
+					db_chunk = self.__submit_new_chunk(chunk, chunk_buf, known_chunks, new_chunks, pool, write_state)
+				offset_to_chunk[chunk.offset] = db_chunk
+			batch.clear()
+
+		try:
+			with contextlib.ExitStack() as es:
+				pool: Optional[FailFastBlockingThreadPool] = None
+				if self.config.get_effective_concurrency() > 1:
+					pool = es.enter_context(FailFastBlockingThreadPool('chunk_compress'))
+
+				with SourceFileNotFoundWrapper.wrap(actual_path_to_read):
+					chunk_with_data: PrettyChunkWithData
+					for chunk_with_data in self.__measure_iter(chunker.cut_with_data(), CreateBackupTimeCostKey.kind_io_read):
+						chunk = PrettyChunk(chunk_with_data.offset, chunk_with_data.length, chunk_with_data.hash)
+						chunks.append(chunk)
+						batch.add(chunk, bytes(chunk_with_data.data))
+						if batch.is_full():
+							flush_batch()
+				flush_batch()
+
+				with self.ctx.time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_io_write):
+					if pool is not None:
+						pool.wait_and_ensure_no_error()
+					self.__flush_compressed_chunk_futures(write_state, force=True)
+
+			blob_hash = chunker.get_entire_file_hash()
+			blob_size = chunker.get_read_file_size()
+			if expected_blob_hash is not None and expected_blob_hash != blob_hash:
+				self.log_and_raise_blob_file_changed('Blob hash mismatch, pre calc {}, chunked {}'.format(expected_blob_hash, blob_hash), self.args.last_chance)
+		except BaseException:
+			self.__discard_written_chunks(new_chunks)
+			raise
+
+		return _ChunkedBlobSnapshot(
+			chunks=SimplePrettyChunkSequence(chunks),
+			blob_hash=blob_hash,
+			blob_size=blob_size,
+			write_result=self.__make_write_result(offset_to_chunk, new_chunks, blob_size, len(known_chunks)),
+		)
+
+	def __measure_iter(self, iterable: Iterable[_T], key: CreateBackupTimeCostKey) -> Iterator[_T]:
+		iterator = iter(iterable)
+		while True:
+			with self.ctx.time_costs.measure_time_cost(key):
+				try:
+					item = next(iterator)
+				except StopIteration:
+					return
+			yield item
+
+	def __discard_written_chunks(self, chunks: List[_PendingChunk]):
+		for chunk in chunks:
+			if chunk.pack_id >= 0:
+				self.ctx.pack_writer.discard_entry(chunk.pack_id, chunk.stored_size)
+
+	def __drop_new_chunks_created_by_others(self, write_result: _ChunkWriteResult) -> _ChunkWriteResult:
+		if len(write_result.new_chunks) == 0:
+			return write_result
+		with self.ctx.time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_db):
+			existing_chunks = self.ctx.session.get_chunks_by_hashes_opt([chunk.hash for chunk in write_result.new_chunks])
+		if all(chunk is None for chunk in existing_chunks.values()):
+			return write_result
+
+		new_chunks: List[_PendingChunk] = []
+		for new_chunk in write_result.new_chunks:
+			if existing_chunks[new_chunk.hash] is not None:
+				self.__discard_written_chunks([new_chunk])
+			else:
+				new_chunks.append(new_chunk)
+		offset_to_chunk: Dict[int, Union[schema.Chunk, _PendingChunk]] = {
+			offset: existing_chunks.get(chunk.hash) or chunk
+			for offset, chunk in write_result.offset_to_chunk.items()
+		}
+		return self.__make_write_result(offset_to_chunk, new_chunks, write_result.raw_size_sum, write_result.unique_chunk_count)
+
+	@classmethod
+	def __make_write_result(cls, offset_to_chunk: Dict[int, Union[schema.Chunk, _PendingChunk]], new_chunks: List[_PendingChunk], blob_size: int, unique_chunk_count: int) -> _ChunkWriteResult:
+		blob_raw_size_sum = sum(db_chunk.raw_size for db_chunk in offset_to_chunk.values())
+		blob_stored_size_sum = sum({db_chunk.hash: db_chunk.stored_size for db_chunk in offset_to_chunk.values()}.values())
+		misc_utils.assert_true(blob_raw_size_sum == blob_size, lambda: f'blob_raw_size_sum {blob_raw_size_sum} should be equal to blob_size {blob_size}')
+		return _ChunkWriteResult(
+			offset_to_chunk=offset_to_chunk,
+			new_chunks=new_chunks,
+			raw_size_sum=blob_raw_size_sum,
+			stored_size_sum=blob_stored_size_sum,
+			unique_chunk_count=unique_chunk_count,
+		)
 
 	def __create_missing_chunks(self, actual_path_to_read: Path, snapshot: _ChunkedBlobSnapshot, known_db_chunks: Dict[str, Optional[schema.Chunk]]) -> _ChunkWriteResult:
 		known_chunks: Dict[str, Optional[Union[schema.Chunk, _PendingChunk]]] = dict(known_db_chunks)
@@ -286,20 +433,8 @@ class ChunkedBlobCreator(BlobCreatorBase):
 					pool.wait_and_ensure_no_error()
 				self.__flush_compressed_chunk_futures(write_state, force=True)
 
-		blob_raw_size_sum = 0
-		blob_stored_size_sum = sum({db_chunk.hash: db_chunk.stored_size for db_chunk in offset_to_chunk.values()}.values())
-		for db_chunk in offset_to_chunk.values():
-			blob_raw_size_sum += db_chunk.raw_size
-		misc_utils.assert_true(blob_raw_size_sum == offset, lambda: f'blob_raw_size_sum {blob_raw_size_sum} should be equal to offset {offset}')
-		misc_utils.assert_true(blob_raw_size_sum == snapshot.blob_size, lambda: f'blob_raw_size_sum {blob_raw_size_sum} should be equal to blob_size {snapshot.blob_size}')
-
-		return _ChunkWriteResult(
-			offset_to_chunk=offset_to_chunk,
-			new_chunks=new_chunks,
-			raw_size_sum=blob_raw_size_sum,
-			stored_size_sum=blob_stored_size_sum,
-			unique_chunk_count=len(known_db_chunks),
-		)
+		misc_utils.assert_true(offset == snapshot.blob_size, lambda: f'offset {offset} should be equal to blob_size {snapshot.blob_size}')
+		return self.__make_write_result(offset_to_chunk, new_chunks, snapshot.blob_size, len(known_db_chunks))
 
 	def __create_new_chunk(
 			self,
@@ -312,12 +447,22 @@ class ChunkedBlobCreator(BlobCreatorBase):
 			write_state: _CompressedChunkWriteState,
 	) -> _PendingChunk:
 		chunk_buf = self.__read_and_validate_new_chunk(src_file, chunk, offset)
-		compress_method: CompressMethod = self.config.backup.get_compress_method_from_size(chunk.length)
-		compressor = Compressor.create(compress_method)
+		return self.__submit_new_chunk(chunk, chunk_buf, known_chunks, new_chunks, pool, write_state)
+
+	def __submit_new_chunk(
+			self,
+			chunk: PrettyChunk,
+			chunk_buf: bytes,
+			known_chunks: Dict[str, Optional[Union[schema.Chunk, _PendingChunk]]],
+			new_chunks: List[_PendingChunk],
+			pool: Optional[FailFastBlockingThreadPool],
+			write_state: _CompressedChunkWriteState,
+	) -> _PendingChunk:
+		compressor = self.config.backup.get_compressor(self.args.rel_path, self.args.st.st_size, data_size=chunk.length, concurrency=self.config.get_effective_concurrency())
 
 		db_chunk = _PendingChunk(
 			hash=chunk.hash,
-			compress=compress_method.name,
+			compress=compressor.get_name(),
 			raw_size=len(chunk_buf),
 			stored_size=-1,
 			pack_id=-1,
@@ -328,8 +473,8 @@ class ChunkedBlobCreator(BlobCreatorBase):
 
 		with self.ctx.time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_io_write):
 			def write_task(db_chunk_: _PendingChunk = db_chunk, compressor_: Compressor = compressor, chunk_buf_: bytes = chunk_buf) -> _CompressedChunk:
-				compressed = compressor_.compress_bytes(chunk_buf_)
-				return _CompressedChunk(db_chunk_, compressed)
+				actual_compressor, compressed = self.ctx.compress_prober.compress_bytes(compressor_, chunk_buf_)
+				return _CompressedChunk(db_chunk_, actual_compressor.get_name(), compressed)
 
 			if pool is not None:
 				write_state.futures.append(pool.submit(write_task))
@@ -357,6 +502,7 @@ class ChunkedBlobCreator(BlobCreatorBase):
 			compressed_chunk = write_state.futures.pop(0).result()
 			write_state.pending_bytes -= compressed_chunk.chunk.raw_size
 			entry_location = self.ctx.pack_writer.write_entry(compressed_chunk.data)
+			compressed_chunk.chunk.compress = compressed_chunk.compress
 			compressed_chunk.chunk.stored_size = len(compressed_chunk.data)
 			compressed_chunk.chunk.pack_id = entry_location.pack_id
 			compressed_chunk.chunk.pack_offset = entry_location.offset
@@ -382,7 +528,8 @@ class ChunkedBlobCreator(BlobCreatorBase):
 		offset_to_chunk_like: Dict[int, ChunkGrouper.ChunkLike] = {}
 		for offset, chunk in write_result.offset_to_chunk.items():
 			if isinstance(chunk, _PendingChunk):
-				offset_to_chunk_like[offset] = chunk.to_chunk_like(new_chunk_ids[chunk.hash])
+				offset_to_chunk_like[offset] = chunk_like = chunk.to_chunk_like(new_chunk_ids[chunk.hash])
+				self.ctx.remember_chunk(chunk_like)
 			else:
 				offset_to_chunk_like[offset] = ChunkGrouper.ChunkLike.of(chunk)
 
@@ -4,8 +4,9 @@ import logging
 import os
 import threading
 from abc import ABC, abstractmethod
+from concurrent.futures import Future
 from pathlib import Path
-from typing import ContextManager, Dict, Generator, List, Optional, TYPE_CHECKING, TypeVar, Union
+from typing import Callable, ContextManager, Dict, Generator, Generic, List, Optional, TYPE_CHECKING, TypeVar, Union
 
 from typing_extensions import NoReturn, override
 
@@ -13,6 +14,8 @@ from prime_backup import logger
 from prime_backup.action.helpers import create_backup_utils
 from prime_backup.action.helpers.blob_pre_calc_result import BlobPrecalculateResult
 from prime_backup.action.helpers.blob_recorder import BlobRecorder
+from prime_backup.action.helpers.chunk_grouper import ChunkGrouper
+from prime_backup.action.helpers.compress_prober import CompressProber
 from prime_backup.action.helpers.create_backup_utils import CreateBackupTimeCostKey
 from prime_backup.db import schema
 from prime_backup.db.session import DbSession
@@ -23,6 +26,7 @@ from prime_backup.utils.time_cost_stats import TimeCostStats
 
 if TYPE_CHECKING:
 	from prime_backup.action.helpers.pack_writer import PackWriter
+	from prime_backup.utils.thread_pool import FailFastBlockingThreadPool
 
 _T = TypeVar('_T')
 
@@ -45,7 +49,17 @@ class LookupBlobByHashRequest:
 	hash: str
 
 
-BlobLookupRequest = Union[LookupBlobBySizeRequest, LookupBlobByHashRequest]
+@dataclasses.dataclass(frozen=True)
+class LookupChunkByHashRequest:
+	hash: str
+
+
+@dataclasses.dataclass(frozen=True)
+class WaitBlobWriteRequest:
+	future: 'Future[_BlobWriteJobOutcome]'
+
+
+BlobLookupRequest = Union[LookupBlobBySizeRequest, LookupBlobByHashRequest, LookupChunkByHashRequest, WaitBlobWriteRequest]
 BlobLookupRoutine = Generator[BlobLookupRequest, None, _T]
 
 
@@ -89,6 +103,25 @@ class _FailureFileDeleter(ContextManager['_FailureFileDeleter']):
 				create_backup_utils.remove_file(file_path, what=self.what)
 
 
+@dataclasses.dataclass(frozen=True)
+class _BlobWriteJobOutcome(Generic[_T]):
+	value: Optional[_T] = None
+	error: Optional[Exception] = None
+
+	@classmethod
+	def run(cls, job: Callable[[], _T]) -> '_BlobWriteJobOutcome[_T]':
+		# errors like BlobFileChanged are expected, they should be raised in the scheduler thread, not in the pool
+		try:
+			return cls(value=job())
+		except Exception as e:
+			return cls(error=e)
+
+	def get(self) -> _T:
+		if self.error is not None:
+			raise self.error
+		return self.value  # type: ignore
+
+
 @dataclasses.dataclass
 class BlobCreateContext:
 	session: DbSession
@@ -99,8 +132,13 @@ class BlobCreateContext:
 	pack_writer: 'PackWriter'
 	blob_by_size_cache: Dict[int, bool]
 	blob_by_hash_cache: Dict[str, schema.Blob]
+	chunk_by_hash_cache: Dict[str, ChunkGrouper.ChunkLike]
+	compress_prober: CompressProber
 	blob_store_st: Optional[os.stat_result] = None
 	blob_store_in_cow_fs: Optional[bool] = None
+	blob_write_pool: Optional['FailFastBlockingThreadPool'] = None
+	pending_blob_writes_by_hash: Dict[str, 'Future[_BlobWriteJobOutcome]'] = dataclasses.field(default_factory=dict)
+	pending_blob_writes_by_size: Dict[int, 'Future[_BlobWriteJobOutcome]'] = dataclasses.field(default_factory=dict)
 
 	@contextlib.contextmanager
 	def make_temp_file(self, src_path_md5: str) -> Generator[Path, None, None]:
@@ -118,6 +156,9 @@ class BlobCreateContext:
 		self.blob_by_size_cache[blob.raw_size] = True
 		self.blob_by_hash_cache[blob.hash] = blob
 
+	def remember_chunk(self, chunk: ChunkGrouper.ChunkLike):
+		self.chunk_by_hash_cache[chunk.hash] = chunk
+
 
 class BlobCreatorBase(ABC):
 	def __init__(self, context: BlobCreateContext):
@@ -132,14 +173,63 @@ class BlobCreatorBase(ABC):
 		(self.logger.warning if last_chance else self.logger.debug)(msg)
 		raise BlobFileChanged(msg)
 
-	def query_cached_blob(self, blob_hash: str) -> BlobLookupRoutine[Optional[schema.Blob]]:
-		if (cache := self.ctx.get_cached_blob(blob_hash)) is not None:
-			return cache
-		yield LookupBlobByHashRequest(blob_hash)
-		return self.ctx.get_cached_blob(blob_hash)
+	def wait_pending_blob_write_by_size(self, blob_size: int) -> BlobLookupRoutine[None]:
+		# a pending blob write with only its size known (the hash_once policy) might produce the blob we want
+		while (future := self.ctx.pending_blob_writes_by_size.get(blob_size)) is not None:
+			yield WaitBlobWriteRequest(future)
+
+	def query_cached_blob(self, blob_hash: str, blob_size: int) -> BlobLookupRoutine[Optional[schema.Blob]]:
+		yield from self.wait_pending_blob_write_by_size(blob_size)
+		looked_up = False
+		while True:
+			if (cache := self.ctx.get_cached_blob(blob_hash)) is not None:
+				return cache
+			if (future := self.ctx.pending_blob_writes_by_hash.get(blob_hash)) is not None:
+				# another generator is writing the blob, wait for it, then check the cache again
+				yield WaitBlobWriteRequest(future)
+				continue
+			if looked_up:
+				return None
+			yield LookupBlobByHashRequest(blob_hash)
+			looked_up = True
 
 	def query_blob_size_exists(self, blob_size: int) -> BlobLookupRoutine[bool]:
+		yield from self.wait_pending_blob_write_by_size(blob_size)
 		if (exist := self.ctx.blob_by_size_cache.get(blob_size)) is not None:
 			return exist
 		yield LookupBlobBySizeRequest(blob_size)
 		return misc_utils.ensure_type(self.ctx.blob_by_size_cache[blob_size], bool)
+
+	def query_chunk_by_hash(self, chunk_hash: str) -> BlobLookupRoutine[Optional[ChunkGrouper.ChunkLike]]:
+		if (cache := self.ctx.chunk_by_hash_cache.get(chunk_hash)) is not None:
+			return cache
+		yield LookupChunkByHashRequest(chunk_hash)
+		# chunks created by other generators while we were waiting are remembered in the cache as well
+		return self.ctx.chunk_by_hash_cache.get(chunk_hash)
+
+	def run_blob_write_job(self, job: Callable[[], _T], *, blob_hash: Optional[str] = None, blob_size: Optional[int] = None) -> BlobLookupRoutine[_T]:
+		"""
+		Run the blob write job in the blob write pool, or in the current thread if the pool is disabled.
+		While the job is running, the given blob hash / size is marked as pending,
+		so other generators that might create the same blob will wait for it instead of writing it again
+
+		:param job: The job to run. It must not access the DB session
+		:param blob_hash: The hash of the blob to be created, if known
+		:param blob_size: The raw size of the blob to be created, if its hash is unknown
+		"""
+		if (pool := self.ctx.blob_write_pool) is None:
+			return job()
+
+		future: 'Future[_BlobWriteJobOutcome[_T]]' = pool.submit(_BlobWriteJobOutcome.run, job)
+		if blob_hash is not None:
+			self.ctx.pending_blob_writes_by_hash[blob_hash] = future
+		if blob_size is not None:
+			self.ctx.pending_blob_writes_by_size[blob_size] = future
+		try:
+			yield WaitBlobWriteRequest(future)
+		finally:
+			if blob_hash is not None and self.ctx.pending_blob_writes_by_hash.get(blob_hash) is future:
+				self.ctx.pending_blob_writes_by_hash.pop(blob_hash)
+			if blob_size is not None and self.ctx.pending_blob_writes_by_size.get(blob_size) is future:
+				self.ctx.pending_blob_writes_by_size.pop(blob_size)
+		return future.result().get()
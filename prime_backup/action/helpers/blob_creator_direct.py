@@ -1,5 +1,6 @@
 import dataclasses
 import enum
+import functools
 import logging
 import os
 from pathlib import Path
@@ -32,7 +33,7 @@ _HASH_ONCE_SIZE_THRESHOLD = 10 * 1024 * 1024  # 10MiB
 @dataclasses.dataclass
 class _DirectBlobPlan:
 	policy: _DirectBlobCreatePolicy
-	compress_method: CompressMethod
+	compressor: Compressor
 	can_copy_on_write: bool
 	blob_hash: Optional[str]
 	blob_content: Optional[bytes]
@@ -40,6 +41,7 @@ class _DirectBlobPlan:
 
 @dataclasses.dataclass
 class _DirectBlobArtifact:
+	compressor: Compressor  # the actually used one, might be different from the planned one due to adaptive compression
 	blob_hash: str
 	raw_size: int
 	stored_size: int
@@ -55,8 +57,8 @@ class _DirectBlobCreateResult:
 		return cls(existing_blob=blob)
 
 	@classmethod
-	def created(cls, blob_hash: str, raw_size: int, stored_size: int) -> '_DirectBlobCreateResult':
-		return cls(artifact=_DirectBlobArtifact(blob_hash, raw_size, stored_size))
+	def created(cls, compressor: Compressor, blob_hash: str, raw_size: int, stored_size: int) -> '_DirectBlobCreateResult':
+		return cls(artifact=_DirectBlobArtifact(compressor, blob_hash, raw_size, stored_size))
 
 
 class DirectBlobCreator(BlobCreatorBase):
@@ -64,6 +66,7 @@ class DirectBlobCreator(BlobCreatorBase):
 	class Args:
 		src_path: Path
 		src_path_md5: str
+		rel_path: Optional[Path]  # relative to the source path
 		st: os.stat_result
 		last_chance: bool
 		is_mutating_file: bool
@@ -77,7 +80,8 @@ class DirectBlobCreator(BlobCreatorBase):
 
 		if plan.blob_hash is not None:
 			misc_utils.assert_true(plan.policy != _DirectBlobCreatePolicy.hash_once, 'unexpected policy')
-			if (cache := (yield from self.query_cached_blob(plan.blob_hash))) is not None:
+			blob_size = len(plan.blob_content) if plan.blob_content is not None else self.args.st.st_size
+			if (cache := (yield from self.query_cached_blob(plan.blob_hash, blob_size))) is not None:
 				return cache
 
 		create_result = yield from self.__create_blob_artifact(plan)
@@ -86,19 +90,18 @@ class DirectBlobCreator(BlobCreatorBase):
 		if (artifact := create_result.artifact) is None:
 			raise AssertionError()
 
-		self.ctx.blob_recorder.add_remove_file_rollbacker(blob_utils.get_blob_path(artifact.blob_hash))
 		return self.ctx.blob_recorder.create_blob(
 			self.ctx.session,
 			storage_method=BlobStorageMethod.direct.value,
 			hash=artifact.blob_hash,
-			compress=plan.compress_method.name,
+			compress=artifact.compressor.get_name(),
 			raw_size=artifact.raw_size,
 			stored_size=artifact.stored_size,
 		)
 
 	def __select_plan(self) -> BlobLookupRoutine[_DirectBlobPlan]:
-		compress_method: CompressMethod = self.config.backup.get_compress_method_from_size(self.args.st.st_size)
-		can_copy_on_write = self.__can_copy_on_write(self.args.st, compress_method)
+		compressor = self.config.backup.get_compressor(self.args.rel_path, self.args.st.st_size, concurrency=self.config.get_effective_concurrency())
+		can_copy_on_write = self.__can_copy_on_write(self.args.st, compressor.get_method())
 
 		policy: Optional[_DirectBlobCreatePolicy] = None
 		blob_hash: Optional[str] = None
@@ -130,7 +133,7 @@ class DirectBlobCreator(BlobCreatorBase):
 
 		return _DirectBlobPlan(
 			policy=policy,
-			compress_method=compress_method,
+			compressor=compressor,
 			can_copy_on_write=can_copy_on_write,
 			blob_hash=blob_hash,
 			blob_content=blob_content,
@@ -163,36 +166,57 @@ class DirectBlobCreator(BlobCreatorBase):
 		return blob_content
 
 	def __create_blob_artifact(self, plan: _DirectBlobPlan) -> BlobLookupRoutine[_DirectBlobCreateResult]:
-		compressor = Compressor.create(plan.compress_method)
+		# notes: the hash_once and default policies are the heavy ones, they are run with run_blob_write_job(),
+		# which might run in the blob write pool, so they must not access the DB session
+		compressor = plan.compressor
 		if plan.policy == _DirectBlobCreatePolicy.copy_hash:
 			return (yield from self.__create_by_copy_hash(compressor))
 		if plan.policy == _DirectBlobCreatePolicy.hash_once:
-			return self.__create_by_hash_once(compressor, plan)
-		if plan.policy in (_DirectBlobCreatePolicy.read_all, _DirectBlobCreatePolicy.default):
+			job = functools.partial(self.__create_by_hash_once, compressor, plan)
+			return (yield from self.run_blob_write_job(job, blob_size=self.args.st.st_size))
+		if plan.policy == _DirectBlobCreatePolicy.default:
+			job = functools.partial(self.__create_by_prehashed_content, compressor, plan)
+			return (yield from self.run_blob_write_job(job, blob_hash=plan.blob_hash))
+		if plan.policy == _DirectBlobCreatePolicy.read_all:
+			# small files, not worth to be dispatched to the pool
 			return self.__create_by_prehashed_content(compressor, plan)
 		raise AssertionError('bad policy {!r}'.format(plan.policy))
 
+	def __probe_file(self, compressor: Compressor, file_path: Path) -> Compressor:
+		# notes: the probe costs an extra read and a trial compression, so only do it after the blob is known to be new.
+		#        This might be called in the blob write pool
+		with self.ctx.time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_io_read):
+			return self.ctx.compress_prober.probe_file(compressor, file_path, self.args.st.st_size)
+
+	def __on_blob_file_created(self, blob_path: Path):
+		# notes: this might be called in the blob write pool
+		self.ctx.blob_recorder.add_remove_file_rollbacker(blob_path)
+
 	def __create_by_copy_hash(self, compressor: Compressor) -> BlobLookupRoutine[_DirectBlobCreateResult]:
 		# copy to temp file, calc hash, then compress to blob store
 		with self.ctx.make_temp_file(self.args.src_path_md5) as temp_file_path, _FailureFileDeleter() as file_deleter:
 			with self.ctx.time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_io_copy), SourceFileNotFoundWrapper.wrap(self.args.src_path):
 				file_utils.copy_file_fast(self.args.src_path, temp_file_path)
 			with self.ctx.time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_io_read):
-				blob_hash = hash_utils.calc_file_hash(temp_file_path)
+				sah = hash_utils.calc_file_size_and_hash(temp_file_path)
+			blob_hash = sah.hash
 
 			misc_utils.assert_true(self.args.last_chance or self.args.is_mutating_file, 'only last_chance=True or is_mutating_file=True is allowed for the copy_hash policy')
-			if (cache := (yield from self.query_cached_blob(blob_hash))) is not None:
+			if (cache := (yield from self.query_cached_blob(blob_hash, sah.size))) is not None:
 				return _DirectBlobCreateResult.existing(cache)
 
 			blob_path = blob_utils.get_blob_path(blob_hash)
 			file_deleter.mark(blob_path)
+			compressor = self.__probe_file(compressor, temp_file_path)
 			with self.ctx.time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_io_copy):
 				cr = compressor.copy_compressed(temp_file_path, blob_path, calc_hash=False, estimate_read_size=self.args.st.st_size)
-			return _DirectBlobCreateResult.created(blob_hash, cr.read_size, cr.write_size)
+			self.__on_blob_file_created(blob_path)
+			return _DirectBlobCreateResult.created(compressor, blob_hash, cr.read_size, cr.write_size)
 
 	def __create_by_hash_once(self, compressor: Compressor, plan: _DirectBlobPlan) -> _DirectBlobCreateResult:
 		# read once, compress+hash to temp file, then move
 		misc_utils.assert_true(plan.blob_hash is None, 'blob_hash should not be calculated')
+		compressor = self.__probe_file(compressor, self.args.src_path)
 		with self.ctx.make_temp_file(self.args.src_path_md5) as temp_file_path, _FailureFileDeleter() as file_deleter:
 			with self.ctx.time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_io_copy):
 				cr = compressor.copy_compressed(self.args.src_path, temp_file_path, calc_hash=True, estimate_read_size=self.args.st.st_size, open_r_func=SourceFileNotFoundWrapper.open_rb)
@@ -212,7 +236,8 @@ class DirectBlobCreator(BlobCreatorBase):
 				# the temp file will be deleted automatically
 				with self.ctx.time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_io_copy):
 					file_utils.copy_file_fast(temp_file_path, blob_path)
-			return _DirectBlobCreateResult.created(blob_hash, cr.read_size, cr.write_size)
+			self.__on_blob_file_created(blob_path)
+			return _DirectBlobCreateResult.created(compressor, blob_hash, cr.read_size, cr.write_size)
 
 	def __create_by_prehashed_content(self, compressor: Compressor, plan: _DirectBlobPlan) -> _DirectBlobCreateResult:
 		misc_utils.assert_true(plan.blob_hash is not None, 'blob_hash is None')
@@ -225,19 +250,24 @@ class DirectBlobCreator(BlobCreatorBase):
 			if plan.policy == _DirectBlobCreatePolicy.read_all:
 				misc_utils.assert_true(plan.blob_content is not None, 'blob_content is None')
 				blob_content = misc_utils.ensure_type(plan.blob_content, bytes)
-				return self.__write_read_all_blob(blob_hash, blob_path, compressor, blob_content)
-			if plan.policy == _DirectBlobCreatePolicy.default:
-				return self.__write_default_blob(blob_hash, blob_path, compressor, plan)
-			raise AssertionError('bad policy {!r}'.format(plan.policy))
+				result = self.__write_read_all_blob(blob_hash, blob_path, compressor, blob_content)
+			elif plan.policy == _DirectBlobCreatePolicy.default:
+				result = self.__write_default_blob(blob_hash, blob_path, compressor, plan)
+			else:
+				raise AssertionError('bad policy {!r}'.format(plan.policy))
+		self.__on_blob_file_created(blob_path)
+		return result
 
 	def __write_read_all_blob(self, blob_hash: str, blob_path: Path, compressor: Compressor, blob_content: bytes) -> _DirectBlobCreateResult:
+		# the content is in memory already, so the trial compression is the real one
+		compressor, compressed = self.ctx.compress_prober.compress_bytes(compressor, blob_content)
 		with self.ctx.time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_io_write):
-			with compressor.open_compressed_bypassed(blob_path) as (writer, f):
-				f.write(blob_content)
-		return _DirectBlobCreateResult.created(blob_hash, len(blob_content), writer.get_write_len())
+			with open(blob_path, 'wb') as f:
+				f.write(compressed)
+		return _DirectBlobCreateResult.created(compressor, blob_hash, len(blob_content), len(compressed))
 
 	def __write_default_blob(self, blob_hash: str, blob_path: Path, compressor: Compressor, plan: _DirectBlobPlan) -> _DirectBlobCreateResult:
-		if plan.can_copy_on_write and plan.compress_method == CompressMethod.plain:
+		if plan.can_copy_on_write and plan.compressor.get_method() == CompressMethod.plain:
 			# fast copy, then calc size and hash to verify
 			with self.ctx.time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_io_copy), SourceFileNotFoundWrapper.wrap(self.args.src_path):
 				file_utils.copy_file_fast(self.args.src_path, blob_path)
@@ -246,12 +276,13 @@ class DirectBlobCreator(BlobCreatorBase):
 			raw_size = stored_size = actual_sah.size
 		else:
 			# copy+compress+hash to blob store
+			compressor = self.__probe_file(compressor, self.args.src_path)
 			with self.ctx.time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_io_copy):
 				cr = compressor.copy_compressed(self.args.src_path, blob_path, calc_hash=True, estimate_read_size=self.args.st.st_size, open_r_func=SourceFileNotFoundWrapper.open_rb)
 			raw_size, stored_size = cr.read_size, cr.write_size
 			actual_sah = SizeAndHash(cr.read_size, misc_utils.ensure_type(cr.read_hash, str))
 		self.__check_changes(blob_hash, actual_sah.size, actual_sah.hash)
-		return _DirectBlobCreateResult.created(blob_hash, raw_size, stored_size)
+		return _DirectBlobCreateResult.created(compressor, blob_hash, raw_size, stored_size)
 
 	def __check_changes(self, blob_hash: Optional[str], new_size: int, new_hash: Optional[str]):
 		if new_size != self.args.st.st_size:
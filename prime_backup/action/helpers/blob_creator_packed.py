@@ -0,0 +1,113 @@
+import dataclasses
+import logging
+import os
+from pathlib import Path
+from typing import Optional, Tuple
+
+from prime_backup.action.helpers.blob_creator_common import BlobLookupRoutine, BlobCreateContext, BlobCreatorBase
+from prime_backup.action.helpers.blob_pre_calc_result import BlobPrecalculateResult
+from prime_backup.action.helpers.chunk_grouper import ChunkGrouper
+from prime_backup.action.helpers.create_backup_utils import CreateBackupTimeCostKey, SourceFileNotFoundWrapper
+from prime_backup.compressors import CompressMethod
+from prime_backup.db import schema
+from prime_backup.db.values import BlobStorageMethod
+from prime_backup.utils import hash_utils
+
+
+class PackedBlobCreator(BlobCreatorBase):
+	"""
+	Stores a small blob as a single pack entry, i.e. a chunk whose hash is the same as the blob hash.
+	The compress method is recorded at the chunk level, the compress field of the blob is always plain.
+	The whole file is read into memory, so the content is consistent even if the file keeps changing
+	"""
+
+	@dataclasses.dataclass(frozen=True)
+	class Args:
+		src_path: Path
+		rel_path: Optional[Path]  # relative to the source path
+		st: os.stat_result
+		max_size: int
+		last_chance: bool
+		is_mutating_file: bool
+
+	def __init__(self, context: BlobCreateContext, args: Args):
+		super().__init__(context)
+		self.args = args
+
+	def get_or_create(self) -> BlobLookupRoutine[schema.Blob]:
+		pre_calc_blob_hash = self.__get_pre_calc_blob_hash()
+		if pre_calc_blob_hash is not None:
+			if (cache := (yield from self.query_cached_blob(pre_calc_blob_hash, self.args.st.st_size))) is not None:
+				return cache
+
+		blob_content = self.__read_file()
+		blob_hash = hash_utils.calc_bytes_hash(blob_content)
+		if pre_calc_blob_hash is not None and pre_calc_blob_hash != blob_hash:
+			self.log_and_raise_blob_file_changed('Blob hash mismatch, pre calc {}, read {}'.format(pre_calc_blob_hash, blob_hash), self.args.last_chance)
+		if pre_calc_blob_hash is None and (cache := (yield from self.query_cached_blob(blob_hash, len(blob_content)))) is not None:
+			return cache
+
+		# the blob hash is also the chunk hash, reuse the chunk if it already exists
+		chunk = yield from self.query_chunk_by_hash(blob_hash)
+
+		# notes: the following code cannot be interrupted (yield)
+		# another generator with the same content might have created the blob while we were waiting
+		if (cache := self.ctx.get_cached_blob(blob_hash)) is not None:
+			return cache
+		if chunk is not None:
+			raw_size, stored_size = chunk.raw_size, chunk.stored_size
+		else:
+			raw_size, stored_size = self.__create_chunk(blob_hash, blob_content)
+
+		# keep the blob compress plain, so the chunk can be recompressed or moved to another pack without touching the blob
+		return self.ctx.blob_recorder.create_blob(
+			self.ctx.session,
+			storage_method=BlobStorageMethod.packed.value,
+			hash=blob_hash,
+			compress=CompressMethod.plain.name,
+			raw_size=raw_size,
+			stored_size=stored_size,
+		)
+
+	def __get_pre_calc_blob_hash(self) -> Optional[str]:
+		pre_cal_result: Optional[BlobPrecalculateResult] = self.ctx.file_lookup.pop_pre_calc_result(self.args.src_path)
+		if pre_cal_result is not None and (self.args.st.st_size != pre_cal_result.size or pre_cal_result.should_be_chunked is True):
+			if self.logger.isEnabledFor(logging.DEBUG):
+				self.logger.debug('Drop pre cal result for path {} due to stat mismatched, st.st_size {}, pre_cal_result {}'.format(
+					self.args.src_path, self.args.st.st_size, pre_cal_result.simple_repr(),
+				))
+			pre_cal_result = None
+		if self.args.last_chance or self.args.is_mutating_file:
+			return None
+		return pre_cal_result.hash if pre_cal_result is not None else None
+
+	def __read_file(self) -> bytes:
+		with self.ctx.time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_io_read):
+			with SourceFileNotFoundWrapper.open_rb(self.args.src_path, 'rb') as f:
+				blob_content = f.read(self.args.max_size + 1)
+		if len(blob_content) > self.args.max_size:
+			self.log_and_raise_blob_file_changed('Read too many bytes for packed blob, stat: {}, read: {}'.format(self.args.st.st_size, len(blob_content)), self.args.last_chance)
+		if len(blob_content) == 0:
+			self.log_and_raise_blob_file_changed('Blob size becomes zero', self.args.last_chance)
+		if len(blob_content) != self.args.st.st_size and not (self.args.last_chance or self.args.is_mutating_file):
+			self.log_and_raise_blob_file_changed('Blob size mismatch, previous: {}, current: {}'.format(self.args.st.st_size, len(blob_content)), self.args.last_chance)
+		return blob_content
+
+	def __create_chunk(self, blob_hash: str, blob_content: bytes) -> Tuple[int, int]:
+		compressor = self.config.backup.get_compressor(self.args.rel_path, len(blob_content), concurrency=self.config.get_effective_concurrency())
+		with self.ctx.time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_io_write):
+			compressor, compressed = self.ctx.compress_prober.compress_bytes(compressor, blob_content)
+			entry_location = self.ctx.pack_writer.write_entry(compressed)
+
+		self.ctx.blob_recorder.record_new_chunk_size(len(blob_content), len(compressed))
+		with self.ctx.time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_db):
+			chunk_ids = self.ctx.session.insert_chunks([{
+				'hash': blob_hash,
+				'compress': compressor.get_name(),
+				'raw_size': len(blob_content),
+				'stored_size': len(compressed),
+				'pack_id': entry_location.pack_id,
+				'pack_offset': entry_location.offset,
+			}])
+		self.ctx.remember_chunk(ChunkGrouper.ChunkLike(id=chunk_ids[blob_hash], hash=blob_hash, raw_size=len(blob_content), stored_size=len(compressed)))
+		return len(blob_content), len(compressed)
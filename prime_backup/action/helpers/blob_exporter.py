@@ -161,7 +161,7 @@ class BlobExporter:
 	def export_to_fs(self, output_path: Path):
 		if self.blob.storage_method == BlobStorageMethod.direct:
 			self.__export_to_fs_direct(output_path)
-		elif self.blob.storage_method == BlobStorageMethod.chunked:
+		elif self.blob.storage_method in (BlobStorageMethod.chunked, BlobStorageMethod.packed):
 			self.__export_to_fs_chunked(output_path)
 		else:
 			raise ValueError('unsupported blob storage method {}'.format(self.blob.storage_method))
@@ -206,7 +206,7 @@ class BlobExporter:
 	def export_as_reader(self, reader_csm: Callable[[SupportsReadBytes], Any]):
 		if self.blob.storage_method == BlobStorageMethod.direct:
 			self.__export_as_reader_direct(reader_csm)
-		elif self.blob.storage_method == BlobStorageMethod.chunked:
+		elif self.blob.storage_method in (BlobStorageMethod.chunked, BlobStorageMethod.packed):
 			self.__export_as_reader_chunked(reader_csm)
 		else:
 			raise ValueError('unsupported blob storage method {}'.format(self.blob.storage_method))
@@ -0,0 +1,88 @@
+import collections
+import contextlib
+import io
+import stat
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, List, Optional, Generator, Tuple, Deque
+
+from prime_backup.action.helpers.blob_exporter import BlobExporter
+from prime_backup.db.rows import FileRow
+from prime_backup.utils import file_utils, misc_utils
+from prime_backup.utils.io_types import SupportsReadBytes
+
+
+class BlobPrefetcher:
+	"""
+	Read-ahead for single-writer exports, e.g. tar and zip
+
+	Upcoming regular files are decompressed and verified by a thread pool into memory, while the consumer
+	iterates the files in their original order. The total size of the prefetched data is bounded.
+	Blobs larger than the per-blob limit are not prefetched, the consumer streams them by itself
+	"""
+	DEFAULT_MAX_BUFFER_SIZE = 64 * 1024 * 1024
+	DEFAULT_MAX_BLOB_SIZE = 4 * 1024 * 1024
+	MAX_WINDOW_LENGTH = 4096
+
+	def __init__(
+			self, name: str, blob_exporter_factory: Callable[[FileRow], BlobExporter], max_workers: int, *,
+			max_buffer_size: int = DEFAULT_MAX_BUFFER_SIZE, max_blob_size: int = DEFAULT_MAX_BLOB_SIZE,
+	):
+		self.name = name
+		self.blob_exporter_factory = blob_exporter_factory
+		self.max_workers = max_workers
+		self.max_buffer_size = max_buffer_size
+		self.max_blob_size = min(max_blob_size, max_buffer_size)
+
+	def __should_prefetch(self, file: FileRow) -> bool:
+		return stat.S_ISREG(file.mode) and file.blob_raw_size is not None and file.blob_raw_size <= self.max_blob_size
+
+	def __read_blob(self, file: FileRow) -> bytes:
+		buf = io.BytesIO()
+
+		def reader_csm(reader: SupportsReadBytes):
+			file_utils.copy_file_obj_fast(reader, buf, estimate_read_size=file.blob_raw_size or 0)
+
+		# the exporter verifies the data when the reader reaches the end
+		self.blob_exporter_factory(file).export_as_reader(reader_csm)
+		return buf.getvalue()
+
+	def iterate(self, files: List[FileRow]) -> Generator[Tuple[FileRow, Optional['Future[bytes]']], None, None]:
+		"""
+		Yields (file, future) in the order of the given files.
+		The future is None if the file is not prefetched. Its result is the raw content of the blob,
+		or it raises the exception that occurred during the read
+		"""
+		with contextlib.ExitStack() as es:
+			pool = es.enter_context(ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=misc_utils.make_thread_name(self.name)))
+			window: Deque[Tuple[FileRow, Optional['Future[bytes]']]] = collections.deque()
+			buffered_size = 0
+			next_idx = 0
+
+			@es.callback
+			def cancel_pending():
+				for _, future_ in window:
+					if future_ is not None:
+						future_.cancel()
+
+			while True:
+				# keep the workers busy, as long as the buffer has room for the upcoming files
+				while next_idx < len(files) and len(window) < self.MAX_WINDOW_LENGTH:
+					file = files[next_idx]
+					if not self.__should_prefetch(file):
+						window.append((file, None))
+					else:
+						size = file.blob_raw_size or 0
+						if len(window) > 0 and buffered_size + size > self.max_buffer_size:
+							break
+						buffered_size += size
+						window.append((file, pool.submit(self.__read_blob, file)))
+					next_idx += 1
+
+				if len(window) == 0:
+					break
+				file, future = window.popleft()
+				try:
+					yield file, future
+				finally:
+					if future is not None:
+						buffered_size -= file.blob_raw_size or 0
@@ -0,0 +1,93 @@
+import dataclasses
+import threading
+from pathlib import Path
+from typing import Tuple, Union
+
+from prime_backup.action.helpers.create_backup_utils import SourceFileNotFoundWrapper
+from prime_backup.compressors import Compressor, CompressMethod
+
+
+@dataclasses.dataclass
+class CompressProbeStats:
+	probe_count: int = 0
+	incompressible_count: int = 0
+	incompressible_raw_size: int = 0
+
+	def get_hit_rate(self) -> float:
+		return self.incompressible_count / self.probe_count if self.probe_count > 0 else 0.0
+
+
+class CompressProber:
+	"""
+	Detects incompressible data, e.g. the already-compressed chunk payloads in region files,
+	by trial-compressing its leading bytes. Data that does not shrink enough is stored with the plain method,
+	which saves CPU in both backup creation and restoration
+
+	Thread-safe, it might be used in the chunk compress pool
+	"""
+
+	def __init__(self):
+		from prime_backup.config.config import Config
+		config = Config.get()
+		self.enabled = config.backup.adaptive_compress_enabled
+		self.sample_size = config.backup.adaptive_compress_sample_size
+		self.ratio_threshold = config.backup.adaptive_compress_ratio_threshold
+
+		self.__stats = CompressProbeStats()
+		self.__stats_lock = threading.Lock()
+
+	def __should_probe(self, compressor: Compressor) -> bool:
+		return self.enabled and compressor.get_method() != CompressMethod.plain
+
+	def __is_incompressible(self, raw_size: int, compressed_size: int) -> bool:
+		return compressed_size > raw_size * self.ratio_threshold
+
+	def __record(self, incompressible: bool, raw_size: int):
+		with self.__stats_lock:
+			self.__stats.probe_count += 1
+			if incompressible:
+				self.__stats.incompressible_count += 1
+				self.__stats.incompressible_raw_size += raw_size
+
+	def probe_file(self, compressor: Compressor, file_path: Path, file_size: int) -> Compressor:
+		"""
+		Trial-compresses the leading bytes of the given file
+
+		:return: The compressor to be used to store the file
+		"""
+		if not self.__should_probe(compressor) or file_size <= 0:
+			return compressor
+		with SourceFileNotFoundWrapper.open_rb(file_path, 'rb') as f:
+			sample = f.read(self.sample_size)
+		if len(sample) == 0:
+			return compressor
+
+		incompressible = self.__is_incompressible(len(sample), len(compressor.compress_bytes(sample)))
+		self.__record(incompressible, file_size)
+		return Compressor.create(CompressMethod.plain) if incompressible else compressor
+
+	def compress_bytes(self, compressor: Compressor, data: Union[bytes, memoryview]) -> Tuple[Compressor, bytes]:
+		"""
+		Compresses the given in-memory data, or leaves it as-is if it's incompressible.
+		The data is compressed only once, and the result of it is used as the probe result
+
+		:return: A tuple of the compressor that was actually used, and the stored data
+		"""
+		if not self.__should_probe(compressor) or len(data) == 0:
+			return compressor, compressor.compress_bytes(data)
+
+		compressed = compressor.compress_bytes(data)
+		incompressible = self.__is_incompressible(len(data), len(compressed))
+		self.__record(incompressible, len(data))
+		if incompressible:
+			return self.__plain_compress_bytes(data)
+		return compressor, compressed
+
+	@classmethod
+	def __plain_compress_bytes(cls, data: Union[bytes, memoryview]) -> Tuple[Compressor, bytes]:
+		compressor = Compressor.create(CompressMethod.plain)
+		return compressor, compressor.compress_bytes(data)
+
+	def get_stats(self) -> CompressProbeStats:
+		with self.__stats_lock:
+			return dataclasses.replace(self.__stats)
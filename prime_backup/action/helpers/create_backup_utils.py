@@ -17,6 +17,7 @@ class CreateBackupTimeCostKey(enum.Enum):
 	kind_io_copy = enum.auto()
 
 	stage_scan_files = enum.auto()
+	stage_snapshot_source = enum.auto()
 	stage_reuse_unchanged_files = enum.auto()
 	stage_pre_calculate_hash = enum.auto()
 	stage_prepare_blob_store = enum.auto()
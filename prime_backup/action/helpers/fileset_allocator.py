@@ -5,6 +5,7 @@ from typing import List, Optional, Dict, Tuple, Iterable, TYPE_CHECKING
 from typing_extensions import Self
 
 from prime_backup import logger
+from prime_backup.action.helpers.fileset_fingerprint import FilesetFingerprint
 from prime_backup.db import schema
 from prime_backup.db.session import DbSession
 from prime_backup.db.values import FileRole
@@ -29,7 +30,9 @@ def _sum_file_sizes(files: Iterable[schema.File]) -> Tuple[int, int]:
 
 
 class FilesetAllocateArgsDefaults:
-	candidate_select_count: int = 2
+	candidate_select_count: int = 32
+	candidate_verify_count: int = 3
+	fingerprint_calc_limit: int = 2
 	candidate_max_changes_ratio: float = 0.2
 	max_delta_ratio: float = 1.5
 	max_base_reuse_count: int = 100
@@ -38,6 +41,8 @@ class FilesetAllocateArgsDefaults:
 @dataclasses.dataclass(frozen=True)
 class FilesetAllocateArgs:
 	candidate_select_count: int = dataclasses.field(default_factory=lambda: FilesetAllocateArgsDefaults.candidate_select_count)
+	candidate_verify_count: int = dataclasses.field(default_factory=lambda: FilesetAllocateArgsDefaults.candidate_verify_count)
+	fingerprint_calc_limit: int = dataclasses.field(default_factory=lambda: FilesetAllocateArgsDefaults.fingerprint_calc_limit)
 	candidate_max_changes_ratio: float = dataclasses.field(default_factory=lambda: FilesetAllocateArgsDefaults.candidate_max_changes_ratio)
 	max_delta_ratio: float = dataclasses.field(default_factory=lambda: FilesetAllocateArgsDefaults.max_delta_ratio)
 	max_base_reuse_count: int = dataclasses.field(default_factory=lambda: FilesetAllocateArgsDefaults.max_base_reuse_count)
@@ -94,6 +99,12 @@ class FilesetAllocator:
 			self.__fileset_files_cache.set(fileset_id, files)
 		return files
 
+	def __calc_fileset_fingerprint(self, fileset: schema.Fileset) -> FilesetFingerprint:
+		# for filesets created before fingerprints were introduced, or whose fingerprint was cleared
+		fingerprint = FilesetFingerprint.of(self.__get_fileset_files(fileset.id))
+		fileset.fingerprint = fingerprint.to_bytes()
+		return fingerprint
+
 	def allocate(self, args: FilesetAllocateArgs) -> FilesetAllocateResult:
 		@dataclasses.dataclass(frozen=True)
 		class Candidate:
@@ -104,17 +115,36 @@ class FilesetAllocator:
 
 		c: Optional[Candidate] = None
 		file_by_path = self.__get_file_by_path(self.files)
+		fingerprint = FilesetFingerprint.of(self.files)
+		max_changes = len(file_by_path) * args.candidate_max_changes_ratio
 
+		# score the candidates with their fingerprints, then only calculate the actual delta of the best few ones
+		scored_candidates: List[Tuple[int, schema.Fileset]] = []
+		fingerprint_calc_count = 0
 		for c_fileset in self.session.get_last_n_base_fileset(limit=args.candidate_select_count):
-			c_fileset_files = self.__get_fileset_files(c_fileset.id)
-			c_file_by_path = self.__get_file_by_path(c_fileset_files)
-			delta = self.__calc_delta(old=c_file_by_path, new=file_by_path)
-			self.logger.debug('Selecting fileset base candidate: id={} delta_size={}'.format(c_fileset.id, delta.size()))
 			if c_fileset.id <= 0 or c_fileset.base_id < 0:
 				# should never happen, but just in case
 				self.logger.error('Skipping corrupt fileset with id {}. Please validate the healthiness of the database'.format(c_fileset.id))
 				continue
-			if delta.size() < len(file_by_path) * args.candidate_max_changes_ratio and (c is None or delta.size() < c.delta_size):
+			if (c_fingerprint := FilesetFingerprint.from_bytes(c_fileset.fingerprint)) is None:
+				# calculating a fingerprint needs all files of the fileset, so only do a few of them in each allocation
+				if fingerprint_calc_count >= args.fingerprint_calc_limit:
+					self.logger.debug('Skipping fileset base candidate without fingerprint: id={}'.format(c_fileset.id))
+					continue
+				fingerprint_calc_count += 1
+				c_fingerprint = self.__calc_fileset_fingerprint(c_fileset)
+			estimated_changes = fingerprint.estimate_changes(len(self.files), c_fingerprint, c_fileset.file_object_count)
+			self.logger.debug('Scoring fileset base candidate: id={} estimated_changes={}'.format(c_fileset.id, estimated_changes))
+			# a changed file is counted twice in the estimation
+			if estimated_changes / 2 < max_changes:
+				scored_candidates.append((estimated_changes, c_fileset))
+
+		scored_candidates.sort(key=lambda sc: (sc[0], -sc[1].id))  # prefer the newer one on tie
+		for _, c_fileset in scored_candidates[:max(1, args.candidate_verify_count)]:
+			c_file_by_path = self.__get_file_by_path(self.__get_fileset_files(c_fileset.id))
+			delta = self.__calc_delta(old=c_file_by_path, new=file_by_path)
+			self.logger.debug('Checking fileset base candidate: id={} delta_size={}'.format(c_fileset.id, delta.size()))
+			if delta.size() < max_changes and (c is None or delta.size() < c.delta_size):
 				c = Candidate(c_fileset, c_file_by_path, delta, delta.size())
 
 		if c is not None:
@@ -146,6 +176,7 @@ class FilesetAllocator:
 				file_count=len(self.files),
 				file_raw_size_sum=rss,
 				file_stored_size_sum=sss,
+				fingerprint=fingerprint.to_bytes(),
 			)
 			self.session.flush()  # this generates fileset_base.id
 
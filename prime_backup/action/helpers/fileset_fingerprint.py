@@ -0,0 +1,60 @@
+import dataclasses
+import hashlib
+import heapq
+import struct
+from typing import Iterable, Optional, Tuple
+
+from typing_extensions import Self
+
+from prime_backup.db import schema
+
+
+@dataclasses.dataclass(frozen=True)
+class FilesetFingerprint:
+	"""
+	A compact summary of the files in a fileset, for estimating the similarity of filesets without loading their files
+
+	It's a bottom-k sketch, i.e. the k smallest 64-bit hashes of the files, where a file is hashed with all the fields
+	that are used by the fileset allocator to tell whether 2 files are the same
+	"""
+	SKETCH_SIZE = 256
+
+	hashes: Tuple[int, ...]  # sorted, at most SKETCH_SIZE elements
+
+	@classmethod
+	def __hash_file(cls, file: schema.File) -> int:
+		key = repr((file.path, file.mode, file.content, file.blob_hash, file.uid, file.gid, file.mtime, file.mtime_ns_part))
+		return int.from_bytes(hashlib.blake2b(key.encode('utf8'), digest_size=8).digest(), 'big')
+
+	@classmethod
+	def of(cls, files: Iterable[schema.File]) -> Self:
+		return cls(tuple(heapq.nsmallest(cls.SKETCH_SIZE, set(map(cls.__hash_file, files)))))
+
+	@classmethod
+	def from_bytes(cls, data: Optional[bytes]) -> Optional[Self]:
+		if data is None or len(data) % 8 != 0:
+			return None
+		return cls(struct.unpack('>{}Q'.format(len(data) // 8), data))
+
+	def to_bytes(self) -> bytes:
+		return struct.pack('>{}Q'.format(len(self.hashes)), *self.hashes)
+
+	def estimate_jaccard(self, other: 'FilesetFingerprint') -> float:
+		"""
+		:return: The estimated Jaccard similarity of the 2 file sets. It's exact if both sets have no more than SKETCH_SIZE files
+		"""
+		a, b = set(self.hashes), set(other.hashes)
+		union = heapq.nsmallest(self.SKETCH_SIZE, a | b)
+		if len(union) == 0:
+			return 1.0
+		return sum(1 for h in union if h in a and h in b) / len(union)
+
+	def estimate_changes(self, self_file_count: int, other: 'FilesetFingerprint', other_file_count: int) -> int:
+		"""
+		:return: The estimated size of the symmetric difference of the 2 file sets.
+			A changed file counts twice, so the actual added + changed + removed file count is within [result / 2, result]
+		"""
+		jaccard = self.estimate_jaccard(other)
+		total = self_file_count + other_file_count
+		intersection = min(jaccard * total / (1 + jaccard), self_file_count, other_file_count)
+		return max(0, round(total - 2 * intersection))
@@ -1,7 +1,7 @@
 import dataclasses
 import logging
 from pathlib import Path
-from typing import BinaryIO, Optional, List
+from typing import BinaryIO, Dict, Optional, List
 
 from prime_backup.constants import pack_constants
 from prime_backup.db import schema
@@ -57,6 +57,7 @@ class PackWriter:
 
 		self.__active: Optional[_ActivePack] = None
 		self.__new_pack_paths: List[Path] = []
+		self.__new_packs_by_id: Dict[int, schema.Pack] = {}
 		self.__created_pack_size = 0
 
 	def get_rollback_paths(self) -> List[Path]:
@@ -77,6 +78,17 @@ class PackWriter:
 			return self.__write_dedicated_reader(reader, size)
 		return self.__write_active_reader(reader, size)
 
+	def discard_entry(self, pack_id: int, size: int):
+		"""
+		Mark an entry written by this writer as dead, e.g. when the chunk it stores turns out to be unneeded.
+		The space of the entry will be reclaimed by pack compaction
+		"""
+		pack = self.__new_packs_by_id.get(pack_id)
+		if pack is None:
+			raise KeyError('pack {} is not created by this writer'.format(pack_id))
+		pack.live_size -= size
+		pack.live_entry_count -= 1
+
 	@staticmethod
 	def __should_write_dedicated(size: int) -> bool:
 		return size >= pack_constants.PACK_DEDICATED_ENTRY_MIN_SIZE
@@ -146,6 +158,7 @@ class PackWriter:
 		pack_path.parent.mkdir(parents=True, exist_ok=True)
 		fh = open(pack_path, 'wb')
 		self.__new_pack_paths.append(pack_path)
+		self.__new_packs_by_id[new_pack.id] = new_pack
 		return _ActivePack(new_pack, fh)
 
 	def __open_new_active(self):
@@ -1,10 +1,11 @@
 import logging
 import threading
 import time
-from typing import Optional
+from typing import Optional, Union
 
 from prime_backup import logger
 from prime_backup.db import schema
+from prime_backup.db.rows import FileRow
 from prime_backup.types.units import ByteCount
 
 
@@ -47,5 +48,5 @@ class SizeProgressReporter:
 		if log_msg is not None:
 			self.logger.info(log_msg)
 
-	def on_one_file_done(self, file: schema.File):
+	def on_one_file_done(self, file: Union[schema.File, FileRow]):
 		self.on_one_done(file.blob_raw_size or 0)
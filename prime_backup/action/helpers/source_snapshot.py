@@ -0,0 +1,144 @@
+import dataclasses
+import logging
+import os
+import shutil
+import stat
+from concurrent.futures import Future
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from prime_backup.action.helpers.create_backup_utils import CreateBackupTimeCostKey, SourceFileNotFoundWrapper
+from prime_backup.exceptions import UnsupportedFileFormat
+from prime_backup.utils import file_utils
+from prime_backup.utils.thread_pool import FailFastBlockingThreadPool
+from prime_backup.utils.time_cost_stats import TimeCostStats
+
+
+@dataclasses.dataclass(frozen=True)
+class SourceSnapshotEntry:
+	path: Path  # full path, inside the snapshot directory
+	stat: os.stat_result
+
+
+class SourceSnapshot:
+	"""
+	A point-in-time copy of the backup source files, placed inside the temp directory.
+	Regular files are copied with copy-on-write if the file system supports it, otherwise they are fully copied.
+	File mode, mtime and owner (if permitted) are kept, so the snapshot stats look the same as the source ones
+	"""
+
+	DIR_NAME_PREFIX = 'source_snapshot'
+
+	def __init__(self, source_path: Path, temp_path: Path, time_costs: TimeCostStats[CreateBackupTimeCostKey]):
+		from prime_backup import logger
+		from prime_backup.config.config import Config
+		self.logger: logging.Logger = logger.get()
+		self.config: Config = Config.get()
+
+		self.__source_path = source_path
+		self.__temp_path = temp_path
+		self.__snapshot_path = temp_path / '{}_{}'.format(self.DIR_NAME_PREFIX, os.getpid())
+		self.__time_costs = time_costs
+		self.__created_dirs: List[Path] = []
+		self.__chown_failed = False
+
+	@property
+	def path(self) -> Path:
+		return self.__snapshot_path
+
+	def __should_skip_missing_source_file(self, rel_path: Path) -> bool:
+		return self.config.backup.creation_skip_missing_file and self.config.backup.creation_skip_missing_file_patterns_spec.match_file(rel_path)
+
+	def __copy_owner(self, src_st: os.stat_result, dst_path: Path):
+		if not hasattr(os, 'chown') or self.__chown_failed:
+			return
+		dst_st = dst_path.lstat()
+		if (src_st.st_uid, src_st.st_gid) == (dst_st.st_uid, dst_st.st_gid):
+			return
+		try:
+			os.chown(dst_path, src_st.st_uid, src_st.st_gid, follow_symlinks=False)
+		except PermissionError as e:
+			self.__chown_failed = True
+			self.logger.warning('Failed to keep the file owner in the source snapshot, uid/gid of the snapshot files will be used: {}'.format(e))
+
+	def __copy_one(self, src_path: Path, dst_path: Path) -> Optional[os.stat_result]:
+		"""
+		Copies a non-directory file into the snapshot
+		:return: the stat of the copied file, or None if the file is gone and is allowed to be skipped
+		"""
+		try:
+			with SourceFileNotFoundWrapper.wrap(src_path):
+				src_st = src_path.lstat()
+				if stat.S_ISREG(src_st.st_mode):
+					file_utils.copy_file_fast(src_path, dst_path)
+				elif stat.S_ISLNK(src_st.st_mode):
+					os.symlink(os.readlink(src_path), dst_path)
+				else:
+					raise UnsupportedFileFormat(src_st.st_mode)
+				shutil.copystat(src_path, dst_path, follow_symlinks=False)
+		except SourceFileNotFoundWrapper as e:
+			if self.__should_skip_missing_source_file(src_path.relative_to(self.__source_path)):
+				self.logger.warning('Backup source file {!r} not found, suppressed and skipped by config'.format(str(e.file_path)))
+				return None
+			raise
+
+		self.__copy_owner(src_st, dst_path)
+		return dst_path.lstat()
+
+	def create(self, src_entries: List[Tuple[Path, os.stat_result]]) -> List[SourceSnapshotEntry]:
+		"""
+		:param src_entries: list of (full path, stat) of the files to snapshot. Parent directories must come before their children
+		:return: the snapshot entries, in the same order of the given source entries
+		"""
+		self.__temp_path.mkdir(parents=True, exist_ok=True)
+		for f in self.__temp_path.iterdir():
+			if f.name.startswith(self.DIR_NAME_PREFIX):
+				self.logger.warning('Removing existing undeleted source snapshot {}'.format(f))
+				self.__rm_snapshot_dir(f)
+		self.__snapshot_path.mkdir()
+		self.__created_dirs.append(self.__snapshot_path)
+		self.logger.debug('Creating source snapshot for {} files at {!r}'.format(len(src_entries), str(self.__snapshot_path)))
+
+		with self.__time_costs.measure_time_cost(CreateBackupTimeCostKey.kind_io_copy):
+			futures: List[Tuple[Path, os.stat_result, Path, Optional['Future[Optional[os.stat_result]]']]] = []
+			with FailFastBlockingThreadPool(name='snapshot') as pool:
+				for src_path, src_st in src_entries:
+					dst_path = self.__snapshot_path / src_path.relative_to(self.__source_path)
+					if stat.S_ISDIR(src_st.st_mode):
+						dst_path.mkdir()
+						self.__created_dirs.append(dst_path)
+						futures.append((src_path, src_st, dst_path, None))
+					else:
+						futures.append((src_path, src_st, dst_path, pool.submit(self.__copy_one, src_path, dst_path)))
+
+			# directory stats are applied at last, so their mtime will not be touched by their children
+			for src_path, src_st, dst_path, fut in reversed(futures):
+				if fut is None:
+					os.chmod(dst_path, stat.S_IMODE(src_st.st_mode))
+					os.utime(dst_path, ns=(src_st.st_atime_ns, src_st.st_mtime_ns))
+					self.__copy_owner(src_st, dst_path)
+
+		entries: List[SourceSnapshotEntry] = []
+		for src_path, src_st, dst_path, fut in futures:
+			dst_st = fut.result() if fut is not None else dst_path.lstat()
+			if dst_st is not None:
+				entries.append(SourceSnapshotEntry(dst_path, dst_st))
+		return entries
+
+	@classmethod
+	def __rm_snapshot_dir(cls, path: Path):
+		# the directory modes are copied from the source, make sure they are removable
+		for dir_path, _, _ in os.walk(path):
+			os.chmod(dir_path, stat.S_IRWXU)
+		file_utils.rm_rf(path, missing_ok=True)
+
+	def remove(self):
+		if len(self.__created_dirs) == 0:
+			return
+		try:
+			for dir_path in self.__created_dirs:
+				os.chmod(dir_path, stat.S_IRWXU)
+			file_utils.rm_rf(self.__snapshot_path, missing_ok=True)
+		except OSError as e:
+			self.logger.error('Remove source snapshot {!r} failed: {}'.format(str(self.__snapshot_path), e))
+		self.__created_dirs.clear()
@@ -11,7 +11,7 @@ from prime_backup.action.helpers.blob_recorder import BlobRecorder
 from prime_backup.action.helpers.chunk_grouper import ChunkGrouper
 from prime_backup.action.helpers.pack_writer import PackWriter
 from prime_backup.action.helpers.packed_backup_file_reader import PackedBackupFileReader, TarBackupReader, ZipBackupReader, PackedBackupFileMember, PackedBackupFileHolder
-from prime_backup.compressors import Compressor, CompressMethod
+from prime_backup.compressors import CompressMethod
 from prime_backup.constants.constants import BACKUP_META_FILE_NAME
 from prime_backup.db import schema
 from prime_backup.db.access import DbAccess
@@ -74,19 +74,18 @@ class ImportBackupAction(Action[BackupInfo]):
 			raise RuntimeError('pack writer is not initialized')
 		return self.__pack_writer
 
-	def __create_blob_file(self, file_reader: IO[bytes], sah: SizeAndHash) -> Tuple[int, CompressMethod]:
+	def __create_blob_file(self, file_path: str, file_reader: IO[bytes], sah: SizeAndHash) -> Tuple[int, CompressMethod]:
 		blob_path = blob_utils.get_blob_path(sah.hash)
 		self.__get_blob_recorder().add_remove_file_rollbacker(blob_path)
 
-		compress_method: CompressMethod = self.config.backup.get_compress_method_from_size(sah.size)
-		compressor = Compressor.create(compress_method)
+		compressor = self.config.backup.get_compressor(file_path, sah.size)
 		with compressor.open_compressed_bypassed(blob_path) as (writer, f):
 			file_utils.copy_file_obj_fast(file_reader, f, estimate_read_size=sah.size)
 
-		return writer.get_write_len(), compress_method
+		return writer.get_write_len(), compressor.get_method()
 
-	def __create_blob_direct(self, session: DbSession, file_reader: IO[bytes], sah: SizeAndHash) -> schema.Blob:
-		stored_size, compress_method = self.__create_blob_file(file_reader, sah)
+	def __create_blob_direct(self, session: DbSession, file_path: str, file_reader: IO[bytes], sah: SizeAndHash) -> schema.Blob:
+		stored_size, compress_method = self.__create_blob_file(file_path, file_reader, sah)
 		return self.__get_blob_recorder().create_blob(
 			session,
 			hash=sah.hash,
@@ -96,17 +95,16 @@ class ImportBackupAction(Action[BackupInfo]):
 			storage_method=BlobStorageMethod.direct.value,
 		)
 
-	def __create_chunk_entry(self, data: memoryview, sah: SizeAndHash) -> Tuple[int, CompressMethod, PackEntryLocation]:
+	def __create_chunk_entry(self, file_path: str, file_size: int, data: memoryview, sah: SizeAndHash) -> Tuple[int, CompressMethod, PackEntryLocation]:
 		if len(data) != sah.size:
 			raise ValueError()
-		compress_method: CompressMethod = self.config.backup.get_compress_method_from_size(sah.size)
-		compressor = Compressor.create(compress_method)
+		compressor = self.config.backup.get_compressor(file_path, file_size, data_size=sah.size)
 		compressed = compressor.compress_bytes(data)
 		entry_location = self.__get_pack_writer().write_entry(compressed)
-		return len(compressed), compress_method, entry_location
+		return len(compressed), compressor.get_method(), entry_location
 
-	def __create_chunk(self, session: DbSession, data: memoryview, sah: SizeAndHash) -> schema.Chunk:
-		stored_size, compress_method, entry_location = self.__create_chunk_entry(data, sah)
+	def __create_chunk(self, session: DbSession, file_path: str, file_size: int, data: memoryview, sah: SizeAndHash) -> schema.Chunk:
+		stored_size, compress_method, entry_location = self.__create_chunk_entry(file_path, file_size, data, sah)
 		chunk = session.create_chunk(
 			hash=sah.hash,
 			compress=compress_method.name,
@@ -118,13 +116,13 @@ class ImportBackupAction(Action[BackupInfo]):
 		self.__chunk_cache[sah.hash] = chunk
 		return chunk
 
-	def __create_blob_chunked(self, session: DbSession, file_reader: IO[bytes], chunk_method: ChunkMethod, pre_cal_result: BlobPrecalculateResult) -> schema.Blob:
+	def __create_blob_chunked(self, session: DbSession, file_path: str, file_reader: IO[bytes], chunk_method: ChunkMethod, pre_cal_result: BlobPrecalculateResult) -> schema.Blob:
 		new_db_chunks: List[schema.Chunk] = []
 		offset_to_db_chunk: Dict[int, schema.Chunk] = {}
 		offset = 0
 		for chunk in chunk_method.create_stream_chunker(file_reader, need_entire_file_hash=False).cut_with_data():
 			if (db_chunk := self.__chunk_cache.get(chunk.hash)) is None:
-				db_chunk = self.__create_chunk(session, chunk.data, SizeAndHash(chunk.length, chunk.hash))
+				db_chunk = self.__create_chunk(session, file_path, pre_cal_result.size, chunk.data, SizeAndHash(chunk.length, chunk.hash))
 				new_db_chunks.append(db_chunk)
 			offset_to_db_chunk[offset] = db_chunk
 			offset += chunk.length
@@ -148,12 +146,30 @@ class ImportBackupAction(Action[BackupInfo]):
 
 		return blob
 
+	def __create_blob_packed(self, session: DbSession, file_path: str, file_reader: IO[bytes], pre_cal_result: BlobPrecalculateResult) -> schema.Blob:
+		if (db_chunk := self.__chunk_cache.get(pre_cal_result.hash)) is None:
+			data = file_reader.read(pre_cal_result.size + 1)
+			db_chunk = self.__create_chunk(session, file_path, pre_cal_result.size, memoryview(data), SizeAndHash(pre_cal_result.size, pre_cal_result.hash))
+			self.__get_blob_recorder().record_new_chunk_size(db_chunk.raw_size, db_chunk.stored_size)
+			session.add(db_chunk)
+
+		return self.__get_blob_recorder().create_blob(
+			session,
+			hash=pre_cal_result.hash,
+			compress=CompressMethod.plain.name,
+			raw_size=db_chunk.raw_size,
+			stored_size=db_chunk.stored_size,
+			storage_method=BlobStorageMethod.packed.value,
+		)
+
 	def __create_blob(self, session: DbSession, file_path: str, file_reader: IO[bytes], pre_cal_result: BlobPrecalculateResult) -> schema.Blob:
 		chunk_method = ChunkMethod.get_for_file(Path(file_path), pre_cal_result.size)
 		if chunk_method is not None:
-			blob = self.__create_blob_chunked(session, file_reader, chunk_method, pre_cal_result)
+			blob = self.__create_blob_chunked(session, file_path, file_reader, chunk_method, pre_cal_result)
+		elif self.config.backup.should_pack_blob(pre_cal_result.size):
+			blob = self.__create_blob_packed(session, file_path, file_reader, pre_cal_result)
 		else:
-			blob = self.__create_blob_direct(session, file_reader, SizeAndHash(pre_cal_result.size, pre_cal_result.hash))
+			blob = self.__create_blob_direct(session, file_path, file_reader, SizeAndHash(pre_cal_result.size, pre_cal_result.hash))
 
 		self.__blob_cache[blob.hash] = blob
 		return blob
@@ -260,12 +276,20 @@ class ImportBackupAction(Action[BackupInfo]):
 				self.__blob_cache[h] = blob
 
 
-		for h, chunk in session.get_chunks_by_hashes_opt(collection_utils.deduplicated_list(
-			chunk_hash
+		packed_blob_hashes = [
+			res.hash
 			for res in pre_cal_dict.values()
-			if res.chunks is not None
-			for chunk_hash in res.chunks.iter_hashes()
-		)).items():
+			if not res.should_be_chunked and self.config.backup.should_pack_blob(res.size)
+		]
+		for h, chunk in session.get_chunks_by_hashes_opt(collection_utils.deduplicated_list([
+			*(
+				chunk_hash
+				for res in pre_cal_dict.values()
+				if res.chunks is not None
+				for chunk_hash in res.chunks.iter_hashes()
+			),
+			*packed_blob_hashes,
+		])).items():
 			if chunk is not None:
 				self.__chunk_cache[h] = chunk
 
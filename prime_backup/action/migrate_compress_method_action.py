@@ -2,7 +2,7 @@ import shutil
 import time
 from concurrent.futures import Future
 from pathlib import Path
-from typing import List, Tuple, Set, Dict
+from typing import List, Tuple, Set, Dict, Optional
 
 from typing_extensions import override
 
@@ -63,10 +63,24 @@ class MigrateCompressMethodAction(Action[SizeDiff]):
 				file_utils.copy_file_obj_fast(f_src, f_dst, estimate_read_size=estimate_read_size)
 			return writer.get_write_len()
 
+	def __create_new_compressor(self, new_compress_method: CompressMethod) -> Compressor:
+		level = self.config.backup.compress_level
+		if new_compress_method != self.new_compress_method or not self.__is_level_valid_for(new_compress_method, level):
+			level = None
+		return Compressor.create(new_compress_method, level)
+
+	@classmethod
+	def __is_level_valid_for(cls, compress_method: CompressMethod, level: Optional[int]) -> bool:
+		try:
+			compress_method.value.validate_level(level)
+		except ValueError:
+			return False
+		return True
+
 	def __migrate_single_direct_blob(self, blob: schema.Blob) -> bool:
 		new_compress_method = self.config.backup.get_compress_method_from_size(blob.raw_size, compress_method_override=self.new_compress_method)
 		decompressor = Compressor.create(blob.compress)
-		compressor = Compressor.create(new_compress_method)
+		compressor = self.__create_new_compressor(new_compress_method)
 		if decompressor.get_method() == compressor.get_method():
 			return False
 
@@ -103,7 +117,7 @@ class MigrateCompressMethodAction(Action[SizeDiff]):
 
 	def __compress_pack_entry_to_temp(self, pack_id: int, chunk: schema.Chunk, temp_path: Path, new_compress_method: CompressMethod) -> int:
 		decompressor = Compressor.create(chunk.compress)
-		compressor = Compressor.create(new_compress_method)
+		compressor = self.__create_new_compressor(new_compress_method)
 		with PackReader.open_entry(pack_id, chunk.pack_offset, chunk.stored_size) as entry_reader:
 			with decompressor.decompress_stream(entry_reader) as f_src:
 				return self.__compress_to_temp(f_src, temp_path, compressor, estimate_read_size=chunk.raw_size)
@@ -202,6 +216,24 @@ class MigrateCompressMethodAction(Action[SizeDiff]):
 		self.logger.info('Syncing {} affected chunk groups and {} affected blobs for chunk changes'.format(len(chunk_groups), len(affected_blobs)))
 		session.flush_and_expunge_all()
 
+	def __update_packed_blobs_for_chunk_changes(self, session: DbSession):
+		if len(self.__migrated_chunk_hashes) == 0:
+			return
+
+		chunks_by_hash = session.get_chunks_by_hashes_opt(self.__migrated_chunk_hashes)
+		affected_blobs: Dict[str, schema.Blob] = {}
+		for blob_hash, blob in session.get_blobs_by_hashes_opt(self.__migrated_chunk_hashes).items():
+			if blob is None or blob.storage_method != BlobStorageMethod.packed.value:
+				continue
+			if (chunk := chunks_by_hash.get(blob_hash)) is None:
+				raise AssertionError('Chunk of packed blob {!r} does not exists'.format(blob))
+			blob.stored_size = chunk.stored_size
+			affected_blobs[blob_hash] = blob
+		self.__update_files_for_blob_change(session, affected_blobs)
+
+		self.logger.info('Syncing {} affected packed blobs for chunk changes'.format(len(affected_blobs)))
+		session.flush_and_expunge_all()
+
 	def __update_fileset_and_backups(self, session: DbSession):
 		if len(self.__affected_fileset_ids) == 0:
 			return
@@ -287,6 +319,7 @@ class MigrateCompressMethodAction(Action[SizeDiff]):
 
 				# 3. migrate affected fileset and backup data
 				self.__update_chunk_group_and_blobs_for_chunk_changes(session)
+				self.__update_packed_blobs_for_chunk_changes(session)
 				self.__update_fileset_and_backups(session)
 				pack_ids_to_compact = CollectCompactablePacksStep(
 					session,
@@ -314,6 +347,9 @@ class MigrateCompressMethodAction(Action[SizeDiff]):
 			self.__erase_old_blob_and_chunk_files()
 
 			self.config.backup.compress_method = self.new_compress_method
+			if not self.__is_level_valid_for(self.new_compress_method, self.config.backup.compress_level):
+				self.logger.warning('Compress level {} is invalid for compress method {}, reset it to the default level'.format(self.config.backup.compress_level, self.new_compress_method.name))
+				self.config.backup.compress_level = None
 			self.logger.info('Compress method migration done, cost {}s'.format(round(time.time() - t, 2)))
 			return SizeDiff(before_size, after_size)
 
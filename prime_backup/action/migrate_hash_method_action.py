@@ -1,6 +1,10 @@
+import collections
 import dataclasses
+import io
 import shutil
+import threading
 import time
+from concurrent.futures import Future
 from pathlib import Path
 from typing import Callable, Dict, Generic, List, Protocol, TypeVar, cast, Tuple
 
@@ -9,6 +13,7 @@ from typing_extensions import override
 from prime_backup.action import Action
 from prime_backup.action.helpers.chunk_grouper import ChunkGrouper
 from prime_backup.action.helpers.chunk_io import ChunkIO
+from prime_backup.action.helpers.pack_reader import PackFileObjectPool
 from prime_backup.compressors import Compressor
 from prime_backup.db import schema
 from prime_backup.db.access import DbAccess
@@ -16,12 +21,16 @@ from prime_backup.db.rows import ChunkRow
 from prime_backup.db.session import DbSession
 from prime_backup.db.values import BlobStorageMethod
 from prime_backup.exceptions import PrimeBackupError
+from prime_backup.types.blob_info import BlobInfo
 from prime_backup.types.chunk_info import ChunkInfo
 from prime_backup.types.hash_method import HashMethod
-from prime_backup.utils import blob_utils, hash_utils
+from prime_backup.utils import blob_utils, hash_utils, pack_utils
+from prime_backup.utils.thread_pool import FailFastBlockingThreadPool
 
-_READ_BUF_SIZE = 128 * 1024
 _FILE_BLOB_HASH_BATCH_SIZE = 200
+_BLOB_HASH_BATCH_SIZE = 1000
+_PACK_READ_BUFFER_SIZE = 1024 * 1024
+_CHUNK_DATA_CACHE_SIZE = 256 * 1024 * 1024
 _T = TypeVar('_T')
 
 
@@ -71,6 +80,43 @@ class _MoveJournal:
 		self.__moves.clear()
 
 
+class _ChunkDataCache:
+	"""
+	A size-bounded LRU cache of decompressed chunk data, shared by the hash calculation workers.
+	Chunks are heavily shared between chunked blobs, so most of them do not need to be read and decompressed again
+	"""
+	def __init__(self, max_size: int, pack_file_obj_pool: PackFileObjectPool):
+		self.max_size = max_size
+		self.pack_file_obj_pool = pack_file_obj_pool
+		self.__lock = threading.Lock()
+		self.__data: 'collections.OrderedDict[int, bytes]' = collections.OrderedDict()
+		self.__data_size = 0
+
+	def put(self, chunk_id: int, data: bytes):
+		if len(data) > self.max_size:
+			return
+		with self.__lock:
+			if chunk_id in self.__data:
+				return
+			self.__data[chunk_id] = data
+			self.__data_size += len(data)
+			while self.__data_size > self.max_size:
+				_, old_data = self.__data.popitem(last=False)
+				self.__data_size -= len(old_data)
+
+	def get(self, chunk: ChunkInfo) -> bytes:
+		with self.__lock:
+			if (data := self.__data.get(chunk.id)) is not None:
+				self.__data.move_to_end(chunk.id)
+				return data
+		with ChunkIO(chunk, pack_file_obj_pool=self.pack_file_obj_pool).open_decompressed() as f:
+			data = f.read()
+		if len(data) != chunk.raw_size:
+			raise ValueError('raw size mismatch for chunk {}, expect {}, found {}'.format(chunk.hash, chunk.raw_size, len(data)))
+		self.put(chunk.id, data)
+		return data
+
+
 def _changed_moves(moves: List[_HashMove[_T]]) -> List[_HashMove[_T]]:
 	return [move for move in moves if move.changed]
 
@@ -107,75 +153,115 @@ class MigrateHashMethodAction(Action[None]):
 
 	# ==================== Hash Calculation ====================
 
-	def __calc_direct_blob_new_hash(self, blob: schema.Blob) -> str:
+	def __calc_pack_chunk_new_hashes(self, pack_id: int, chunks: List[ChunkInfo], chunk_data_cache: _ChunkDataCache) -> Dict[int, str]:
+		"""
+		:param chunks: chunks in the pack, sorted by their pack offsets, so the pack file is read sequentially in one pass
+		:return: chunk id -> new chunk hash
+		"""
+		new_hashes: Dict[int, str] = {}
+		with open(pack_utils.get_pack_path(pack_id), 'rb', buffering=_PACK_READ_BUFFER_SIZE) as f:
+			position = 0
+			for chunk in chunks:
+				if chunk.pack_entry.offset != position:
+					f.seek(chunk.pack_entry.offset)
+				raw = f.read(chunk.stored_size)
+				position = chunk.pack_entry.offset + len(raw)
+				if len(raw) != chunk.stored_size:
+					raise ValueError('stored size mismatch for chunk {}, expect {}, found {}'.format(chunk.hash, chunk.stored_size, len(raw)))
+				with Compressor.create(chunk.compress).decompress_stream(io.BytesIO(raw)) as f_decompressed:
+					data = f_decompressed.read()
+				if len(data) != chunk.raw_size:
+					raise ValueError('raw size mismatch for chunk {}, expect {}, found {}'.format(chunk.hash, chunk.raw_size, len(data)))
+				new_hashes[chunk.id] = hash_utils.create_hasher(data, hash_method=self.new_hash_method).hexdigest()
+				chunk_data_cache.put(chunk.id, data)
+		return new_hashes
+
+	def __calc_direct_blob_new_hash(self, blob: BlobInfo) -> str:
 		with Compressor.create(blob.compress).open_decompressed(blob_utils.get_blob_path(blob.hash)) as f:
 			sah = hash_utils.calc_reader_size_and_hash(f, hash_method=self.new_hash_method)
 		if sah.size != blob.raw_size:
 			raise ValueError('raw size mismatch for blob {}, expect {}, found {}'.format(blob.hash, blob.raw_size, sah.size))
 		return sah.hash
 
-	def __calc_chunked_blob_new_hash(self, session: DbSession, blob: schema.Blob) -> str:
+	def __calc_chunked_blob_new_hash(self, blob: BlobInfo, chunks: List[ChunkInfo], chunk_data_cache: _ChunkDataCache) -> str:
 		hasher = self.new_hash_method.value.create_hasher()
 		size = 0
-		for offset_chunk in session.get_blob_chunks(blob.id):
-			chunk = offset_chunk.chunk
-			chunk_size = 0
-			with ChunkIO(ChunkInfo.of(chunk)).open_decompressed() as f:
-				while True:
-					buf = f.read(_READ_BUF_SIZE)
-					if len(buf) == 0:
-						break
-					hasher.update(buf)
-					chunk_size += len(buf)
-			if chunk_size != chunk.raw_size:
-				raise ValueError('raw size mismatch for chunk {}, expect {}, found {}'.format(chunk.hash, chunk.raw_size, chunk_size))
-			size += chunk_size
+		for chunk in chunks:
+			data = chunk_data_cache.get(chunk)
+			hasher.update(data)
+			size += len(data)
 		if size != blob.raw_size:
 			raise ValueError('raw size mismatch for chunked blob {}, expect {}, found {}'.format(blob.hash, blob.raw_size, size))
 		return hasher.hexdigest()
 
-	def __calc_chunk_new_hash(self, chunk: schema.Chunk) -> str:
-		with ChunkIO(ChunkInfo.of(chunk)).open_decompressed_bypassed() as (reader, f):
-			sah = hash_utils.calc_reader_size_and_hash(f, hash_method=self.new_hash_method)
-		if reader.get_read_len() != chunk.stored_size:
-			raise ValueError('stored size mismatch for chunk {}, expect {}, found {}'.format(chunk.hash, chunk.stored_size, reader.get_read_len()))
-		if sah.size != chunk.raw_size:
-			raise ValueError('raw size mismatch for chunk {}, expect {}, found {}'.format(chunk.hash, chunk.raw_size, sah.size))
-		return sah.hash
+	def __calc_chunk_new_hashes(self, session: DbSession, chunk_data_cache: _ChunkDataCache) -> Dict[int, str]:
+		"""
+		Every chunk is read and decompressed exactly once, pack by pack, with packs processed in parallel
+
+		:return: chunk id -> new chunk hash
+		"""
+		futures: List['Future[Dict[int, str]]'] = []
+		with FailFastBlockingThreadPool('hash_migrator') as pool:
+			for pack in session.list_packs():
+				chunks = [ChunkInfo.of(chunk) for chunk in session.get_live_chunks_by_pack_id(pack.id)]
+				if len(chunks) > 0:
+					futures.append(pool.submit(self.__calc_pack_chunk_new_hashes, pack.id, chunks, chunk_data_cache))
+
+		new_hashes: Dict[int, str] = {}
+		for future in futures:
+			new_hashes.update(future.result())
+		return new_hashes
+
+	def __calc_blob_new_hashes(self, session: DbSession, chunk_new_hashes: Dict[int, str], chunk_data_cache: _ChunkDataCache) -> Dict[int, str]:
+		"""
+		Direct blobs are hashed in parallel. Packed blobs and single-chunk chunked blobs reuse the new hash of their chunk,
+		and other chunked blobs stream their chunk data, mostly from the cache, through the hasher in offset order
+
+		:return: blob id -> new blob hash
+		"""
+		new_hashes: Dict[int, str] = {}
+		blob_count = session.get_blob_count()
+		done = 0
+		with FailFastBlockingThreadPool('hash_migrator') as pool:
+			for blobs in session.iterate_blob_batch(batch_size=_BLOB_HASH_BATCH_SIZE):
+				futures: List[Tuple[int, 'Future[str]']] = []
+				for blob in map(BlobInfo.of, blobs):
+					if blob.storage_method == BlobStorageMethod.direct:
+						futures.append((blob.id, pool.submit(self.__calc_direct_blob_new_hash, blob)))
+					elif blob.storage_method in (BlobStorageMethod.chunked, BlobStorageMethod.packed):
+						chunks = [ChunkInfo.of(offset_chunk.chunk) for offset_chunk in session.get_blob_chunks(blob.id)]
+						if len(chunks) == 1 and chunks[0].raw_size == blob.raw_size:
+							new_hashes[blob.id] = chunk_new_hashes[chunks[0].id]
+						else:
+							futures.append((blob.id, pool.submit(self.__calc_chunked_blob_new_hash, blob, chunks, chunk_data_cache)))
+					else:
+						raise ValueError('unsupported blob storage method {}'.format(blob.storage_method))
+				for blob_id, future in futures:
+					new_hashes[blob_id] = future.result()
+				done += len(blobs)
+				self.logger.info('Calculated blob hashes {} / {}'.format(done, blob_count))
+		return new_hashes
 
 	# ==================== Move Collection ====================
 
-	def __collect_blob_moves(self, session: DbSession) -> List[_HashMove[schema.Blob]]:
+	def __collect_blob_moves(self, session: DbSession, new_hashes: Dict[int, str]) -> List[_HashMove[schema.Blob]]:
 		moves: List[_HashMove[schema.Blob]] = []
-		blobs = session.list_blobs()
-		total = len(blobs)
-		for i, blob in enumerate(blobs):
-			if blob.storage_method == BlobStorageMethod.direct.value:
-				new_hash = self.__calc_direct_blob_new_hash(blob)
-				has_file_to_move = True
-			elif blob.storage_method == BlobStorageMethod.chunked.value:
-				new_hash = self.__calc_chunked_blob_new_hash(session, blob)
-				has_file_to_move = False
-			else:
-				raise ValueError('unsupported blob storage method {}'.format(blob.storage_method))
-
+		for blob in session.list_blobs():
+			if (new_hash := new_hashes.get(blob.id)) is None:
+				raise ValueError('new hash of blob {} is not calculated'.format(blob.hash))
+			has_file_to_move = blob.storage_method == BlobStorageMethod.direct.value
 			moves.append(_HashMove(object=blob, old_hash=blob.hash, new_hash=new_hash, has_file_to_move=has_file_to_move))
-			if (i + 1) % 1000 == 0 or i + 1 == total:
-				self.logger.info('Calculated blob hashes {} / {}'.format(i + 1, total))
 
 		self.__ensure_hashes_can_migrate(moves, 'blob')
 		self.__ensure_paths_can_migrate(moves, blob_utils.get_blob_path)
 		return _changed_moves(moves)
 
-	def __collect_chunk_moves(self, session: DbSession) -> List[_HashMove[schema.Chunk]]:
+	def __collect_chunk_moves(self, session: DbSession, new_hashes: Dict[int, str]) -> List[_HashMove[schema.Chunk]]:
 		moves: List[_HashMove[schema.Chunk]] = []
-		chunks = session.list_chunks()
-		total = len(chunks)
-		for i, chunk in enumerate(chunks):
-			new_hash = self.__calc_chunk_new_hash(chunk)
+		for chunk in session.list_chunks():
+			if (new_hash := new_hashes.get(chunk.id)) is None:
+				raise ValueError('new hash of chunk {} is not calculated, is its pack {} missing?'.format(chunk.hash, chunk.pack_id))
 			moves.append(_HashMove(object=chunk, old_hash=chunk.hash, new_hash=new_hash, has_file_to_move=False))
-			if (i + 1) % 2000 == 0 or i + 1 == total:
-				self.logger.info('Calculated chunk hashes {} / {}'.format(i + 1, total))
 
 		self.__ensure_hashes_can_migrate(moves, 'chunk')
 		return _changed_moves(moves)
@@ -267,9 +353,19 @@ class MigrateHashMethodAction(Action[None]):
 				self.logger.info('Migrating hash method from {} to {}'.format(meta.hash_method, self.new_hash_method.name))
 				blob_utils.prepare_blob_directories()
 
-				self.__migrate_blob_hashes(session, self.__collect_blob_moves(session))
-				self.__migrate_chunk_hashes(session, self.__collect_chunk_moves(session))
+				with PackFileObjectPool(max_size=16) as pack_file_obj_pool:
+					chunk_data_cache = _ChunkDataCache(_CHUNK_DATA_CACHE_SIZE, pack_file_obj_pool)
+					chunk_new_hashes = self.__calc_chunk_new_hashes(session, chunk_data_cache)
+					self.logger.info('Calculated chunk hashes, total {}'.format(len(chunk_new_hashes)))
+					blob_new_hashes = self.__calc_blob_new_hashes(session, chunk_new_hashes, chunk_data_cache)
+					del chunk_data_cache  # release the cached chunk data before the database updates
+
+				chunk_moves = self.__collect_chunk_moves(session, chunk_new_hashes)
+				self.__migrate_blob_hashes(session, self.__collect_blob_moves(session, blob_new_hashes))
+				self.__migrate_chunk_hashes(session, chunk_moves)
 				self.__regroup_chunked_blobs(session)
+				session.delete_all_file_stat_caches()  # the cached hashes are calculated with the old hash method
+				session.clear_fileset_fingerprints()  # the fingerprints are calculated with the old file blob hashes
 
 				meta = session.get_db_meta()
 				meta.hash_method = self.new_hash_method.name
@@ -11,6 +11,7 @@ from prime_backup.action.delete_chunk_action import DeleteChunksAction
 from prime_backup.action.delete_chunk_group_action import DeleteChunkGroupsAction
 from prime_backup.action.delete_chunk_group_chunk_binding_action import DeleteChunkGroupChunkBindingsAction
 from prime_backup.action.delete_file_action import DeleteFilesStep
+from prime_backup.action.validate_ref_counts_action import RebuildRefCountsAction
 from prime_backup.db import schema
 from prime_backup.db.access import DbAccess
 from prime_backup.db.session import DbSession
@@ -38,6 +39,11 @@ _R = TypeVar('_R', bound=_ResultWithCount)  # result
 
 
 class _ScanAndDeleteObjectsActionBase(Generic[_T, _K, _R], Action[_R], ABC):
+	"""
+	For blobs, chunk groups and chunks, only the objects with ref_count <= 0 are scanned,
+	and :meth:`_filter_orphans` confirms them with the ground truth before deleting.
+	Run :class:`RebuildRefCountsAction` before it to also catch the objects with a drifted reference count
+	"""
 	MAX_IN_MEMORY_OBJECTS = 10000
 
 	def __init__(self, what: str, show_progress_step: int):
@@ -124,11 +130,11 @@ class ScanAndDeleteOrphanBlobsAction(_ScanAndDeleteObjectsActionBase[schema.Blob
 
 	@override
 	def _get_total_count(self, session: DbSession) -> int:
-		return session.get_blob_count()
+		return session.get_unreferenced_blob_count()
 
 	@override
 	def _batch_iterate(self, session: DbSession) -> Iterable[List[schema.Blob]]:
-		return session.iterate_blob_batch(batch_size=500)
+		return session.iterate_unreferenced_blob_batch(batch_size=500)
 
 	@override
 	def _filter_orphans(self, session: DbSession, objs: List[schema.Blob]) -> List[str]:
@@ -151,11 +157,11 @@ class ScanAndDeleteOrphanChunkGroupsAction(_ScanAndDeleteObjectsActionBase[schem
 
 	@override
 	def _get_total_count(self, session: DbSession) -> int:
-		return session.get_chunk_group_count()
+		return session.get_unreferenced_chunk_group_count()
 
 	@override
 	def _batch_iterate(self, session: DbSession) -> Iterable[List[schema.ChunkGroup]]:
-		return session.iterate_chunk_group_batch(batch_size=500)
+		return session.iterate_unreferenced_chunk_group_batch(batch_size=500)
 
 	@override
 	def _filter_orphans(self, session: DbSession, objs: List[schema.ChunkGroup]) -> List[int]:
@@ -177,11 +183,11 @@ class ScanAndDeleteOrphanChunksAction(_ScanAndDeleteObjectsActionBase[schema.Chu
 
 	@override
 	def _get_total_count(self, session: DbSession) -> int:
-		return session.get_chunk_count()
+		return session.get_unreferenced_chunk_count()
 
 	@override
 	def _batch_iterate(self, session: DbSession) -> Iterable[List[schema.Chunk]]:
-		return session.iterate_chunk_batch(batch_size=500)
+		return session.iterate_unreferenced_chunk_batch(batch_size=500)
 
 	@override
 	def _filter_orphans(self, session: DbSession, objs: List[schema.Chunk]) -> List[int]:
@@ -378,6 +384,8 @@ class ScanAndDeleteOrphanObjectsResult:
 class ScanAndDeleteOrphanObjectsAction(Action[ScanAndDeleteOrphanObjectsResult]):
 	def run(self) -> ScanAndDeleteOrphanObjectsResult:
 		self.logger.info('Scanning orphan objects')
+		# the scans below only visit objects with ref_count <= 0, so fix the drifted reference counts first
+		RebuildRefCountsAction().run()
 		orphan_blob_summary = ScanAndDeleteOrphanBlobsAction().run()
 		orphan_chunk_group_summary = ScanAndDeleteOrphanChunkGroupsAction().run()
 		orphan_chunk_summary = ScanAndDeleteOrphanChunksAction().run()
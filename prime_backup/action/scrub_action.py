@@ -0,0 +1,125 @@
+import dataclasses
+import heapq
+import math
+import time
+from typing import List, Iterator, Tuple, Set, Optional
+
+from typing_extensions import override
+
+from prime_backup.action import Action
+from prime_backup.action.validate_blobs_action import ValidateBlobsAction, ValidateBlobsResult
+from prime_backup.action.validate_chunks_action import ValidateChunksAction, ValidateChunksResult, BadChunkItemType
+from prime_backup.db.access import DbAccess
+from prime_backup.db.session import DbSession
+
+
+@dataclasses.dataclass(frozen=True)
+class ScrubResult:
+	size_budget: int
+	pack_count: int
+	blob_count: int
+	size: int
+	chunk_result: ValidateChunksResult
+	blob_result: ValidateBlobsResult
+
+	@property
+	def bad(self) -> int:
+		return self.chunk_result.bad + self.blob_result.bad
+
+
+class ScrubAction(Action[ScrubResult]):
+	"""
+	Verify a part of the stored data, i.e. pack files and direct blob files, within a size budget.
+
+	Objects are picked in the order of their last verification time, where never-verified objects come first.
+	Only good objects get their last verification time updated, so bad ones will be picked again in the next run.
+	Orphan chunks are only reported, since the data of their packs is still intact.
+	Running it periodically with a budget of ``store size * run interval / period`` verifies the whole store in every period
+	"""
+	CANDIDATE_BATCH_SIZE = 1000
+
+	def __init__(self, *, size_ratio: float):
+		"""
+		:param size_ratio: The size budget of this run, as a ratio of the total size of all pack files and direct blob files
+		"""
+		super().__init__()
+		if not 0 < size_ratio <= 1:
+			raise ValueError('size_ratio should be in range (0, 1], got {}'.format(size_ratio))
+		self.size_ratio = size_ratio
+
+	@override
+	def is_interruptable(self) -> bool:
+		return True
+
+	def __iterate_candidates(self, session: DbSession) -> Iterator[Tuple[int, bool, int, int]]:
+		"""
+		:return: An iterator of (last_verified, is_pack, object id, size), from the least-recently-verified one
+		"""
+		def iterate_packs():
+			after: Optional[Tuple[Optional[int], int]] = None
+			while len(packs := session.list_packs_by_last_verified(limit=self.CANDIDATE_BATCH_SIZE, after=after)) > 0:
+				for pack in packs:
+					yield pack.last_verified or 0, True, pack.id, pack.size
+				after = (packs[-1].last_verified, packs[-1].id)
+
+		def iterate_blobs():
+			after: Optional[Tuple[Optional[int], int]] = None
+			while len(blobs := session.list_direct_blobs_by_last_verified(limit=self.CANDIDATE_BATCH_SIZE, after=after)) > 0:
+				for blob in blobs:
+					yield blob.last_verified or 0, False, blob.id, blob.stored_size
+				after = (blobs[-1].last_verified, blobs[-1].id)
+
+		return heapq.merge(iterate_packs(), iterate_blobs())
+
+	@override
+	def run(self) -> ScrubResult:
+		with DbAccess.open_session() as session:
+			store_size = session.get_pack_overview_stats().size_sum + session.get_direct_blob_stored_size_sum()
+			size_budget = math.ceil(store_size * self.size_ratio)
+
+			pack_ids: List[int] = []
+			blob_ids: List[int] = []
+			size = 0
+			for _, is_pack, obj_id, obj_size in self.__iterate_candidates(session):
+				if size >= size_budget:
+					break
+				(pack_ids if is_pack else blob_ids).append(obj_id)
+				size += obj_size
+
+		self.logger.info('Scrub start, size budget {}, selected {} packs and {} direct blobs with total size {}'.format(size_budget, len(pack_ids), len(blob_ids), size))
+		timestamp = int(time.time())
+		chunk_result = ValidateChunksResult()
+		blob_result = ValidateBlobsResult()
+		if len(pack_ids) > 0 and not self.is_interrupted.is_set():
+			chunk_result = self.run_action(ValidateChunksAction(pack_ids=pack_ids))
+		if len(blob_ids) > 0 and not self.is_interrupted.is_set():
+			blob_result = self.run_action(ValidateBlobsAction(blob_ids=blob_ids))
+
+		if not self.is_interrupted.is_set():
+			# orphan chunks are unused but intact, so they are only reported and do not prevent their packs from being marked as verified
+			bad_pack_ids: Set[int] = set()
+			orphan_chunk_count = 0
+			for item in chunk_result.bad_chunks:
+				if item.typ == BadChunkItemType.orphan:
+					orphan_chunk_count += 1
+				else:
+					bad_pack_ids.add(item.chunk.pack_entry.pack_id)
+			if orphan_chunk_count > 0:
+				self.logger.warning('Found {} orphan chunks in the scrubbed packs'.format(orphan_chunk_count))
+			bad_blob_ids: Set[int] = {item.blob.id for item in blob_result.bad_blobs}
+			with DbAccess.open_session() as session:
+				session.update_packs_last_verified([pack_id for pack_id in pack_ids if pack_id not in bad_pack_ids], timestamp)
+				session.update_blobs_last_verified([blob_id for blob_id in blob_ids if blob_id not in bad_blob_ids], timestamp)
+
+		result = ScrubResult(
+			size_budget=size_budget,
+			pack_count=len(pack_ids),
+			blob_count=len(blob_ids),
+			size=size,
+			chunk_result=chunk_result,
+			blob_result=blob_result,
+		)
+		self.logger.info('Scrub done, verified {} packs and {} direct blobs with total size {}, bad chunks {}, bad blobs {}'.format(
+			result.pack_count, result.blob_count, result.size, chunk_result.bad, blob_result.bad,
+		))
+		return result
@@ -1,12 +1,12 @@
-from typing import Dict, Set, List
+from typing import Set, List
 
 from typing_extensions import override
 
 from prime_backup.action import Action
 from prime_backup.action.delete_blob_action import DeleteOrphanBlobsAction
 from prime_backup.action.list_fileset_action import ListFilesetAction
-from prime_backup.db import schema
 from prime_backup.db.access import DbAccess
+from prime_backup.db.session import DbSession
 from prime_backup.db.values import FileRole
 from prime_backup.exceptions import PrimeBackupError, FilesetNotFound
 from prime_backup.types.blob_info import BlobDeltaSummary
@@ -18,106 +18,87 @@ class NotBaseFileset(PrimeBackupError):
 	pass
 
 
-_DEBUG_LOG = False
+class ShrinkBaseFilesetsAction(Action[FileListSummary]):
+	"""
+	Remove the files of the base filesets that are overridden or removed in all of their delta filesets.
+	Delta files on those paths are rewritten accordingly: delta_override -> delta_add, and delta_remove -> deleted
 
-
-class ShrinkBaseFilesetAction(Action[FileListSummary]):
-	def __init__(self, base_fileset_id: int):
+	Unused paths are found with one grouped query per base fileset, and the changes are applied with bulk statements.
+	All base filesets are shrunk in one session, and orphan blobs are cleaned up once at the end
+	"""
+	def __init__(self, base_fileset_ids: List[int], *, skip_bad_fileset: bool = False):
+		"""
+		:param skip_bad_fileset: Skip the filesets that do not exist or are not base filesets, instead of raising an error
+		"""
 		super().__init__()
-		self.base_fileset_id = base_fileset_id
+		self.base_fileset_ids = base_fileset_ids
+		self.skip_bad_fileset = skip_bad_fileset
+
+	def __shrink(self, session: DbSession, base_fileset_id: int, deleted_file_hashes: Set[str]) -> int:
+		"""
+		:return: The amount of deleted file objects
+		"""
+		base_fileset = session.get_fileset(base_fileset_id)
+		if base_fileset.base_id != 0:
+			raise NotBaseFileset('Fileset {} with base_id {} is not a base fileset'.format(base_fileset_id, base_fileset.base_id))
+
+		unused_paths = session.get_unused_base_file_paths(base_fileset_id)
+		if len(unused_paths) == 0:
+			self.logger.debug('Base fileset {} has no unused file'.format(base_fileset_id))
+			return 0
+		self.logger.info('Found {} unused files in base fileset {}, shrinking'.format(len(unused_paths), base_fileset_id))
+
+		# the sizes of the base files are moved to the delta filesets, where the base file was overridden or removed
+		deleted_delta_file_count = 0
+		for (delta_fileset_id, role), stats in session.get_delta_file_stats_on_base_paths(base_fileset_id, unused_paths).items():
+			if role == FileRole.delta_override:
+				file_object_count_delta = 0
+			elif role == FileRole.delta_remove:
+				file_object_count_delta = -stats.file_count
+				deleted_delta_file_count += stats.file_count
+			else:
+				raise AssertionError('unexpected role {}'.format(role))
+			session.add_fileset_stats(
+				delta_fileset_id,
+				file_object_count=file_object_count_delta,
+				file_count=stats.file_count,
+				file_raw_size_sum=stats.raw_size_sum,
+				file_stored_size_sum=stats.stored_size_sum,
+			)
+		session.update_delta_file_roles_on_base_paths(base_fileset_id, unused_paths, FileRole.delta_override, FileRole.delta_add)
+		session.delete_delta_files_on_base_paths(base_fileset_id, unused_paths, FileRole.delta_remove)
+
+		base_stats = session.get_fileset_file_stats_by_paths(base_fileset_id, unused_paths)
+		session.add_fileset_stats(
+			base_fileset_id,
+			file_object_count=-base_stats.file_count,
+			file_count=-base_stats.file_count,
+			file_raw_size_sum=-base_stats.raw_size_sum,
+			file_stored_size_sum=-base_stats.stored_size_sum,
+		)
+		deleted_file_hashes.update(session.get_blob_hashes_by_fileset_paths(base_fileset_id, unused_paths))
+		session.delete_fileset_files_by_paths(base_fileset_id, unused_paths)
+		session.clear_fileset_fingerprints([base_fileset_id])  # recalculated on the next use
+
+		deleted_file_count = base_stats.file_count + deleted_delta_file_count
+		self.logger.info('Deleted {} file objects for base fileset {}'.format(deleted_file_count, base_fileset_id))
+		return deleted_file_count
 
 	@override
 	def run(self) -> FileListSummary:
-		self.logger.debug('Shrinking base fileset {}'.format(self.base_fileset_id))
+		self.logger.debug('Shrinking base filesets {}'.format(self.base_fileset_ids))
 		fls = FileListSummary.zero()
 
 		with DbAccess.open_session() as session:
-			base_fileset: schema.Fileset = session.get_fileset(self.base_fileset_id)
-			if base_fileset.base_id != 0:
-				raise NotBaseFileset('Fileset {} with base_id {} is not a base fileset'.format(self.base_fileset_id, base_fileset.base_id))
-			base_files_by_path: Dict[str, schema.File] = {file.path: file for file in session.get_fileset_files(self.base_fileset_id)}
-			base_path_in_used = {path: False for path in base_files_by_path.keys()}
-			base_path_in_used_count = 0
-
-			delta_filesets: List[schema.Fileset] = session.get_delta_filesets_for_base_fileset(self.base_fileset_id)
-			if _DEBUG_LOG:
-				self.logger.info('DBG: delta_filesets len {}'.format(len(delta_filesets)))
-
-			delta_file: schema.File
-			for delta_fileset in delta_filesets:
-				delta_in_used_paths: Set[str] = set(base_path_in_used.keys())
-				for delta_file in session.get_fileset_files(delta_fileset.id):
-					if delta_file.role in [FileRole.delta_override.value, FileRole.delta_remove.value]:
-						try:
-							delta_in_used_paths.remove(delta_file.path)
-						except KeyError:
-							self.logger.warning('delta file path not in base file paths? base fileset id {}, delta fileset id {}, delta file {}'.format(delta_fileset.id, delta_fileset.id, repr(delta_file)))
-				for delta_in_used_path in delta_in_used_paths:
-					if not base_path_in_used[delta_in_used_path]:
-						base_path_in_used_count += 1
-					base_path_in_used[delta_in_used_path] = True
-
-				# fast break if `all(base_path_in_used.values())`
-				if base_path_in_used_count == len(base_path_in_used):
-					break
-
-			if _DEBUG_LOG:
-				self.logger.info('DBG: base_path_in_used')
-				for k, v in base_path_in_used.items():
-					self.logger.info(f'DBG:   {k.ljust(80)}: {v}')
-
-			unused_base_files: Dict[str, schema.File] = {}
-			for path, file in base_files_by_path.items():
-				if base_path_in_used[path] is False:
-					unused_base_files[path] = file
-
-			if _DEBUG_LOG:
-				self.logger.info('DBG: unused_base_files')
-				for k in unused_base_files:
-					self.logger.info(f'DBG:   {k}')
-
 			deleted_file_hashes: Set[str] = set()
-			if len(unused_base_files) > 0:
-				self.logger.info('Found {} unused files in base fileset {}, shrinking'.format(len(unused_base_files), self.base_fileset_id))
-				for unused_base_file in unused_base_files.values():
-					base_fileset.file_count -= 1
-					base_fileset.file_object_count -= 1
-					base_fileset.file_raw_size_sum -= unused_base_file.blob_raw_size or 0
-					base_fileset.file_stored_size_sum -= unused_base_file.blob_stored_size or 0
-
-				files_to_delete: List[schema.File] = []
-				files_to_delete.extend(unused_base_files.values())
-				for delta_fileset in delta_filesets:
-					for delta_file in session.get_fileset_files(delta_fileset.id):
-						if (unused_base_file_opt := unused_base_files.get(delta_file.path)) is None:
-							continue
-						unused_base_file = unused_base_file_opt
-						if delta_file.role in [FileRole.delta_override.value, FileRole.delta_remove.value]:
-							if delta_file.role == FileRole.delta_override.value:
-								if _DEBUG_LOG:
-									self.logger.info(f'DBG: fileset {delta_fileset.id}, {delta_file.path}: override -> add')
-								# override -> add
-								delta_file.role = FileRole.delta_add.value
-								delta_fileset.file_count += 1
-							else:
-								if _DEBUG_LOG:
-									self.logger.info(f'DBG: fileset {delta_fileset.id}, {delta_file.path}: remove -> X')
-								# remove -> X
-								files_to_delete.append(delta_file)
-								delta_fileset.file_count += 1
-								delta_fileset.file_object_count -= 1
-							delta_fileset.file_raw_size_sum += unused_base_file.blob_raw_size or 0
-							delta_fileset.file_stored_size_sum += unused_base_file.blob_stored_size or 0
-
-				self.logger.info('Deleting {} file objects'.format(len(files_to_delete)))
-				fls.count += len(files_to_delete)
-				for file_to_delete in files_to_delete:
-					if file_to_delete.blob_hash is not None:
-						deleted_file_hashes.add(file_to_delete.blob_hash)
-					session.delete_file(file_to_delete)
-
-			if _DEBUG_LOG:
-				self.logger.info('DBG: deleted_file_hashes len {}'.format(len(deleted_file_hashes)))
+			for base_fileset_id in self.base_fileset_ids:
+				try:
+					fls.count += self.__shrink(session, base_fileset_id, deleted_file_hashes)
+				except (FilesetNotFound, NotBaseFileset) as e:
+					if not self.skip_bad_fileset:
+						raise
+					self.logger.warning('Skipped shrinking fileset {}: {}'.format(base_fileset_id, e))
+
 			if len(deleted_file_hashes) > 0:
 				orphan_blob_cleaner = DeleteOrphanBlobsAction(deleted_file_hashes)
 				bds = orphan_blob_cleaner.run(session=session)
@@ -126,27 +107,31 @@ class ShrinkBaseFilesetAction(Action[FileListSummary]):
 			fls.blob_summary = bds
 
 		if bds.blob_count > 0:
-			self.logger.info('Shrink base fileset {} done, removed {} blobs, {} chunks and changed {} packs (freed disk {} / raw {})'.format(
-				self.base_fileset_id, bds.blob_count, bds.chunk_count, bds.packs.changed_pack_count, ByteCount(bds.freed_disk_size).auto_str(), ByteCount(bds.raw_size).auto_str(),
+			self.logger.info('Shrink {} base filesets done, removed {} blobs, {} chunks and changed {} packs (freed disk {} / raw {})'.format(
+				len(self.base_fileset_ids), bds.blob_count, bds.chunk_count, bds.packs.changed_pack_count, ByteCount(bds.freed_disk_size).auto_str(), ByteCount(bds.raw_size).auto_str(),
 			))
 		else:
-			self.logger.info('Shrink base fileset {} done, nothing to shrink'.format(self.base_fileset_id))
+			self.logger.info('Shrink {} base filesets done, no blob to remove'.format(len(self.base_fileset_ids)))
 		return fls
 
 
+class ShrinkBaseFilesetAction(Action[FileListSummary]):
+	def __init__(self, base_fileset_id: int):
+		super().__init__()
+		self.base_fileset_id = base_fileset_id
+
+	@override
+	def run(self) -> FileListSummary:
+		return ShrinkBaseFilesetsAction([self.base_fileset_id]).run()
+
+
 class ShrinkAllBaseFilesetsAction(Action[FileListSummary]):
 	@override
 	def run(self) -> FileListSummary:
 		filesets = ListFilesetAction(is_base=True).run()
-		fls_total = FileListSummary.zero()
 
 		self.logger.info('Shrinking {} base filesets'.format(len(filesets)))
-		for fileset in filesets:
-			try:
-				fls = ShrinkBaseFilesetAction(fileset.id).run()
-			except (FilesetNotFound, NotBaseFileset):
-				continue
-			fls_total += fls
+		fls_total = ShrinkBaseFilesetsAction([fileset.id for fileset in filesets], skip_bad_fileset=True).run()
 		self.logger.info('Shrank {} base filesets: {}'.format(len(filesets), fls_total))
 
 		return fls_total
@@ -0,0 +1,119 @@
+import dataclasses
+import time
+from typing import List, Union
+
+from typing_extensions import override
+
+from prime_backup.action import Action
+from prime_backup.action.helpers.chunk_io import ChunkIO
+from prime_backup.compressors import Compressor
+from prime_backup.db.access import DbAccess
+from prime_backup.db.values import BlobStorageMethod
+from prime_backup.db.zstd_dict_cache import ZstdDictCache
+from prime_backup.exceptions import NotEnoughZstdDictSamples
+from prime_backup.types.blob_info import BlobInfo
+from prime_backup.types.chunk_info import ChunkInfo
+from prime_backup.utils import blob_utils
+
+
+@dataclasses.dataclass(frozen=True)
+class TrainZstdDictResult:
+	dict_id: int
+	dict_size: int
+	sample_count: int
+	sample_size_sum: int
+
+
+class TrainZstdDictAction(Action[TrainZstdDictResult]):
+	"""
+	Train a new zstd dictionary from the most recent small blobs and chunks, and make it the one to be used by new data
+	"""
+	DEFAULT_DICT_SIZE = 112640  # same as the zstd cli
+	DEFAULT_MAX_SAMPLE_COUNT = 10000
+	DEFAULT_MAX_SAMPLE_SIZE_SUM = 64 * 1024 * 1024
+	MIN_SAMPLE_COUNT = 10
+
+	def __init__(self, *, dict_size: int = DEFAULT_DICT_SIZE, max_sample_count: int = DEFAULT_MAX_SAMPLE_COUNT, max_sample_size_sum: int = DEFAULT_MAX_SAMPLE_SIZE_SUM):
+		super().__init__()
+		self.dict_size = dict_size
+		self.max_sample_count = max_sample_count
+		self.max_sample_size_sum = max_sample_size_sum
+
+	def __list_samples(self) -> List[Union[BlobInfo, ChunkInfo]]:
+		max_raw_size = self.config.backup.zstd_dict_threshold
+		samples: List[Union[BlobInfo, ChunkInfo]] = []
+		size_sum = 0
+
+		def try_add(sample: Union[BlobInfo, ChunkInfo]) -> bool:
+			nonlocal size_sum
+			if size_sum + sample.raw_size > self.max_sample_size_sum:
+				return False
+			samples.append(sample)
+			size_sum += sample.raw_size
+			return True
+
+		with DbAccess.open_session() as session:
+			# packed blobs are stored as chunks, so they are sampled with the chunks
+			for blob in session.list_recent_blobs_by_max_raw_size(BlobStorageMethod.direct, max_raw_size, self.max_sample_count // 2):
+				if not try_add(BlobInfo.of(blob)):
+					break
+			for chunk in session.list_recent_chunks_by_max_raw_size(max_raw_size, self.max_sample_count - len(samples)):
+				if not try_add(ChunkInfo.of(chunk)):
+					break
+		return samples
+
+	def __read_samples(self) -> List[bytes]:
+		# the files are read after the session is closed, so the database is not kept busy
+		samples: List[bytes] = []
+		for sample in self.__list_samples():
+			if isinstance(sample, BlobInfo):
+				with Compressor.create(sample.compress).open_decompressed(blob_utils.get_blob_path(sample.hash)) as f:
+					samples.append(f.read())
+			else:
+				with ChunkIO(sample).open_decompressed() as f:
+					samples.append(f.read())
+		return [sample for sample in samples if len(sample) > 0]
+
+	@override
+	def run(self) -> TrainZstdDictResult:
+		import zstandard
+
+		self.logger.info('Reading samples for zstd dictionary training')
+		samples = self.__read_samples()
+		if len(samples) < self.MIN_SAMPLE_COUNT:
+			raise NotEnoughZstdDictSamples(len(samples), self.MIN_SAMPLE_COUNT)
+		sample_size_sum = sum(map(len, samples))
+
+		# the dictionary id is embedded in the trained dictionary, so reserve it first.
+		# The reserved dictionary has no data, so it will not be used before the training is done
+		with DbAccess.open_session() as session:
+			zstd_dict = session.create_and_add_zstd_dict(
+				timestamp=int(time.time()),
+				sample_count=len(samples),
+				sample_size_sum=sample_size_sum,
+				data=b'',
+			)
+			session.flush()  # this generates zstd_dict.id
+			dict_id = zstd_dict.id
+
+		# the training might take a while, do it outside any session, so backups are not blocked
+		try:
+			self.logger.info('Training zstd dictionary {} with {} samples, total size {}'.format(dict_id, len(samples), sample_size_sum))
+			training_samples: List[Union[bytes, bytearray, memoryview]] = list(samples)  # list is invariant, so widen the element type
+			trained = zstandard.train_dictionary(self.dict_size, training_samples, dict_id=dict_id, threads=self.config.get_effective_concurrency())
+			if trained.dict_id() != dict_id:
+				raise AssertionError('trained dictionary id mismatched, expected {}, got {}'.format(dict_id, trained.dict_id()))
+			with DbAccess.open_session() as session:
+				if (zstd_dict := session.get_zstd_dict_opt(dict_id)) is None:
+					raise AssertionError('reserved zstd dictionary {} does not exist'.format(dict_id))
+				zstd_dict.data = trained.as_bytes()
+		except Exception:
+			with DbAccess.open_session() as session:
+				if (zstd_dict := session.get_zstd_dict_opt(dict_id)) is not None:
+					session.delete_zstd_dict(zstd_dict)
+			raise
+
+		result = TrainZstdDictResult(dict_id=dict_id, dict_size=len(trained.as_bytes()), sample_count=len(samples), sample_size_sum=sample_size_sum)
+		ZstdDictCache.add(result.dict_id, trained.as_bytes())
+		self.logger.info('Trained zstd dictionary {}, size {}'.format(result.dict_id, result.dict_size))
+		return result
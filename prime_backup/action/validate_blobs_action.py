@@ -1,7 +1,7 @@
 import collections
 import dataclasses
 import enum
-from typing import List, Dict, Set
+from typing import List, Dict, Set, Optional, Iterator
 
 from typing_extensions import override
 
@@ -70,6 +70,15 @@ class _SubResultStore:
 
 
 class ValidateBlobsAction(Action[ValidateBlobsResult]):
+	BLOB_BATCH_SIZE = 3000
+
+	def __init__(self, *, blob_ids: Optional[List[int]] = None):
+		"""
+		:param blob_ids: Only validate the given blobs. Validate all blobs if it's None
+		"""
+		super().__init__()
+		self.blob_ids = blob_ids
+
 	@override
 	def is_interruptable(self) -> bool:
 		return True
@@ -199,6 +208,35 @@ class ValidateBlobsAction(Action[ValidateBlobsResult]):
 			validate_one_blob(b)
 		return good_blob_hashes
 
+	def __validate_packed_blobs(self, session: DbSession, result: ValidateBlobsResult, blobs: List[BlobInfo]) -> Set[str]:
+		if len(blobs) == 0 or self.is_interrupted.is_set():
+			return set()
+
+		chunks_by_hash = session.get_chunks_by_hashes_opt([blob.hash for blob in blobs])
+		good_blob_hashes: Set[str] = set()
+		for blob in blobs:
+			if blob.storage_method != BlobStorageMethod.packed:
+				raise AssertionError()
+			if blob.compress != CompressMethod.plain:
+				result.add_bad(blob, BadBlobItemType.corrupted, f'the compress field of packed blob should always be plain, found {blob.compress}')
+				continue
+
+			# NOTES: complete validations for the chunk are done in ValidateChunksAction
+
+			chunk = chunks_by_hash.get(blob.hash)
+			if chunk is None:
+				result.add_bad(blob, BadBlobItemType.missing, 'the chunk of packed blob does not exist')
+				continue
+			if chunk.raw_size != blob.raw_size:
+				result.add_bad(blob, BadBlobItemType.mismatched, f'raw size mismatch, expect {chunk.raw_size}, found {blob.raw_size}')
+				continue
+			if chunk.stored_size != blob.stored_size:
+				result.add_bad(blob, BadBlobItemType.mismatched, f'stored size mismatch, expect {chunk.stored_size}, found {blob.stored_size}')
+				continue
+
+			good_blob_hashes.add(blob.hash)
+		return good_blob_hashes
+
 	def __validate(self, session: DbSession, result: ValidateBlobsResult, blobs: List[BlobInfo]):
 		blobs_by_storage_method: Dict[BlobStorageMethod, List[BlobInfo]] = collections.defaultdict(list)
 		for blob in blobs:
@@ -215,6 +253,7 @@ class ValidateBlobsAction(Action[ValidateBlobsResult]):
 		good_blob_hashes |= self.__validate_direct_blobs(sub_results.acquire(), blobs_by_storage_method[BlobStorageMethod.direct])
 		for chunked_blob_part in collection_utils.slicing_iterate(blobs_by_storage_method[BlobStorageMethod.chunked], 10):
 			good_blob_hashes |= self.__validate_chunked_blobs(session, sub_results.acquire(), chunked_blob_part)
+		good_blob_hashes |= self.__validate_packed_blobs(session, sub_results.acquire(), blobs_by_storage_method[BlobStorageMethod.packed])
 		if self.is_interrupted.is_set():
 			return
 
@@ -233,6 +272,13 @@ class ValidateBlobsAction(Action[ValidateBlobsResult]):
 		result.validated += len(blobs)
 		result.ok += len(good_blob_hashes)
 
+	def __iterate_blob_batch(self, session: DbSession) -> Iterator[List[schema.Blob]]:
+		if self.blob_ids is None:
+			yield from session.iterate_blob_batch(batch_size=self.BLOB_BATCH_SIZE)
+		else:
+			for view in collection_utils.slicing_iterate(self.blob_ids, self.BLOB_BATCH_SIZE):
+				yield [blob for blob in session.get_blobs_by_ids(view).values() if blob is not None]
+
 	@override
 	def run(self) -> ValidateBlobsResult:
 		self.logger.info('Blob validation start')
@@ -240,9 +286,9 @@ class ValidateBlobsAction(Action[ValidateBlobsResult]):
 
 		session: DbSession
 		with DbAccess.open_session() as session:
-			result.total = session.get_blob_count()
+			result.total = session.get_blob_count() if self.blob_ids is None else len(self.blob_ids)
 			cnt = 0
-			for blobs in session.iterate_blob_batch(batch_size=3000):
+			for blobs in self.__iterate_blob_batch(session):
 				if self.is_interrupted.is_set():
 					break
 				cnt += len(blobs)
@@ -1,16 +1,20 @@
 import contextlib
 import dataclasses
 import enum
-from typing import List, Dict, Optional, Set
+import io
+import os
+from concurrent.futures import Future
+from typing import List, Dict, Optional, Iterator
 
 from typing_extensions import override
 
 from prime_backup.action import Action
-from prime_backup.action.helpers.chunk_io import ChunkIO
+from prime_backup.compressors import Compressor
+from prime_backup.db import schema
 from prime_backup.db.access import DbAccess
 from prime_backup.db.session import DbSession
 from prime_backup.types.chunk_info import ChunkInfo
-from prime_backup.utils import chunk_utils, collection_utils, hash_utils
+from prime_backup.utils import chunk_utils, hash_utils, pack_utils, collection_utils
 from prime_backup.utils.thread_pool import FailFastBlockingThreadPool
 
 
@@ -37,6 +41,7 @@ class ValidateChunksResult:
 	validated: int = 0
 	ok: int = 0
 	bad_chunks: List[BadChunkItem] = dataclasses.field(default_factory=list)
+	pack_gap_size: int = 0  # pack file space not used by any chunk, i.e. the dead space to be reclaimed by compaction
 
 	@property
 	def bad(self) -> int:
@@ -53,68 +58,103 @@ class ValidateChunksResult:
 
 
 class ValidateChunksAction(Action[ValidateChunksResult]):
+	"""
+	Validate chunks pack by pack. Chunks of a pack are validated in the order of their pack offsets,
+	so each pack file is read with one sequential pass, and different packs are validated in parallel
+	"""
+	PACK_BATCH_SIZE = 100
+	PACK_READ_BUFFER_SIZE = 1024 * 1024
+
+	def __init__(self, *, pack_ids: Optional[List[int]] = None):
+		"""
+		:param pack_ids: Only validate the chunks in the given packs. Validate all chunks if it's None
+		"""
+		super().__init__()
+		self.pack_ids = pack_ids
+
 	@override
 	def is_interruptable(self) -> bool:
 		return True
 
-	def __validate(self, session: DbSession, result: ValidateChunksResult, chunks: List[ChunkInfo], existing_pack_ids: Set[int]):
-		id_to_good_chunks: Dict[int, ChunkInfo] = {}
+	def __validate_pack(self, result: ValidateChunksResult, pack_id: int, chunks: List[ChunkInfo], id_to_good_chunks: Dict[int, ChunkInfo]) -> int:
+		"""
+		:return: The size of the pack file space not used by the given chunks
+		"""
 		hash_method = chunk_utils.get_hash_method()
-
-		def validate_one_chunk(chunk: ChunkInfo):
-			if not chunk.id:
-				result.add_bad(chunk, BadChunkItemType.invalid, f'invalid id {chunk.id!r}')
-				return
-			if chunk.pack_entry.pack_id <= 0 or chunk.pack_entry.pack_id not in existing_pack_ids:
-				result.add_bad(chunk, BadChunkItemType.missing_pack, f'missing pack for pack_id {chunk.pack_entry.pack_id}')
-				return
-
-			pack_path = chunk.pack_file_path
-			if not pack_path.is_file():
+		pack_path = pack_utils.get_pack_path(pack_id)
+		if not pack_path.is_file():
+			for chunk in chunks:
 				result.add_bad(chunk, BadChunkItemType.missing_file, f'pack file {pack_path} does not exist')
-				return
-			pack_size = pack_path.stat().st_size
-			if chunk.pack_entry.offset < 0 or chunk.stored_size < 0 or chunk.pack_entry.offset + chunk.stored_size > pack_size:
-				result.add_bad(chunk, BadChunkItemType.bad_pack_entry, f'bad pack entry range, offset {chunk.pack_entry.offset}, size {chunk.stored_size}, pack size {pack_size}')
-				return
-
-			try:
-				with ChunkIO(chunk).open_decompressed_bypassed() as (reader, f_decompressed):
-					sah = hash_utils.calc_reader_size_and_hash(f_decompressed, hash_method=hash_method)
-			except Exception as e:
-				result.add_bad(chunk, BadChunkItemType.corrupted, f'cannot read and decompress pack entry: ({type(e)} {e})')
-				return
-
-			file_size = reader.get_read_len()
-			if file_size != chunk.stored_size:
-				result.add_bad(chunk, BadChunkItemType.mismatched, f'stored size mismatch, expect {chunk.stored_size}, found {file_size}')
-				return
-			if sah.hash != chunk.hash:
-				result.add_bad(chunk, BadChunkItemType.mismatched, f'hash mismatch, expect {chunk.hash}, found {sah.hash}')
-				return
-			if sah.size != chunk.raw_size:
-				result.add_bad(chunk, BadChunkItemType.mismatched, f'raw size mismatch, expect {chunk.raw_size}, found {sah.size}')
-				return
-
-			# it's a good chunk
-			id_to_good_chunks[chunk.id] = chunk
-
-		def check_orphan_chunks():
-			orphan_chunk_ids = set(session.filtered_orphan_chunk_ids(list(id_to_good_chunks.keys())))
-			for chunk_id, chunk in id_to_good_chunks.items():
-				if chunk_id in orphan_chunk_ids:
-					result.add_bad(chunk, BadChunkItemType.orphan, f'orphan chunk with 0 associated file, id {chunk_id}, hash {chunk.hash}')
-				else:
-					result.ok += 1
-
-		with FailFastBlockingThreadPool('validator') as pool:
-			for c in chunks:
+			return 0
+
+		with open(pack_path, 'rb', buffering=self.PACK_READ_BUFFER_SIZE) as f:
+			pack_size = os.fstat(f.fileno()).st_size
+			position = 0
+			gap_size = 0
+			prev_chunk: Optional[ChunkInfo] = None
+			for chunk in chunks:
 				if self.is_interrupted.is_set():
 					break
-				result.validated += 1
-				pool.submit(validate_one_chunk, c)
-
-		check_orphan_chunks()
+				if not chunk.id:
+					result.add_bad(chunk, BadChunkItemType.invalid, f'invalid id {chunk.id!r}')
+					continue
+
+				offset, stored_size = chunk.pack_entry.offset, chunk.stored_size
+				if offset < 0 or stored_size < 0 or offset + stored_size > pack_size:
+					result.add_bad(chunk, BadChunkItemType.bad_pack_entry, f'bad pack entry range, offset {offset}, size {stored_size}, pack size {pack_size}')
+					continue
+				if offset < position:
+					assert prev_chunk is not None
+					result.add_bad(chunk, BadChunkItemType.bad_pack_entry, f'pack entry overlaps with chunk {prev_chunk.id}, offset {offset}, previous entry end {position}')
+					continue
+				if offset > position:
+					# dead space of deleted chunks, which will be reclaimed by pack compaction
+					gap_size += offset - position
+					f.seek(offset)
+
+				data = f.read(stored_size)
+				position = offset + len(data)
+				prev_chunk = chunk
+				if len(data) != stored_size:
+					result.add_bad(chunk, BadChunkItemType.mismatched, f'stored size mismatch, expect {stored_size}, found {len(data)}')
+					continue
+
+				try:
+					with Compressor.create(chunk.compress).decompress_stream(io.BytesIO(data)) as f_decompressed:
+						sah = hash_utils.calc_reader_size_and_hash(f_decompressed, hash_method=hash_method)
+				except Exception as e:
+					result.add_bad(chunk, BadChunkItemType.corrupted, f'cannot read and decompress pack entry: ({type(e)} {e})')
+					continue
+
+				if sah.hash != chunk.hash:
+					result.add_bad(chunk, BadChunkItemType.mismatched, f'hash mismatch, expect {chunk.hash}, found {sah.hash}')
+					continue
+				if sah.size != chunk.raw_size:
+					result.add_bad(chunk, BadChunkItemType.mismatched, f'raw size mismatch, expect {chunk.raw_size}, found {sah.size}')
+					continue
+
+				# it's a good chunk
+				id_to_good_chunks[chunk.id] = chunk
+
+			if not self.is_interrupted.is_set():
+				gap_size += max(0, pack_size - position)
+			return gap_size
+
+	@classmethod
+	def __check_orphan_chunks(cls, session: DbSession, result: ValidateChunksResult, id_to_good_chunks: Dict[int, ChunkInfo]):
+		orphan_chunk_ids = set(session.filtered_orphan_chunk_ids(list(id_to_good_chunks.keys())))
+		for chunk_id, chunk in id_to_good_chunks.items():
+			if chunk_id in orphan_chunk_ids:
+				result.add_bad(chunk, BadChunkItemType.orphan, f'orphan chunk with 0 associated file, id {chunk_id}, hash {chunk.hash}')
+			else:
+				result.ok += 1
+
+	def __iterate_pack_batch(self, session: DbSession) -> Iterator[List[schema.Pack]]:
+		if self.pack_ids is None:
+			yield from session.iterate_pack_batch(batch_size=self.PACK_BATCH_SIZE)
+		else:
+			for view in collection_utils.slicing_iterate(self.pack_ids, self.PACK_BATCH_SIZE):
+				yield [pack for pack in session.get_packs_by_ids(view).values() if pack is not None]
 
 	@override
 	def run(self, *, session: Optional[DbSession] = None) -> ValidateChunksResult:
@@ -125,22 +165,32 @@ class ValidateChunksAction(Action[ValidateChunksResult]):
 			if session is None:
 				session = es.enter_context(DbAccess.open_session())
 
-			result.total = session.get_chunk_count()
-			cnt = 0
-			for chunks in session.iterate_chunk_batch(batch_size=3000):
+			if self.pack_ids is None:
+				result.total = session.get_chunk_count()
+				for chunk in map(ChunkInfo.of, session.list_chunks_with_missing_pack()):
+					result.validated += 1
+					result.add_bad(chunk, BadChunkItemType.missing_pack, f'missing pack for pack_id {chunk.pack_entry.pack_id}')
+			else:
+				result.total = sum(stats.live_entry_count for stats in session.get_pack_live_stats_by_ids(self.pack_ids).values())
+
+			for packs in self.__iterate_pack_batch(session):
 				if self.is_interrupted.is_set():
 					break
-				cnt += len(chunks)
-				self.logger.info('Validating {} / {} chunks'.format(cnt, result.total))
-				pack_ids = collection_utils.deduplicated_list(chunk.pack_id for chunk in chunks if chunk.pack_id > 0)
-				existing_pack_ids = {
-					pack_id
-					for pack_id, pack in session.get_packs_by_ids(pack_ids).items()
-					if pack is not None
-				}
-				self.__validate(session, result, [ChunkInfo.of(chunk) for chunk in chunks], existing_pack_ids)
-
-		self.logger.info('Chunk validation done: total {}, validated {}, ok {}, bad {}'.format(
-			result.total, result.validated, result.ok, len(result.bad_chunks),
+				id_to_good_chunks: Dict[int, ChunkInfo] = {}
+				gap_size_futures: List['Future[int]'] = []
+				with FailFastBlockingThreadPool('validator') as pool:
+					for pack in packs:
+						if self.is_interrupted.is_set():
+							break
+						chunks = [ChunkInfo.of(chunk) for chunk in session.get_live_chunks_by_pack_id(pack.id)]
+						result.validated += len(chunks)
+						if len(chunks) > 0:
+							gap_size_futures.append(pool.submit(self.__validate_pack, result, pack.id, chunks, id_to_good_chunks))
+				result.pack_gap_size += sum(future.result() for future in gap_size_futures)
+				self.__check_orphan_chunks(session, result, id_to_good_chunks)
+				self.logger.info('Validating {} / {} chunks'.format(result.validated, result.total))
+
+		self.logger.info('Chunk validation done: total {}, validated {}, ok {}, bad {}, pack gap size {}'.format(
+			result.total, result.validated, result.ok, len(result.bad_chunks), result.pack_gap_size,
 		))
 		return result
@@ -62,7 +62,7 @@ class ValidateFilesetsAction(Action[ValidateFilesetsResult]):
 	def __validate(self, session: DbSession, result: ValidateFilesetsResult, filesets: List[FilesetInfo]):
 		@functools.lru_cache(maxsize=16)
 		def get_fileset_files_cached(fileset_id_: int):
-			return session.get_fileset_files(fileset_id_)
+			return session.get_fileset_file_rows(fileset_id_)
 
 		base_filesets: Dict[int, FilesetInfo] = {}
 		fileset_ids_to_query: Set[int] = set()
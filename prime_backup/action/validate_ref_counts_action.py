@@ -0,0 +1,59 @@
+import dataclasses
+from typing import List, Dict
+
+from typing_extensions import override
+
+from prime_backup.action import Action
+from prime_backup.db import ref_counts
+from prime_backup.db.access import DbAccess
+from prime_backup.db.ref_counts import BadRefCountItem
+
+
+@dataclasses.dataclass
+class ValidateRefCountsResult:
+	total: Dict[str, int] = dataclasses.field(default_factory=dict)  # table -> object count
+	bad: Dict[str, int] = dataclasses.field(default_factory=dict)  # table -> bad object count
+	bad_samples: List[BadRefCountItem] = dataclasses.field(default_factory=list)
+
+	@property
+	def total_count(self) -> int:
+		return sum(self.total.values())
+
+	@property
+	def bad_count(self) -> int:
+		return sum(self.bad.values())
+
+
+class ValidateRefCountsAction(Action[ValidateRefCountsResult]):
+	MAX_SAMPLES_PER_TABLE = 100
+
+	@override
+	def run(self) -> ValidateRefCountsResult:
+		self.logger.info('Reference count validation start')
+		result = ValidateRefCountsResult()
+
+		with DbAccess.open_session() as session:
+			result.total['blob'] = session.get_blob_count()
+			result.total['chunk_group'] = session.get_chunk_group_count()
+			result.total['chunk'] = session.get_chunk_count()
+			for table in ref_counts.TABLES:
+				result.bad[table] = session.count_bad_ref_counts(table)
+				if result.bad[table] > 0:
+					result.bad_samples.extend(session.list_bad_ref_counts(table, self.MAX_SAMPLES_PER_TABLE))
+
+		self.logger.info('Reference count validation done: total {}, bad {}'.format(result.total, result.bad))
+		return result
+
+
+class RebuildRefCountsAction(Action[Dict[str, int]]):
+	@override
+	def run(self) -> Dict[str, int]:
+		"""
+		:return: table -> amount of objects whose reference count got fixed
+		"""
+		fixed: Dict[str, int] = {}
+		with DbAccess.open_session() as session:
+			for table in ref_counts.TABLES:
+				fixed[table] = session.rebuild_ref_counts(table)
+				self.logger.info('Rebuilt reference counts of table {}, fixed {} objects'.format(table, fixed[table]))
+		return fixed
@@ -5,6 +5,7 @@ from typing import List, Dict
 from prime_backup.cli import cli_utils
 from prime_backup.cli.cmd import CliCommandAdapterBase
 from prime_backup.cli.cmd.cmd_back import BackCommandAdapter
+from prime_backup.cli.cmd.cmd_db_backup import DbBackupCommandAdapter
 from prime_backup.cli.cmd.cmd_db_overview import DbOverviewCommandAdapter
 from prime_backup.cli.cmd.cmd_export import ExportCommandAdapter
 from prime_backup.cli.cmd.cmd_extract import ExtractCommandAdapter
@@ -44,6 +45,7 @@ class CliEntrypoint:
 	def __create_command_adapters(cls) -> Dict[str, CliCommandAdapterBase]:
 		all_adapters: List[CliCommandAdapterBase] = [
 			BackCommandAdapter(),
+			DbBackupCommandAdapter(),
 			DbOverviewCommandAdapter(),
 			ExportCommandAdapter(),
 			ExtractCommandAdapter(),
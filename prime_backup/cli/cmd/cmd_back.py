@@ -27,6 +27,8 @@ class BackCommandArgs(CommonCommandArgs):
 	confirm: bool
 	fail_soft: bool
 	no_verify: bool
+	incremental: bool
+	incremental_hash_check: bool
 	skip_pre_restore_backup: bool
 
 
@@ -95,12 +97,15 @@ class BackCommandHandler(CliCommandHandlerBase):
 		if pre_restore_backup is not None:
 			self.logger.info('Pre-restore temporary backup #{} created, cost {}s'.format(pre_restore_backup.id, round(cost_backup, 2)))
 
-		self.logger.info('Restoring to backup #{} at path {!r} (fail_soft={}, verify_blob={})'.format(
-			backup.id, source_root.as_posix(), self.args.fail_soft, not self.args.no_verify,
+		incremental = self.args.incremental or self.config.command.incremental_restore
+		self.logger.info('Restoring to backup #{} at path {!r} (fail_soft={}, verify_blob={}, incremental={})'.format(
+			backup.id, source_root.as_posix(), self.args.fail_soft, not self.args.no_verify, incremental,
 		))
 		failures = ExportBackupToDirectoryAction(
 			backup.id, source_root,
 			restore_mode=True,
+			incremental=incremental,
+			incremental_hash_check=self.args.incremental_hash_check or self.config.command.incremental_restore_hash_check,
 			fail_soft=self.args.fail_soft,
 			verify_blob=not self.args.no_verify,
 			retain_patterns=self.config.backup.retain_patterns,
@@ -137,6 +142,8 @@ class BackCommandAdapter(CliCommandAdapterBase):
 		parser.add_argument('--confirm', action='store_true', help='Skip the interactive confirmation prompt')
 		parser.add_argument('--fail-soft', action='store_true', help='Skip files with restore failure, so a single failure will not abort the restore')
 		parser.add_argument('--no-verify', action='store_true', help='Do not verify restored file contents')
+		parser.add_argument('--incremental', action='store_true', help='Only rewrite files that differ from the existing ones, and only delete extra files. Default to the command.incremental_restore config')
+		parser.add_argument('--incremental-hash-check', action='store_true', help='In incremental restore, also check the hash of the stat-unchanged files. Default to the command.incremental_restore_hash_check config')
 		parser.add_argument('--no-pre-restore-backup', '--skip-pre-restore-backup', dest='skip_pre_restore_backup', action='store_true', help='Do not create a temporary backup before restoring')
 
 	@override
@@ -149,6 +156,8 @@ class BackCommandAdapter(CliCommandAdapterBase):
 			confirm=args.confirm,
 			fail_soft=args.fail_soft,
 			no_verify=args.no_verify,
+			incremental=args.incremental,
+			incremental_hash_check=args.incremental_hash_check,
 			skip_pre_restore_backup=args.skip_pre_restore_backup,
 		))
 		handler.handle()
@@ -0,0 +1,95 @@
+import argparse
+import dataclasses
+import time
+from pathlib import Path
+from typing import Optional
+
+from typing_extensions import override
+
+from prime_backup.cli.cmd import CliCommandHandlerBase, CommonCommandArgs, CliCommandAdapterBase
+from prime_backup.cli.return_codes import ErrorReturnCodes
+from prime_backup.db import db_constants
+from prime_backup.db.db_page_store import DbPageStore, DbPageStoreError
+from prime_backup.types.units import ByteCount
+
+
+@dataclasses.dataclass(frozen=True)
+class DbBackupCommandArgs(CommonCommandArgs):
+	name: Optional[str]
+	output: Optional[Path]
+	human: bool
+
+
+class DbBackupCommandHandler(CliCommandHandlerBase):
+	def __init__(self, args: DbBackupCommandArgs):
+		super().__init__()
+		self.args = args
+
+	@override
+	def requires_user_config_file(self) -> bool:
+		return False
+
+	def handle(self):
+		# the database itself is not opened, so it works even if the database file is broken
+		root_path = self.args.db_path
+		if root_path.name == db_constants.DB_FILE_NAME:
+			root_path = root_path.parent
+		store = DbPageStore(root_path / db_constants.DB_BACKUP_DIR_NAME / db_constants.DB_INCREMENTAL_BACKUP_DIR_NAME)
+
+		if self.args.name is None:
+			snapshots = store.list_snapshots()
+			self.logger.info('Incremental database backup amount: {}'.format(len(snapshots)))
+			for snapshot in snapshots:
+				values = {
+					'name': snapshot.name,
+					'date': repr(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot.created_at))),
+					'db_size': ByteCount(snapshot.db_size).auto_str() if self.args.human else snapshot.db_size,
+					'page_size': snapshot.page_size,
+					'page_count': snapshot.page_count,
+				}
+				self.logger.info('%s', ' '.join([f'{k}={v}' for k, v in values.items()]))
+			return
+
+		if self.args.output is None:
+			self.logger.error('Argument output is required to restore a database backup')
+			ErrorReturnCodes.invalid_argument.sys_exit()
+		if self.args.output.exists():
+			self.logger.error('Output path {!r} already exists'.format(self.args.output.as_posix()))
+			ErrorReturnCodes.invalid_argument.sys_exit()
+
+		self.logger.info('Restoring incremental database backup {!r} to {!r}'.format(self.args.name, self.args.output.as_posix()))
+		try:
+			store.restore_snapshot(self.args.name, self.args.output)
+		except DbPageStoreError as e:
+			self.logger.error('Restore database backup failed: {}'.format(e))
+			ErrorReturnCodes.action_failed.sys_exit()
+		self.logger.info('Restore done, size {}'.format(ByteCount(self.args.output.stat().st_size).auto_str()))
+
+
+class DbBackupCommandAdapter(CliCommandAdapterBase):
+	@property
+	@override
+	def command(self) -> str:
+		return 'db_backup'
+
+	@property
+	@override
+	def description(self) -> str:
+		return 'List the incremental database backups, or restore one of them to a database file'
+
+	@override
+	def build_parser(self, parser: argparse.ArgumentParser):
+		parser.add_argument('name', nargs='?', help='The name of the database backup to restore, e.g. db_backup_20240101_060000. If not given, list all incremental database backups')
+		parser.add_argument('output', nargs='?', help='The path of the restored database file. It must not exist')
+		parser.add_argument('-H', '--human', action='store_true', help='Prettify database sizes, make it human-readable')
+
+	@override
+	def run(self, args: argparse.Namespace):
+		handler = DbBackupCommandHandler(DbBackupCommandArgs(
+			db_path=Path(args.db),
+			config_path=Path(args.config) if args.config is not None else None,
+			name=args.name,
+			output=Path(args.output) if args.output is not None else None,
+			human=args.human,
+		))
+		handler.handle()
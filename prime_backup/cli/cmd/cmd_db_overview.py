@@ -73,15 +73,16 @@ class DbOverviewCommandHandler(CliCommandHandlerBase):
 		self.logger.info('File object dedup stats: %s', self.__one_dedupe_str(self.__ratio_str(result.file_total_count - result.file_object_count, result.file_total_count), result.file_total_count - result.file_object_count, result.file_total_count))
 
 		self.logger.info('[Blob]')
-		self.logger.info('Blob count: %s (direct: %s, chunked: %s)', result.blob_count, result.direct_blob_count, result.chunked_blob_count)
+		self.logger.info('Blob count: %s (direct: %s, chunked: %s, packed: %s)', result.blob_count, result.direct_blob_count, result.chunked_blob_count, result.packed_blob_count)
 		self.logger.info(
-			'Blob stored size sum: %s (%s; direct: %s, chunked: %s)',
+			'Blob stored size sum: %s (%s; direct: %s, chunked: %s, packed: %s)',
 			self.__size_str(result.blob_stored_size_sum),
 			self.__ratio_str(result.blob_stored_size_sum, result.blob_raw_size_sum),
 			self.__ratio_str(result.direct_blob_stored_size_sum, result.direct_blob_raw_size_sum),
 			self.__ratio_str(result.chunked_blob_stored_size_sum, result.chunked_blob_raw_size_sum),
+			self.__ratio_str(result.packed_blob_stored_size_sum, result.packed_blob_raw_size_sum),
 		)
-		self.logger.info('Blob raw size sum: %s (direct: %s, chunked: %s)', self.__size_str(result.blob_raw_size_sum), self.__size_str(result.direct_blob_raw_size_sum), self.__size_str(result.chunked_blob_raw_size_sum))
+		self.logger.info('Blob raw size sum: %s (direct: %s, chunked: %s, packed: %s)', self.__size_str(result.blob_raw_size_sum), self.__size_str(result.direct_blob_raw_size_sum), self.__size_str(result.chunked_blob_raw_size_sum), self.__size_str(result.packed_blob_raw_size_sum))
 		blob_count_str, blob_size_str = self.__dedup_stat_str(result.blob_count, result.file_object_count, result.blob_raw_size_sum, result.file_raw_size_sum)
 		self.logger.info('Blob dedup stats: count %s, size %s', blob_count_str, blob_size_str)
 
@@ -89,7 +90,7 @@ class DbOverviewCommandHandler(CliCommandHandlerBase):
 		self.logger.info('Chunk count: %s', result.chunk_count)
 		self.logger.info('Chunk stored size sum: %s (%s)', self.__size_str(result.chunk_stored_size_sum), self.__ratio_str(result.chunk_stored_size_sum, result.chunk_raw_size_sum))
 		self.logger.info('Chunk raw size sum: %s', self.__size_str(result.chunk_raw_size_sum))
-		chunk_count_str, chunk_size_str = self.__dedup_stat_str(result.chunk_count, result.chunk_group_chunk_binding_count, result.chunk_raw_size_sum, result.chunked_blob_raw_size_sum)
+		chunk_count_str, chunk_size_str = self.__dedup_stat_str(result.chunk_count, result.chunk_group_chunk_binding_count + result.packed_blob_count, result.chunk_raw_size_sum, result.chunked_blob_raw_size_sum + result.packed_blob_raw_size_sum)
 		self.logger.info('Chunk dedup stats: count %s, size %s', chunk_count_str, chunk_size_str)
 
 		self.logger.info('[Pack]')
@@ -10,6 +10,7 @@ from typing_extensions import override
 from prime_backup.cli.cmd import CliCommandHandlerBase, CommonCommandArgs, CliCommandAdapterBase
 from prime_backup.cli.return_codes import ErrorReturnCodes
 from prime_backup.constants import constants
+from prime_backup.types.units import ByteCount
 
 
 @dataclasses.dataclass(frozen=True)
@@ -20,6 +21,8 @@ class FuseCommandArgs(CommonCommandArgs):
 	allow_other: bool
 	no_cache: bool
 	no_meta: bool
+	chunk_cache_size: int
+	readahead_chunks: int
 
 
 class FuseCommandHandler(CliCommandHandlerBase):
@@ -37,6 +40,8 @@ class FuseCommandHandler(CliCommandHandlerBase):
 
 		fuse_config.no_cache = self.args.no_cache
 		fuse_config.no_meta = self.args.no_meta
+		fuse_config.chunk_cache_size = self.args.chunk_cache_size
+		fuse_config.readahead_chunks = self.args.readahead_chunks
 		if self.args.debug:
 			fuse_config.log_call = True
 
@@ -94,6 +99,8 @@ class FuseCommandAdapter(CliCommandAdapterBase):
 		parser.add_argument('--allow-other', action='store_true', help='Allow other users to access the fuse filesystem')
 		parser.add_argument('--debug', action='store_true', help='Enable fuse debug and more debug logging')
 		parser.add_argument('--no-cache', action='store_true', help='Disabled database access cache')
+		parser.add_argument('--chunk-cache-size', type=ByteCount, default=ByteCount('256MiB'), help='Max total size of the decompressed chunks to be cached in memory. Default: 256MiB')
+		parser.add_argument('--readahead-chunks', type=int, default=8, help='Amount of upcoming chunks to be read ahead for sequentially-read files. Set it to 0 to disable read-ahead. Default: 8')
 		parser.add_argument('--no-meta', action='store_true', help='Do not add the backup metadata file {!r} in the exported file'.format(constants.BACKUP_META_FILE_NAME))
 
 	@override
@@ -107,5 +114,7 @@ class FuseCommandAdapter(CliCommandAdapterBase):
 			allow_other=args.allow_other,
 			no_cache=args.no_cache,
 			no_meta=args.no_meta,
+			chunk_cache_size=int(args.chunk_cache_size.value),
+			readahead_chunks=args.readahead_chunks,
 		))
 		handler.handle()
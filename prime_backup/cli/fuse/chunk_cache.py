@@ -0,0 +1,121 @@
+import collections
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, List, Optional, Tuple
+
+from prime_backup.action.helpers.chunk_io import ChunkIO
+from prime_backup.action.helpers.pack_reader import PackFileObjectPool
+from prime_backup.types.chunk_info import ChunkInfo
+from prime_backup.utils import misc_utils
+
+
+class FuseChunkCache:
+	"""
+	Process-wide cache of decompressed chunks, shared by all opened files of all mounted backups
+
+	- Decompressed chunks are kept in an LRU keyed by chunk id, bounded by the total raw size.
+	  Chunks are immutable, so cached data never goes stale
+	- Pack files are read via a shared :class:`PackFileObjectPool`, instead of being reopened on every chunk switch
+	- Upcoming chunks of sequentially-read files can be read ahead with a small thread pool
+	"""
+	__instance: Optional['FuseChunkCache'] = None
+	__instance_lock = threading.Lock()
+
+	def __init__(self, max_size: int, *, max_open_packs: int = 16, readahead_workers: int = 2):
+		self.max_size = max_size
+		self.__lock = threading.Lock()
+		self.__data: 'collections.OrderedDict[int, bytes]' = collections.OrderedDict()
+		self.__data_size = 0
+		self.__loading: Dict[int, 'Future[bytes]'] = {}
+		self.__pack_file_obj_pool = PackFileObjectPool(max_size=max_open_packs)
+		self.__readahead_pool = ThreadPoolExecutor(max_workers=readahead_workers, thread_name_prefix=misc_utils.make_thread_name('fuse-readahead'))
+
+	@classmethod
+	def get_instance(cls) -> 'FuseChunkCache':
+		# created lazily, so the readahead threads are created after fuse forks into background
+		with cls.__instance_lock:
+			if cls.__instance is None:
+				from prime_backup.cli.fuse.config import FuseConfig
+				cls.__instance = FuseChunkCache(FuseConfig.get().chunk_cache_size)
+			return cls.__instance
+
+	def __len__(self) -> int:
+		return len(self.__data)
+
+	@property
+	def data_size(self) -> int:
+		return self.__data_size
+
+	def __put(self, chunk_id: int, data: bytes):
+		# invoked with self.__lock held
+		if len(data) > self.max_size:
+			return
+		self.__data[chunk_id] = data
+		self.__data_size += len(data)
+		while self.__data_size > self.max_size:
+			_, old_data = self.__data.popitem(last=False)
+			self.__data_size -= len(old_data)
+
+	def __load(self, chunk: ChunkInfo, future: 'Future[bytes]'):
+		try:
+			with ChunkIO(chunk, pack_file_obj_pool=self.__pack_file_obj_pool).open_decompressed() as f:
+				data = f.read()
+			if len(data) != chunk.raw_size:
+				raise ValueError('raw size mismatched for chunk {}, expected {}, got {}'.format(chunk.id, chunk.raw_size, len(data)))
+		except BaseException as e:
+			with self.__lock:
+				self.__loading.pop(chunk.id, None)
+			future.set_exception(e)
+			raise
+		else:
+			with self.__lock:
+				self.__loading.pop(chunk.id, None)
+				self.__put(chunk.id, data)
+			future.set_result(data)
+
+	def __get_or_start_loading(self, chunk: ChunkInfo) -> Tuple[Optional[bytes], Optional['Future[bytes]'], bool]:
+		with self.__lock:
+			if (data := self.__data.get(chunk.id)) is not None:
+				self.__data.move_to_end(chunk.id)
+				return data, None, False
+			if (future := self.__loading.get(chunk.id)) is not None:
+				return None, future, False
+			future = Future()
+			self.__loading[chunk.id] = future
+			return None, future, True
+
+	def get(self, chunk: ChunkInfo) -> bytes:
+		"""
+		:return: The decompressed content of the chunk
+		"""
+		data, future, is_owner = self.__get_or_start_loading(chunk)
+		if data is not None:
+			return data
+		assert future is not None
+		if is_owner:
+			self.__load(chunk, future)
+		return future.result()
+
+	def readahead(self, chunks: List[ChunkInfo]):
+		"""
+		Load the given chunks into the cache in background, if they are not cached or being loaded yet
+		"""
+		for chunk in chunks:
+			if chunk.raw_size > self.max_size:
+				continue
+			_, future, is_owner = self.__get_or_start_loading(chunk)
+			if is_owner and future is not None:
+				self.__readahead_pool.submit(self.__load_quietly, chunk, future)
+
+	def __load_quietly(self, chunk: ChunkInfo, future: 'Future[bytes]'):
+		try:
+			self.__load(chunk, future)
+		except Exception:
+			pass  # the error will be raised again to the reader, if the chunk does get read
+
+	def close(self):
+		self.__readahead_pool.shutdown(wait=True)
+		self.__pack_file_obj_pool.close()
+		with self.__lock:
+			self.__data.clear()
+			self.__data_size = 0
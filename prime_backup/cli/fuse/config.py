@@ -6,6 +6,8 @@ class FuseConfig:
 	log_call: bool = False
 	no_cache: bool = False
 	no_meta: bool = False
+	chunk_cache_size: int = 256 * 1024 * 1024
+	readahead_chunks: int = 8
 
 	@classmethod
 	def get(cls) -> 'FuseConfig':
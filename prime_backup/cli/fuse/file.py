@@ -10,12 +10,13 @@ from typing_extensions import Optional, override
 
 from prime_backup import logger
 from prime_backup.action.get_chunk_action import GetBlobChunksAction
-from prime_backup.action.helpers.chunk_io import ChunkIO
+from prime_backup.cli.fuse.chunk_cache import FuseChunkCache
+from prime_backup.cli.fuse.config import FuseConfig
 from prime_backup.cli.fuse.utils import fuse_operation_wrapper, FuseErrnoReturnError
 from prime_backup.compressors import Compressor, CompressMethod
 from prime_backup.db.values import BlobStorageMethod
 from prime_backup.types.blob_info import BlobInfo
-from prime_backup.types.chunk_info import OffsetChunkInfo, ChunkInfo
+from prime_backup.types.chunk_info import OffsetChunkInfo
 from prime_backup.utils import blob_utils
 from prime_backup.utils.io_types import SupportsReadBytes, SupportsReadAndSeek
 
@@ -59,20 +60,17 @@ class _SingleFileReader(_FileReader):
 
 	@classmethod
 	def create_from_file(cls, file_path: Path, compress_method: CompressMethod) -> '_SingleFileReader':
-		if compress_method == CompressMethod.plain:
-			return _SingleFileReader(open(file_path, 'rb'))
+		compressor = Compressor.create(compress_method)
+		if compressor.SEEKABLE:
+			# e.g. plain, zstd_seekable. They support random access
+			return _SingleFileReader(compressor.open_decompressed_seekable(file_path))
 		else:
-			decompressed_stream = Compressor.create(compress_method).open_decompressed(file_path)
-			return _SingleFileReader(decompressed_stream)
+			return _SingleFileReader(compressor.open_decompressed(file_path))
 
 	@classmethod
 	def create_from_blob(cls, blob: BlobInfo) -> '_SingleFileReader':
 		return _SingleFileReader.create_from_file(blob_utils.get_blob_path(blob.hash), blob.compress)
 
-	@classmethod
-	def create_from_chunk(cls, chunk: ChunkInfo) -> '_SingleFileReader':
-		return _SingleFileReader(ChunkIO(chunk).open_decompressed())
-
 
 class _MultiFileReader(_FileReader):
 	def __init__(self, chunks: List[OffsetChunkInfo]):
@@ -81,8 +79,10 @@ class _MultiFileReader(_FileReader):
 		self.chunks = sorted(chunks)
 		self.total_size = self.chunks[-1].offset + self.chunks[-1].size
 		self.current_index: int = 0
-		self.current_reader: Optional[_SingleFileReader] = None
-		self.__reopen_to_chunk(0)
+		self.chunk_cache = FuseChunkCache.get_instance()
+		self.readahead_chunks = FuseConfig.get().readahead_chunks
+		self.next_sequential_offset: int = 0
+		self.last_readahead_index: int = -1
 
 	@property
 	def current_chunk(self) -> OffsetChunkInfo:
@@ -96,12 +96,6 @@ class _MultiFileReader(_FileReader):
 	def current_offset_upper(self) -> int:
 		return self.current_chunk.offset + self.current_chunk.size
 
-	def __reopen_to_chunk(self, idx: int):
-		self.close()
-
-		self.current_index = idx
-		self.current_reader = _SingleFileReader.create_from_chunk(self.chunks[idx].chunk)
-
 	def __is_offset_in_index(self, offset: int, index: int) -> bool:
 		if index < 0 or index >= len(self.chunks):
 			return False
@@ -126,41 +120,50 @@ class _MultiFileReader(_FileReader):
 
 		raise ValueError(f'Offset {offset} is out of range of all chunks')
 
-	def __read_once(self, offset: int, size: int) -> bytes:
+	def __readahead(self):
+		if self.readahead_chunks <= 0 or self.last_readahead_index == self.current_index:
+			return
+		self.last_readahead_index = self.current_index
+		upcoming = self.chunks[self.current_index + 1:self.current_index + 1 + self.readahead_chunks]
+		self.chunk_cache.readahead([oc.chunk for oc in upcoming])
+
+	def __read_once(self, offset: int, size: int, sequential: bool) -> bytes:
 		if not self.__is_offset_in_index(offset, self.current_index):
 			if self.__is_offset_in_index(offset, self.current_index + 1):
-				target_idx = self.current_index + 1
+				self.current_index += 1
 			else:
-				target_idx = self.__find_chunk_index(offset)
-			self.__reopen_to_chunk(target_idx)
+				self.current_index = self.__find_chunk_index(offset)
+		if sequential:
+			self.__readahead()
 
 		relative_offset = offset - self.current_offset_lower
 		read_size = min(size, self.current_offset_upper - offset)
 
-		assert self.current_reader is not None
-		return self.current_reader.read(read_size, relative_offset)
+		data = self.chunk_cache.get(self.current_chunk.chunk)
+		return data[relative_offset:relative_offset + read_size]
 
 	@override
 	def read(self, size: int, offset: int) -> bytes:
 		if offset >= self.total_size:
 			return b''
 
+		# the upcoming chunks are read ahead only if the file is being read sequentially
+		sequential = offset == self.next_sequential_offset
 		buf_list: List[bytes] = []
 		while True:
-			buf = self.__read_once(offset, size)
+			buf = self.__read_once(offset, size, sequential)
 			buf_list.append(buf)
 			size -= len(buf)
+			offset += len(buf)
 			if size <= 0 or self.current_index >= len(self.chunks) - 1:
 				break
-			offset += len(buf)
 
+		self.next_sequential_offset = offset
 		return b''.join(buf_list)
 
 	@override
 	def close(self):
-		if self.current_reader is not None:
-			self.current_reader.close()
-			self.current_reader = None
+		pass
 
 
 class PrimeBackupFuseFile:
@@ -181,7 +184,7 @@ class PrimeBackupFuseFile:
 	def __create_reader_from_blob(cls, blob: BlobInfo) -> _FileReader:
 		if blob.storage_method == BlobStorageMethod.direct:
 			return cls.__create_reader_from_blob_direct(blob)
-		elif blob.storage_method == BlobStorageMethod.chunked:
+		elif blob.storage_method in (BlobStorageMethod.chunked, BlobStorageMethod.packed):
 			return cls.__create_reader_from_blob_chunked(blob)
 		else:
 			raise FuseErrnoReturnError(errno.EIO)
@@ -202,7 +205,7 @@ class PrimeBackupFuseFile:
 		try:
 			return self.reader.read(length, offset)
 		except _FileReader.NoSequenceRead:
-			self.logger.warning(f'seeking is not supported by blob {self.blob}')
+			self.logger.warning(f'seeking is not supported by blob {self.blob}, consider using a seekable compress method like zstd_seekable for it')
 			raise FuseErrnoReturnError(errno.ENOTSUP)
 
 	@fuse_operation_wrapper()
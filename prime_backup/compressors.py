@@ -1,14 +1,18 @@
+import bisect
 import contextlib
 import dataclasses
 import enum
+import io
+import os
+import struct
 from abc import abstractmethod, ABC
-from typing import BinaryIO, Union, ContextManager, Tuple, Callable, Literal, Generator, TYPE_CHECKING, Type
+from typing import BinaryIO, Union, ContextManager, Tuple, Callable, Literal, Generator, TYPE_CHECKING, Type, Optional, ClassVar, Dict, Any, List, cast, IO
 
 from typing_extensions import Protocol, override
 
 from prime_backup.utils import file_utils
 from prime_backup.utils.bypass_io import BypassReader, BypassWriter
-from prime_backup.utils.io_types import SupportsReadBytes
+from prime_backup.utils.io_types import SupportsReadBytes, SupportsReadAndSeek
 from prime_backup.utils.path_like import PathLike
 
 
@@ -19,14 +23,39 @@ class Compressor(ABC):
 		read_hash: str
 		write_size: int
 
+	LEVEL_RANGE: ClassVar[Optional[Tuple[int, int]]] = None  # inclusive range. None means the compression level is not supported
+	SUPPORTS_THREADS: ClassVar[bool] = False
+	SEEKABLE: ClassVar[bool] = False  # if decompress_stream_seekable() is supported
+
+	def __init__(self, level: Optional[int] = None, threads: int = 0):
+		"""
+		:param level: The compression level. None means the default level of the compression library
+		:param threads: The amount of compression worker threads. 0 means compressing in the current thread.
+			It's ignored if the compressor does not support multithreaded compression
+		"""
+		self.validate_level(level)
+		if threads < 0:
+			raise ValueError('Compression threads should be >= 0, got {}'.format(threads))
+		self.level = level
+		self.threads = threads if self.SUPPORTS_THREADS else 0
+
 	@classmethod
-	def create(cls, method: Union[str, 'CompressMethod']) -> 'Compressor':
+	def create(cls, method: Union[str, 'CompressMethod'], level: Optional[int] = None, *, threads: int = 0) -> 'Compressor':
 		if not isinstance(method, CompressMethod):
 			if method in CompressMethod.__members__:
 				method = CompressMethod[method]
 			else:
 				raise ValueError(f'Unknown compression method: {method}')
-		return method.value()
+		return method.value(level, threads)
+
+	@classmethod
+	def validate_level(cls, level: Optional[int]):
+		if level is None:
+			return
+		if cls.LEVEL_RANGE is None:
+			raise ValueError('Compression method {} does not support compression level, got {}'.format(cls.get_name(), level))
+		if not cls.LEVEL_RANGE[0] <= level <= cls.LEVEL_RANGE[1]:
+			raise ValueError('Compression level of {} should be in range [{}, {}], got {}'.format(cls.get_name(), cls.LEVEL_RANGE[0], cls.LEVEL_RANGE[1], level))
 
 	@classmethod
 	def get_method(cls) -> 'CompressMethod':
@@ -108,6 +137,15 @@ class Compressor(ABC):
 			with self.decompress_stream(reader) as f_decompressed:
 				yield reader, f_decompressed
 
+	@contextlib.contextmanager
+	def open_decompressed_seekable(self, source_path: PathLike) -> Generator[SupportsReadAndSeek, None, None]:
+		"""
+		source_path --[decompress]--> (seekable reader)
+		"""
+		with open(source_path, 'rb') as f:
+			with self.decompress_stream_seekable(f) as f_decompressed:
+				yield f_decompressed
+
 	def _copy_compressed(self, f_in: BinaryIO, f_out: BinaryIO, *, estimate_read_size: int = 0):
 		"""
 		(f_in) --[compress]--> (f_out)
@@ -136,6 +174,12 @@ class Compressor(ABC):
 		"""
 		...
 
+	def decompress_stream_seekable(self, f_in: SupportsReadAndSeek) -> ContextManager[SupportsReadAndSeek]:
+		"""
+		Open a stream from decompressing read, with random access support. Only available if :attr:`SEEKABLE` is True
+		"""
+		raise NotImplementedError('Compress method {} does not support seekable decompression'.format(self.get_name()))
+
 	@abstractmethod
 	def compress_bytes(self, data: Union[bytes, memoryview]) -> bytes:
 		...
@@ -146,6 +190,8 @@ class Compressor(ABC):
 
 
 class PlainCompressor(Compressor):
+	SEEKABLE = True
+
 	@classmethod
 	@override
 	def ensure_lib(cls):
@@ -161,6 +207,11 @@ class PlainCompressor(Compressor):
 	def decompress_stream(self, f_in: SupportsReadBytes) -> Generator[SupportsReadBytes, None, None]:
 		yield f_in
 
+	@contextlib.contextmanager
+	@override
+	def decompress_stream_seekable(self, f_in: SupportsReadAndSeek) -> Generator[SupportsReadAndSeek, None, None]:
+		yield f_in
+
 	@override
 	def compress_bytes(self, data: Union[bytes, memoryview]) -> bytes:
 		return data if isinstance(data, bytes) else bytes(data)
@@ -171,10 +222,10 @@ class PlainCompressor(Compressor):
 
 
 class _GzipLikeLibrary(Protocol):
-	def open(self, file_obj: SupportsReadBytes, mode: str) -> BinaryIO:
+	def open(self, file_obj: SupportsReadBytes, mode: str, **kwargs) -> BinaryIO:
 		...
 
-	def compress(self, data: Union[bytes, memoryview]) -> bytes:
+	def compress(self, data: Union[bytes, memoryview], **kwargs) -> bytes:
 		...
 
 	def decompress(self, data: Union[bytes, memoryview]) -> bytes:
@@ -192,10 +243,22 @@ class _GzipLikeCompressorBase(Compressor, ABC):
 	def ensure_lib(cls):
 		cls._lib()
 
+	def _get_open_kwargs(self) -> Dict[str, Any]:
+		"""
+		Extra kwargs for the compressing lib.open(), e.g. the compression level
+		"""
+		return self._get_compress_kwargs()
+
+	def _get_compress_kwargs(self) -> Dict[str, Any]:
+		"""
+		Extra kwargs for lib.compress(), e.g. the compression level
+		"""
+		return {}
+
 	@contextlib.contextmanager
 	@override
 	def compress_stream(self, f_out: BinaryIO) -> Generator[BinaryIO, None, None]:
-		with self._lib().open(f_out, 'wb') as compressed_out:
+		with self._lib().open(f_out, 'wb', **self._get_open_kwargs()) as compressed_out:
 			yield compressed_out
 
 	@contextlib.contextmanager
@@ -206,7 +269,7 @@ class _GzipLikeCompressorBase(Compressor, ABC):
 
 	@override
 	def compress_bytes(self, data: Union[bytes, memoryview]) -> bytes:
-		return self._lib().compress(data)
+		return self._lib().compress(data, **self._get_compress_kwargs())
 
 	@override
 	def decompress_bytes(self, data: Union[bytes, memoryview]) -> bytes:
@@ -214,30 +277,307 @@ class _GzipLikeCompressorBase(Compressor, ABC):
 
 
 class GzipCompressor(_GzipLikeCompressorBase):
+	LEVEL_RANGE = (0, 9)
+
 	@classmethod
 	@override
 	def _lib(cls):
 		import gzip
 		return gzip
 
+	@override
+	def _get_compress_kwargs(self) -> Dict[str, Any]:
+		return {'compresslevel': self.level} if self.level is not None else {}
+
 
 class LzmaCompressor(_GzipLikeCompressorBase):
+	LEVEL_RANGE = (0, 9)
+
 	@classmethod
 	@override
 	def _lib(cls):
 		import lzma
 		return lzma
 
+	@override
+	def _get_compress_kwargs(self) -> Dict[str, Any]:
+		return {'preset': self.level} if self.level is not None else {}
+
 
 class ZstdCompressor(_GzipLikeCompressorBase):
+	LEVEL_RANGE = (-131072, 22)  # negative levels are the fast ones
+	SUPPORTS_THREADS = True
+
 	@classmethod
 	@override
 	def _lib(cls):
 		import zstandard
 		return zstandard
 
+	def _get_cctx_kwargs(self) -> Dict[str, Any]:
+		kwargs: Dict[str, Any] = {}
+		if self.level is not None:
+			kwargs['level'] = self.level
+		if self.threads > 0:
+			# zstd splits the input into jobs and compresses them in its own worker threads
+			kwargs['threads'] = self.threads
+		return kwargs
+
+	def _create_cctx(self):
+		import zstandard
+		return zstandard.ZstdCompressor(**self._get_cctx_kwargs())
+
+	@override
+	def _get_open_kwargs(self) -> Dict[str, Any]:
+		if self.level is None and self.threads == 0:
+			return {}
+		return {'cctx': self._create_cctx()}
+
+	@override
+	def _get_compress_kwargs(self) -> Dict[str, Any]:
+		return {'level': self.level} if self.level is not None else {}
+
+	@override
+	def compress_bytes(self, data: Union[bytes, memoryview]) -> bytes:
+		if self.threads == 0:
+			return super().compress_bytes(data)
+		return self._create_cctx().compress(data)
+
+
+class _PrependedReader:
+	def __init__(self, head: bytes, file_obj: SupportsReadBytes):
+		self.head = head
+		self.file_obj = file_obj
+
+	def read(self, n: int = -1) -> bytes:
+		if len(self.head) == 0:
+			return self.file_obj.read(n)
+		if 0 <= n <= len(self.head):
+			data, self.head = self.head[:n], self.head[n:]
+			return data
+		data, self.head = self.head, b''
+		return data + self.file_obj.read(n - len(data) if n >= 0 else -1)
+
+
+class ZstdDictCompressor(ZstdCompressor):
+	"""
+	zstd with the latest trained dictionary, which works much better than plain zstd on small data.
+	Without any trained dictionary, the output is the same as :class:`ZstdCompressor`
+
+	The dictionary id is stored in the zstd frame header, so the decompressor knows which dictionary to use
+	"""
+	DEFAULT_LEVEL = 3  # the default level of zstd
+	FRAME_HEADER_SIZE_MAX = 18
+
+	@override
+	def _create_cctx(self):
+		import zstandard
+		from prime_backup.db.zstd_dict_cache import ZstdDictCache
+		kwargs = self._get_cctx_kwargs()
+		if (dict_id := ZstdDictCache.get_latest_id()) is not None:
+			level = self.level if self.level else self.DEFAULT_LEVEL
+			kwargs['dict_data'] = ZstdDictCache.get_compress_dict(dict_id, level)
+		return zstandard.ZstdCompressor(**kwargs)
+
+	@classmethod
+	def __create_dctx(cls, frame_head: bytes):
+		import zstandard
+		from prime_backup.db.zstd_dict_cache import ZstdDictCache
+		dict_id = zstandard.get_frame_parameters(frame_head).dict_id if len(frame_head) > 0 else 0
+		if dict_id == 0:
+			return zstandard.ZstdDecompressor()
+		return zstandard.ZstdDecompressor(dict_data=ZstdDictCache.get_decompress_dict(dict_id))
+
+	@override
+	def _get_open_kwargs(self) -> Dict[str, Any]:
+		return {'cctx': self._create_cctx()}
+
+	@contextlib.contextmanager
+	@override
+	def decompress_stream(self, f_in: SupportsReadBytes) -> Generator[SupportsReadBytes, None, None]:
+		frame_head = f_in.read(self.FRAME_HEADER_SIZE_MAX)
+		dctx = self.__create_dctx(frame_head)
+		with dctx.stream_reader(_PrependedReader(frame_head, f_in), closefd=False) as compressed_in:
+			yield compressed_in
+
+	@override
+	def compress_bytes(self, data: Union[bytes, memoryview]) -> bytes:
+		return self._create_cctx().compress(data)
+
+	@override
+	def decompress_bytes(self, data: Union[bytes, memoryview]) -> bytes:
+		return self.__create_dctx(bytes(data[:self.FRAME_HEADER_SIZE_MAX])).decompress(data)
+
+
+class _ZstdSeekableWriter:
+	def __init__(self, f_out: BinaryIO, cctx, frame_raw_size: int):
+		self.f_out = f_out
+		self.cctx = cctx
+		self.frame_raw_size = frame_raw_size
+		self.buf = bytearray()
+		self.frame_sizes: List[Tuple[int, int]] = []  # (compressed size, raw size)
+
+	def __write_frame(self, data: Union[bytes, bytearray, memoryview]):
+		compressed = self.cctx.compress(data)
+		self.f_out.write(compressed)
+		self.frame_sizes.append((len(compressed), len(data)))
+
+	def write(self, data: Union[bytes, bytearray, memoryview]) -> int:
+		self.buf += data
+		if len(self.buf) >= self.frame_raw_size:
+			view = memoryview(self.buf)
+			pos = 0
+			while len(self.buf) - pos >= self.frame_raw_size:
+				self.__write_frame(view[pos:pos + self.frame_raw_size])
+				pos += self.frame_raw_size
+			view.release()
+			del self.buf[:pos]
+		return len(data)
+
+	def flush(self):
+		pass
+
+	def finish(self):
+		if len(self.buf) > 0:
+			self.__write_frame(self.buf)
+			self.buf = bytearray()
+		entries = b''.join(struct.pack('<II', c_size, r_size) for c_size, r_size in self.frame_sizes)
+		footer = struct.pack('<IBI', len(self.frame_sizes), 0, ZstdSeekableCompressor.SEEKABLE_MAGIC)
+		self.f_out.write(struct.pack('<II', ZstdSeekableCompressor.SKIPPABLE_FRAME_MAGIC, len(entries) + len(footer)))
+		self.f_out.write(entries)
+		self.f_out.write(footer)
+
+
+class _ZstdSeekableReader:
+	def __init__(self, f_in: SupportsReadAndSeek):
+		import zstandard
+		self.f_in = f_in
+		self.dctx = zstandard.ZstdDecompressor()
+
+		file_size = cast(int, f_in.seek(0, os.SEEK_END))
+		footer_size = struct.calcsize('<IBI')
+		if file_size < footer_size + 8:
+			raise ValueError('file too small for a seekable zstd stream, size {}'.format(file_size))
+		f_in.seek(file_size - footer_size)
+		frame_count, descriptor, magic = struct.unpack('<IBI', f_in.read(footer_size))
+		if magic != ZstdSeekableCompressor.SEEKABLE_MAGIC:
+			raise ValueError('bad seekable zstd magic number {:#x}'.format(magic))
+		entry_size = 12 if descriptor & 0x80 else 8  # the optional checksum is not used by us
+		table_size = frame_count * entry_size
+		if file_size < footer_size + table_size + 8:
+			raise ValueError('seek table out of range, frame count {}, file size {}'.format(frame_count, file_size))
+		f_in.seek(file_size - footer_size - table_size)
+		table = f_in.read(table_size)
+
+		# the offsets of frame i is at index i, and the offsets of the stream end is at the last index
+		self.compressed_offsets: List[int] = [0]
+		self.raw_offsets: List[int] = [0]
+		for i in range(frame_count):
+			c_size, r_size = struct.unpack_from('<II', table, i * entry_size)
+			self.compressed_offsets.append(self.compressed_offsets[-1] + c_size)
+			self.raw_offsets.append(self.raw_offsets[-1] + r_size)
+		if self.compressed_offsets[-1] > file_size - footer_size - table_size - 8:
+			raise ValueError('seek table does not match the file size {}'.format(file_size))
+
+		self.raw_size = self.raw_offsets[-1]
+		self.position = 0
+		self.cached_frame_index = -1
+		self.cached_frame = b''
+
+	def __get_frame(self, idx: int) -> bytes:
+		if idx != self.cached_frame_index:
+			c_offset = self.compressed_offsets[idx]
+			self.f_in.seek(c_offset)
+			compressed = self.f_in.read(self.compressed_offsets[idx + 1] - c_offset)
+			raw_size = self.raw_offsets[idx + 1] - self.raw_offsets[idx]
+			frame = self.dctx.decompress(compressed, max_output_size=raw_size) if raw_size > 0 else b''
+			if len(frame) != raw_size:
+				raise ValueError('frame {} raw size mismatched, expected {}, got {}'.format(idx, raw_size, len(frame)))
+			self.cached_frame_index, self.cached_frame = idx, frame
+		return self.cached_frame
+
+	def read(self, n: int = -1) -> bytes:
+		end = self.raw_size if n < 0 else min(self.raw_size, self.position + n)
+		buf_list: List[bytes] = []
+		while self.position < end:
+			idx = bisect.bisect_right(self.raw_offsets, self.position) - 1
+			frame = self.__get_frame(idx)
+			start = self.position - self.raw_offsets[idx]
+			data = frame[start:start + end - self.position]
+			buf_list.append(data)
+			self.position += len(data)
+		return b''.join(buf_list)
+
+	def seekable(self) -> bool:
+		return True
+
+	def seek(self, offset: int, whence: int = 0) -> int:
+		if whence == os.SEEK_SET:
+			position = offset
+		elif whence == os.SEEK_CUR:
+			position = self.position + offset
+		elif whence == os.SEEK_END:
+			position = self.raw_size + offset
+		else:
+			raise ValueError('invalid whence {}'.format(whence))
+		if position < 0:
+			raise ValueError('negative seek position {}'.format(position))
+		self.position = position
+		return self.position
+
+	def tell(self) -> int:
+		return self.position
+
+
+class ZstdSeekableCompressor(ZstdCompressor):
+	"""
+	zstd in the seekable format: the data is split into independently compressed frames,
+	followed by a seek table in a skippable frame, so reads can jump to any offset by decompressing a single frame.
+	See https://github.com/facebook/zstd/blob/dev/contrib/seekable_format/zstd_seekable_compression_format.md
+
+	It's a valid zstd stream, so any zstd decompressor can still decompress it as a whole
+	"""
+	SEEKABLE = True
+	FRAME_RAW_SIZE = 1024 * 1024
+	SKIPPABLE_FRAME_MAGIC = 0x184D2A5E
+	SEEKABLE_MAGIC = 0x8F92EAB1
+
+	@contextlib.contextmanager
+	@override
+	def compress_stream(self, f_out: BinaryIO) -> Generator[BinaryIO, None, None]:
+		writer = _ZstdSeekableWriter(f_out, self._create_cctx(), self.FRAME_RAW_SIZE)
+		yield cast(BinaryIO, writer)
+		writer.finish()
+
+	@contextlib.contextmanager
+	@override
+	def decompress_stream(self, f_in: SupportsReadBytes) -> Generator[SupportsReadBytes, None, None]:
+		import zstandard
+		# the stream reader only calls read() of the source
+		with zstandard.ZstdDecompressor().stream_reader(cast(IO[bytes], f_in), read_across_frames=True, closefd=False) as compressed_in:
+			yield compressed_in
+
+	@contextlib.contextmanager
+	@override
+	def decompress_stream_seekable(self, f_in: SupportsReadAndSeek) -> Generator[SupportsReadAndSeek, None, None]:
+		yield _ZstdSeekableReader(f_in)
+
+	@override
+	def compress_bytes(self, data: Union[bytes, memoryview]) -> bytes:
+		buf = io.BytesIO()
+		with self.compress_stream(buf) as f:
+			f.write(data)
+		return buf.getvalue()
+
+	@override
+	def decompress_bytes(self, data: Union[bytes, memoryview]) -> bytes:
+		with self.decompress_stream(io.BytesIO(data)) as f:
+			return f.read()
+
 
 class Lz4Compressor(_GzipLikeCompressorBase):
+	LEVEL_RANGE = (0, 16)
+
 	@classmethod
 	@override
 	def _lib(cls):
@@ -245,6 +585,10 @@ class Lz4Compressor(_GzipLikeCompressorBase):
 		import lz4.frame
 		return lz4.frame
 
+	@override
+	def _get_compress_kwargs(self) -> Dict[str, Any]:
+		return {'compression_level': self.level} if self.level is not None else {}
+
 
 class CompressMethod(enum.Enum):
 	plain = PlainCompressor
@@ -252,6 +596,8 @@ class CompressMethod(enum.Enum):
 	lzma = LzmaCompressor
 	zstd = ZstdCompressor
 	lz4 = Lz4Compressor
+	zstd_dict = ZstdDictCompressor
+	zstd_seekable = ZstdSeekableCompressor
 
 	if TYPE_CHECKING:
 		value: Type[Compressor]
@@ -1,10 +1,12 @@
 from typing import List, Optional, TYPE_CHECKING
 
 from mcdreforged.api.utils import Serializable
+from typing_extensions import override
 
-from prime_backup.compressors import CompressMethod
+from prime_backup.compressors import CompressMethod, Compressor
 from prime_backup.types.chunk_method import ChunkMethod
 from prime_backup.types.hash_method import HashMethod
+from prime_backup.utils.path_like import PathLike
 
 if TYPE_CHECKING:
 	import pathspec
@@ -21,6 +23,34 @@ class ChunkingRule(Serializable):
 		return pathspec_utils.compile_gitignore_spec(self.patterns)
 
 
+class CompressionRule(Serializable):
+	method: CompressMethod
+	level: Optional[int] = None
+	file_size_min: int = 0
+	file_size_max: Optional[int] = None
+	patterns: List[str] = []
+
+	@override
+	def on_deserialization(self, **kwargs):
+		self.method.value.validate_level(self.level)
+		if self.file_size_min < 0:
+			raise ValueError('Field file_size_min must >= 0, got {!r}'.format(self.file_size_min))
+		if self.file_size_max is not None and self.file_size_max < self.file_size_min:
+			raise ValueError('Field file_size_max must >= file_size_min ({}), got {!r}'.format(self.file_size_min, self.file_size_max))
+
+	@property
+	def patterns_spec(self) -> 'pathspec.GitIgnoreSpec':
+		from prime_backup.utils import pathspec_utils
+		return pathspec_utils.compile_gitignore_spec(self.patterns)
+
+	def matches(self, file_path: PathLike, file_size: int) -> bool:
+		return (
+				self.file_size_min <= file_size and
+				(self.file_size_max is None or file_size <= self.file_size_max) and
+				self.patterns_spec.match_file(file_path)
+		)
+
+
 class BackupConfig(Serializable):
 	# Source
 	source_root: str = './server'
@@ -37,11 +67,13 @@ class BackupConfig(Serializable):
 	retain_patterns: List[str] = []
 	follow_target_symlink: bool = False
 	reuse_stat_unchanged_file: bool = False
+	stat_cache_enabled: bool = False
 	creation_skip_missing_file: bool = False
 	creation_skip_missing_file_patterns: List[str] = [
 		'**',
 	]
 	mutating_file_patterns: List[str] = []
+	source_snapshot_enabled: bool = False
 
 	# Chunking
 	chunking_enabled: bool = False
@@ -65,13 +97,33 @@ class BackupConfig(Serializable):
 	# Storage
 	hash_method: HashMethod = HashMethod.blake3
 	compress_method: CompressMethod = CompressMethod.zstd
+	compress_level: Optional[int] = None
 	compress_threshold: int = 64
+	compress_threads: int = 0
+	compress_threads_threshold: int = 16 * 1024 * 1024
+	compression_rules: List[CompressionRule] = []
+	zstd_dict_enabled: bool = False
+	zstd_dict_threshold: int = 128 * 1024
+	adaptive_compress_enabled: bool = False
+	adaptive_compress_sample_size: int = 64 * 1024
+	adaptive_compress_ratio_threshold: float = 0.95
+	blob_pack_threshold: int = 0
 
 	# Advanced
-	fileset_allocate_lookback_count: int = 2
+	fileset_allocate_lookback_count: int = 32
 	pack_auto_compact_threshold: float = 0.5
 	pack_maintenance_compact_threshold: float = 0.8
 
+	@override
+	def on_deserialization(self, **kwargs):
+		self.compress_method.value.validate_level(self.compress_level)
+		if self.compress_threads < 0:
+			raise ValueError('Field compress_threads must >= 0, got {!r}'.format(self.compress_threads))
+		if self.adaptive_compress_sample_size <= 0:
+			raise ValueError('Field adaptive_compress_sample_size must > 0, got {!r}'.format(self.adaptive_compress_sample_size))
+		if not 0 < self.adaptive_compress_ratio_threshold <= 1:
+			raise ValueError('Field adaptive_compress_ratio_threshold must be in range (0, 1], got {!r}'.format(self.adaptive_compress_ratio_threshold))
+
 	def get_compress_method_from_size(self, file_size: int, *, compress_method_override: Optional[CompressMethod] = None) -> CompressMethod:
 		if file_size < self.compress_threshold:
 			return CompressMethod.plain
@@ -81,6 +133,50 @@ class BackupConfig(Serializable):
 			else:
 				return self.compress_method
 
+	def get_compress_threads(self, data_size: int, *, concurrency: int = 1) -> int:
+		"""
+		:param data_size: The size of the data to be compressed
+		:param concurrency: The amount of compressions that might run at the same time, e.g. the worker count of the blob creating pool
+		:return: The amount of compression worker threads for the data. The cpu cores are shared by all concurrent compressions,
+			so a compressor gets at most its part of them. 0 means compressing in the current thread
+		"""
+		if self.compress_threads == 0 or data_size < self.compress_threads_threshold:
+			return 0
+		import multiprocessing
+		threads = min(self.compress_threads, multiprocessing.cpu_count() // max(1, concurrency))
+		return threads if threads > 1 else 0  # a single worker thread does not make compression faster
+
+	def get_compressor(self, file_path: Optional[PathLike], file_size: int, *, data_size: Optional[int] = None, concurrency: int = 1) -> Compressor:
+		"""
+		Select the compression method and level to store the data of a file
+
+		:param file_path: The path of the file, relative to the source root. None if unknown, then no compression rule will be applied
+		:param file_size: The size of the file
+		:param data_size: The size of the data to be compressed, e.g. the chunk size for chunked files. Default: the file size
+		:param concurrency: The amount of compressions that might run at the same time, see :meth:`get_compress_threads`
+		"""
+		if data_size is None:
+			data_size = file_size
+		if data_size < self.compress_threshold:
+			return Compressor.create(CompressMethod.plain)
+		threads = self.get_compress_threads(data_size, concurrency=concurrency)
+
+		method, level = self.compress_method, self.compress_level
+		if file_path is not None:
+			for rule in self.compression_rules:
+				if rule.matches(file_path, file_size):
+					method, level = rule.method, rule.level
+					break
+
+		if method == CompressMethod.zstd and self.zstd_dict_enabled and data_size <= self.zstd_dict_threshold:
+			from prime_backup.db.zstd_dict_cache import ZstdDictCache
+			if ZstdDictCache.get_latest_id() is not None:
+				method = CompressMethod.zstd_dict
+		return Compressor.create(method, level, threads=threads)
+
+	def should_pack_blob(self, file_size: int) -> bool:
+		return 0 < file_size <= self.blob_pack_threshold
+
 	def is_file_ignore_by_deprecated_ignored_files(self, file_name: str) -> bool:
 		for item in self.ignored_files:
 			if len(item) > 0:
@@ -59,6 +59,8 @@ class CommandConfig(Serializable):
 	confirm_time_wait: Duration = Duration('60s')
 	backup_on_restore: bool = True
 	restore_countdown_sec: int = 10
+	incremental_restore: bool = False
+	incremental_restore_hash_check: bool = False
 
 	@override
 	def on_deserialization(self, **kwargs):
@@ -1,4 +1,7 @@
+from typing import List, Tuple
+
 from mcdreforged.api.utils import Serializable
+from typing_extensions import override
 
 from prime_backup.config.config_common import CrontabJobSetting
 from prime_backup.types.units import Duration
@@ -17,6 +20,13 @@ class BackUpDatabaseConfig(CrontabJobSetting):
 	crontab = '0 6 * * 0'
 	jitter = Duration('1m')
 	max_amount: int = 100
+	mode: str = 'full'
+
+	@override
+	def on_deserialization(self, **kwargs):
+		super().on_deserialization(**kwargs)
+		if self.mode not in (modes := ['full', 'incremental']):
+			raise ValueError('Field mode must be one of {}, got {!r}'.format(modes, self.mode))
 
 
 class CompactPackDatabaseConfig(CrontabJobSetting):
@@ -31,7 +41,59 @@ class CompactPackDatabaseConfig(CrontabJobSetting):
 		return Config.get().backup.pack_maintenance_compact_threshold
 
 
+class ScrubDatabaseConfig(CrontabJobSetting):
+	enabled = False
+	interval = None
+	crontab = '0 4 * * *'
+	jitter = Duration('1m')
+	period: Duration = Duration('30d')
+
+	@override
+	def on_deserialization(self, **kwargs):
+		super().on_deserialization(**kwargs)
+		if self.period.value <= 0:
+			raise ValueError('Field period must > 0, got {!r}'.format(self.period))
+
+
+class SqliteConfig(Serializable):
+	journal_mode: str = 'wal'
+	synchronous: str = 'full'
+	cache_size: int = -65536
+	mmap_size: int = 256 * 1048576
+	temp_store: str = 'default'
+	busy_timeout: Duration = Duration('30s')
+
+	@override
+	def on_deserialization(self, **kwargs):
+		def check_choices(field: str, choices: List[str]):
+			if (value := getattr(self, field)).lower() not in choices:
+				raise ValueError('Field {} must be one of {}, got {!r}'.format(field, choices, value))
+
+		check_choices('journal_mode', ['delete', 'truncate', 'persist', 'memory', 'wal', 'off'])
+		check_choices('synchronous', ['off', 'normal', 'full', 'extra'])
+		check_choices('temp_store', ['default', 'file', 'memory'])
+		if self.mmap_size < 0:
+			raise ValueError('Field mmap_size must >= 0, got {!r}'.format(self.mmap_size))
+		if self.busy_timeout.value < 0:
+			raise ValueError('Field busy_timeout must >= 0, got {!r}'.format(self.busy_timeout))
+
+	def get_pragmas(self) -> List[Tuple[str, str]]:
+		"""
+		:return: a list of (pragma name, pragma value) to be applied on every new database connection
+		"""
+		return [
+			('busy_timeout', str(int(self.busy_timeout.value * 1000))),
+			('journal_mode', self.journal_mode.upper()),
+			('synchronous', self.synchronous.upper()),
+			('cache_size', str(self.cache_size)),
+			('mmap_size', str(self.mmap_size)),
+			('temp_store', self.temp_store.upper()),
+		]
+
+
 class DatabaseConfig(Serializable):
 	compact: CompactDatabaseConfig = CompactDatabaseConfig()
 	backup: BackUpDatabaseConfig = BackUpDatabaseConfig()
 	compact_pack: CompactPackDatabaseConfig = CompactPackDatabaseConfig()
+	scrub: ScrubDatabaseConfig = ScrubDatabaseConfig()
+	sqlite: SqliteConfig = SqliteConfig()
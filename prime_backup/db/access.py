@@ -2,7 +2,7 @@ import contextlib
 from pathlib import Path
 from typing import Optional, Generator, TypeVar
 
-from sqlalchemy import create_engine, Engine
+from sqlalchemy import create_engine, Engine, event
 from sqlalchemy.orm import Session
 from sqlalchemy.pool import StaticPool
 
@@ -11,6 +11,7 @@ from prime_backup.db import db_constants
 from prime_backup.db.db_meta_cache import DbMetaCache
 from prime_backup.db.migration import DbMigration
 from prime_backup.db.session import DbSession
+from prime_backup.db.zstd_dict_cache import ZstdDictCache
 
 _T = TypeVar('_T')
 
@@ -31,6 +32,7 @@ class DbAccess:
 		db_path = db_dir / db_constants.DB_FILE_NAME
 		cls.__engine = create_engine('sqlite:///' + str(db_path))
 		cls.__db_file_path = db_path
+		cls.__setup_connection_pragmas(cls.__engine)
 
 		try:
 			migration = DbMigration(cls.__engine, db_dir, db_path, config.temp_path)
@@ -41,6 +43,23 @@ class DbAccess:
 			raise
 
 		cls.sync_meta_cache()
+		cls.sync_zstd_dict_cache()
+
+	@classmethod
+	def __setup_connection_pragmas(cls, engine: Engine):
+		from prime_backup import logger
+		pragmas = Config.get().database.sqlite.get_pragmas()
+
+		@event.listens_for(engine, 'connect')
+		def on_connect(dbapi_connection, _connection_record):
+			cursor = dbapi_connection.cursor()
+			try:
+				for name, value in pragmas:
+					cursor.execute('PRAGMA {}={}'.format(name, value))
+					if name == 'journal_mode' and (row := cursor.fetchone()) is not None and str(row[0]).upper() != value:
+						logger.get().warning('Failed to set SQLite journal_mode to {}, current: {}'.format(value, row[0]))
+			finally:
+				cursor.close()
 
 	@classmethod
 	def init_memory_db(cls):
@@ -55,6 +74,7 @@ class DbAccess:
 			raise
 
 		cls.sync_meta_cache()
+		cls.sync_zstd_dict_cache()
 
 	@classmethod
 	def shutdown(cls):
@@ -62,6 +82,7 @@ class DbAccess:
 			engine.dispose()
 			cls.__engine = None
 		DbMetaCache.reset()
+		ZstdDictCache.reset()
 		cls.__db_file_path = None
 
 	@classmethod
@@ -70,6 +91,12 @@ class DbAccess:
 		with cls.open_session() as session:
 			DbMetaCache.set(DbMetaInfo.of(session.get_db_meta()))
 
+	@classmethod
+	def sync_zstd_dict_cache(cls):
+		with cls.open_session() as session:
+			# dictionaries without data are the reserved ones that are still being trained
+			ZstdDictCache.set({zstd_dict.id: zstd_dict.data for zstd_dict in session.list_zstd_dicts() if len(zstd_dict.data) > 0})
+
 	@classmethod
 	def __ensure_engine(cls) -> Engine:
 		if cls.__engine is None:
@@ -1,4 +1,6 @@
 DB_MAGIC_INDEX: int = 0
-DB_VERSION: int = 4
+DB_VERSION: int = 5
 
 DB_FILE_NAME = 'prime_backup.db'
+DB_BACKUP_DIR_NAME = 'db_backup'
+DB_INCREMENTAL_BACKUP_DIR_NAME = 'incremental'
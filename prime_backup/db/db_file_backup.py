@@ -54,6 +54,9 @@ class _DbFileBackupHelper:
 			with open(tmp_src_file, 'wb') as f_dst, self.__open_backup_for_read() as f_src:
 				file_utils.copy_file_obj_fast(f_src, f_dst)
 			tmp_src_file.replace(self.src_file)
+			# stale WAL files do not belong to the restored db file
+			for suffix in ['-wal', '-shm']:
+				self.src_file.with_name(self.src_file.name + suffix).unlink(missing_ok=True)
 		except Exception:
 			tmp_src_file.unlink(missing_ok=True)
 			raise
@@ -0,0 +1,373 @@
+import collections
+import contextlib
+import dataclasses
+import hashlib
+import os
+import sqlite3
+import struct
+import time
+from pathlib import Path
+from typing import List, Dict, Iterable, Generator, BinaryIO, Set
+
+from prime_backup import logger
+from prime_backup.compressors import Compressor, CompressMethod
+from prime_backup.exceptions import PrimeBackupError
+from prime_backup.utils import collection_utils
+
+
+@dataclasses.dataclass(frozen=True)
+class DbPageSnapshot:
+	name: str
+	created_at: float
+	db_size: int
+	page_size: int
+	page_count: int
+
+
+@dataclasses.dataclass(frozen=True)
+class DbPageSnapshotCreateResult:
+	snapshot: DbPageSnapshot
+	new_page_count: int
+	new_stored_size: int
+
+
+@dataclasses.dataclass(frozen=True)
+class DbPageStoreGcResult:
+	deleted_page_count: int = 0
+	deleted_pack_count: int = 0
+	rewritten_pack_count: int = 0
+	freed_size: int = 0
+
+
+@dataclasses.dataclass(frozen=True)
+class _PageLocation:
+	pack_id: int
+	offset: int
+	stored_size: int
+	raw_size: int
+	compress: str
+
+
+class DbPageStoreError(PrimeBackupError):
+	pass
+
+
+class DbPageStore:
+	"""
+	A standalone store for incremental database backups
+
+	A snapshot is split into pages of the database page size. Pages are deduplicated by their hash,
+	compressed one by one and appended to pack files. A snapshot itself only keeps the list of its page hashes,
+	so the unchanged pages between snapshots are stored only once
+
+	The store never touches the main database, so the snapshots are still restorable if the main database is broken
+	"""
+	INDEX_FILE_NAME = 'index.db'
+	PACK_DIR_NAME = 'packs'
+	HASH_SIZE = 16
+	DEFAULT_PAGE_SIZE = 4096
+	__LOOKUP_BATCH_SIZE = 256
+
+	def __init__(self, root: Path):
+		self.root = root
+		self.logger = logger.get()
+
+	# ==================== Utils ====================
+
+	@contextlib.contextmanager
+	def __open_index(self) -> Generator[sqlite3.Connection, None, None]:
+		self.root.mkdir(parents=True, exist_ok=True)
+		conn = sqlite3.connect(self.root / self.INDEX_FILE_NAME, isolation_level=None)
+		try:
+			conn.execute('PRAGMA journal_mode=WAL')
+			conn.execute('PRAGMA synchronous=FULL')
+			conn.execute('CREATE TABLE IF NOT EXISTS pack (id INTEGER PRIMARY KEY AUTOINCREMENT, size INTEGER NOT NULL, live_size INTEGER NOT NULL)')
+			conn.execute('CREATE TABLE IF NOT EXISTS page (hash BLOB PRIMARY KEY, pack_id INTEGER NOT NULL, offset INTEGER NOT NULL, stored_size INTEGER NOT NULL, raw_size INTEGER NOT NULL, compress TEXT NOT NULL, ref_count INTEGER NOT NULL)')
+			conn.execute('CREATE INDEX IF NOT EXISTS ix_page_pack_id ON page (pack_id)')
+			conn.execute('CREATE TABLE IF NOT EXISTS snapshot (name TEXT PRIMARY KEY, created_at REAL NOT NULL, db_size INTEGER NOT NULL, page_size INTEGER NOT NULL, db_hash BLOB NOT NULL, page_hashes BLOB NOT NULL)')
+			yield conn
+		finally:
+			conn.close()
+
+	@contextlib.contextmanager
+	def __transaction(self, conn: sqlite3.Connection) -> Generator[None, None, None]:
+		conn.execute('BEGIN IMMEDIATE')
+		try:
+			yield
+		except BaseException:
+			conn.execute('ROLLBACK')
+			raise
+		else:
+			conn.execute('COMMIT')
+
+	def __get_pack_path(self, pack_id: int) -> Path:
+		return self.root / self.PACK_DIR_NAME / '{:08d}.pack'.format(pack_id)
+
+	@classmethod
+	def __insert_pack(cls, conn: sqlite3.Connection) -> int:
+		if (pack_id := conn.execute('INSERT INTO pack (size, live_size) VALUES (0, 0)').lastrowid) is None:
+			raise DbPageStoreError('Failed to get the id of the inserted pack')
+		return pack_id
+
+	@classmethod
+	def __hash_page(cls, data: bytes) -> bytes:
+		return hashlib.blake2b(data, digest_size=cls.HASH_SIZE).digest()
+
+	@classmethod
+	def __split_hashes(cls, page_hashes: bytes) -> List[bytes]:
+		return [page_hashes[i:i + cls.HASH_SIZE] for i in range(0, len(page_hashes), cls.HASH_SIZE)]
+
+	@classmethod
+	def __get_compressor(cls) -> Compressor:
+		try:
+			import zstandard  # noqa
+			return Compressor.create(CompressMethod.zstd)
+		except ImportError:
+			return Compressor.create(CompressMethod.gzip)
+
+	@classmethod
+	def read_page_size(cls, db_file: Path) -> int:
+		"""
+		Reads the page size from the sqlite database file header
+
+		See https://www.sqlite.org/fileformat.html#the_database_header
+		"""
+		with open(db_file, 'rb') as f:
+			header = f.read(18)
+		if len(header) < 18 or not header.startswith(b'SQLite format 3\x00'):
+			return cls.DEFAULT_PAGE_SIZE
+		page_size = struct.unpack('>H', header[16:18])[0]
+		if page_size == 1:
+			return 65536
+		if page_size < 512 or page_size & (page_size - 1) != 0:
+			return cls.DEFAULT_PAGE_SIZE
+		return page_size
+
+	@classmethod
+	def __row_to_snapshot(cls, row: tuple) -> DbPageSnapshot:
+		name, created_at, db_size, page_size, page_hashes_len = row
+		return DbPageSnapshot(name=name, created_at=created_at, db_size=db_size, page_size=page_size, page_count=page_hashes_len // cls.HASH_SIZE)
+
+	def __query_page_locations(self, conn: sqlite3.Connection, hashes: Iterable[bytes]) -> Dict[bytes, _PageLocation]:
+		result: Dict[bytes, _PageLocation] = {}
+		for batch in collection_utils.slicing_iterate(list(hashes), self.__LOOKUP_BATCH_SIZE):
+			sql = 'SELECT hash, pack_id, offset, stored_size, raw_size, compress FROM page WHERE hash IN ({})'.format(','.join('?' * len(batch)))
+			for h, pack_id, offset, stored_size, raw_size, compress in conn.execute(sql, list(batch)):
+				result[h] = _PageLocation(pack_id=pack_id, offset=offset, stored_size=stored_size, raw_size=raw_size, compress=compress)
+		return result
+
+	# ==================== Snapshot ====================
+
+	def list_snapshots(self) -> List[DbPageSnapshot]:
+		"""
+		:return: All snapshots, new first
+		"""
+		if not (self.root / self.INDEX_FILE_NAME).is_file():
+			return []
+		with self.__open_index() as conn:
+			rows = conn.execute('SELECT name, created_at, db_size, page_size, length(page_hashes) FROM snapshot ORDER BY created_at DESC, name DESC').fetchall()
+		return [self.__row_to_snapshot(row) for row in rows]
+
+	def create_snapshot(self, db_file: Path, name: str) -> DbPageSnapshotCreateResult:
+		page_size = self.read_page_size(db_file)
+		compressor = self.__get_compressor()
+		plain_compressor = Compressor.create(CompressMethod.plain)
+
+		with self.__open_index() as conn:
+			if conn.execute('SELECT 1 FROM snapshot WHERE name = ?', (name,)).fetchone() is not None:
+				raise DbPageStoreError('Snapshot {!r} already exists'.format(name))
+
+			with self.__transaction(conn):
+				pack_id = self.__insert_pack(conn)
+				pack_path = self.__get_pack_path(pack_id)
+				pack_path.parent.mkdir(parents=True, exist_ok=True)
+
+				try:
+					page_hashes: List[bytes] = []
+					referenced_hashes: Set[bytes] = set()
+					new_page_count = 0
+					db_hasher = hashlib.blake2b()
+
+					with open(db_file, 'rb') as f_db, open(pack_path, 'wb') as f_pack:
+						def process_batch(pages: List[bytes]):
+							nonlocal new_page_count
+							hashes = [self.__hash_page(page) for page in pages]
+							page_hashes.extend(hashes)
+							first_seen = {h: page for h, page in zip(hashes, pages) if h not in referenced_hashes}
+							if len(first_seen) == 0:
+								return
+							referenced_hashes.update(first_seen.keys())
+
+							existing = self.__query_page_locations(conn, first_seen.keys())
+							conn.executemany('UPDATE page SET ref_count = ref_count + 1 WHERE hash = ?', [(h,) for h in existing.keys()])
+							new_rows = []
+							for h, page in first_seen.items():
+								if h in existing:
+									continue
+								used_compressor = compressor
+								stored = compressor.compress_bytes(page)
+								if len(stored) >= len(page):
+									used_compressor, stored = plain_compressor, page
+								new_rows.append((h, pack_id, f_pack.tell(), len(stored), len(page), used_compressor.get_name()))
+								f_pack.write(stored)
+							conn.executemany('INSERT INTO page (hash, pack_id, offset, stored_size, raw_size, compress, ref_count) VALUES (?, ?, ?, ?, ?, ?, 1)', new_rows)
+							new_page_count += len(new_rows)
+
+						batch: List[bytes] = []
+						while len(page := f_db.read(page_size)) > 0:
+							db_hasher.update(page)
+							batch.append(page)
+							if len(batch) >= self.__LOOKUP_BATCH_SIZE:
+								process_batch(batch)
+								batch.clear()
+						if len(batch) > 0:
+							process_batch(batch)
+						db_size = f_db.tell()
+
+						f_pack.flush()
+						os.fsync(f_pack.fileno())
+						pack_size = f_pack.tell()
+
+					if pack_size > 0:
+						conn.execute('UPDATE pack SET size = ?, live_size = ? WHERE id = ?', (pack_size, pack_size, pack_id))
+					else:
+						conn.execute('DELETE FROM pack WHERE id = ?', (pack_id,))
+						pack_path.unlink()
+
+					created_at = time.time()
+					conn.execute(
+						'INSERT INTO snapshot (name, created_at, db_size, page_size, db_hash, page_hashes) VALUES (?, ?, ?, ?, ?, ?)',
+						(name, created_at, db_size, page_size, db_hasher.digest(), b''.join(page_hashes)),
+					)
+				except BaseException:
+					with contextlib.suppress(OSError):
+						pack_path.unlink(missing_ok=True)
+					raise
+
+		snapshot = DbPageSnapshot(name=name, created_at=created_at, db_size=db_size, page_size=page_size, page_count=len(page_hashes))
+		return DbPageSnapshotCreateResult(snapshot=snapshot, new_page_count=new_page_count, new_stored_size=pack_size)
+
+	def restore_snapshot(self, name: str, output_path: Path):
+		"""
+		Reassembles the database file of the given snapshot to the output path, with its content hash verified
+		"""
+		with self.__open_index() as conn:
+			row = conn.execute('SELECT db_size, db_hash, page_hashes FROM snapshot WHERE name = ?', (name,)).fetchone()
+			if row is None:
+				raise DbPageStoreError('Snapshot {!r} does not exist'.format(name))
+			db_size, db_hash, page_hashes_blob = row
+			page_hashes = self.__split_hashes(page_hashes_blob)
+			locations = self.__query_page_locations(conn, set(page_hashes))
+
+		compressors: Dict[str, Compressor] = {}
+		pack_files: Dict[int, BinaryIO] = {}
+		tmp_path = output_path.with_name(output_path.name + '.tmp')
+		try:
+			db_hasher = hashlib.blake2b()
+			with contextlib.ExitStack() as es, open(tmp_path, 'wb') as f_out:
+				for h in page_hashes:
+					if (loc := locations.get(h)) is None:
+						raise DbPageStoreError('Page {} of snapshot {!r} is missing'.format(h.hex(), name))
+					if (f_pack := pack_files.get(loc.pack_id)) is None:
+						f_pack = pack_files[loc.pack_id] = es.enter_context(open(self.__get_pack_path(loc.pack_id), 'rb'))
+					if (compressor := compressors.get(loc.compress)) is None:
+						compressor = compressors[loc.compress] = Compressor.create(loc.compress)
+
+					f_pack.seek(loc.offset)
+					page = compressor.decompress_bytes(f_pack.read(loc.stored_size))
+					if len(page) != loc.raw_size or self.__hash_page(page) != h:
+						raise DbPageStoreError('Page {} of snapshot {!r} is corrupted'.format(h.hex(), name))
+					db_hasher.update(page)
+					f_out.write(page)
+
+				if f_out.tell() != db_size or db_hasher.digest() != db_hash:
+					raise DbPageStoreError('Restored database of snapshot {!r} mismatches, size {} / {}'.format(name, f_out.tell(), db_size))
+			tmp_path.replace(output_path)
+		except BaseException:
+			with contextlib.suppress(OSError):
+				tmp_path.unlink(missing_ok=True)
+			raise
+
+	def delete_snapshots(self, names: List[str], compact_threshold: float) -> DbPageStoreGcResult:
+		"""
+		Deletes the given snapshots, and then frees the pages that are no longer used by any snapshot
+
+		:param compact_threshold: Packs with a live size ratio below this value are rewritten
+		"""
+		with self.__open_index() as conn:
+			deleted_page_count = 0
+			with self.__transaction(conn):
+				for name in names:
+					row = conn.execute('SELECT page_hashes FROM snapshot WHERE name = ?', (name,)).fetchone()
+					if row is None:
+						continue
+					hashes = set(self.__split_hashes(row[0]))
+					conn.executemany('UPDATE page SET ref_count = ref_count - 1 WHERE hash = ?', [(h,) for h in hashes])
+					conn.execute('DELETE FROM snapshot WHERE name = ?', (name,))
+
+				dead_sizes: Dict[int, int] = collections.defaultdict(int)
+				for pack_id, stored_size in conn.execute('SELECT pack_id, stored_size FROM page WHERE ref_count <= 0'):
+					dead_sizes[pack_id] += stored_size
+					deleted_page_count += 1
+				conn.execute('DELETE FROM page WHERE ref_count <= 0')
+				conn.executemany('UPDATE pack SET live_size = live_size - ? WHERE id = ?', [(size, pack_id) for pack_id, size in dead_sizes.items()])
+
+			result = self.__collect_packs(conn, compact_threshold)
+		return dataclasses.replace(result, deleted_page_count=deleted_page_count)
+
+	# ==================== Pack GC ====================
+
+	def __collect_packs(self, conn: sqlite3.Connection, compact_threshold: float) -> DbPageStoreGcResult:
+		deleted_pack_count = 0
+		rewritten_pack_count = 0
+		freed_size = 0
+
+		for pack_id, size, live_size in conn.execute('SELECT id, size, live_size FROM pack').fetchall():
+			if live_size <= 0:
+				with self.__transaction(conn):
+					conn.execute('DELETE FROM pack WHERE id = ?', (pack_id,))
+				self.__get_pack_path(pack_id).unlink(missing_ok=True)
+				deleted_pack_count += 1
+				freed_size += size
+			elif live_size < size * compact_threshold:
+				self.__rewrite_pack(conn, pack_id)
+				rewritten_pack_count += 1
+				freed_size += size - live_size
+
+		# packs left by an interrupted snapshot creation
+		known_pack_ids = {row[0] for row in conn.execute('SELECT id FROM pack')}
+		if (pack_dir := self.root / self.PACK_DIR_NAME).is_dir():
+			for pack_path in pack_dir.iterdir():
+				if pack_path.suffix == '.pack' and pack_path.stem.isdigit() and int(pack_path.stem) not in known_pack_ids:
+					self.logger.info('Deleting orphan database backup pack {}'.format(pack_path.as_posix()))
+					freed_size += pack_path.stat().st_size
+					pack_path.unlink()
+					deleted_pack_count += 1
+
+		return DbPageStoreGcResult(deleted_pack_count=deleted_pack_count, rewritten_pack_count=rewritten_pack_count, freed_size=freed_size)
+
+	def __rewrite_pack(self, conn: sqlite3.Connection, old_pack_id: int):
+		old_pack_path = self.__get_pack_path(old_pack_id)
+		with self.__transaction(conn):
+			new_pack_id = self.__insert_pack(conn)
+			new_pack_path = self.__get_pack_path(new_pack_id)
+			try:
+				updates = []
+				rows = conn.execute('SELECT hash, offset, stored_size FROM page WHERE pack_id = ? ORDER BY offset', (old_pack_id,)).fetchall()
+				with open(old_pack_path, 'rb') as f_old, open(new_pack_path, 'wb') as f_new:
+					for h, offset, stored_size in rows:
+						f_old.seek(offset)
+						updates.append((new_pack_id, f_new.tell(), h))
+						f_new.write(f_old.read(stored_size))
+					f_new.flush()
+					os.fsync(f_new.fileno())
+					new_size = f_new.tell()
+
+				conn.executemany('UPDATE page SET pack_id = ?, offset = ? WHERE hash = ?', updates)
+				conn.execute('UPDATE pack SET size = ?, live_size = ? WHERE id = ?', (new_size, new_size, new_pack_id))
+				conn.execute('DELETE FROM pack WHERE id = ?', (old_pack_id,))
+			except BaseException:
+				with contextlib.suppress(OSError):
+					new_pack_path.unlink(missing_ok=True)
+				raise
+		old_pack_path.unlink(missing_ok=True)
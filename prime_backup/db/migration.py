@@ -30,6 +30,7 @@ class DbMigration:
 			2: self.__migrate_1_2,  # 1 -> 2
 			3: self.__migrate_2_3,  # 2 -> 3
 			4: self.__migrate_3_4,  # 3 -> 4
+			5: self.__migrate_4_5,  # 4 -> 5
 		}
 
 	def check_and_migrate(self, *, create: bool, migrate: bool):
@@ -74,6 +75,9 @@ class DbMigration:
 		start_ts = time.time()
 		self.logger.info('DB migration starts. current DB version: {}, target version: {}'.format(current_version, target_version))
 
+		# make sure all changes in the WAL file, if any, are in the db file before copying it
+		with self.engine.connect() as conn:
+			conn.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)')
 		backup_helper = _DbFileBackupHelper(self.db_file, self.db_dir / 'db_backup', 'pre_migration_{}to{}_{}'.format(current_version, target_version, time.strftime('%Y%m%d%H%M%S')))
 		self.logger.info('Creating DB pre migration backup at {}'.format(str(backup_helper.backup_file)))
 		backup_helper.create(skip_existing=True)
@@ -133,3 +137,10 @@ class DbMigration:
 		"""
 		from prime_backup.db.migrations.migration_3_4 import MigrationImpl3To4
 		MigrationImpl3To4(self.engine, self.temp_dir, session).migrate()
+
+	def __migrate_4_5(self, session: Session):
+		"""
+		v1.14.0 changes: file stat cache, reference counts of blobs, chunks and chunk groups
+		"""
+		from prime_backup.db.migrations.migration_4_5 import MigrationImpl4To5
+		MigrationImpl4To5(self.engine, self.temp_dir, session).migrate()
@@ -0,0 +1,146 @@
+from typing import Dict, Any
+
+from sqlalchemy import Table, Column, String, BigInteger, BINARY, inspect, Integer, ForeignKey, Index, text, LargeBinary
+from sqlalchemy.orm import declarative_base
+from typing_extensions import override
+
+from prime_backup.db import ref_counts
+from prime_backup.db.db_features import DbFeatures
+from prime_backup.db.migrations import MigrationImplBase
+from prime_backup.db.values import BlobStorageMethod
+
+_with_rowid_kwargs: Dict[str, Any] = {}
+if DbFeatures.supports_without_rowid():
+	_with_rowid_kwargs['sqlite_with_rowid'] = False
+
+
+class _V5:
+	"""
+	Only contains the tables that are added or changed in v5
+	"""
+	Base = declarative_base()
+	FileStatCache = Table(
+		'file_stat_cache',
+		Base.metadata,
+		Column('path', String, primary_key=True),
+		Column('size', BigInteger, primary_key=True),
+		Column('mtime_ns', BigInteger, primary_key=True),
+		Column('ctime_ns', BigInteger, primary_key=True),
+		Column('inode', BigInteger, primary_key=True),
+		Column('blob_hash', BINARY, index=True, nullable=False),
+		**_with_rowid_kwargs,
+	)
+	Pack = Table(
+		'pack',
+		Base.metadata,
+		Column('id', Integer, primary_key=True, autoincrement=True),
+		Column('size', BigInteger, nullable=False),
+		Column('entry_count', Integer, nullable=False),
+		Column('live_size', BigInteger, nullable=False),
+		Column('live_entry_count', Integer, nullable=False),
+		Column('last_verified', BigInteger, nullable=True),
+		Index('ix_pack_last_verified', 'last_verified'),
+		sqlite_autoincrement=True,
+	)
+	Blob = Table(
+		'blob',
+		Base.metadata,
+		Column('id', Integer, primary_key=True, autoincrement=True),
+		Column('storage_method', Integer, nullable=False),
+		Column('hash', BINARY, unique=True, nullable=False),
+		Column('compress', String, nullable=False),
+		Column('raw_size', BigInteger, index=True, nullable=False),
+		Column('stored_size', BigInteger, nullable=False),
+		Column('ref_count', BigInteger, nullable=False),
+		Column('last_verified', BigInteger, nullable=True),
+		Index('ix_blob_unreferenced', 'id', sqlite_where=text('ref_count <= 0')),
+		Index('ix_blob_direct_last_verified', 'last_verified', sqlite_where=text('storage_method = {}'.format(BlobStorageMethod.direct.value))),
+		sqlite_autoincrement=True,
+	)
+	Chunk = Table(
+		'chunk',
+		Base.metadata,
+		Column('id', Integer, primary_key=True, autoincrement=True),
+		Column('hash', BINARY, unique=True, nullable=False),
+		Column('compress', String, nullable=False),
+		Column('raw_size', BigInteger, nullable=False),
+		Column('stored_size', BigInteger, nullable=False),
+		Column('pack_id', Integer, ForeignKey('pack.id'), index=True, nullable=False),
+		Column('pack_offset', BigInteger, nullable=False),
+		Column('ref_count', BigInteger, nullable=False),
+		Index('ix_chunk_unreferenced', 'id', sqlite_where=text('ref_count <= 0')),
+		sqlite_autoincrement=True,
+	)
+	ChunkGroup = Table(
+		'chunk_group',
+		Base.metadata,
+		Column('id', Integer, primary_key=True, autoincrement=True),
+		Column('hash', BINARY, unique=True, nullable=False),
+		Column('chunk_count', Integer, nullable=False),
+		Column('chunk_raw_size_sum', BigInteger, nullable=False),
+		Column('chunk_stored_size_sum', BigInteger, nullable=False),
+		Column('ref_count', BigInteger, nullable=False),
+		Index('ix_chunk_group_unreferenced', 'id', sqlite_where=text('ref_count <= 0')),
+		sqlite_autoincrement=True,
+	)
+	Fileset = Table(
+		'fileset',
+		Base.metadata,
+		Column('id', Integer, primary_key=True, autoincrement=True),
+		Column('base_id', Integer, nullable=False),
+		Column('file_object_count', BigInteger, nullable=False),
+		Column('file_count', BigInteger, nullable=False),
+		Column('file_raw_size_sum', BigInteger, nullable=False),
+		Column('file_stored_size_sum', BigInteger, nullable=False),
+		Column('fingerprint', LargeBinary, nullable=True),
+		sqlite_autoincrement=True,
+	)
+	ZstdDict = Table(
+		'zstd_dict',
+		Base.metadata,
+		Column('id', Integer, primary_key=True, autoincrement=True),
+		Column('timestamp', BigInteger, nullable=False),
+		Column('sample_count', Integer, nullable=False),
+		Column('sample_size_sum', BigInteger, nullable=False),
+		Column('data', LargeBinary, nullable=False),
+		sqlite_autoincrement=True,
+	)
+
+
+class MigrationImpl4To5(MigrationImplBase):
+	@override
+	def _migrate(self):
+		conn = self.session.connection()
+		if _V5.FileStatCache.name not in inspect(conn).get_table_names():
+			self.logger.info('Creating the file stat cache table')
+			_V5.Base.metadata.create_all(conn, tables=[_V5.FileStatCache])
+		if _V5.ZstdDict.name not in inspect(conn).get_table_names():
+			self.logger.info('Creating the zstd dictionary table')
+			_V5.Base.metadata.create_all(conn, tables=[_V5.ZstdDict])
+
+		for table in [_V5.Blob, _V5.Chunk, _V5.ChunkGroup]:
+			if 'ref_count' not in [column['name'] for column in inspect(conn).get_columns(table.name)]:
+				self.logger.info('Adding column ref_count to table {}'.format(table.name))
+				conn.execute(text('ALTER TABLE {} ADD COLUMN ref_count BIGINT NOT NULL DEFAULT 0'.format(table.name)))
+			for index in table.indexes:
+				if index.name is not None and index.name.endswith('_unreferenced'):
+					index.create(conn, checkfirst=True)
+
+		for table in [_V5.Pack, _V5.Blob]:
+			if 'last_verified' not in [column['name'] for column in inspect(conn).get_columns(table.name)]:
+				self.logger.info('Adding column last_verified to table {}'.format(table.name))
+				conn.execute(text('ALTER TABLE {} ADD COLUMN last_verified BIGINT'.format(table.name)))
+			for index in table.indexes:
+				if index.name is not None and index.name.endswith('_last_verified'):
+					index.create(conn, checkfirst=True)
+
+		if 'fingerprint' not in [column['name'] for column in inspect(conn).get_columns(_V5.Fileset.name)]:
+			# calculated lazily by the fileset allocator
+			self.logger.info('Adding column fingerprint to table {}'.format(_V5.Fileset.name))
+			conn.execute(text('ALTER TABLE {} ADD COLUMN fingerprint BLOB'.format(_V5.Fileset.name)))
+
+		self.logger.info('Creating reference count triggers')
+		ref_counts.create_triggers(conn)
+		for table_name in ref_counts.TABLES:
+			fixed = ref_counts.rebuild_ref_counts(conn, table_name)
+			self.logger.info('Calculated reference counts of {} {} objects'.format(fixed, table_name))
@@ -0,0 +1,159 @@
+"""
+Reference counts of blobs, chunks and chunk groups
+
+- Blob.ref_count: amount of files with the blob hash
+- ChunkGroup.ref_count: amount of BlobChunkGroupBinding to the chunk group
+- Chunk.ref_count: amount of ChunkGroupChunkBinding to the chunk, plus 1 if it's the content of a packed blob
+
+They are maintained by sqlite triggers, so every insert / update / delete, including bulk ones, is covered.
+A newly inserted object gets its reference count recalculated, so it does not matter whether it's inserted before its referrers.
+Objects with ref_count <= 0 are indexed by partial indexes, so orphan candidates can be found without a full table scan
+"""
+import dataclasses
+from typing import List, Dict
+
+from sqlalchemy import Connection, text
+
+from prime_backup.db.values import BlobStorageMethod
+
+_PACKED = BlobStorageMethod.packed.value
+
+TRIGGERS: Dict[str, str] = {
+	# File -> Blob
+	'trg_ref_file_insert': '''
+		AFTER INSERT ON file WHEN NEW.blob_hash IS NOT NULL BEGIN
+			UPDATE blob SET ref_count = ref_count + 1 WHERE hash = NEW.blob_hash;
+		END
+	''',
+	'trg_ref_file_delete': '''
+		AFTER DELETE ON file WHEN OLD.blob_hash IS NOT NULL BEGIN
+			UPDATE blob SET ref_count = ref_count - 1 WHERE hash = OLD.blob_hash;
+		END
+	''',
+	'trg_ref_file_update': '''
+		AFTER UPDATE OF blob_hash ON file WHEN OLD.blob_hash IS NOT NEW.blob_hash BEGIN
+			UPDATE blob SET ref_count = ref_count - 1 WHERE hash = OLD.blob_hash;
+			UPDATE blob SET ref_count = ref_count + 1 WHERE hash = NEW.blob_hash;
+		END
+	''',
+	'trg_ref_blob_insert': f'''
+		AFTER INSERT ON blob BEGIN
+			UPDATE blob SET ref_count = (SELECT count(*) FROM file WHERE blob_hash = NEW.hash) WHERE id = NEW.id;
+			UPDATE chunk SET ref_count = ref_count + 1 WHERE NEW.storage_method = {_PACKED} AND hash = NEW.hash;
+		END
+	''',
+	'trg_ref_blob_update': f'''
+		AFTER UPDATE OF hash, storage_method ON blob BEGIN
+			UPDATE blob SET ref_count = (SELECT count(*) FROM file WHERE blob_hash = NEW.hash) WHERE id = NEW.id AND OLD.hash IS NOT NEW.hash;
+			UPDATE chunk SET ref_count = ref_count - 1 WHERE OLD.storage_method = {_PACKED} AND hash = OLD.hash;
+			UPDATE chunk SET ref_count = ref_count + 1 WHERE NEW.storage_method = {_PACKED} AND hash = NEW.hash;
+		END
+	''',
+	'trg_ref_blob_delete': f'''
+		AFTER DELETE ON blob WHEN OLD.storage_method = {_PACKED} BEGIN
+			UPDATE chunk SET ref_count = ref_count - 1 WHERE hash = OLD.hash;
+		END
+	''',
+
+	# BlobChunkGroupBinding -> ChunkGroup
+	'trg_ref_chunk_group_insert': '''
+		AFTER INSERT ON chunk_group BEGIN
+			UPDATE chunk_group SET ref_count = (SELECT count(*) FROM blob_chunk_group_binding WHERE chunk_group_id = NEW.id) WHERE id = NEW.id;
+		END
+	''',
+	'trg_ref_bcg_binding_insert': '''
+		AFTER INSERT ON blob_chunk_group_binding BEGIN
+			UPDATE chunk_group SET ref_count = ref_count + 1 WHERE id = NEW.chunk_group_id;
+		END
+	''',
+	'trg_ref_bcg_binding_delete': '''
+		AFTER DELETE ON blob_chunk_group_binding BEGIN
+			UPDATE chunk_group SET ref_count = ref_count - 1 WHERE id = OLD.chunk_group_id;
+		END
+	''',
+	'trg_ref_bcg_binding_update': '''
+		AFTER UPDATE OF chunk_group_id ON blob_chunk_group_binding WHEN OLD.chunk_group_id IS NOT NEW.chunk_group_id BEGIN
+			UPDATE chunk_group SET ref_count = ref_count - 1 WHERE id = OLD.chunk_group_id;
+			UPDATE chunk_group SET ref_count = ref_count + 1 WHERE id = NEW.chunk_group_id;
+		END
+	''',
+
+	# ChunkGroupChunkBinding, packed Blob -> Chunk
+	'trg_ref_cgc_binding_insert': '''
+		AFTER INSERT ON chunk_group_chunk_binding BEGIN
+			UPDATE chunk SET ref_count = ref_count + 1 WHERE id = NEW.chunk_id;
+		END
+	''',
+	'trg_ref_cgc_binding_delete': '''
+		AFTER DELETE ON chunk_group_chunk_binding BEGIN
+			UPDATE chunk SET ref_count = ref_count - 1 WHERE id = OLD.chunk_id;
+		END
+	''',
+	'trg_ref_cgc_binding_update': '''
+		AFTER UPDATE OF chunk_id ON chunk_group_chunk_binding WHEN OLD.chunk_id IS NOT NEW.chunk_id BEGIN
+			UPDATE chunk SET ref_count = ref_count - 1 WHERE id = OLD.chunk_id;
+			UPDATE chunk SET ref_count = ref_count + 1 WHERE id = NEW.chunk_id;
+		END
+	''',
+	'trg_ref_chunk_insert': f'''
+		AFTER INSERT ON chunk BEGIN
+			UPDATE chunk SET ref_count = (
+				(SELECT count(*) FROM chunk_group_chunk_binding WHERE chunk_id = NEW.id) +
+				(SELECT count(*) FROM blob WHERE hash = NEW.hash AND storage_method = {_PACKED})
+			) WHERE id = NEW.id;
+		END
+	''',
+	'trg_ref_chunk_update': f'''
+		AFTER UPDATE OF hash ON chunk WHEN OLD.hash IS NOT NEW.hash BEGIN
+			UPDATE chunk SET ref_count = (
+				(SELECT count(*) FROM chunk_group_chunk_binding WHERE chunk_id = NEW.id) +
+				(SELECT count(*) FROM blob WHERE hash = NEW.hash AND storage_method = {_PACKED})
+			) WHERE id = NEW.id;
+		END
+	''',
+}
+
+# the actual reference count of each table, in sql expressions
+_EXPECTED_REF_COUNTS: Dict[str, str] = {
+	'blob': '(SELECT count(*) FROM file WHERE file.blob_hash = blob.hash)',
+	'chunk_group': '(SELECT count(*) FROM blob_chunk_group_binding WHERE blob_chunk_group_binding.chunk_group_id = chunk_group.id)',
+	'chunk': (
+		'((SELECT count(*) FROM chunk_group_chunk_binding WHERE chunk_group_chunk_binding.chunk_id = chunk.id) + '
+		f'(SELECT count(*) FROM blob WHERE blob.hash = chunk.hash AND blob.storage_method = {_PACKED}))'
+	),
+}
+TABLES: List[str] = list(_EXPECTED_REF_COUNTS.keys())
+
+
+@dataclasses.dataclass(frozen=True)
+class BadRefCountItem:
+	table: str
+	id: int
+	ref_count: int
+	expected_ref_count: int
+
+
+def create_triggers(conn: Connection):
+	for name, body in TRIGGERS.items():
+		conn.execute(text('CREATE TRIGGER IF NOT EXISTS {} {}'.format(name, body.strip())))
+
+
+def list_bad_ref_counts(conn: Connection, table: str, limit: int) -> List[BadRefCountItem]:
+	expected = _EXPECTED_REF_COUNTS[table]
+	rows = conn.execute(text(
+		'SELECT id, ref_count, {expected} AS expected FROM {table} WHERE ref_count != {expected} ORDER BY id LIMIT :limit'.format(table=table, expected=expected),
+	), {'limit': limit}).all()
+	return [BadRefCountItem(table=table, id=row[0], ref_count=row[1], expected_ref_count=row[2]) for row in rows]
+
+
+def count_bad_ref_counts(conn: Connection, table: str) -> int:
+	expected = _EXPECTED_REF_COUNTS[table]
+	return conn.execute(text('SELECT count(*) FROM {table} WHERE ref_count != {expected}'.format(table=table, expected=expected))).scalar_one()
+
+
+def rebuild_ref_counts(conn: Connection, table: str) -> int:
+	"""
+	:return: The amount of rows whose ref_count got fixed
+	"""
+	expected = _EXPECTED_REF_COUNTS[table]
+	return conn.execute(text('UPDATE {table} SET ref_count = {expected} WHERE ref_count != {expected}'.format(table=table, expected=expected))).rowcount
@@ -1,5 +1,5 @@
 import dataclasses
-from typing import get_args, get_type_hints
+from typing import get_args, get_type_hints, NamedTuple, Optional, List, Tuple, Any, Type
 
 from prime_backup.db import schema
 
@@ -13,6 +13,7 @@ class ChunkRow:
 	stored_size: int
 	pack_id: int
 	pack_offset: int
+	ref_count: int
 
 
 @dataclasses.dataclass(frozen=True)
@@ -24,23 +25,63 @@ class OffsetChunkRow:
 		return self.offset < other.offset
 
 
+class FileRow(NamedTuple):
+	"""
+	A lightweight read-only snapshot of a :class:`schema.File` row, without any ORM state
+	"""
+	fileset_id: int
+	path: str
+	role: int
+	mode: int
+	content: Optional[bytes]
+	blob_id: Optional[int]
+	blob_storage_method: Optional[int]
+	blob_hash: Optional[str]
+	blob_compress: Optional[str]
+	blob_raw_size: Optional[int]
+	blob_stored_size: Optional[int]
+	uid: Optional[int]
+	gid: Optional[int]
+	mtime: Optional[int]
+	mtime_ns_part: Optional[int]
+
+	@property
+	def mtime_unix_sec(self) -> float:
+		return (self.mtime or 0) + (self.mtime_ns_part or 0) / 1e9
+
+	@property
+	def mtime_unix_ns(self) -> int:
+		return (self.mtime or 0) * (10 ** 9) + (self.mtime_ns_part or 0)
+
+
+def __validate_row_fields(row_fields: List[Tuple[str, Any]], schema_class: Type[schema.Base]):
+	schema_type_hints = get_type_hints(schema_class)
+	schema_fields = [
+		(column.name, get_args(schema_type_hints[column.name])[0])
+		for column in schema_class.__table__.columns
+	]
+
+	if row_fields != schema_fields:
+		print(row_fields)
+		print(schema_fields)
+		raise AssertionError('{} fields must match schema.{} columns'.format(schema_class.__name__ + 'Row', schema_class.__name__))
+
+
 def __validate_chunk_row_fields():
 	chunk_row_type_hints = get_type_hints(ChunkRow)
-	chunk_row_fields = [
+	__validate_row_fields([
 		(field.name, chunk_row_type_hints[field.name])
 		for field in dataclasses.fields(ChunkRow)
-	]
+	], schema.Chunk)
 
-	chunk_schema_type_hints = get_type_hints(schema.Chunk)
-	chunk_schema_fields = [
-		(column.name, get_args(chunk_schema_type_hints[column.name])[0])
-		for column in schema.Chunk.__table__.columns
-	]
 
-	if chunk_row_fields != chunk_schema_fields:
-		print(chunk_row_fields)
-		print(chunk_schema_fields)
-		raise AssertionError('ChunkRow fields must match schema.Chunk columns')
+def __validate_file_row_fields():
+	file_row_type_hints = get_type_hints(FileRow)
+	__validate_row_fields([
+		(field_name, file_row_type_hints[field_name])
+		for field_name in FileRow._fields
+	], schema.File)
 
 
-__validate_chunk_row_fields()
\ No newline at end of file
+__validate_chunk_row_fields()
+__validate_file_row_fields()
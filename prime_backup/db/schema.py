@@ -1,20 +1,27 @@
 from typing import Optional, List, get_type_hints
 
-from sqlalchemy import String, Integer, ForeignKey, BigInteger, JSON, LargeBinary
+from sqlalchemy import String, Integer, ForeignKey, BigInteger, JSON, LargeBinary, Index, text, event
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 from prime_backup.db.db_features import DbFeatures
 from prime_backup.db.types import HashHex
-from prime_backup.db.values import BackupTagDict
+from prime_backup.db.values import BackupTagDict, BlobStorageMethod
 
 
 class Base(DeclarativeBase):
 	def __repr__(self) -> str:
 		return '{}({})'.format(
 			self.__class__.__name__,
-			', '.join(f'{k}={v!r}' for k, v in self.to_dict().items()),
+			', '.join(f'{k}={self.__repr_value(v)}' for k, v in self.to_dict().items()),
 		)
 
+	@classmethod
+	def __repr_value(cls, value) -> str:
+		if isinstance(value, bytes):
+			# binary columns (e.g. fingerprints and zstd dictionaries) are too long to be readable
+			return '<{} bytes>'.format(len(value))
+		return repr(value)
+
 	def to_dict(self) -> dict:
 		values = {}
 		for name, type_ in get_type_hints(self.__class__).items():
@@ -35,7 +42,10 @@ class DbMeta(Base):
 
 class Pack(Base):
 	__tablename__ = 'pack'
-	__table_args__ = {'sqlite_autoincrement': True}
+	__table_args__ = (
+		Index('ix_pack_last_verified', 'last_verified'),
+		{'sqlite_autoincrement': True},
+	)
 
 	id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
 
@@ -43,13 +53,18 @@ class Pack(Base):
 	entry_count: Mapped[int] = mapped_column(Integer)
 	live_size: Mapped[int] = mapped_column(BigInteger)  # live entries size sum
 	live_entry_count: Mapped[int] = mapped_column(Integer)
+	last_verified: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)  # timestamp in seconds, None for never verified
 
 	__fields_end__: bool
 
 
 class Blob(Base):
 	__tablename__ = 'blob'
-	__table_args__ = {'sqlite_autoincrement': True}
+	__table_args__ = (
+		Index('ix_blob_unreferenced', 'id', sqlite_where=text('ref_count <= 0')),
+		Index('ix_blob_direct_last_verified', 'last_verified', sqlite_where=text('storage_method = {}'.format(BlobStorageMethod.direct.value))),
+		{'sqlite_autoincrement': True},
+	)
 
 	id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
 	storage_method: Mapped[int] = mapped_column(Integer)  # see enum BlobStorageMethod
@@ -58,13 +73,18 @@ class Blob(Base):
 	compress: Mapped[str] = mapped_column(String)
 	raw_size: Mapped[int] = mapped_column(BigInteger, index=True)
 	stored_size: Mapped[int] = mapped_column(BigInteger)  # for chunked blob, this is the sum of unique chunk stored sizes
+	ref_count: Mapped[int] = mapped_column(BigInteger, default=0)  # maintained by triggers, see prime_backup.db.ref_counts
+	last_verified: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)  # timestamp in seconds, for direct blobs only
 
 	__fields_end__: bool
 
 
 class Chunk(Base):
 	__tablename__ = 'chunk'
-	__table_args__ = {'sqlite_autoincrement': True}
+	__table_args__ = (
+		Index('ix_chunk_unreferenced', 'id', sqlite_where=text('ref_count <= 0')),
+		{'sqlite_autoincrement': True},
+	)
 
 	id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
 	hash: Mapped[str] = mapped_column(HashHex, unique=True)  # configured db hash method
@@ -76,6 +96,8 @@ class Chunk(Base):
 	pack_id: Mapped[int] = mapped_column(ForeignKey('pack.id'), index=True)
 	pack_offset: Mapped[int] = mapped_column(BigInteger)
 
+	ref_count: Mapped[int] = mapped_column(BigInteger, default=0)  # maintained by triggers, see prime_backup.db.ref_counts
+
 	__fields_end__: bool
 
 	pack: Mapped['Pack'] = relationship(viewonly=True, foreign_keys=[pack_id], lazy='selectin')
@@ -83,13 +105,17 @@ class Chunk(Base):
 
 class ChunkGroup(Base):
 	__tablename__ = 'chunk_group'
-	__table_args__ = {'sqlite_autoincrement': True}
+	__table_args__ = (
+		Index('ix_chunk_group_unreferenced', 'id', sqlite_where=text('ref_count <= 0')),
+		{'sqlite_autoincrement': True},
+	)
 
 	id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
 	hash: Mapped[str] = mapped_column(HashHex, unique=True)  # sha256 of b'\0'.join(chunk hashes)
 	chunk_count: Mapped[int] = mapped_column(Integer)
 	chunk_raw_size_sum: Mapped[int] = mapped_column(BigInteger)
 	chunk_stored_size_sum: Mapped[int] = mapped_column(BigInteger)  # sum of unique chunk stored sizes
+	ref_count: Mapped[int] = mapped_column(BigInteger, default=0)  # maintained by triggers, see prime_backup.db.ref_counts
 
 	__fields_end__: bool
 
@@ -182,6 +208,10 @@ class Fileset(Base):
 	file_raw_size_sum: Mapped[int] = mapped_column(BigInteger)
 	file_stored_size_sum: Mapped[int] = mapped_column(BigInteger)
 
+	# Bottom-k sketch of the files, for selecting similar base filesets. See FilesetFingerprint
+	# Only base filesets have it. It's None if not calculated yet
+	fingerprint: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+
 	__fields_end__: bool
 
 
@@ -210,3 +240,46 @@ class Backup(Base):
 
 	fileset_base: Mapped['Fileset'] = relationship(viewonly=True, foreign_keys=[fileset_id_base])
 	fileset_delta: Mapped['Fileset'] = relationship(viewonly=True, foreign_keys=[fileset_id_delta])
+
+
+class FileStatCache(Base):
+	"""
+	Source file stat -> content hash index, for skipping the hashing of files whose content is known
+	"""
+
+	__tablename__ = 'file_stat_cache'
+	__table_args__ = {'sqlite_with_rowid': False} if DbFeatures.supports_without_rowid() else {}
+
+	path: Mapped[str] = mapped_column(String, primary_key=True)  # relative to the backup source root
+	size: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+	mtime_ns: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+	ctime_ns: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+	inode: Mapped[int] = mapped_column(BigInteger, primary_key=True)  # stored as int64
+
+	blob_hash: Mapped[str] = mapped_column(HashHex, index=True)
+
+	__fields_end__: bool
+
+
+class ZstdDict(Base):
+	"""
+	Trained zstd dictionaries, used by the zstd_dict compress method.
+	The dictionary id is also written in the header of each zstd frame compressed with it, so dictionaries are never deleted
+	"""
+
+	__tablename__ = 'zstd_dict'
+	__table_args__ = {'sqlite_autoincrement': True}
+
+	id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+	timestamp: Mapped[int] = mapped_column(BigInteger)  # creation timestamp in seconds
+	sample_count: Mapped[int] = mapped_column(Integer)
+	sample_size_sum: Mapped[int] = mapped_column(BigInteger)
+	data: Mapped[bytes] = mapped_column(LargeBinary)
+
+	__fields_end__: bool
+
+
+@event.listens_for(Base.metadata, 'after_create')
+def __create_ref_count_triggers(target, connection, **kwargs):
+	from prime_backup.db import ref_counts
+	ref_counts.create_triggers(connection)
@@ -7,11 +7,11 @@ from pathlib import Path
 from typing import Optional, Sequence, Dict, Iterator, Set, Generator, Iterable, Tuple, Any, Type, TYPE_CHECKING
 from typing import TypeVar, List
 
-from sqlalchemy import select, delete, desc, func, Select, JSON, text, or_, not_, and_, exists, Row, update, inspect, ColumnElement, insert
-from sqlalchemy.orm import Session, Mapper, InstrumentedAttribute
+from sqlalchemy import select, delete, desc, func, Select, JSON, text, or_, not_, and_, exists, Row, update, inspect, ColumnElement, insert, literal
+from sqlalchemy.orm import Session, Mapper, InstrumentedAttribute, aliased
 from typing_extensions import overload, Union, TypedDict, Unpack, NotRequired
 
-from prime_backup.db import schema, db_constants
+from prime_backup.db import schema, db_constants, ref_counts
 from prime_backup.db.db_features import DbFeatures
 from prime_backup.db.values import FileRole, BackupTagDict, OffsetChunk, OffsetChunkGroup, BlobStorageMethod, ChunkGroupChunkBindingIdentifier, BlobChunkGroupBindingIdentifier, FileIdentifier
 from prime_backup.exceptions import BackupNotFound, BackupFileNotFound, BlobHashNotFound, PrimeBackupError, FilesetNotFound, FilesetFileNotFound, BlobIdNotFound, ChunkHashNotFound, ChunkIdNotFound, ChunkGroupChunkBindingNotFound, BlobChunkGroupBindingNotFound, ChunkGroupIdNotFound, ChunkGroupHashNotFound, PackIdNotFound
@@ -21,12 +21,15 @@ from prime_backup.utils import collection_utils, db_utils, validation_utils
 
 if TYPE_CHECKING:
 	from sqlalchemy.sql.type_api import TypeEngine
-	from prime_backup.db.rows import ChunkRow, OffsetChunkRow
+	from prime_backup.db.rows import ChunkRow, OffsetChunkRow, FileRow
 	from prime_backup.types.chunker import PrettyChunk
 
 
 _T = TypeVar('_T')
 _TP = TypeVar('_TP', bound=Tuple[Any, ...])
+_FileT = TypeVar('_FileT', schema.File, 'FileRow')
+_RefCountedSchema = Union[Type[schema.Blob], Type[schema.Chunk], Type[schema.ChunkGroup]]
+_RefCountedT = TypeVar('_RefCountedT', schema.Blob, schema.Chunk, schema.ChunkGroup)
 
 
 class UnsupportedDatabaseOperation(PrimeBackupError):
@@ -273,6 +276,40 @@ class DbSession:
 			order_by(schema.Chunk.pack_offset)
 		).scalars().all())
 
+	def list_chunks_with_missing_pack(self) -> List[schema.Chunk]:
+		return _list_it(self.session.execute(
+			select(schema.Chunk).
+			outerjoin(schema.Pack, schema.Pack.id == schema.Chunk.pack_id).
+			where(schema.Pack.id.is_(None))
+		).scalars().all())
+
+	@classmethod
+	def __last_verified_after(cls, last_verified_column: InstrumentedAttribute[Optional[int]], id_column: InstrumentedAttribute[int], after: Tuple[Optional[int], int]) -> ColumnElement[bool]:
+		"""
+		The keyset pagination condition of ``(last_verified, id) > after``, where NULL last_verified values come first
+		"""
+		after_last_verified, after_id = after
+		if after_last_verified is None:
+			return or_(last_verified_column.is_not(None), and_(last_verified_column.is_(None), id_column > after_id))
+		return or_(last_verified_column > after_last_verified, and_(last_verified_column == after_last_verified, id_column > after_id))
+
+	def list_packs_by_last_verified(self, limit: int, after: Optional[Tuple[Optional[int], int]] = None) -> List[schema.Pack]:
+		"""
+		Packs ordered by their last verification time, oldest first. Never-verified packs come first
+
+		:param after: The (last_verified, id) of the last pack of the previous page, for keyset pagination
+		"""
+		s = select(schema.Pack)
+		if after is not None:
+			s = s.where(self.__last_verified_after(schema.Pack.last_verified, schema.Pack.id, after))
+		return _list_it(self.session.execute(
+			s.order_by(schema.Pack.last_verified, schema.Pack.id).limit(limit)
+		).scalars().all())
+
+	def update_packs_last_verified(self, pack_ids: List[int], timestamp: int):
+		for view in collection_utils.slicing_iterate(pack_ids, self.__safe_var_limit):
+			self.session.execute(update(schema.Pack).where(schema.Pack.id.in_(view)).values(last_verified=timestamp))
+
 	def delete_pack(self, pack: schema.Pack):
 		self.session.delete(pack)
 
@@ -421,6 +458,23 @@ class DbSession:
 			where(schema.Blob.storage_method == BlobStorageMethod.direct.value)
 		).scalar_one())
 
+	def list_direct_blobs_by_last_verified(self, limit: int, after: Optional[Tuple[Optional[int], int]] = None) -> List[schema.Blob]:
+		"""
+		Direct blobs ordered by their last verification time, oldest first. Never-verified blobs come first
+
+		:param after: The (last_verified, id) of the last blob of the previous page, for keyset pagination
+		"""
+		s = select(schema.Blob).where(schema.Blob.storage_method == BlobStorageMethod.direct.value)
+		if after is not None:
+			s = s.where(self.__last_verified_after(schema.Blob.last_verified, schema.Blob.id, after))
+		return _list_it(self.session.execute(
+			s.order_by(schema.Blob.last_verified, schema.Blob.id).limit(limit)
+		).scalars().all())
+
+	def update_blobs_last_verified(self, blob_ids: List[int], timestamp: int):
+		for view in collection_utils.slicing_iterate(blob_ids, self.__safe_var_limit):
+			self.session.execute(update(schema.Blob).where(schema.Blob.id.in_(view)).values(last_verified=timestamp))
+
 	def get_direct_blob_raw_size_sum(self) -> int:
 		return _int_or_0(self.session.execute(
 			func.sum(schema.Blob.raw_size).select().
@@ -653,6 +707,9 @@ class DbSession:
 			offset += limit
 
 	def filtered_orphan_chunk_ids(self, chunk_ids: List[int]) -> List[int]:
+		"""
+		A chunk is alive if it's bound to a chunk group, or it's the content of a packed blob
+		"""
 		good_chunk_ids: Set[int] = set()
 		for view in collection_utils.slicing_iterate(chunk_ids, self.__safe_var_limit):
 			good_chunk_ids.update(
@@ -662,6 +719,16 @@ class DbSession:
 					distinct()
 				).scalars().all()
 			)
+			good_chunk_ids.update(
+				self.session.execute(
+					select(schema.Chunk.id).
+					join(schema.Blob, schema.Blob.hash == schema.Chunk.hash).
+					where(
+						schema.Chunk.id.in_(view),
+						schema.Blob.storage_method == BlobStorageMethod.packed.value,
+					)
+				).scalars().all()
+			)
 		return [
 			chunk_id for chunk_id in chunk_ids
 			if chunk_id not in good_chunk_ids
@@ -1100,7 +1167,7 @@ class DbSession:
 
 	def get_blob_chunks(self, blob_id: int, *, limit: Optional[int] = None) -> List['OffsetChunkRow']:
 		"""
-		result is sorted
+		result is sorted. For packed blobs, the result is the only chunk at offset 0
 		"""
 		absolute_offset = (schema.BlobChunkGroupBinding.chunk_group_offset + schema.ChunkGroupChunkBinding.chunk_offset).label('absolute_offset')
 		stmt = (
@@ -1113,6 +1180,7 @@ class DbSession:
 				schema.Chunk.stored_size,
 				schema.Chunk.pack_id,
 				schema.Chunk.pack_offset,
+				schema.Chunk.ref_count,
 			).
 			select_from(schema.BlobChunkGroupBinding).
 			join(
@@ -1128,7 +1196,28 @@ class DbSession:
 		)
 		if limit is not None:
 			stmt = stmt.limit(limit)
-		result: Sequence[Row[Tuple[int, int, str, str, int, int, int, int]]] = self.session.execute(stmt).all()
+		result: Sequence[Row[Tuple[int, int, str, str, int, int, int, int, int]]] = self.session.execute(stmt).all()
+		if len(result) == 0 and limit != 0:
+			# a chunked blob always has at least 1 chunk, so it might be a packed blob
+			result = self.session.execute(
+				select(
+					literal(0),
+					schema.Chunk.id,
+					schema.Chunk.hash,
+					schema.Chunk.compress,
+					schema.Chunk.raw_size,
+					schema.Chunk.stored_size,
+					schema.Chunk.pack_id,
+					schema.Chunk.pack_offset,
+					schema.Chunk.ref_count,
+				).
+				select_from(schema.Blob).
+				join(schema.Chunk, schema.Chunk.hash == schema.Blob.hash).
+				where(
+					schema.Blob.id == blob_id,
+					schema.Blob.storage_method == BlobStorageMethod.packed.value,
+				)
+			).all()
 
 		from prime_backup.db.rows import ChunkRow, OffsetChunkRow
 		return [
@@ -1142,9 +1231,10 @@ class DbSession:
 					stored_size=stored_size,
 					pack_id=pack_id,
 					pack_offset=pack_offset,
+					ref_count=ref_count,
 				),
 			)
-			for offset, chunk_id, chunk_hash, compress, raw_size, stored_size, pack_id, pack_offset in result
+			for offset, chunk_id, chunk_hash, compress, raw_size, stored_size, pack_id, pack_offset, ref_count in result
 		]
 
 	def batch_get_blob_pretty_chunks(self, blob_ids: List[int]) -> Dict[int, List['PrettyChunk']]:
@@ -1435,6 +1525,22 @@ class DbSession:
 	def delete_file(self, file: schema.File):
 		self.session.delete(file)
 
+	def delete_files_by_fileset_ids(self, fileset_ids: List[int]):
+		for view in collection_utils.slicing_iterate(fileset_ids, self.__safe_var_limit):
+			self.session.execute(delete(schema.File).where(schema.File.fileset_id.in_(view)))
+
+	def get_blob_hashes_by_fileset_ids(self, fileset_ids: List[int]) -> List[str]:
+		hashes: Set[str] = set()
+		for view in collection_utils.slicing_iterate(fileset_ids, self.__safe_var_limit):
+			hashes.update(_drop_none(
+				self.session.execute(
+					select(schema.File.blob_hash).
+					where(schema.File.fileset_id.in_(view)).
+					distinct()
+				).scalars().all()
+			))
+		return list(sorted(hashes))
+
 	def has_file_with_hash(self, h: str):
 		q = self.session.query(schema.File).filter_by(blob_hash=h).exists()
 		return bool(self.session.query(q).scalar())
@@ -1453,6 +1559,7 @@ class DbSession:
 		file_count: int
 		file_raw_size_sum: int
 		file_stored_size_sum: int
+		fingerprint: NotRequired[Optional[bytes]]
 
 	def create_and_add_fileset(self, **kwargs: Unpack[CreateFilesetKwargs]) -> schema.Fileset:
 		fileset = schema.Fileset(**kwargs)
@@ -1557,6 +1664,33 @@ class DbSession:
 			where(schema.File.fileset_id == fileset_id)
 		).scalars().all())
 
+	def get_fileset_file_rows(self, fileset_id: Optional[int]) -> List['FileRow']:
+		"""
+		Read-only version of :meth:`get_fileset_files`. Rows are returned as plain tuples, no ORM object is created
+		"""
+		if fileset_id is None:
+			return []
+		from prime_backup.db.rows import FileRow
+		return list(map(FileRow._make, self.session.execute(
+			select(*schema.File.__table__.columns).
+			where(schema.File.fileset_id == fileset_id)
+		).all()))
+
+	def get_fileset_file_rows_by_paths(self, fileset_id: int, paths: List[str]) -> Dict[str, 'FileRow']:
+		"""
+		:return: a dict, path -> file row. Paths that do not exist in the fileset are not in the dict
+		"""
+		from prime_backup.db.rows import FileRow
+		result: Dict[str, FileRow] = {}
+		for view in collection_utils.slicing_iterate(paths, self.__safe_var_limit):
+			for row in self.session.execute(
+				select(*schema.File.__table__.columns).
+				where(schema.File.fileset_id == fileset_id, schema.File.path.in_(view))
+			).all():
+				file = FileRow._make(row)
+				result[file.path] = file
+		return result
+
 	def get_fileset_file_paths(self, fileset_id: int) -> List[str]:
 		return _list_it(self.session.execute(
 			select(schema.File.path).
@@ -1590,9 +1724,146 @@ class DbSession:
 			where(schema.Fileset.base_id == base_fileset_id)
 		).scalars().all())
 
+	def __select_delta_fileset_ids(self, base_fileset_id: int) -> Select:
+		return select(schema.Fileset.id).where(schema.Fileset.base_id == base_fileset_id)
+
+	def get_unused_base_file_paths(self, base_fileset_id: int) -> List[str]:
+		"""
+		Paths of the base fileset files that are overridden or removed in all delta filesets of the base fileset,
+		i.e. the base files that no backup uses anymore
+		"""
+		delta_count = _int_or_0(self.session.execute(
+			select(func.count()).select_from(self.__select_delta_fileset_ids(base_fileset_id).subquery())
+		).scalar_one())
+		base_paths = select(schema.File.path).where(schema.File.fileset_id == base_fileset_id)
+		if delta_count == 0:
+			return _list_it(self.session.execute(base_paths).scalars().all())
+		return _list_it(self.session.execute(
+			select(schema.File.path).
+			where(
+				schema.File.fileset_id.in_(self.__select_delta_fileset_ids(base_fileset_id)),
+				schema.File.role.in_([FileRole.delta_override.value, FileRole.delta_remove.value]),
+				schema.File.path.in_(base_paths),
+			).
+			group_by(schema.File.path).
+			having(func.count() == delta_count)
+		).scalars().all())
+
+	@dataclasses.dataclass
+	class FileSizeStats:
+		file_count: int = 0
+		raw_size_sum: int = 0
+		stored_size_sum: int = 0
+
+	def get_fileset_file_stats_by_paths(self, fileset_id: int, paths: List[str]) -> FileSizeStats:
+		stats = self.FileSizeStats()
+		for view in collection_utils.slicing_iterate(paths, self.__safe_var_limit):
+			file_count, raw_size_sum, stored_size_sum = self.session.execute(
+				select(func.count(), func.sum(schema.File.blob_raw_size), func.sum(schema.File.blob_stored_size)).
+				where(schema.File.fileset_id == fileset_id, schema.File.path.in_(view))
+			).one()
+			stats.file_count += _int_or_0(file_count)
+			stats.raw_size_sum += _int_or_0(raw_size_sum)
+			stats.stored_size_sum += _int_or_0(stored_size_sum)
+		return stats
+
+	def get_delta_file_stats_on_base_paths(self, base_fileset_id: int, paths: List[str]) -> Dict[Tuple[int, FileRole], FileSizeStats]:
+		"""
+		Stats of the delta_override and delta_remove files at the given paths, in the delta filesets of the base fileset
+
+		:return: a dict, (delta fileset id, role) -> stats, where the sizes are the sizes of the base files at those paths
+		"""
+		base_file = aliased(schema.File)
+		result: Dict[Tuple[int, FileRole], DbSession.FileSizeStats] = {}
+		for view in collection_utils.slicing_iterate(paths, self.__safe_var_limit):
+			rows = self.session.execute(
+				select(schema.File.fileset_id, schema.File.role, func.count(), func.sum(base_file.blob_raw_size), func.sum(base_file.blob_stored_size)).
+				join(base_file, and_(base_file.fileset_id == base_fileset_id, base_file.path == schema.File.path)).
+				where(
+					schema.File.fileset_id.in_(self.__select_delta_fileset_ids(base_fileset_id)),
+					schema.File.role.in_([FileRole.delta_override.value, FileRole.delta_remove.value]),
+					schema.File.path.in_(view),
+				).
+				group_by(schema.File.fileset_id, schema.File.role)
+			).all()
+			for fileset_id, role, file_count, raw_size_sum, stored_size_sum in rows:
+				stats = result.setdefault((fileset_id, FileRole(role)), self.FileSizeStats())
+				stats.file_count += _int_or_0(file_count)
+				stats.raw_size_sum += _int_or_0(raw_size_sum)
+				stats.stored_size_sum += _int_or_0(stored_size_sum)
+		return result
+
+	def update_delta_file_roles_on_base_paths(self, base_fileset_id: int, paths: List[str], old_role: FileRole, new_role: FileRole):
+		for view in collection_utils.slicing_iterate(paths, self.__safe_var_limit):
+			self.session.execute(
+				update(schema.File).
+				where(
+					schema.File.fileset_id.in_(self.__select_delta_fileset_ids(base_fileset_id)),
+					schema.File.role == old_role.value,
+					schema.File.path.in_(view),
+				).
+				values(role=new_role.value)
+			)
+
+	def delete_delta_files_on_base_paths(self, base_fileset_id: int, paths: List[str], role: FileRole):
+		for view in collection_utils.slicing_iterate(paths, self.__safe_var_limit):
+			self.session.execute(
+				delete(schema.File).
+				where(
+					schema.File.fileset_id.in_(self.__select_delta_fileset_ids(base_fileset_id)),
+					schema.File.role == role.value,
+					schema.File.path.in_(view),
+				)
+			)
+
+	def get_blob_hashes_by_fileset_paths(self, fileset_id: int, paths: List[str]) -> List[str]:
+		hashes: Set[str] = set()
+		for view in collection_utils.slicing_iterate(paths, self.__safe_var_limit):
+			hashes.update(_drop_none(
+				self.session.execute(
+					select(schema.File.blob_hash).
+					where(schema.File.fileset_id == fileset_id, schema.File.path.in_(view)).
+					distinct()
+				).scalars().all()
+			))
+		return list(hashes)
+
+	def delete_fileset_files_by_paths(self, fileset_id: int, paths: List[str]):
+		for view in collection_utils.slicing_iterate(paths, self.__safe_var_limit):
+			self.session.execute(
+				delete(schema.File).
+				where(schema.File.fileset_id == fileset_id, schema.File.path.in_(view))
+			)
+
+	def add_fileset_stats(self, fileset_id: int, *, file_object_count: int = 0, file_count: int = 0, file_raw_size_sum: int = 0, file_stored_size_sum: int = 0):
+		self.session.execute(
+			update(schema.Fileset).
+			where(schema.Fileset.id == fileset_id).
+			values(
+				file_object_count=schema.Fileset.file_object_count + file_object_count,
+				file_count=schema.Fileset.file_count + file_count,
+				file_raw_size_sum=schema.Fileset.file_raw_size_sum + file_raw_size_sum,
+				file_stored_size_sum=schema.Fileset.file_stored_size_sum + file_stored_size_sum,
+			)
+		)
+
+	def clear_fileset_fingerprints(self, fileset_ids: Optional[List[int]] = None):
+		"""
+		:param fileset_ids: The filesets to clear. Clear all filesets if it's None
+		"""
+		if fileset_ids is None:
+			self.session.execute(update(schema.Fileset).values(fingerprint=None))
+		else:
+			for view in collection_utils.slicing_iterate(fileset_ids, self.__safe_var_limit):
+				self.session.execute(update(schema.Fileset).where(schema.Fileset.id.in_(view)).values(fingerprint=None))
+
 	def delete_fileset(self, fileset: schema.Fileset):
 		self.session.delete(fileset)
 
+	def delete_filesets_by_ids(self, fileset_ids: List[int]):
+		for view in collection_utils.slicing_iterate(fileset_ids, self.__safe_var_limit):
+			self.session.execute(delete(schema.Fileset).where(schema.Fileset.id.in_(view)))
+
 	def list_filesets(self, is_base: Optional[bool] = None, limit: Optional[int] = None, offset: Optional[int] = None) -> List[schema.Fileset]:
 		s = select(schema.Fileset)
 		if is_base is not None:
@@ -1802,7 +2073,7 @@ class DbSession:
 			raise TypeError(type(backup_or_backup_id))
 
 	@classmethod
-	def merge_fileset_files(cls, files_base: Iterable[schema.File], files_delta: Iterable[schema.File]) -> List[schema.File]:
+	def merge_fileset_files(cls, files_base: Iterable[_FileT], files_delta: Iterable[_FileT]) -> List[_FileT]:
 		if isinstance(files_delta, list) and len(files_delta) == 0:
 			return list(files_base)
 
@@ -1826,6 +2097,15 @@ class DbSession:
 		files_delta = self.get_fileset_files(backup.fileset_id_delta)
 		return self.merge_fileset_files(files_base, files_delta)
 
+	def get_backup_file_rows(self, backup_or_backup_id: Union[int, schema.Backup], /) -> List['FileRow']:
+		"""
+		Read-only version of :meth:`get_backup_files`. Rows are returned as plain tuples, no ORM object is created
+		"""
+		backup = self.__convert_backup_or_backup_id_to_backup(backup_or_backup_id)
+		files_base = self.get_fileset_file_rows(backup.fileset_id_base)
+		files_delta = self.get_fileset_file_rows(backup.fileset_id_delta)
+		return self.merge_fileset_files(files_base, files_delta)
+
 	def get_backup_file_paths(self, backup_or_backup_id: Union[int, schema.Backup]) -> List[str]:
 		backup = self.__convert_backup_or_backup_id_to_backup(backup_or_backup_id)
 		file_paths: Dict[str, None] = dict.fromkeys(self.get_fileset_file_paths(backup.fileset_id_base), None)
@@ -1956,6 +2236,10 @@ class DbSession:
 	def delete_backup(self, backup: schema.Backup):
 		self.session.delete(backup)
 
+	def delete_backups_by_ids(self, backup_ids: List[int]):
+		for view in collection_utils.slicing_iterate(backup_ids, self.__safe_var_limit):
+			self.session.execute(delete(schema.Backup).where(schema.Backup.id.in_(view)))
+
 	def reassign_backup_id(self, order: BackupSortOrder) -> Optional[int]:
 		if not DbFeatures.supports_row_number():
 			raise RuntimeError('Current SQLite version {} does not support ROW_NUMBER() function'.format(db_utils.get_sqlite_version()))
@@ -2001,3 +2285,171 @@ class DbSession:
 			bindparams(seq=max_id, name=table_name)
 		)
 		return max_id
+
+	# ==================================== FileStatCache ====================================
+
+	class CreateFileStatCacheKwargs(TypedDict):
+		path: str
+		size: int
+		mtime_ns: int
+		ctime_ns: int
+		inode: int
+		blob_hash: str
+
+	__FILE_STAT_CACHE_INSERT_FIELD_COUNT = len(schema.FileStatCache.__table__.columns)
+
+	def get_file_stat_cache_count(self) -> int:
+		return _int_or_0(self.session.execute(func.count().select().select_from(schema.FileStatCache)).scalar_one())
+
+	def get_file_stat_caches_by_paths(self, paths: List[str]) -> Dict[str, List[schema.FileStatCache]]:
+		"""
+		:return: a dict, path -> list of cached stats. All given paths are in the dict
+		"""
+		result: Dict[str, List[schema.FileStatCache]] = {path: [] for path in paths}
+		for view in collection_utils.slicing_iterate(paths, self.__safe_var_limit):
+			fsc: schema.FileStatCache
+			for fsc in self.session.execute(select(schema.FileStatCache).where(schema.FileStatCache.path.in_(view))).scalars().all():
+				result[fsc.path].append(fsc)
+		return result
+
+	def replace_file_stat_caches(self, rows: List[CreateFileStatCacheKwargs]):
+		"""
+		Inserts the given caches, and deletes all other existing caches of their paths,
+		so there's at most 1 cache for each path
+		"""
+		paths = collection_utils.deduplicated_list(row['path'] for row in rows)
+		for view in collection_utils.slicing_iterate(paths, self.__safe_var_limit):
+			self.session.execute(delete(schema.FileStatCache).where(schema.FileStatCache.path.in_(view)))
+		self.insert_file_stat_caches(rows)
+
+	def insert_file_stat_caches(self, rows: List[CreateFileStatCacheKwargs]):
+		"""
+		Existing rows with the same stat are kept as-is
+		"""
+		for row_page in collection_utils.slicing_iterate(rows, self.__safe_var_limit // self.__FILE_STAT_CACHE_INSERT_FIELD_COUNT):
+			self.session.execute(insert(schema.FileStatCache).prefix_with('OR IGNORE').values(row_page))
+
+	def delete_file_stat_caches_by_blob_hashes(self, blob_hashes: List[str]):
+		for view in collection_utils.slicing_iterate(blob_hashes, self.__safe_var_limit):
+			self.session.execute(delete(schema.FileStatCache).where(schema.FileStatCache.blob_hash.in_(view)))
+
+	def delete_all_file_stat_caches(self):
+		self.session.execute(delete(schema.FileStatCache))
+
+	# ==================================== ZstdDict ====================================
+
+	class CreateZstdDictKwargs(TypedDict):
+		timestamp: int
+		sample_count: int
+		sample_size_sum: int
+		data: bytes
+
+	def create_and_add_zstd_dict(self, **kwargs: Unpack[CreateZstdDictKwargs]) -> schema.ZstdDict:
+		zstd_dict = schema.ZstdDict(**kwargs)
+		self.add(zstd_dict)
+		return zstd_dict
+
+	def get_zstd_dict_opt(self, dict_id: int) -> Optional[schema.ZstdDict]:
+		return self.session.get(schema.ZstdDict, dict_id)
+
+	def delete_zstd_dict(self, zstd_dict: schema.ZstdDict):
+		self.session.delete(zstd_dict)
+
+	def get_zstd_dict_count(self) -> int:
+		return _int_or_0(self.session.execute(select(func.count()).select_from(schema.ZstdDict)).scalar_one())
+
+	def list_zstd_dicts(self) -> List[schema.ZstdDict]:
+		return _list_it(self.session.execute(select(schema.ZstdDict).order_by(schema.ZstdDict.id)).scalars().all())
+
+	def list_recent_chunks_by_max_raw_size(self, max_raw_size: int, limit: int) -> List[schema.Chunk]:
+		return _list_it(self.session.execute(
+			select(schema.Chunk).
+			where(schema.Chunk.raw_size <= max_raw_size).
+			order_by(desc(schema.Chunk.id)).
+			limit(limit)
+		).scalars().all())
+
+	def list_recent_blobs_by_max_raw_size(self, storage_method: 'BlobStorageMethod', max_raw_size: int, limit: int) -> List[schema.Blob]:
+		return _list_it(self.session.execute(
+			select(schema.Blob).
+			where(schema.Blob.storage_method == storage_method.value, schema.Blob.raw_size <= max_raw_size).
+			order_by(desc(schema.Blob.id)).
+			limit(limit)
+		).scalars().all())
+
+	# ==================================== Reference Counts ====================================
+
+	def __get_unreferenced_count(self, typ: _RefCountedSchema) -> int:
+		return _int_or_0(self.session.execute(select(func.count()).select_from(typ).where(typ.ref_count <= 0)).scalar_one())
+
+	def __iterate_unreferenced_batch(self, typ: Type[_RefCountedT], batch_size: int) -> Iterator[List[_RefCountedT]]:
+		# keyset pagination, so the partial index on unreferenced rows is used, and deleting yielded rows does not shift the pages
+		last_id = 0
+		while True:
+			objs = _list_it(self.session.execute(
+				select(typ).where(typ.ref_count <= 0, typ.id > last_id).order_by(typ.id).limit(batch_size)
+			).scalars().all())
+			if len(objs) == 0:
+				break
+			yield objs
+			last_id = objs[-1].id
+
+	def __filtered_unreferenced_ids(self, typ: _RefCountedSchema, ids: List[int]) -> List[int]:
+		unreferenced_ids: Set[int] = set()
+		for view in collection_utils.slicing_iterate(ids, self.__safe_var_limit):
+			unreferenced_ids.update(self.session.execute(
+				select(typ.id).where(typ.id.in_(view), typ.ref_count <= 0)
+			).scalars().all())
+		return [obj_id for obj_id in ids if obj_id in unreferenced_ids]
+
+	def get_unreferenced_blob_count(self) -> int:
+		return self.__get_unreferenced_count(schema.Blob)
+
+	def get_unreferenced_chunk_group_count(self) -> int:
+		return self.__get_unreferenced_count(schema.ChunkGroup)
+
+	def get_unreferenced_chunk_count(self) -> int:
+		return self.__get_unreferenced_count(schema.Chunk)
+
+	def iterate_unreferenced_blob_batch(self, *, batch_size: int) -> Iterator[List[schema.Blob]]:
+		return self.__iterate_unreferenced_batch(schema.Blob, batch_size)
+
+	def iterate_unreferenced_chunk_group_batch(self, *, batch_size: int) -> Iterator[List[schema.ChunkGroup]]:
+		return self.__iterate_unreferenced_batch(schema.ChunkGroup, batch_size)
+
+	def iterate_unreferenced_chunk_batch(self, *, batch_size: int) -> Iterator[List[schema.Chunk]]:
+		return self.__iterate_unreferenced_batch(schema.Chunk, batch_size)
+
+	def filtered_unreferenced_blob_hashes(self, hashes: List[str]) -> List[str]:
+		"""
+		A cheap pre-filter of :meth:`filtered_orphan_blob_hashes`, which only reads the maintained reference counts
+		"""
+		unreferenced_hashes: Set[str] = set()
+		for view in collection_utils.slicing_iterate(hashes, self.__safe_var_limit):
+			unreferenced_hashes.update(self.session.execute(
+				select(schema.Blob.hash).where(schema.Blob.hash.in_(view), schema.Blob.ref_count <= 0)
+			).scalars().all())
+		return [blob_hash for blob_hash in hashes if blob_hash in unreferenced_hashes]
+
+	def filtered_unreferenced_chunk_group_ids(self, chunk_group_ids: List[int]) -> List[int]:
+		return self.__filtered_unreferenced_ids(schema.ChunkGroup, chunk_group_ids)
+
+	def filtered_unreferenced_chunk_ids(self, chunk_ids: List[int]) -> List[int]:
+		return self.__filtered_unreferenced_ids(schema.Chunk, chunk_ids)
+
+	def count_bad_ref_counts(self, table: str) -> int:
+		self.flush()
+		return ref_counts.count_bad_ref_counts(self.session.connection(), table)
+
+	def list_bad_ref_counts(self, table: str, limit: int) -> List[ref_counts.BadRefCountItem]:
+		self.flush()
+		return ref_counts.list_bad_ref_counts(self.session.connection(), table, limit)
+
+	def rebuild_ref_counts(self, table: str) -> int:
+		"""
+		:return: The amount of rows whose ref_count got fixed
+		"""
+		self.flush()
+		cnt = ref_counts.rebuild_ref_counts(self.session.connection(), table)
+		self.session.expire_all()
+		return cnt
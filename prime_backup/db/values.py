@@ -12,6 +12,7 @@ class BlobStorageMethod(enum.IntEnum):
 	unknown = 0
 	direct = 1   # at blob store (regular method)
 	chunked = 2  # split into chunks and stored as pack entries
+	packed = 3   # small blob stored as a single pack entry, i.e. the chunk with the same hash
 
 
 @dataclasses.dataclass(frozen=True)
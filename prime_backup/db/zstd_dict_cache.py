@@ -0,0 +1,79 @@
+import threading
+from typing import TYPE_CHECKING, Optional, Dict, Tuple
+
+if TYPE_CHECKING:
+	import zstandard
+
+
+class ZstdDictCache:
+	"""
+	In-memory copy of the trained zstd dictionaries in the database, for the zstd_dict compress method
+
+	zstandard dictionary objects build their compression / decompression states lazily,
+	so they are created and kept per thread, instead of being shared between threads
+	"""
+	__lock = threading.Lock()
+	__dicts: Dict[int, bytes] = {}
+	__latest_id: Optional[int] = None
+	__generation: int = 0
+	__local = threading.local()
+
+	@classmethod
+	def set(cls, dicts: Dict[int, bytes]):
+		with cls.__lock:
+			cls.__dicts = dict(dicts)
+			cls.__latest_id = max(dicts.keys()) if len(dicts) > 0 else None
+			cls.__generation += 1
+
+	@classmethod
+	def add(cls, dict_id: int, data: bytes):
+		with cls.__lock:
+			cls.__dicts[dict_id] = data
+			if cls.__latest_id is None or dict_id > cls.__latest_id:
+				cls.__latest_id = dict_id
+
+	@classmethod
+	def reset(cls):
+		cls.set({})
+
+	@classmethod
+	def get_latest_id(cls) -> Optional[int]:
+		return cls.__latest_id
+
+	@classmethod
+	def __get_data(cls, dict_id: int) -> Tuple[bytes, int]:
+		with cls.__lock:
+			data, generation = cls.__dicts.get(dict_id), cls.__generation
+		if data is None:
+			# might be trained by another process, e.g. the cli
+			from prime_backup.db.access import DbAccess
+			if DbAccess.is_initialized():
+				DbAccess.sync_zstd_dict_cache()
+			with cls.__lock:
+				data, generation = cls.__dicts.get(dict_id), cls.__generation
+			if data is None:
+				raise ValueError('zstd dictionary {} does not exist'.format(dict_id))
+		return data, generation
+
+	@classmethod
+	def __get_local_dict(cls, key: Tuple[int, Optional[int]]) -> 'zstandard.ZstdCompressionDict':
+		import zstandard
+		data, generation = cls.__get_data(key[0])
+		if getattr(cls.__local, 'generation', None) != generation:
+			cls.__local.generation = generation
+			cls.__local.dicts = {}
+		local_dicts: Dict[Tuple[int, Optional[int]], zstandard.ZstdCompressionDict] = cls.__local.dicts
+		if (zd := local_dicts.get(key)) is None:
+			zd = zstandard.ZstdCompressionDict(data)
+			if key[1] is not None:
+				zd.precompute_compress(level=key[1])
+			local_dicts[key] = zd
+		return zd
+
+	@classmethod
+	def get_compress_dict(cls, dict_id: int, level: int) -> 'zstandard.ZstdCompressionDict':
+		return cls.__get_local_dict((dict_id, level))
+
+	@classmethod
+	def get_decompress_dict(cls, dict_id: int) -> 'zstandard.ZstdCompressionDict':
+		return cls.__get_local_dict((dict_id, None))
@@ -165,3 +165,10 @@ class VerificationError(PrimeBackupError):
 
 class CorruptDataError(PrimeBackupError):
 	pass
+
+
+class NotEnoughZstdDictSamples(PrimeBackupError):
+	def __init__(self, sample_count: int, required: int):
+		super().__init__('found {} samples, at least {} is required'.format(sample_count, required))
+		self.sample_count = sample_count
+		self.required = required
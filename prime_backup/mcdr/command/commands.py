@@ -39,6 +39,8 @@ from prime_backup.mcdr.task.db.migrate_hash_method_task import MigrateHashMethod
 from prime_backup.mcdr.task.db.prune_database_task import PruneDatabaseTask
 from prime_backup.mcdr.task.db.reassign_backup_id_task import ReassignBackupIdTask
 from prime_backup.mcdr.task.db.show_db_overview_task import ShowDbOverviewTask
+from prime_backup.mcdr.task.db.rebuild_ref_counts_task import RebuildRefCountsTask
+from prime_backup.mcdr.task.db.train_zstd_dict_task import TrainZstdDictTask
 from prime_backup.mcdr.task.db.vacuum_sqlite_task import VacuumSqliteTask
 from prime_backup.mcdr.task.db.validate_db_task import ValidateDbTask, ValidatePart
 from prime_backup.mcdr.task.general.show_help_task import ShowHelpTask
@@ -156,6 +158,12 @@ class CommandManager:
 	def cmd_db_compact_packs(self, source: CommandSource, _: CommandContext):
 		self.task_manager.add_task(CompactPacksTask(source, threshold=1.0))
 
+	def cmd_db_rebuild_refcounts(self, source: CommandSource, _: CommandContext):
+		self.task_manager.add_task(RebuildRefCountsTask(source))
+
+	def cmd_db_train_zstd_dict(self, source: CommandSource, _: CommandContext):
+		self.task_manager.add_task(TrainZstdDictTask(source))
+
 	def cmd_db_reassign_backup_id(self, source: CommandSource, context: CommandContext):
 		order = context.get('reassign_backup_order', BackupSortOrder.id)
 		self.task_manager.add_task(ReassignBackupIdTask(source, order))
@@ -447,6 +455,8 @@ class CommandManager:
 		builder.command('database vacuum', self.cmd_db_vacuum)
 		builder.command('database prune', self.cmd_db_prune)
 		builder.command('database compact_packs', self.cmd_db_compact_packs)
+		builder.command('database rebuild_refcounts', self.cmd_db_rebuild_refcounts)
+		builder.command('database train_zstd_dict', self.cmd_db_train_zstd_dict)
 		builder.command('database migrate_compress_method <compress_method>', self.cmd_db_migrate_compress_method)
 		builder.command('database migrate_hash_method <hash_method>', self.cmd_db_migrate_hash_method)
 		builder.command('database reassign_backup_id', self.cmd_db_reassign_backup_id)
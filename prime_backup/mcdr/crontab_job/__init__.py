@@ -15,6 +15,7 @@ class CrontabJobId(enum.Enum):
 	schedule_backup = enum.auto()
 	vacuum_sqlite = enum.auto()
 	compact_pack = enum.auto()
+	scrub = enum.auto()
 
 
 class CrontabJobEvent(enum.Enum):
@@ -0,0 +1,54 @@
+import datetime
+from typing import TYPE_CHECKING
+
+from apscheduler.schedulers.base import BaseScheduler
+from apscheduler.triggers.cron import CronTrigger
+from typing_extensions import override
+
+from prime_backup.config.config_common import CrontabJobSetting
+from prime_backup.config.database_config import ScrubDatabaseConfig
+from prime_backup.mcdr.crontab_job import CrontabJobId
+from prime_backup.mcdr.crontab_job.basic_job import BasicCrontabJob
+from prime_backup.mcdr.task.db.scrub_task import ScrubTask
+
+if TYPE_CHECKING:
+	from prime_backup.mcdr.task_manager import TaskManager
+
+
+class ScrubJob(BasicCrontabJob):
+	def __init__(self, scheduler: BaseScheduler, task_manager: 'TaskManager'):
+		super().__init__(scheduler, task_manager)
+		self.config: ScrubDatabaseConfig = self._root_config.database.scrub
+
+	@property
+	@override
+	def id(self) -> CrontabJobId:
+		return CrontabJobId.scrub
+
+	@property
+	@override
+	def job_config(self) -> CrontabJobSetting:
+		return self.config
+
+	def __get_run_interval_sec(self) -> float:
+		if self.interval is not None:
+			return self.interval.value
+		if self.crontab is not None:
+			trigger = CronTrigger.from_crontab(self.crontab)
+			now = datetime.datetime.now(trigger.timezone)
+			t1 = trigger.get_next_fire_time(None, now)
+			if t1 is not None:
+				t2 = trigger.get_next_fire_time(t1, t1 + datetime.timedelta(seconds=1))
+				if t2 is not None:
+					return (t2 - t1).total_seconds()
+		return self.config.period.value
+
+	def get_size_ratio(self) -> float:
+		"""
+		Every run verifies ``interval / period`` of the store, so the whole store gets verified in every period
+		"""
+		return min(1.0, max(1e-6, self.__get_run_interval_sec() / self.config.period.value))
+
+	@override
+	def run(self):
+		self.run_task_with_retry(ScrubTask(self.get_command_source(), size_ratio=self.get_size_ratio()), True).report()
@@ -10,6 +10,7 @@ from prime_backup.mcdr.crontab_job.compact_pack_job import CompactPackJob
 from prime_backup.mcdr.crontab_job.create_db_backup_job import CreateDbBackupJob
 from prime_backup.mcdr.crontab_job.prune_backup_job import PruneBackupJob
 from prime_backup.mcdr.crontab_job.scheduled_backup_job import ScheduledBackupJob
+from prime_backup.mcdr.crontab_job.scrub_job import ScrubJob
 from prime_backup.mcdr.crontab_job.vacuum_sqlite_job import VacuumSqliteJob
 from prime_backup.mcdr.task_manager import TaskManager
 from prime_backup.utils import misc_utils
@@ -34,6 +35,7 @@ class CrontabManager:
 			ScheduledBackupJob,
 			VacuumSqliteJob,
 			CompactPackJob,
+			ScrubJob,
 		]
 		jobs: List[CrontabJob] = [clazz(self.scheduler, self.task_manager) for clazz in job_classes]
 		self.jobs: Dict[CrontabJobId, CrontabJob] = {job.id: job for job in jobs}
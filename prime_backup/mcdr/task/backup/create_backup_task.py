@@ -11,6 +11,7 @@ from prime_backup.mcdr.task.basic_task import HeavyTask
 from prime_backup.mcdr.text_components import TextComponents
 from prime_backup.types.backup_tags import BackupTags
 from prime_backup.types.operator import Operator
+from prime_backup.utils.run_once import RunOnceFunc
 from prime_backup.utils.timer import Timer
 
 
@@ -44,18 +45,22 @@ class CreateBackupTask(HeavyTask[Optional[int]]):
 			self.server.execute(cmd_auto_save_off)
 			applied_auto_save_off = True
 
-		try:
-			yield
-		finally:
+		def restore_auto_save():
 			if applied_auto_save_off and self.server.is_server_running() and len(cmd_auto_save_on) > 0:
 				self.server.execute(cmd_auto_save_on)
 
+		auto_save_restorer = RunOnceFunc(restore_auto_save)
+		try:
+			yield auto_save_restorer
+		finally:
+			auto_save_restorer()
+
 	@override
 	def run(self) -> Optional[int]:
 		self.broadcast(self.tr('start'))
 
 		with contextlib.ExitStack() as exit_stack:
-			exit_stack.enter_context(self.__autosave_disabler())
+			auto_save_restorer: RunOnceFunc = exit_stack.enter_context(self.__autosave_disabler())
 
 			timer = Timer()
 			if self.server.is_server_running():
@@ -76,13 +81,26 @@ class CreateBackupTask(HeavyTask[Optional[int]]):
 				self.broadcast(self.tr('abort.unloaded').set_color(RColor.red))
 				return None
 
-			action = CreateBackupAction(self.operator, self.comment, tags=self.backup_tags)
+			cost_snapshot: Optional[float] = None
+
+			def snapshot_done_callback():
+				nonlocal cost_snapshot
+				cost_snapshot = timer.get_elapsed()
+				auto_save_restorer()
+
+			action = CreateBackupAction(
+				self.operator, self.comment, tags=self.backup_tags,
+				snapshot_done_callback=snapshot_done_callback if self.config.backup.source_snapshot_enabled else None,
+			)
 			backup = action.run()
 			bds = action.get_new_blob_storage_delta()
 			cost_create = timer.get_elapsed()
 			cost_total = cost_save_wait + cost_create
 
-			self.logger.info('Time costs: save wait {}s, create backup {}s'.format(round(cost_save_wait, 2), round(cost_create, 2)))
+			if cost_snapshot is not None:
+				self.logger.info('Time costs: save wait {}s, create backup {}s (snapshot {}s)'.format(round(cost_save_wait, 2), round(cost_create, 2), round(cost_snapshot, 2)))
+			else:
+				self.logger.info('Time costs: save wait {}s, create backup {}s'.format(round(cost_save_wait, 2), round(cost_create, 2)))
 			self.broadcast(self.tr(
 				'completed',
 				TextComponents.backup_id(backup.id),
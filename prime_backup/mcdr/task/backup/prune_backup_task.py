@@ -9,10 +9,9 @@ import pytz
 from mcdreforged.api.all import CommandSource, RTextBase, RTextList, RColor
 from typing_extensions import override
 
-from prime_backup.action.delete_backup_action import DeleteBackupAction
+from prime_backup.action.delete_backup_action import DeleteBackupsAction
 from prime_backup.action.list_backup_action import ListBackupAction
 from prime_backup.config.prune_config import PruneSetting
-from prime_backup.exceptions import BackupNotFound
 from prime_backup.mcdr.task.basic_task import HeavyTask
 from prime_backup.mcdr.text_components import TextComponents
 from prime_backup.types.backup_filter import BackupFilter
@@ -21,7 +20,7 @@ from prime_backup.types.blob_info import BlobDeltaSummary
 from prime_backup.types.operator import PrimeBackupOperatorNames
 from prime_backup.types.timestamp import Timestamp
 from prime_backup.types.units import ByteCount
-from prime_backup.utils import misc_utils, log_utils, conversion_utils
+from prime_backup.utils import misc_utils, log_utils, conversion_utils, collection_utils
 
 
 class _PruneVerbose:
@@ -86,6 +85,8 @@ class PruneAllBackupResult:
 
 
 class PruneBackupTask(HeavyTask[PruneBackupResult]):
+	DELETE_BATCH_SIZE = 100
+
 	def __init__(self, source: CommandSource, backup_filter: BackupFilter, setting: PruneSetting, *, what_to_prune: Optional[RTextBase] = None, verbose: int = 2):
 		super().__init__(source)
 		self.backup_filter = backup_filter
@@ -240,26 +241,23 @@ class PruneBackupTask(HeavyTask[PruneBackupResult]):
 					TextComponents.backup_id_list(to_deleted_ids, hover=False, click=False),
 				)
 
-			for pl in plan_list:
-				bid = pl.backup.id
+			# delete in batches, so the orphan object cleanup runs once per batch instead of once per backup
+			for batch_ids in collection_utils.slicing_iterate(to_deleted_ids, self.DELETE_BATCH_SIZE):
 				if self.aborted_event.is_set():
 					if self.verbose >= _PruneVerbose.delete:
 						self.reply(self.get_aborted_text())
 					break
-				if not pl.mark.keep:
-					self.reply_tr('prune', TextComponents.backup_id(bid, hover=False, click=False))
-					try:
-						dr = DeleteBackupAction(bid).run()
-					except Exception as e:
-						if isinstance(e, BackupNotFound):
-							prune_logger.error('Delete backup #%s resulting in BackupNotFound', bid)
-						else:
-							prune_logger.exception('Delete backup #%s error', bid)
-							raise
-					else:
-						prune_logger.info('Delete backup #%s done', bid)
-						result.freed_blob_delta_summary += dr.delta
-						result.deleted_backup_count += 1
+				self.reply_tr('prune', TextComponents.backup_id_list(batch_ids, hover=False, click=False))
+				try:
+					dr = DeleteBackupsAction(batch_ids).run()
+				except Exception:
+					prune_logger.exception('Delete backups %s error', batch_ids)
+					raise
+				for bid in dr.missing_backup_ids:
+					prune_logger.error('Delete backup #%s resulting in BackupNotFound', bid)
+				prune_logger.info('Delete backups %s done', [backup.id for backup in dr.backups])
+				result.freed_blob_delta_summary += dr.delta
+				result.deleted_backup_count += len(dr.backups)
 			for logger in [self.logger, prune_logger]:
 				logger.info('Pruned backup done, deleted {} backups, freed {} blobs, {} chunks and changed {} packs (freed disk {} / raw {})'.format(
 					result.deleted_backup_count, result.freed_blob_delta_summary.blob_count, result.freed_blob_delta_summary.chunk_count,
@@ -98,10 +98,12 @@ class RestoreBackupTask(HeavyTask[None]):
 				pre_restore_backup_id = 'N/A'
 			cost_backup = timer.get_and_restart()
 
-			self.logger.info('Restoring to backup #{} (fail_soft={}, verify_blob={})'.format(backup.id, self.fail_soft, self.verify_blob))
+			self.logger.info('Restoring to backup #{} (fail_soft={}, verify_blob={}, incremental={})'.format(backup.id, self.fail_soft, self.verify_blob, self.config.command.incremental_restore))
 			failures = ExportBackupToDirectoryAction(
 				backup.id, self.config.source_path,
 				restore_mode=True,
+				incremental=self.config.command.incremental_restore,
+				incremental_hash_check=self.config.command.incremental_restore_hash_check,
 				fail_soft=self.fail_soft,
 				verify_blob=self.verify_blob,
 				retain_patterns=self.config.backup.retain_patterns,
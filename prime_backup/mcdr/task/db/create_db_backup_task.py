@@ -12,6 +12,7 @@ from typing_extensions import override
 
 from prime_backup.action.vacuum_sqlite_action import VacuumSqliteAction
 from prime_backup.db import db_constants
+from prime_backup.db.db_page_store import DbPageStore
 from prime_backup.mcdr.task.basic_task import HeavyTask
 from prime_backup.types.units import ByteCount
 from prime_backup.utils import misc_utils
@@ -42,7 +43,7 @@ class CreateDbBackupTask(HeavyTask[Optional[threading.Thread]]):
 		sem_releaser = RunOnceFunc(self.__task_sem.release)
 
 		try:
-			db_backup_root: Path = self.config.storage_path / 'db_backup'
+			db_backup_root: Path = self.config.storage_path / db_constants.DB_BACKUP_DIR_NAME
 			db_backup_root.mkdir(parents=True, exist_ok=True)
 			temp_db_path = db_backup_root / 'temp.db'
 
@@ -80,12 +81,37 @@ class CreateDbBackupTask(HeavyTask[Optional[threading.Thread]]):
 					sem_releaser()
 					temp_db_path.unlink(missing_ok=True)
 
+			def incremental_thread():
+				store = DbPageStore(db_backup_root / db_constants.DB_INCREMENTAL_BACKUP_DIR_NAME)
+				snapshot_name = time.strftime('db_backup_%Y%m%d_%H%M%S')
+				try:
+					t = time.time()
+
+					self.logger.info('db backup: Storing incremental database backup {}'.format(snapshot_name))
+					result = store.create_snapshot(temp_db_path, snapshot_name)
+					cost = time.time() - t
+					self.logger.info('db backup: Store incremental database backup done, name {!r}, cost {:.2f}s, pages {} (new {}), new stored size {} ({})'.format(
+						snapshot_name, cost, result.snapshot.page_count, result.new_page_count,
+						ByteCount(result.new_stored_size).auto_str(), f'{100 * result.new_stored_size / max(db_size, 1):.2f}%',
+					))
+				except Exception:
+					self.logger.exception('db backup: Store incremental database backup {} failed'.format(snapshot_name))
+				else:
+					try:
+						self.__delete_old_db_snapshots(store)
+					except Exception:
+						self.logger.exception('db backup: Delete old database backups failed')
+				finally:
+					sem_releaser()
+					temp_db_path.unlink(missing_ok=True)
+
 			try:
 				VacuumSqliteAction(temp_db_path).run()
 				db_size = temp_db_path.stat().st_size
-				self.logger.info('db backup: Vacuum database done, start a new thread for compressing')
+				self.logger.info('db backup: Vacuum database done, start a new thread for storing')
 
-				thread = threading.Thread(target=tar_thread, name=misc_utils.make_thread_name('db-backup'), daemon=True)
+				target = incremental_thread if self.config.database.backup.mode == 'incremental' else tar_thread
+				thread = threading.Thread(target=target, name=misc_utils.make_thread_name('db-backup'), daemon=True)
 				thread.start()
 				return thread
 
@@ -143,3 +169,19 @@ class CreateDbBackupTask(HeavyTask[Optional[threading.Thread]]):
 				self.logger.exception('db backup: Failed to delete old database backup {}'.format(backup_file.path.as_posix()))
 			else:
 				self.logger.info('db backup: Deleted old database backup {}'.format(backup_file.path.as_posix()))
+
+	def __delete_old_db_snapshots(self, store: DbPageStore):
+		max_amount = self.config.database.backup.max_amount
+		if max_amount <= 0:
+			return
+
+		snapshots = store.list_snapshots()  # [new, ..., old)
+		names_to_delete = [snapshot.name for snapshot in snapshots[max_amount:]]
+		if not names_to_delete:
+			return
+
+		self.logger.info('db backup: Deleting {} old incremental database backup(s), keeping {}'.format(len(names_to_delete), max_amount))
+		result = store.delete_snapshots(names_to_delete, self.config.backup.pack_maintenance_compact_threshold)
+		self.logger.info('db backup: Deleted old incremental database backups {}, freed {} pages, {} packs deleted, {} packs rewritten, {} released'.format(
+			names_to_delete, result.deleted_page_count, result.deleted_pack_count, result.rewritten_pack_count, ByteCount(result.freed_size).auto_str(),
+		))
@@ -260,10 +260,11 @@ class InspectBlobTask(_InspectObjectTaskBase):
 		self.reply_tr('raw_size', RText(blob.raw_size, TextColors.byte_count), TextComponents.file_size(blob.raw_size))
 		self.reply_tr('stored_size', RText(blob.stored_size, TextColors.byte_count), TextComponents.file_size(blob.stored_size))
 
-		if blob.storage_method == BlobStorageMethod.chunked:
-			counts = GetBlobChunkAndChunkGroupCountAction(blob.id).run()
+		if blob.storage_method in (BlobStorageMethod.chunked, BlobStorageMethod.packed):
+			if blob.storage_method == BlobStorageMethod.chunked:
+				counts = GetBlobChunkAndChunkGroupCountAction(blob.id).run()
+				self.reply_tr('chunk_count', TextComponents.number(counts.chunk_count), TextComponents.number(counts.chunk_group_count))
 			blob_chunks = GetBlobChunksAction(blob.id, limit=5).run()
-			self.reply_tr('chunk_count', TextComponents.number(counts.chunk_count), TextComponents.number(counts.chunk_group_count))
 			for i, offset_chunk in enumerate(blob_chunks, start=1):
 				self.reply(RTextList(
 					f'{i}. ',
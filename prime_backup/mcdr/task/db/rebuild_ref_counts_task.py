@@ -0,0 +1,27 @@
+from typing_extensions import override
+
+from prime_backup.action.validate_ref_counts_action import RebuildRefCountsAction
+from prime_backup.mcdr.task.basic_task import HeavyTask
+from prime_backup.mcdr.text_components import TextComponents
+
+
+class RebuildRefCountsTask(HeavyTask[None]):
+	@property
+	@override
+	def id(self) -> str:
+		return 'db_rebuild_refcounts'
+
+	@override
+	def run(self) -> None:
+		self.reply_tr('start')
+		fixed = self.run_action(RebuildRefCountsAction())
+
+		if sum(fixed.values()) == 0:
+			self.reply_tr('done_clean')
+		else:
+			self.reply_tr(
+				'done',
+				TextComponents.number(fixed['blob']),
+				TextComponents.number(fixed['chunk_group']),
+				TextComponents.number(fixed['chunk']),
+			)
@@ -0,0 +1,43 @@
+from mcdreforged.api.all import CommandSource
+from typing_extensions import override
+
+from prime_backup.action.scrub_action import ScrubAction
+from prime_backup.mcdr.task.basic_task import HeavyTask
+from prime_backup.mcdr.text_components import TextComponents
+
+
+class ScrubTask(HeavyTask[None]):
+	def __init__(self, source: CommandSource, *, size_ratio: float):
+		super().__init__(source)
+		self.size_ratio = size_ratio
+
+	@property
+	@override
+	def id(self) -> str:
+		return 'db_scrub'
+
+	@override
+	def is_abort_able(self) -> bool:
+		return True
+
+	@override
+	def run(self) -> None:
+		self.reply_tr('start', TextComponents.percent(self.size_ratio, 1, ndigits=2))
+		result = self.run_action(ScrubAction(size_ratio=self.size_ratio))
+		if self.aborted_event.is_set():
+			return
+
+		args = (
+			TextComponents.number(result.pack_count),
+			TextComponents.number(result.blob_count),
+			TextComponents.file_size(result.size),
+		)
+		if result.bad == 0:
+			self.reply_tr('done', *args)
+		else:
+			self.reply_tr(
+				'done_bad', *args,
+				TextComponents.number(result.chunk_result.bad),
+				TextComponents.number(result.blob_result.bad),
+				TextComponents.command('database validate all', suggest=True),
+			)
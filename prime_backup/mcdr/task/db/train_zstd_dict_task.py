@@ -0,0 +1,32 @@
+from typing_extensions import override
+
+from prime_backup.action.train_zstd_dict_action import TrainZstdDictAction
+from prime_backup.exceptions import NotEnoughZstdDictSamples
+from prime_backup.mcdr.task.basic_task import HeavyTask
+from prime_backup.mcdr.text_components import TextComponents
+
+
+class TrainZstdDictTask(HeavyTask[None]):
+	@property
+	@override
+	def id(self) -> str:
+		return 'db_train_zstd_dict'
+
+	@override
+	def run(self) -> None:
+		self.reply_tr('start', TextComponents.file_size(self.config.backup.zstd_dict_threshold, ndigits=0))
+		try:
+			result = self.run_action(TrainZstdDictAction())
+		except NotEnoughZstdDictSamples as e:
+			self.reply_tr('not_enough_samples', TextComponents.number(e.sample_count), TextComponents.number(e.required))
+			return
+
+		self.reply_tr(
+			'done',
+			TextComponents.number(result.dict_id),
+			TextComponents.file_size(result.dict_size),
+			TextComponents.number(result.sample_count),
+			TextComponents.file_size(result.sample_size_sum),
+		)
+		if not self.config.backup.zstd_dict_enabled:
+			self.reply_tr('not_enabled')
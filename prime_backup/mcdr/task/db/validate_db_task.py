@@ -18,6 +18,8 @@ from prime_backup.action.validate_chunks_action import BadChunkItem, ValidateChu
 from prime_backup.action.validate_files_action import ValidateFilesAction, BadFileItemType
 from prime_backup.action.validate_filesets_action import ValidateFilesetsAction, BadFilesetItemType
 from prime_backup.action.validate_packs_action import BadPackItem, ValidatePacksAction
+from prime_backup.action.validate_ref_counts_action import ValidateRefCountsAction
+from prime_backup.db.ref_counts import BadRefCountItem
 from prime_backup.mcdr.task.basic_task import HeavyTask
 from prime_backup.mcdr.text_components import TextComponents
 from prime_backup.types.file_info import FileInfo
@@ -32,6 +34,7 @@ class ValidatePart(enum.Flag):
 	files = enum.auto()
 	filesets = enum.auto()
 	backups = enum.auto()
+	refcounts = enum.auto()
 
 	@classmethod
 	def all(cls) -> 'ValidatePart':
@@ -312,6 +315,29 @@ class ValidateDbTask(HeavyTask[None]):
 		self.__show_bad_objects(vlogger, result.bad_backups, item_formatter)
 		return False
 
+	def __validate_refcounts(self, vlogger: logging.Logger) -> bool:
+		result = self.run_action(ValidateRefCountsAction())
+		vlogger.info('Validate reference counts result: total={} bad={}'.format(result.total, result.bad))
+		if result.bad_count == 0:
+			self.reply(self.tr(
+				'validate_refcounts.all_ok',
+				*[TextComponents.number(result.total.get(table, 0)) for table in ['blob', 'chunk_group', 'chunk']],
+			).set_color(RColor.green))
+			return True
+
+		self.reply(self.tr('validate_refcounts.found_bad_refcounts', TextComponents.number(result.bad_count), TextComponents.number(result.total_count)).set_color(RColor.red))
+		for table, bad_count in result.bad.items():
+			if bad_count == 0:
+				continue
+
+			def item_formatter(item: BadRefCountItem) -> str:
+				return f'id={item.id}: ref_count={item.ref_count}, expected={item.expected_ref_count}'
+			vlogger.info('bad reference counts in table {!r} (len={})'.format(table, bad_count))
+			self.reply_tr(f'validate_refcounts.bad_type.{table}', TextComponents.number(bad_count))
+			self.__show_bad_objects(vlogger, [item for item in result.bad_samples if item.table == table], item_formatter)
+		self.reply(self.tr('validate_refcounts.fix_tip', TextComponents.command('database rebuild_refcounts', suggest=True)).set_color(RColor.gold))
+		return False
+
 	@override
 	def run(self) -> None:
 		if not self.parts:
@@ -329,6 +355,7 @@ class ValidateDbTask(HeavyTask[None]):
 				ValidatePart.files: self.__validate_files,
 				ValidatePart.filesets: self.__validate_filesets,
 				ValidatePart.backups: self.__validate_backups,
+				ValidatePart.refcounts: self.__validate_refcounts,
 			}
 			selected_parts = [part for part in validators.keys() if part in self.parts]
 			if len(selected_parts) > 1:
@@ -2,11 +2,12 @@ import dataclasses
 import datetime
 import functools
 import json
-from typing import List, TYPE_CHECKING, Optional
+from typing import List, TYPE_CHECKING, Optional, Union, Sequence
 
 from typing_extensions import Self
 
 from prime_backup.db import schema
+from prime_backup.db.rows import FileRow
 from prime_backup.types.backup_tags import BackupTags
 from prime_backup.types.operator import Operator
 from prime_backup.types.timestamp import Timestamp
@@ -44,7 +45,7 @@ class BackupInfo:
 		return conversion_utils.datetime_to_str(self.timestamp.to_local_date())
 
 	@classmethod
-	def of(cls, backup: schema.Backup, *, backup_files: Optional[List[schema.File]] = None) -> 'Self':
+	def of(cls, backup: schema.Backup, *, backup_files: Optional[Sequence[Union[schema.File, FileRow]]] = None) -> 'Self':
 		"""
 		Notes: should be inside a session
 		"""
@@ -95,6 +95,7 @@ class BlobListSummary:
 class BlobDeltaSummary:
 	direct_blobs: BlobListSummary
 	chunked_blobs: BlobListSummary
+	packed_blobs: BlobListSummary
 	chunks: 'ChunkListSummary'
 	packs: 'PackChangeSummary'
 
@@ -105,6 +106,7 @@ class BlobDeltaSummary:
 		return BlobDeltaSummary(
 			chunked_blobs=BlobListSummary.zero(),
 			direct_blobs=BlobListSummary.zero(),
+			packed_blobs=BlobListSummary.zero(),
 			chunks=ChunkListSummary.zero(),
 			packs=PackChangeSummary.zero(),
 		)
@@ -116,17 +118,18 @@ class BlobDeltaSummary:
 		return BlobDeltaSummary(
 			direct_blobs=BlobListSummary.of(blob for blob in new_blobs if blob.storage_method == BlobStorageMethod.direct),
 			chunked_blobs=BlobListSummary.of(blob for blob in new_blobs if blob.storage_method == BlobStorageMethod.chunked),
+			packed_blobs=BlobListSummary.of(blob for blob in new_blobs if blob.storage_method == BlobStorageMethod.packed),
 			chunks=new_chunks if isinstance(new_chunks, ChunkListSummary) else ChunkListSummary.of(new_chunks),
 			packs=packs or PackChangeSummary.zero(),
 		)
 
 	@property
 	def blobs(self) -> BlobListSummary:
-		return self.direct_blobs + self.chunked_blobs
+		return self.direct_blobs + self.chunked_blobs + self.packed_blobs
 
 	@property
 	def blob_count(self) -> int:
-		return self.direct_blobs.count + self.chunked_blobs.count
+		return self.direct_blobs.count + self.chunked_blobs.count + self.packed_blobs.count
 
 	@property
 	def chunk_count(self) -> int:
@@ -157,6 +160,7 @@ class BlobDeltaSummary:
 		return BlobDeltaSummary(
 			direct_blobs=self.direct_blobs + other.direct_blobs,
 			chunked_blobs=self.chunked_blobs + other.chunked_blobs,
+			packed_blobs=self.packed_blobs + other.packed_blobs,
 			chunks=self.chunks + other.chunks,
 			packs=self.packs + other.packs,
 		)
@@ -4,7 +4,7 @@ from typing import Optional, IO, TYPE_CHECKING, Iterable
 
 from prime_backup.types.chunker import Chunker
 from prime_backup.types.chunker import PrettyChunk
-from prime_backup.types.chunker_definition import ChunkerDefinition, FastCDCChunkerDefinition, FixedSizeChunkerDefinition, FixedAutoChunkerDefinition
+from prime_backup.types.chunker_definition import ChunkerDefinition, FastCDCChunkerDefinition, FixedSizeChunkerDefinition, FixedAutoChunkerDefinition, McaSectorChunkerDefinition
 from prime_backup.utils.path_like import PathLike
 
 
@@ -21,6 +21,9 @@ class ChunkMethod(enum.Enum):
 	fixed_1m = FixedSizeChunkerDefinition(1024 * 1024)
 	fixed_auto = FixedAutoChunkerDefinition()
 
+	# Structure-Aware Chunking
+	mca_sector = McaSectorChunkerDefinition()
+
 	if TYPE_CHECKING:
 		value: ChunkerDefinition
 
@@ -2,6 +2,7 @@ import dataclasses
 import logging
 import mmap
 import os
+import struct
 from abc import abstractmethod, ABC
 from pathlib import Path
 from typing import TYPE_CHECKING, List, Generator, IO, Optional, Iterable, Dict, Iterator, Callable, Tuple, Type
@@ -282,6 +283,20 @@ class _MmapFileIterator:
 			yield offset, buf
 			offset += len(buf)
 
+	def create_reader(self) -> Callable[[int], memoryview]:
+		"""
+		Return a read(n) function that sequentially reads the file. It returns less than n bytes only if EOF is reached
+		"""
+		offset = 0
+
+		def read(length: int) -> memoryview:
+			nonlocal offset
+			buf = memoryview(self.__data[offset: offset + length])
+			offset += len(buf)
+			return buf
+
+		return read
+
 
 class FixedSizeFileChunker(_FixedSizeChunker):
 	def __init__(self, chunk_size: int, file_path: Path, need_entire_file_hash: bool = False):
@@ -433,3 +448,96 @@ class FixedAutoFileChunker(Chunker):
 				previous_big_reused_count, previous_big_split_count, fallback_big_count,
 				previous_small_merged_count, previous_small_kept_count,
 			))
+
+
+# ======================== MCA Sector Chunker ========================
+
+
+class _McaSectorChunker(Chunker, ABC):
+	"""
+	Cuts a Minecraft Anvil region file (.mca) along its own chunk entries:
+	the location table, the timestamp table, then one chunk for each sector run listed in the location table.
+	A game chunk that is moved or rewritten by the game only changes its own chunk
+
+	Gaps between sector runs, and the data of files that are not valid region files, are cut into fixed-size chunks
+	"""
+	SECTOR_SIZE = 4 * 1024
+	HEADER_SIZE = 2 * SECTOR_SIZE
+	GAP_CHUNK_SIZE = 128 * 1024
+
+	@classmethod
+	def _parse_sector_runs(cls, location_table: memoryview) -> List[Tuple[int, int]]:
+		"""
+		:return: Sorted and non-overlapping [start, end) byte ranges of the sector runs. Overlapping runs are ignored
+		"""
+		runs: List[Tuple[int, int]] = []
+		for (entry,) in struct.iter_unpack('>I', location_table):
+			sector_offset, sector_count = entry >> 8, entry & 0xFF
+			if sector_offset > 0 and sector_count > 0:
+				runs.append((sector_offset * cls.SECTOR_SIZE, (sector_offset + sector_count) * cls.SECTOR_SIZE))
+		runs.sort()
+
+		result: List[Tuple[int, int]] = []
+		pos = cls.HEADER_SIZE
+		for start, end in runs:
+			if start >= pos:
+				result.append((start, end))
+				pos = end
+		return result
+
+	def _cut_region(self, read: Callable[[int], memoryview]) -> Generator[_RawChunk, None, None]:
+		pos = 0
+		eof = False
+
+		def cut_until(end: Optional[int], piece_size: int) -> Generator[_RawChunk, None, None]:
+			nonlocal pos, eof
+			while not eof and (end is None or pos < end):
+				length = piece_size if end is None else min(piece_size, end - pos)
+				buf = read(length)
+				if len(buf) > 0:
+					yield pos, len(buf), buf, chunk_utils.calc_bytes_hash(buf)
+					pos += len(buf)
+				if len(buf) < length:
+					eof = True
+
+		location_table: Optional[memoryview] = None
+		for raw_chunk in cut_until(self.SECTOR_SIZE, self.SECTOR_SIZE):
+			location_table = raw_chunk[2]
+			yield raw_chunk
+		yield from cut_until(self.HEADER_SIZE, self.SECTOR_SIZE)  # the timestamp table
+
+		if location_table is not None and len(location_table) == self.SECTOR_SIZE:
+			for start, end in self._parse_sector_runs(location_table):
+				yield from cut_until(start, self.GAP_CHUNK_SIZE)
+				yield from cut_until(end, end - start)
+		yield from cut_until(None, self.GAP_CHUNK_SIZE)
+
+
+class McaSectorFileChunker(_McaSectorChunker):
+	def __init__(self, file_path: Path, need_entire_file_hash: bool = False):
+		super().__init__(need_entire_file_hash)
+		self.file_path = file_path
+
+	@override
+	def _iter_raw_chunks(self) -> Iterable[_RawChunk]:
+		with _MmapFileIterator(self.file_path) as mmap_iter:
+			yield from self._cut_region(mmap_iter.create_reader())
+
+
+class McaSectorStreamChunker(_McaSectorChunker):
+	def __init__(self, stream: IO[bytes], need_entire_file_hash: bool = False):
+		super().__init__(need_entire_file_hash)
+		self.stream = stream
+
+	def __read(self, length: int) -> memoryview:
+		buf = self.stream.read(length)
+		while 0 < len(buf) < length:
+			more = self.stream.read(length - len(buf))
+			if not more:
+				break
+			buf += more
+		return memoryview(buf)
+
+	@override
+	def _iter_raw_chunks(self) -> Iterable[_RawChunk]:
+		yield from self._cut_region(self.__read)
@@ -5,7 +5,7 @@ from typing import IO, Optional, Iterable
 
 from typing_extensions import override
 
-from prime_backup.types.chunker import Chunker, FastCDCFileChunker, FastCDCStreamChunker, FixedSizeFileChunker, FixedSizeStreamChunker, FastCDCChunkerConfig, FixedAutoFileChunker, PrettyChunk, _get_fastcdc_class
+from prime_backup.types.chunker import Chunker, FastCDCFileChunker, FastCDCStreamChunker, FixedSizeFileChunker, FixedSizeStreamChunker, FastCDCChunkerConfig, FixedAutoFileChunker, PrettyChunk, _get_fastcdc_class, McaSectorFileChunker, McaSectorStreamChunker
 
 
 class ChunkerDefinition(ABC):
@@ -73,3 +73,14 @@ class FixedAutoChunkerDefinition(ChunkerDefinition):
 	@override
 	def needs_previous_chunks(self) -> bool:
 		return True
+
+
+@dataclasses.dataclass(frozen=True)
+class McaSectorChunkerDefinition(ChunkerDefinition):
+	@override
+	def create_file_chunker(self, file_path: Path, need_entire_file_hash: bool, *, previous_chunks: Optional[Iterable[PrettyChunk]] = None) -> Chunker:
+		return McaSectorFileChunker(file_path, need_entire_file_hash)
+
+	@override
+	def create_stream_chunker(self, stream, need_entire_file_hash: bool) -> Chunker:
+		return McaSectorStreamChunker(stream, need_entire_file_hash)
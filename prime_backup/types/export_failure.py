@@ -1,10 +1,11 @@
 import contextlib
 import dataclasses
-from typing import List, Iterator
+from typing import List, Iterator, Union
 
 from mcdreforged.api.all import RTextBase, RText
 
 from prime_backup.db import schema
+from prime_backup.db.rows import FileRow
 from prime_backup.types.file_info import FileInfo
 
 
@@ -20,7 +21,7 @@ class ExportFailures:
 		self.failures: List[ExportFailure] = []
 
 	@contextlib.contextmanager
-	def handling_exception(self, file: schema.File):
+	def handling_exception(self, file: Union[schema.File, FileRow]):
 		try:
 			yield
 		except Exception as e:
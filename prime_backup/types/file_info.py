@@ -2,12 +2,13 @@ import dataclasses
 import enum
 import functools
 import stat
-from typing import Optional, List, TYPE_CHECKING
+from typing import Optional, List, TYPE_CHECKING, Union
 
 from typing_extensions import Self
 
 from prime_backup.compressors import CompressMethod
 from prime_backup.db import schema
+from prime_backup.db.rows import FileRow
 from prime_backup.db.values import FileRole, BlobStorageMethod, FileIdentifier
 from prime_backup.exceptions import CorruptDataError
 from prime_backup.types.blob_info import BlobInfo, BlobDeltaSummary
@@ -45,7 +46,7 @@ class FileInfo:
 	backup_samples: List['BackupInfo'] = dataclasses.field(default_factory=list)
 
 	@classmethod
-	def of(cls, file: schema.File, *, backup_count: int = 0, backup_samples: Optional[List[schema.Backup]] = None) -> 'FileInfo':
+	def of(cls, file: Union[schema.File, FileRow], *, backup_count: int = 0, backup_samples: Optional[List[schema.Backup]] = None) -> 'FileInfo':
 		"""
 		Notes: should be inside a session
 		"""
@@ -1,6 +1,7 @@
 import collections
 import contextlib
 import operator
+import threading
 import time
 from typing import Dict, TypeVar, Generic, Optional, Callable, Any, Generator
 
@@ -10,6 +11,7 @@ _K = TypeVar('_K')
 class TimeCostStats(Generic[_K]):
 	def __init__(self):
 		self.__costs: Dict[_K, float] = collections.defaultdict(float)
+		self.__lock = threading.Lock()  # costs might be measured in multiple threads
 
 	@contextlib.contextmanager
 	def measure_time_cost(self, *keys: _K) -> Generator[Callable[[], float], Any, None]:
@@ -24,20 +26,25 @@ class TimeCostStats(Generic[_K]):
 			yield get_cost
 		finally:
 			cost = time.time() - start
-			for key in keys:
-				self.__costs[key] += cost
+			with self.__lock:
+				for key in keys:
+					self.__costs[key] += cost
 
 	def get_cost(self, key: _K) -> float:
-		return self.__costs.get(key, 0)
+		with self.__lock:
+			return self.__costs.get(key, 0)
 
 	def get_costs(self, *, by_key: bool = False, by_cost: bool = False) -> Dict[_K, float]:
+		with self.__lock:
+			costs = self.__costs.copy()
 		if by_key:
 			idx = 0
 		elif by_cost:
 			idx = 1
 		else:
-			return self.__costs.copy()
-		return dict(sorted(self.__costs.items(), key=operator.itemgetter(idx)))
+			return costs
+		return dict(sorted(costs.items(), key=operator.itemgetter(idx)))
 
 	def reset(self):
-		self.__costs.clear()
+		with self.__lock:
+			self.__costs.clear()
@@ -0,0 +1,90 @@
+import dataclasses
+from pathlib import Path
+
+from prime_backup.action.create_backup_action import CreateBackupAction
+from prime_backup.action.validate_chunks_action import ValidateChunksAction
+from prime_backup.action.validate_packs_action import ValidatePacksAction
+from prime_backup.compressors import CompressMethod
+from prime_backup.config.backup_config import ChunkingRule
+from prime_backup.config.config import Config, set_config_instance
+from prime_backup.db.access import DbAccess
+from prime_backup.types.backup_info import BackupInfo
+from prime_backup.types.chunk_method import ChunkMethod
+from prime_backup.types.hash_method import HashMethod
+from prime_backup.types.operator import Operator
+from prime_backup.utils import pack_utils
+
+
+@dataclasses.dataclass(frozen=True)
+class BackupEnv:
+	"""A world with 2 chunked files and a small file, backed up into an in-memory database"""
+	root: Path
+	pb_path: Path
+	server_path: Path
+	world_path: Path
+	export_path: Path
+
+
+def setup_backup_env(root: Path) -> BackupEnv:
+	"""
+	Create the world files and install a fresh config and database for them.
+	The caller is responsible for shutting down the database and restoring the config
+	"""
+	pb_path = root / 'pb_files'
+	server_path = root / 'server'
+	world_path = server_path / 'world'
+	export_path = root / 'out.tar'
+
+	world_path.mkdir(parents=True)
+	(world_path / 'a.dat').write_bytes((b'a' * 9000 + b'b' * 9000) * 10)
+	(world_path / 'b.dat').write_bytes((b'c' * 7000 + b'd' * 7000) * 12)
+	(world_path / 'small.txt').write_text('hello pack', encoding='utf8')
+
+	config = Config.get_default()
+	set_config_instance(config)
+	config.storage_root = str(pb_path)
+	config.backup.source_root = str(server_path)
+	config.backup.targets = ['world']
+	config.backup.hash_method = HashMethod.xxh128
+	config.backup.compress_method = CompressMethod.plain
+	config.backup.compress_threshold = 1 << 60
+	config.backup.chunking_enabled = True
+	config.backup.chunking_rules = [
+		ChunkingRule(algorithm=ChunkMethod.fixed_4k, file_size_threshold=1, patterns=['**/*.dat']),
+	]
+	config.backup.pack_auto_compact_threshold = 0.75
+	DbAccess.init_memory_db()
+
+	return BackupEnv(root, pb_path, server_path, world_path, export_path)
+
+
+def create_backup() -> BackupInfo:
+	return CreateBackupAction(Operator.literal('test'), '').run()
+
+
+def assert_pack_and_chunk_validate_ok() -> None:
+	assert_pack_validate_ok()
+	assert ValidateChunksAction().run().bad == 0
+
+
+def assert_pack_validate_ok() -> None:
+	assert_pack_db_files_consistent()
+	assert ValidatePacksAction().run().bad == 0
+
+
+def assert_pack_db_files_consistent() -> None:
+	with DbAccess.open_session() as session:
+		for pack in session.list_packs():
+			assert pack_utils.get_pack_path(pack.id).stat().st_size == pack.size
+			live_chunks = session.get_live_chunks_by_pack_id(pack.id)
+			assert sum(chunk.stored_size for chunk in live_chunks) == pack.live_size
+			assert len(live_chunks) == pack.live_entry_count
+			prev_end = 0
+			for chunk in live_chunks:
+				assert chunk.pack_offset >= prev_end
+				prev_end = chunk.pack_offset + chunk.stored_size
+				assert prev_end <= pack.size
+		for chunk in session.list_chunks():
+			assert chunk.pack_id > 0
+			assert chunk.pack_offset >= 0
+			assert chunk.stored_size >= 0
@@ -0,0 +1,22 @@
+from pathlib import Path
+from typing import Generator
+
+import pytest
+
+from prime_backup.config.config import Config, set_config_instance
+from prime_backup.db.access import DbAccess
+from tests.backup_env import BackupEnv, setup_backup_env
+
+
+@pytest.fixture(name='env')
+def __backup_env(tmp_path: Path) -> Generator[BackupEnv, None, None]:
+	old_config = Config.get()
+	if DbAccess.is_initialized():
+		DbAccess.shutdown()
+
+	try:
+		yield setup_backup_env(tmp_path / 'pack_storage')
+	finally:
+		if DbAccess.is_initialized():
+			DbAccess.shutdown()
+		set_config_instance(old_config)
@@ -0,0 +1,35 @@
+from prime_backup.action.diff_backup_action import DiffBackupAction
+from prime_backup.db.access import DbAccess
+from prime_backup.types.backup_info import BackupInfo
+from tests import backup_env
+from tests.backup_env import BackupEnv
+
+
+def test_diff_backups_sharing_base_fileset(env: BackupEnv) -> None:
+	# enough unchanged files, so the delta ratio stays low and the base fileset is reused
+	for i in range(50):
+		(env.world_path / f'file_{i}.txt').write_text(f'file {i}', encoding='utf8')
+	backup_1 = backup_env.create_backup()
+	(env.world_path / 'small.txt').write_text('changed', encoding='utf8')
+	(env.world_path / 'new.txt').write_text('new file', encoding='utf8')
+	backup_2 = backup_env.create_backup()
+	(env.world_path / 'file_0.txt').unlink()
+	(env.world_path / 'small.txt').write_text('hello pack', encoding='utf8')
+	backup_3 = backup_env.create_backup()
+
+	with DbAccess.open_session() as session:
+		assert len({session.get_backup(backup.id).fileset_id_base for backup in [backup_1, backup_2, backup_3]}) == 1
+
+	def diff(old: BackupInfo, new: BackupInfo):
+		result = DiffBackupAction(old.id, new.id, compare_status=False).run()
+		return (
+			sorted(f.path for f in result.added),
+			sorted(f.path for f in result.deleted),
+			sorted((a.path, b.path) for a, b in result.changed),
+		)
+
+	assert diff(backup_1, backup_2) == (['world/new.txt'], [], [('world/small.txt', 'world/small.txt')])
+	assert diff(backup_2, backup_3) == ([], ['world/file_0.txt'], [('world/small.txt', 'world/small.txt')])
+	assert diff(backup_1, backup_3) == (['world/new.txt'], ['world/file_0.txt'], [])
+	assert diff(backup_3, backup_1) == (['world/file_0.txt'], ['world/new.txt'], [])
+	assert diff(backup_2, backup_2) == ([], [], [])
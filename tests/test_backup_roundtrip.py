@@ -1,17 +1,27 @@
+import argparse
 import dataclasses
+import json
+import os
+import random
+import stat
 from pathlib import Path
-from typing import Dict, Generator, List
+from typing import Dict, Generator, List, Tuple
 
 import pytest
 
 from prime_backup.action.create_backup_action import CreateBackupAction
+from prime_backup.action.delete_backup_action import DeleteBackupAction
 from prime_backup.action.export_backup_action_directory import ExportBackupToDirectoryAction
 from prime_backup.action.export_backup_action_tar import ExportBackupToTarAction
 from prime_backup.action.export_backup_action_zip import ExportBackupToZipAction
+from prime_backup.action.helpers.blob_allocator import BlobAllocator
+from prime_backup.action.helpers.compress_prober import CompressProber
+from prime_backup.action.helpers.source_snapshot import SourceSnapshot
 from prime_backup.action.import_backup_action import ImportBackupAction
 from prime_backup.action.validate_chunks_action import ValidateChunksAction
 from prime_backup.action.validate_packs_action import ValidatePacksAction
-from prime_backup.compressors import CompressMethod
+from prime_backup.cli.cmd.cmd_back import BackCommandAdapter
+from prime_backup.compressors import CompressMethod, Compressor, ZstdSeekableCompressor
 from prime_backup.config.backup_config import ChunkingRule
 from prime_backup.config.config import Config, set_config_instance
 from prime_backup.db.access import DbAccess
@@ -21,6 +31,7 @@ from prime_backup.types.hash_method import HashMethod
 from prime_backup.types.operator import Operator
 from prime_backup.types.standalone_backup_format import StandaloneBackupFormat
 from prime_backup.types.tar_format import TarFormat
+from prime_backup.utils import blob_utils
 
 
 @dataclasses.dataclass(frozen=True)
@@ -329,3 +340,314 @@ def test_backup_roundtrip(
 			export_format,
 			concurrency,
 		)
+
+
+def test_backup_from_source_snapshot(tmp_path: Path) -> None:
+	source_pb_path = tmp_path / 'source_pb'
+	server_path = tmp_path / 'server'
+	world_path = server_path / 'world'
+
+	world_path.mkdir(parents=True)
+	expected_tree = __populate_world_for_first_backup(world_path)
+	(world_path / 'nested' / 'deeper' / 'payload.bin').chmod(0o600)
+
+	config = __make_config(source_pb_path, server_path, HashMethod.xxh128, CompressMethod.plain, ChunkMethod.fixed_4k, 2)
+	set_config_instance(config)
+	DbAccess.init_memory_db()
+
+	snapshot_done_calls: List[bool] = []
+
+	def snapshot_done_callback():
+		# the source files can be changed freely after the snapshot is created
+		(world_path / 'small.txt').write_bytes(b'changed after snapshot')
+		snapshot_done_calls.append(True)
+
+	backup = CreateBackupAction(Operator.literal('test'), 'snapshot', snapshot_done_callback=snapshot_done_callback).run()
+	assert snapshot_done_calls == [True]
+	assert list(config.temp_path.iterdir()) == []
+	__assert_pack_and_chunk_validate_ok()
+
+	with DbAccess.open_session() as session:
+		file_stats = {file.path: (file.mode, file.mtime_unix_ns) for file in session.get_backup_files(session.get_backup(backup.id))}
+	for rel_path in ['world', 'world/nested/deeper', 'world/nested/deeper/payload.bin', 'world/empty_dir/child']:
+		st = (server_path / rel_path).lstat()
+		assert file_stats[rel_path] == (st.st_mode, st.st_mtime_ns)
+
+	restored_path = tmp_path / 'restored'
+	failures = ExportBackupToDirectoryAction(backup.id, restored_path, restore_mode=True).run()
+	assert len(failures) == 0
+	__assert_restored_backup(restored_path, expected_tree)
+
+
+def test_source_snapshot_skips_files_with_known_content(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+	source_pb_path = tmp_path / 'source_pb'
+	server_path = tmp_path / 'server'
+	world_path = server_path / 'world'
+
+	world_path.mkdir(parents=True)
+	expected_tree = __populate_world_for_first_backup(world_path)
+	config = __make_config(source_pb_path, server_path, HashMethod.xxh128, CompressMethod.plain, ChunkMethod.fixed_4k, 2)
+	config.backup.stat_cache_enabled = True
+	set_config_instance(config)
+	DbAccess.init_memory_db()
+
+	copied_paths: List[str] = []
+	original_create = SourceSnapshot.create
+
+	def create(self: SourceSnapshot, src_entries: List[Tuple[Path, os.stat_result]]):
+		copied_paths.extend(path.relative_to(server_path).as_posix() for path, st in src_entries if stat.S_ISREG(st.st_mode))
+		return original_create(self, src_entries)
+
+	monkeypatch.setattr(SourceSnapshot, 'create', create)
+
+	def create_backup() -> int:
+		copied_paths.clear()
+		return CreateBackupAction(Operator.literal('test'), 'snapshot', snapshot_done_callback=lambda: None).run().id
+
+	create_backup()
+	assert sorted(copied_paths) == sorted('world/' + p for p in expected_tree.files.keys())
+
+	# files hit by the stat cache are not copied into the snapshot
+	(world_path / 'small.txt').write_bytes(b'changed small file')
+	backup2 = create_backup()
+	assert copied_paths == ['world/small.txt']
+	assert list(config.temp_path.iterdir()) == []
+	__assert_pack_and_chunk_validate_ok()
+
+	restored_path = tmp_path / 'restored'
+	failures = ExportBackupToDirectoryAction(backup2, restored_path, restore_mode=True).run()
+	assert len(failures) == 0
+	__assert_restored_backup(restored_path, __read_tree(world_path))
+
+
+def test_backup_with_stat_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+	source_pb_path = tmp_path / 'source_pb'
+	server_path = tmp_path / 'server'
+	world_path = server_path / 'world'
+
+	world_path.mkdir(parents=True)
+	expected_tree = __populate_world_for_first_backup(world_path)
+	config = __make_config(source_pb_path, server_path, HashMethod.xxh128, CompressMethod.plain, ChunkMethod.fixed_4k, 2)
+	config.backup.stat_cache_enabled = True
+	set_config_instance(config)
+	DbAccess.init_memory_db()
+
+	read_paths: List[str] = []
+	original_get_or_create_blob = BlobAllocator.get_or_create_blob
+
+	def get_or_create_blob(self: BlobAllocator, src_path: Path, st: os.stat_result):
+		read_paths.append(src_path.relative_to(server_path).as_posix())
+		return original_get_or_create_blob(self, src_path, st)
+
+	monkeypatch.setattr(BlobAllocator, 'get_or_create_blob', get_or_create_blob)
+
+	def create_backup() -> int:
+		read_paths.clear()
+		return CreateBackupAction(Operator.literal('test'), 'stat cache').run().id
+
+	def get_stat_cache_count() -> int:
+		with DbAccess.open_session() as session:
+			return session.get_file_stat_cache_count()
+
+	backup1 = create_backup()
+	assert sorted(read_paths) == sorted('world/' + p for p in expected_tree.files.keys())
+	assert get_stat_cache_count() == len(expected_tree.files)
+
+	# only the changed file needs to be read, and only the latest stat of it is kept
+	(world_path / 'small.txt').write_bytes(b'changed small file')
+	backup2 = create_backup()
+	assert read_paths == ['world/small.txt']
+	assert get_stat_cache_count() == len(expected_tree.files)
+
+	# the caches are deleted with their blobs, and everything needs to be read again
+	DeleteBackupAction(backup1).run()
+	DeleteBackupAction(backup2).run()
+	assert get_stat_cache_count() == 0
+	backup3 = create_backup()
+	assert len(read_paths) == len(expected_tree.files)
+	assert get_stat_cache_count() == len(expected_tree.files)
+	__assert_pack_and_chunk_validate_ok()
+
+	restored_path = tmp_path / 'restored'
+	failures = ExportBackupToDirectoryAction(backup3, restored_path, restore_mode=True).run()
+	assert len(failures) == 0
+	__assert_restored_backup(restored_path, __read_tree(world_path))
+
+
+def test_backup_with_adaptive_compress(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+	source_pb_path = tmp_path / 'source_pb'
+	server_path = tmp_path / 'server'
+	world_path = server_path / 'world'
+
+	world_path.mkdir(parents=True)
+	random_data = os.urandom(256 * 1024)
+	__write_world_files(world_path, {
+		'random.bin': random_data,
+		'text.txt': b'compressible text\n' * 10000,
+		'packed_random.bin': random_data[:2000],
+		'packed_text.txt': b'small compressible text\n' * 80,
+		'small_random.bin': random_data[:6000],
+		'mixed.dat': random_data + b'a' * (64 * 1024),
+	})
+	config = __make_config(source_pb_path, server_path, HashMethod.xxh128, CompressMethod.gzip, ChunkMethod.fixed_32k, 2)
+	config.backup.blob_pack_threshold = 4096
+	config.backup.adaptive_compress_enabled = True
+	config.backup.adaptive_compress_sample_size = 16 * 1024
+	set_config_instance(config)
+	DbAccess.init_memory_db()
+
+	probed_paths: List[str] = []
+	original_probe_file = CompressProber.probe_file
+
+	def probe_file(self: CompressProber, compressor: Compressor, file_path: Path, file_size: int) -> Compressor:
+		probed_paths.append(file_path.name)
+		return original_probe_file(self, compressor, file_path, file_size)
+
+	monkeypatch.setattr(CompressProber, 'probe_file', probe_file)
+
+	backup_id = CreateBackupAction(Operator.literal('test'), 'adaptive compress').run().id
+	__assert_pack_and_chunk_validate_ok()
+	assert sorted(probed_paths) == ['random.bin', 'text.txt']  # the small file is probed in memory
+
+	# existing blobs are not probed again
+	probed_paths.clear()
+	(world_path / 'random_copy.bin').write_bytes(random_data)
+	CreateBackupAction(Operator.literal('test'), 'adaptive compress dedup').run()
+	assert probed_paths == []
+
+	with DbAccess.open_session() as session:
+		file_rows = {row.path: row for row in session.get_backup_file_rows(backup_id)}
+
+		def get_chunk_compress(path: str) -> str:
+			blob_hash = file_rows[path].blob_hash
+			assert blob_hash is not None
+			chunk = session.get_chunks_by_hashes_opt([blob_hash])[blob_hash]
+			assert chunk is not None
+			return chunk.compress
+
+		assert file_rows['world/random.bin'].blob_compress == CompressMethod.plain.name
+		assert file_rows['world/text.txt'].blob_compress == CompressMethod.gzip.name
+		assert file_rows['world/small_random.bin'].blob_compress == CompressMethod.plain.name
+		assert get_chunk_compress('world/packed_random.bin') == CompressMethod.plain.name
+		assert get_chunk_compress('world/packed_text.txt') == CompressMethod.gzip.name
+		chunk_compresses = {chunk.compress for chunk in session.list_chunks() if chunk.raw_size == 32 * 1024}
+		assert chunk_compresses == {CompressMethod.plain.name, CompressMethod.gzip.name}
+
+	restored_path = tmp_path / 'restored'
+	failures = ExportBackupToDirectoryAction(backup_id, restored_path, restore_mode=True).run()
+	assert len(failures) == 0
+	(world_path / 'random_copy.bin').unlink()
+	__assert_restored_backup(restored_path, __read_tree(world_path))
+
+
+def test_backup_with_zstd_seekable_random_access(tmp_path: Path) -> None:
+	__skip_if_dependencies_unavailable(HashMethod.xxh128, CompressMethod.zstd_seekable, ChunkMethod.fixed_32k, StandaloneBackupFormat.zip)
+	source_pb_path = tmp_path / 'source_pb'
+	server_path = tmp_path / 'server'
+	world_path = server_path / 'world'
+
+	world_path.mkdir(parents=True)
+	rnd = random.Random(0)
+	frame_size = ZstdSeekableCompressor.FRAME_RAW_SIZE
+	region_data = b''.join(i.to_bytes(4, 'big') + rnd.getrandbits(32).to_bytes(4, 'big') for i in range(frame_size * 3 // 8 + 1000))  # a bit more than 3 frames
+	__write_world_files(world_path, {
+		'region.mca': region_data,
+		'level.txt': b'hello seekable',
+	})
+	config = __make_config(source_pb_path, server_path, HashMethod.xxh128, CompressMethod.zstd_seekable, ChunkMethod.fixed_32k, 1)
+	set_config_instance(config)
+	DbAccess.init_memory_db()
+
+	backup_id = CreateBackupAction(Operator.literal('test'), 'zstd seekable').run().id
+	with DbAccess.open_session() as session:
+		row = {row.path: row for row in session.get_backup_file_rows(backup_id)}['world/region.mca']
+	assert row.blob_hash is not None and row.blob_storage_method == BlobStorageMethod.direct.value
+	assert row.blob_compress == CompressMethod.zstd_seekable.name
+
+	compressor = Compressor.create(row.blob_compress)
+	with compressor.open_decompressed_seekable(blob_utils.get_blob_path(row.blob_hash)) as f:
+		# reads that cross the frame boundaries, in random order
+		reads = [(boundary - rnd.randint(1, 4096), 8192) for boundary in range(frame_size, len(region_data), frame_size)]
+		reads += [(rnd.randrange(len(region_data)), rnd.randint(1, 3 * frame_size)) for _ in range(10)]
+		rnd.shuffle(reads)
+		for offset, size in reads:
+			f.seek(offset)
+			assert f.read(size) == region_data[offset:offset + size]
+
+	restored_path = tmp_path / 'restored'
+	failures = ExportBackupToDirectoryAction(backup_id, restored_path, restore_mode=True).run()
+	assert len(failures) == 0
+	__assert_restored_backup(restored_path, __read_tree(world_path))
+
+
+def test_incremental_restore(tmp_path: Path) -> None:
+	source_pb_path = tmp_path / 'source_pb'
+	server_path = tmp_path / 'server'
+	world_path = server_path / 'world'
+
+	world_path.mkdir(parents=True)
+	expected_tree = __populate_world_for_first_backup(world_path)
+	set_config_instance(__make_config(source_pb_path, server_path, HashMethod.xxh128, CompressMethod.plain, ChunkMethod.fixed_4k, 2))
+	DbAccess.init_memory_db()
+
+	backup = CreateBackupAction(Operator.literal('test'), 'incremental').run()
+	unchanged_inode = (world_path / 'unchanged' / 'reused.dat').stat().st_ino
+
+	__mutate_world_for_second_backup(world_path)
+	(world_path / 'small.txt').unlink()
+	(world_path / 'small.txt').mkdir()  # file -> dir
+	(world_path / 'small.txt' / 'child.txt').write_bytes(b'child')
+	(world_path / 'nested').rename(tmp_path / 'nested')
+	(world_path / 'nested').write_bytes(b'dir -> file')
+
+	failures = ExportBackupToDirectoryAction(backup.id, server_path, restore_mode=True, incremental=True).run()
+	assert len(failures) == 0
+	assert (world_path / 'unchanged' / 'reused.dat').stat().st_ino == unchanged_inode
+	__assert_restored_tree(world_path, expected_tree)
+
+	# same size and mtime, but different content
+	same_stat_path = world_path / 'config' / 'settings.json'
+	same_stat_content = same_stat_path.read_bytes()
+	same_stat_st = same_stat_path.stat()
+	same_stat_path.write_bytes(same_stat_content.replace(b'3', b'4'))
+	os.utime(same_stat_path, ns=(same_stat_st.st_atime_ns, same_stat_st.st_mtime_ns))
+	ExportBackupToDirectoryAction(backup.id, server_path, restore_mode=True, incremental=True).run()
+	assert same_stat_path.read_bytes() != same_stat_content
+	ExportBackupToDirectoryAction(backup.id, server_path, restore_mode=True, incremental=True, incremental_hash_check=True).run()
+	assert same_stat_path.read_bytes() == same_stat_content
+	__assert_restored_tree(world_path, expected_tree)
+
+
+@pytest.mark.parametrize('incremental', (False, True), ids=('full', 'incremental'))
+def test_back_command_restores_backup(tmp_path: Path, incremental: bool) -> None:
+	pb_path = tmp_path / 'pb_files'
+	server_path = tmp_path / 'server'
+	world_path = server_path / 'world'
+	config_path = tmp_path / 'config.json'
+
+	world_path.mkdir(parents=True)
+	expected_tree = __populate_world_for_first_backup(world_path)
+	config = __make_config(pb_path, server_path, HashMethod.xxh128, CompressMethod.plain, ChunkMethod.fixed_4k, 1)
+	config.command.backup_on_restore = False
+	config_path.write_text(json.dumps(config.serialize()), encoding='utf8')
+	set_config_instance(config)
+	DbAccess.init(create=True, migrate=False)
+	backup_id = CreateBackupAction(Operator.literal('test'), 'cli back').run().id
+	DbAccess.shutdown()
+
+	unchanged_inode = (world_path / 'unchanged' / 'reused.dat').stat().st_ino
+	__mutate_world_for_second_backup(world_path)
+
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-d', '--db')
+	parser.add_argument('-c', '--config')
+	adapter = BackCommandAdapter()
+	adapter.build_parser(parser)
+	argv = ['-d', str(pb_path), '-c', str(config_path), str(backup_id), '-s', str(server_path), '--confirm']
+	if incremental:
+		argv += ['--incremental', '--incremental-hash-check']
+	adapter.run(parser.parse_args(argv))
+
+	__assert_restored_tree(world_path, expected_tree)
+	if incremental:
+		assert (world_path / 'unchanged' / 'reused.dat').stat().st_ino == unchanged_inode
@@ -0,0 +1,42 @@
+from pathlib import Path
+from typing import Dict
+
+from prime_backup.action.export_backup_action_tar import ExportBackupToTarAction
+from prime_backup.action.helpers.blob_exporter import ThreadSafeBlobChunksGetter
+from prime_backup.action.helpers.blob_prefetcher import BlobPrefetcher
+from prime_backup.config.config import Config
+from prime_backup.db.access import DbAccess
+from prime_backup.types.tar_format import TarFormat
+from tests import backup_env
+from tests.backup_env import BackupEnv
+
+
+def test_tar_export_with_prefetch_matches_sequential_export(env: BackupEnv) -> None:
+	for i in range(30):
+		(env.world_path / f'file_{i}.txt').write_bytes(bytes([i]) * (i * 500))
+	backup = backup_env.create_backup()
+
+	def export_tar(path: Path) -> Dict[str, bytes]:
+		import tarfile
+		assert len(ExportBackupToTarAction(backup.id, path, TarFormat.plain, create_meta=False).run()) == 0
+		with tarfile.open(path) as tar:
+			return {member.name: tar.extractfile(member).read() for member in tar.getmembers() if member.isfile()}
+
+	sequential = export_tar(env.root / 'sequential.tar')
+	Config.get().concurrency = 4
+	assert export_tar(env.root / 'prefetch.tar') == sequential
+
+	# blobs larger than the buffer are left to the consumer, and the file order is kept
+	with DbAccess.open_session() as session:
+		files = session.get_backup_file_rows(backup.id)
+		action = ExportBackupToTarAction(backup.id, env.export_path, TarFormat.plain)
+		ts_bcg = ThreadSafeBlobChunksGetter(session)
+		prefetcher = BlobPrefetcher('test', lambda f: action._create_blob_exporter(ts_bcg, f), 4, max_buffer_size=20000)
+		prefetched_paths = []
+		for file, future in prefetcher.iterate(files):
+			if future is not None:
+				assert future.result() == sequential[file.path]
+				prefetched_paths.append(file.path)
+		assert [file.path for file in files if file.path in prefetched_paths] == prefetched_paths
+		assert 'world/file_29.txt' in prefetched_paths
+		assert 'world/a.dat' not in prefetched_paths
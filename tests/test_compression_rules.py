@@ -0,0 +1,110 @@
+import io
+import unittest
+from unittest import mock
+from pathlib import Path
+
+from prime_backup.compressors import CompressMethod
+from prime_backup.config.backup_config import BackupConfig, CompressionRule
+
+
+class CompressionRuleTests(unittest.TestCase):
+	def test_1_level_validation(self):
+		CompressMethod.zstd.value.validate_level(19)
+		CompressMethod.zstd.value.validate_level(None)
+		CompressMethod.plain.value.validate_level(None)
+		with self.assertRaises(ValueError):
+			CompressMethod.plain.value.validate_level(1)
+		with self.assertRaises(ValueError):
+			CompressMethod.gzip.value.validate_level(10)
+		with self.assertRaises(ValueError):
+			BackupConfig.deserialize({'compress_method': 'lz4', 'compress_level': 17})
+		with self.assertRaises(ValueError):
+			CompressionRule.deserialize({'method': 'gzip', 'level': -1, 'patterns': ['*']})
+		with self.assertRaises(ValueError):
+			CompressionRule.deserialize({'method': 'gzip', 'file_size_min': 10, 'file_size_max': 5, 'patterns': ['*']})
+
+	def test_2_compressor_selection(self):
+		config = BackupConfig.deserialize({
+			'compress_method': 'gzip',
+			'compress_level': 3,
+			'compress_threshold': 64,
+			'compression_rules': [
+				{'method': 'zstd', 'level': 1, 'file_size_min': 1000, 'patterns': ['*.mca']},
+				{'method': 'plain', 'patterns': ['*.png', 'logs/']},
+			],
+		})
+
+		def check(path, size, method: CompressMethod, level, **kwargs):
+			compressor = config.get_compressor(Path(path) if path is not None else None, size, **kwargs)
+			self.assertEqual(method, compressor.get_method())
+			self.assertEqual(level, compressor.level)
+
+		check('world/region/r.0.0.mca', 5000, CompressMethod.zstd, 1)
+		check('world/region/r.0.0.mca', 500, CompressMethod.gzip, 3)  # too small for the rule
+		check('world/icon.png', 5000, CompressMethod.plain, None)
+		check('logs/latest.log', 5000, CompressMethod.plain, None)
+		check('world/level.dat', 5000, CompressMethod.gzip, 3)
+		check(None, 5000, CompressMethod.gzip, 3)
+		check('world/level.dat', 10, CompressMethod.plain, None)  # below compress_threshold
+		check('world/region/r.0.0.mca', 5000, CompressMethod.plain, None, data_size=10)  # tiny chunk
+
+		data = b'hello world ' * 1000
+		for path in ['x.mca', 'x.dat']:
+			compressor = config.get_compressor(Path(path), 5000)
+			self.assertEqual(data, compressor.decompress_bytes(compressor.compress_bytes(data)))
+
+	def test_3_compress_threads(self):
+		config = BackupConfig.deserialize({
+			'compress_method': 'zstd',
+			'compress_threads': 2,
+			'compress_threads_threshold': 1000000,
+			'compression_rules': [
+				{'method': 'gzip', 'patterns': ['*.log']},
+			],
+		})
+		with mock.patch('multiprocessing.cpu_count', return_value=8):
+			self.assertEqual(2, config.get_compressor(Path('x.dat'), 2000000).threads)
+			self.assertEqual(0, config.get_compressor(Path('x.dat'), 2000000, data_size=100000).threads)  # small chunk
+			self.assertEqual(0, config.get_compressor(Path('x.dat'), 500).threads)
+			self.assertEqual(0, config.get_compressor(Path('x.log'), 2000000).threads)  # gzip is single-threaded
+			# concurrent compressions share the cpu cores
+			self.assertEqual(2, config.get_compressor(Path('x.dat'), 2000000, concurrency=4).threads)
+			self.assertEqual(0, config.get_compressor(Path('x.dat'), 2000000, concurrency=5).threads)
+		with self.assertRaises(ValueError):
+			BackupConfig.deserialize({'compress_threads': -1})
+
+		data = bytes(range(256)) * 20000
+		compressor = config.get_compressor(Path('x.dat'), len(data))
+		self.assertEqual(data, compressor.decompress_bytes(compressor.compress_bytes(data)))
+		buf = io.BytesIO()
+		with compressor.compress_stream(buf) as f:
+			f.write(data)
+		buf.seek(0)
+		with compressor.decompress_stream(buf) as f:
+			self.assertEqual(data, f.read())
+
+	def test_4_zstd_seekable(self):
+		config = BackupConfig.deserialize({
+			'compress_method': 'zstd',
+			'compression_rules': [
+				{'method': 'zstd_seekable', 'patterns': ['*.mca']},
+			],
+		})
+		compressor = config.get_compressor(Path('r.0.0.mca'), 3000000)
+		self.assertEqual(CompressMethod.zstd_seekable, compressor.get_method())
+		self.assertTrue(compressor.SEEKABLE)
+		self.assertFalse(config.get_compressor(Path('x.dat'), 3000000).SEEKABLE)
+
+		data = b''.join(i.to_bytes(4, 'big') for i in range(750000))
+		compressed = compressor.compress_bytes(data)
+		self.assertEqual(data, compressor.decompress_bytes(compressed))
+		with compressor.decompress_stream_seekable(io.BytesIO(compressed)) as f:
+			for offset, size in [(2500000, 100), (0, 10), (1048570, 20), (2999990, 100), (3000000, 1)]:
+				f.seek(offset)
+				self.assertEqual(data[offset:offset + size], f.read(size))
+			f.seek(-4, io.SEEK_END)
+			self.assertEqual(data[-4:], f.read())
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,58 @@
+import os
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from prime_backup.db.db_page_store import DbPageStore, DbPageStoreError
+
+
+def _write_rows(db_path: Path, start: int, count: int):
+	conn = sqlite3.connect(db_path)
+	try:
+		conn.execute('CREATE TABLE IF NOT EXISTS t (id INTEGER PRIMARY KEY, data BLOB)')
+		conn.executemany('INSERT INTO t (id, data) VALUES (?, ?)', [(i, os.urandom(1000)) for i in range(start, start + count)])
+		conn.commit()
+	finally:
+		conn.close()
+
+
+def test_incremental_snapshots(tmp_path: Path):
+	db_path = tmp_path / 'test.db'
+	store = DbPageStore(tmp_path / 'store')
+
+	_write_rows(db_path, 0, 2000)
+	data_1 = db_path.read_bytes()
+	result_1 = store.create_snapshot(db_path, 'snap_1')
+	assert store.read_page_size(db_path) == result_1.snapshot.page_size
+	assert result_1.snapshot.db_size == len(data_1)
+	assert result_1.new_page_count > 0
+
+	_write_rows(db_path, 2000, 10)
+	data_2 = db_path.read_bytes()
+	result_2 = store.create_snapshot(db_path, 'snap_2')
+	assert result_2.snapshot.page_count > result_1.snapshot.page_count
+	assert 0 < result_2.new_page_count < result_1.new_page_count // 10
+
+	with pytest.raises(DbPageStoreError):
+		store.create_snapshot(db_path, 'snap_2')
+	assert [s.name for s in store.list_snapshots()] == ['snap_2', 'snap_1']
+
+	for name, data in [('snap_1', data_1), ('snap_2', data_2)]:
+		output = tmp_path / (name + '.db')
+		store.restore_snapshot(name, output)
+		assert output.read_bytes() == data
+
+	# the pages of snap_2 must survive the deletion of snap_1
+	gc_result = store.delete_snapshots(['snap_1'], compact_threshold=0.999)
+	assert [s.name for s in store.list_snapshots()] == ['snap_2']
+	assert gc_result.deleted_page_count < result_1.new_page_count
+	output = tmp_path / 'snap_2_again.db'
+	store.restore_snapshot('snap_2', output)
+	assert output.read_bytes() == data_2
+
+	gc_result = store.delete_snapshots(['snap_2'], compact_threshold=0.8)
+	assert gc_result.deleted_pack_count > 0
+	assert list((tmp_path / 'store' / DbPageStore.PACK_DIR_NAME).iterdir()) == []
+	with pytest.raises(DbPageStoreError):
+		store.restore_snapshot('snap_2', output)
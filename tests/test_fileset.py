@@ -0,0 +1,86 @@
+import os
+
+from prime_backup.action.delete_backup_action import DeleteBackupAction
+from prime_backup.action.export_backup_action_directory import ExportBackupToDirectoryAction
+from prime_backup.action.validate_files_action import ValidateFilesAction
+from prime_backup.action.validate_filesets_action import ValidateFilesetsAction
+from prime_backup.db.access import DbAccess
+from prime_backup.db.values import FileRole
+from tests import backup_env
+from tests.backup_env import BackupEnv
+
+
+def test_shrink_base_fileset_rewrites_delta_files_in_bulk(env: BackupEnv) -> None:
+	for i in range(30):
+		(env.world_path / 'keep_{}.txt'.format(i)).write_text('keep {}'.format(i), encoding='utf8')
+	backup_1 = backup_env.create_backup()
+
+	(env.world_path / 'a.dat').unlink()
+	(env.world_path / 'small.txt').write_text('hello pack 2', encoding='utf8')
+	backup_2 = backup_env.create_backup()
+	(env.world_path / 'small.txt').write_text('hello pack 3', encoding='utf8')
+	backup_3 = backup_env.create_backup()
+	assert backup_1.fileset_id_base == backup_2.fileset_id_base == backup_3.fileset_id_base
+
+	DeleteBackupAction(backup_1.id).run()
+	with DbAccess.open_session() as session:
+		base_paths = set(session.get_fileset_file_paths(backup_2.fileset_id_base))
+		assert 'world/a.dat' not in base_paths and 'world/small.txt' not in base_paths
+		assert 'world/b.dat' in base_paths
+		for backup in [backup_2, backup_3]:
+			delta_roles = session.get_fileset_file_path_and_role(backup.fileset_id_delta)
+			assert 'world/a.dat' not in delta_roles
+			assert delta_roles['world/small.txt'] == FileRole.delta_add
+	assert ValidateFilesetsAction().run().bad == 0
+	assert ValidateFilesAction().run().bad == 0
+
+	restore_path = env.root / 'restored'
+	assert len(ExportBackupToDirectoryAction(backup_3.id, restore_path, restore_mode=True).run()) == 0
+	assert not (restore_path / 'world' / 'a.dat').exists()
+	assert (restore_path / 'world' / 'small.txt').read_text(encoding='utf8') == 'hello pack 3'
+	assert (restore_path / 'world' / 'b.dat').read_bytes() == (env.world_path / 'b.dat').read_bytes()
+
+
+def test_fileset_allocator_picks_older_base_by_fingerprint(env: BackupEnv) -> None:
+	def write_files(prefix: str, count: int):
+		for path in list(env.world_path.glob('*_*.txt')):
+			path.unlink()
+		for i in range(count):
+			path = env.world_path / '{}_{}.txt'.format(prefix, i)
+			path.write_text('{} {}'.format(prefix, i), encoding='utf8')
+			os.utime(path, (1700000000 + i, 1700000000 + i))  # so the rewritten files are the same as before
+
+	write_files('keep', 30)
+	backup_1 = backup_env.create_backup()
+	write_files('other', 30)
+	backup_2 = backup_env.create_backup()
+	assert backup_2.fileset_id_base != backup_1.fileset_id_base
+
+	write_files('keep', 30)
+	backup_3 = backup_env.create_backup()
+	assert backup_3.fileset_id_base == backup_1.fileset_id_base
+
+	write_files('third', 30)
+	backup_4 = backup_env.create_backup()
+	assert backup_4.fileset_id_base not in (backup_1.fileset_id_base, backup_2.fileset_id_base)
+
+	with DbAccess.open_session() as session:
+		fileset = session.get_fileset(backup_1.fileset_id_base)
+		assert fileset.fingerprint is not None
+		assert 'fingerprint=<{} bytes>'.format(len(fileset.fingerprint)) in repr(fileset)
+		session.clear_fileset_fingerprints()
+	(env.world_path / 'small.txt').write_text('hello fingerprint', encoding='utf8')
+	backup_5 = backup_env.create_backup()
+	assert backup_5.fileset_id_base == backup_4.fileset_id_base
+	with DbAccess.open_session() as session:
+		# calculated lazily for the 2 newest candidates only
+		assert session.get_fileset(backup_4.fileset_id_base).fingerprint is not None
+		assert session.get_fileset(backup_2.fileset_id_base).fingerprint is not None
+		assert session.get_fileset(backup_1.fileset_id_base).fingerprint is None
+
+	write_files('keep', 30)
+	backup_6 = backup_env.create_backup()
+	assert backup_6.fileset_id_base == backup_1.fileset_id_base
+	with DbAccess.open_session() as session:
+		assert session.get_fileset(backup_1.fileset_id_base).fingerprint is not None
+	assert ValidateFilesetsAction().run().bad == 0
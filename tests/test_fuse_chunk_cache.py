@@ -0,0 +1,24 @@
+from prime_backup.action.get_chunk_action import GetBlobChunksAction
+from prime_backup.cli.fuse.chunk_cache import FuseChunkCache
+from prime_backup.db.access import DbAccess
+from tests import backup_env
+from tests.backup_env import BackupEnv
+
+
+def test_fuse_chunk_cache_is_bounded_and_shared(env: BackupEnv) -> None:
+	backup = backup_env.create_backup()
+	with DbAccess.open_session() as session:
+		file = next(f for f in session.get_backup_file_rows(backup.id) if f.path == 'world/b.dat')
+		blob_id = session.get_blob_by_hash(file.blob_hash).id
+	offset_chunks = sorted(GetBlobChunksAction(blob_id).run())
+	assert len({oc.chunk.id for oc in offset_chunks}) > 3
+
+	cache = FuseChunkCache(3 * 4096)
+	try:
+		cache.readahead([oc.chunk for oc in offset_chunks[:2]])
+		content = b''.join(cache.get(oc.chunk) for oc in offset_chunks)
+		assert content == (env.world_path / 'b.dat').read_bytes()
+		assert len(cache) <= 3 and cache.data_size <= 3 * 4096
+		assert cache.get(offset_chunks[-1].chunk) is cache.get(offset_chunks[-1].chunk)
+	finally:
+		cache.close()
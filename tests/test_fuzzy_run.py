@@ -19,7 +19,7 @@ from typing_extensions import Self, override, Protocol
 
 from prime_backup import logger
 from prime_backup.action.create_backup_action import CreateBackupAction
-from prime_backup.action.delete_backup_action import DeleteBackupAction
+from prime_backup.action.delete_backup_action import DeleteBackupsAction
 from prime_backup.action.delete_backup_file_action import DeleteBackupFileAction
 from prime_backup.action.export_backup_action_directory import ExportBackupToDirectoryAction
 from prime_backup.action.export_backup_action_tar import ExportBackupToTarAction
@@ -504,6 +504,7 @@ class FuzzyRunTestCase(unittest.TestCase):
 			file_size_threshold=1 * 1048576,  # 1MiB
 			patterns=['**'],
 		)]
+		Config.get().backup.blob_pack_threshold = 4096
 		DbAccess.init(create=True, migrate=False)
 
 		with contextlib.ExitStack() as es:
@@ -528,9 +529,10 @@ class FuzzyRunTestCase(unittest.TestCase):
 				_TestStats.get().backup_create += 1
 				return CreateBackupAction(Operator.literal('test'), '').run().id
 
-			def delete_backup(bid_: int):
-				_TestStats.get().backup_delete += 1
-				DeleteBackupAction(bid_).run()
+			def delete_backups(bids: List[int]):
+				_TestStats.get().backup_delete += len(bids)
+				result = DeleteBackupsAction(bids).run()
+				self.assertEqual(bids, [backup.id for backup in result.backups])
 
 			def restore_backup(bid_: int):
 				_TestStats.get().backup_restore += 1
@@ -635,11 +637,11 @@ class FuzzyRunTestCase(unittest.TestCase):
 				# Step 3: Delete a random backup with 20% probability (if any exist)
 				if backup_ids and rnd.random() < 0.2:
 					chosen_deleted_id = rnd.choice(backup_ids)
-					for delete_id in backup_ids[:]:
-						if delete_id == chosen_deleted_id or rnd.random() < 0.01:
-							delete_backup(delete_id)
-							backup_ids.remove(delete_id)
-							backup_snapshots.pop(delete_id)
+					delete_ids = [delete_id for delete_id in backup_ids if delete_id == chosen_deleted_id or rnd.random() < 0.01]
+					delete_backups(delete_ids)
+					for delete_id in delete_ids:
+						backup_ids.remove(delete_id)
+						backup_snapshots.pop(delete_id)
 				if backup_ids and rnd.random() < 0.2:
 					to_mess_backup_id = rnd.choice(backup_ids)
 					delete_backup_file(to_mess_backup_id, backup_snapshots[to_mess_backup_id])
@@ -677,7 +679,7 @@ class FuzzyRunTestCase(unittest.TestCase):
 			next_check = step
 			for i, backup_id in enumerate(backup_ids.copy()):
 				self.logger.info('Deleting backup {}'.format(backup_id))
-				delete_backup(backup_id)
+				delete_backups([backup_id])
 				backup_ids.remove(backup_id)
 				backup_snapshots.pop(backup_id)
 
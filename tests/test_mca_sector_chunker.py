@@ -0,0 +1,92 @@
+import io
+import struct
+from pathlib import Path
+from typing import Dict, Generator, List, Tuple
+
+import pytest
+
+from prime_backup.config.config import Config, set_config_instance
+from prime_backup.db.access import DbAccess
+from prime_backup.types.chunk_method import ChunkMethod
+from prime_backup.types.chunker import PrettyChunk
+
+_SECTOR = 4096
+
+
+@pytest.fixture(autouse=True)
+def __init_config_and_db(tmp_path: Path) -> Generator[None, None, None]:
+	old_config = Config.get()
+	config = Config.get_default()
+	config.storage_root = str(tmp_path / 'pb_files')
+	set_config_instance(config)
+	DbAccess.init_memory_db()
+	try:
+		yield
+	finally:
+		DbAccess.shutdown()
+		set_config_instance(old_config)
+
+
+def _make_region(entries: Dict[int, Tuple[int, bytes]], total_sectors: int) -> bytes:
+	"""
+	:param entries: chunk index -> (sector offset, chunk payload)
+	"""
+	location_table = bytearray(_SECTOR)
+	timestamp_table = bytearray(_SECTOR)
+	body = bytearray(total_sectors * _SECTOR - 2 * _SECTOR)
+	for index, (sector_offset, payload) in entries.items():
+		sector_count = (len(payload) + _SECTOR - 1) // _SECTOR
+		struct.pack_into('>I', location_table, index * 4, (sector_offset << 8) | sector_count)
+		struct.pack_into('>I', timestamp_table, index * 4, sector_offset)
+		start = (sector_offset - 2) * _SECTOR
+		body[start:start + len(payload)] = payload
+	return bytes(location_table + timestamp_table + body)
+
+
+def _cut_file(tmp_path: Path, data: bytes) -> List[PrettyChunk]:
+	file_path = tmp_path / 'r.0.0.mca'
+	file_path.write_bytes(data)
+	file_chunks = ChunkMethod.mca_sector.create_file_chunker(file_path, need_entire_file_hash=False).cut_all()
+	stream_chunks = ChunkMethod.mca_sector.create_stream_chunker(io.BytesIO(data), need_entire_file_hash=False).cut_all()
+	assert [(c.offset, c.length, c.hash) for c in file_chunks] == [(c.offset, c.length, c.hash) for c in stream_chunks]
+
+	offset = 0
+	for chunk in file_chunks:
+		assert chunk.offset == offset
+		offset += chunk.length
+	assert offset == len(data)
+	return file_chunks
+
+
+def test_cut_along_sector_runs(tmp_path: Path) -> None:
+	payload_a = b'a' * 5000
+	payload_b = b'b' * 100
+	data = _make_region({0: (2, payload_a), 5: (5, payload_b)}, total_sectors=40)
+
+	chunks = _cut_file(tmp_path, data)
+	assert [(c.offset, c.length) for c in chunks] == [
+		(0, _SECTOR),  # location table
+		(_SECTOR, _SECTOR),  # timestamp table
+		(2 * _SECTOR, 2 * _SECTOR),  # payload_a
+		(4 * _SECTOR, _SECTOR),  # gap
+		(5 * _SECTOR, _SECTOR),  # payload_b
+		(6 * _SECTOR, 32 * _SECTOR),  # tail gaps, cut into 128KiB chunks
+		(38 * _SECTOR, 2 * _SECTOR),
+	]
+
+	# moving a game chunk to another place keeps its chunk hash
+	moved_data = _make_region({0: (10, payload_a), 5: (5, payload_b)}, total_sectors=40)
+	moved_chunks = _cut_file(tmp_path, moved_data)
+	assert chunks[2].hash in {c.hash for c in moved_chunks if c.offset == 10 * _SECTOR}
+	assert chunks[4].hash in {c.hash for c in moved_chunks if c.offset == 5 * _SECTOR}
+
+
+def test_cut_irregular_files(tmp_path: Path) -> None:
+	# too small, not a region file, overlapping and out-of-bound entries
+	_cut_file(tmp_path, b'x' * 100)
+	_cut_file(tmp_path, bytes(range(256)) * 2000)
+	data = bytearray(_make_region({0: (2, b'a' * 9000)}, total_sectors=8))
+	struct.pack_into('>I', data, 4, (3 << 8) | 2)  # overlaps the first entry
+	struct.pack_into('>I', data, 8, (100 << 8) | 5)  # beyond EOF
+	chunks = _cut_file(tmp_path, bytes(data))
+	assert (2 * _SECTOR, 3 * _SECTOR) in [(c.offset, c.length) for c in chunks]
@@ -0,0 +1,35 @@
+from prime_backup.action.export_backup_action_directory import ExportBackupToDirectoryAction
+from prime_backup.action.migrate_hash_method_action import MigrateHashMethodAction
+from prime_backup.action.validate_blobs_action import ValidateBlobsAction
+from prime_backup.config.config import Config
+from prime_backup.db.access import DbAccess
+from prime_backup.db.values import BlobStorageMethod
+from prime_backup.types.hash_method import HashMethod
+from prime_backup.utils import hash_utils
+from tests import backup_env
+from tests.backup_env import BackupEnv
+
+
+def test_migrate_hash_method_hashes_shared_chunks_once(env: BackupEnv) -> None:
+	Config.get().backup.blob_pack_threshold = 4096
+	(env.world_path / 'a_copy.dat').write_bytes((b'a' * 9000 + b'b' * 9000) * 10 + b'tail')  # shares most chunks with a.dat
+	(env.world_path / 'large.txt').write_bytes(b'x' * 5000)
+	backup = backup_env.create_backup()
+
+	MigrateHashMethodAction(HashMethod.sha256).run()
+	assert Config.get().backup.hash_method == HashMethod.sha256
+	backup_env.assert_pack_and_chunk_validate_ok()
+	assert ValidateBlobsAction().run().bad == 0
+
+	with DbAccess.open_session() as session:
+		assert session.get_db_meta().hash_method == HashMethod.sha256.name
+		assert {blob.storage_method for blob in session.list_blobs()} == {m.value for m in BlobStorageMethod if m != BlobStorageMethod.unknown}
+		blob_hashes = {blob.hash for blob in session.list_blobs()}
+	for file_name in ['a.dat', 'a_copy.dat', 'b.dat', 'small.txt', 'large.txt']:
+		content = (env.world_path / file_name).read_bytes()
+		assert hash_utils.create_hasher(content, hash_method=HashMethod.sha256).hexdigest() in blob_hashes
+
+	restore_path = env.root / 'restored'
+	assert len(ExportBackupToDirectoryAction(backup.id, restore_path, restore_mode=True).run()) == 0
+	for file_name in ['a.dat', 'a_copy.dat', 'b.dat', 'small.txt', 'large.txt']:
+		assert (restore_path / 'world' / file_name).read_bytes() == (env.world_path / file_name).read_bytes()
@@ -1,14 +1,14 @@
 import dataclasses
 from io import BytesIO
-from pathlib import Path
 from typing import Dict, Generator, List, Optional
 
 import pytest
+from sqlalchemy import text
 
 from prime_backup.action.compact_packs_action import CompactAllPacksAction
-from prime_backup.action.create_backup_action import CreateBackupAction
-from prime_backup.action.delete_backup_action import DeleteBackupAction
+from prime_backup.action.delete_backup_action import DeleteBackupAction, DeleteBackupsAction
 from prime_backup.action.delete_backup_file_action import DeleteBackupFileAction
+from prime_backup.action.export_backup_action_directory import ExportBackupToDirectoryAction
 from prime_backup.action.export_backup_action_tar import ExportBackupToTarAction
 from prime_backup.action.get_pack_action import GetPackByFileNamePrefixAction, GetPackByIdAction
 from prime_backup.action.helpers.blob_exporter import _CombinedChunksReader, _OpenedChunk
@@ -17,35 +17,28 @@ from prime_backup.action.helpers.pack_reader import PackEntryReader
 from prime_backup.action.helpers.pack_writer import PackWriter
 from prime_backup.action.import_backup_action import ImportBackupAction
 from prime_backup.action.migrate_compress_method_action import MigrateCompressMethodAction
+from prime_backup.action.scan_and_delete_orphan_objects_action import ScanAndDeleteOrphanObjectsAction
 from prime_backup.action.scan_unknown_pack_files import ScanUnknownPackFilesAction
+from prime_backup.action.validate_blobs_action import ValidateBlobsAction
 from prime_backup.action.validate_chunk_objects_action import ValidateChunkObjectsAction
-from prime_backup.action.validate_chunks_action import ValidateChunksAction
 from prime_backup.action.validate_packs_action import ValidatePacksAction
+from prime_backup.action.validate_ref_counts_action import ValidateRefCountsAction, RebuildRefCountsAction
 from prime_backup.compressors import CompressMethod
-from prime_backup.config.backup_config import ChunkingRule
-from prime_backup.config.config import Config, set_config_instance
+from prime_backup.config.config import Config
 from prime_backup.constants import pack_constants
+from prime_backup.db import schema
 from prime_backup.db.access import DbAccess
+from prime_backup.db.rows import FileRow
 from prime_backup.db.session import DbSession
+from prime_backup.db.values import BlobStorageMethod
 from prime_backup.exceptions import PackFileNameNotUnique
-from prime_backup.types.backup_info import BackupInfo
 from prime_backup.types.chunk_info import ChunkInfo, OffsetChunkInfo
-from prime_backup.types.chunk_method import ChunkMethod
-from prime_backup.types.hash_method import HashMethod
-from prime_backup.types.operator import Operator
 from prime_backup.types.pack_info import PackChangeSummary, PackEntryLocation, PackInfo
 from prime_backup.types.standalone_backup_format import StandaloneBackupFormat
 from prime_backup.types.tar_format import TarFormat
-from prime_backup.utils import hash_utils, pack_utils
-
-
-@dataclasses.dataclass(frozen=True)
-class PackStorageEnv:
-	root: Path
-	pb_path: Path
-	server_path: Path
-	world_path: Path
-	export_path: Path
+from prime_backup.utils import blob_utils, hash_utils, pack_utils
+from tests import backup_env
+from tests.backup_env import BackupEnv
 
 
 @dataclasses.dataclass(frozen=True)
@@ -56,78 +49,6 @@ class PackStats:
 	live_entry_count: int
 
 
-@pytest.fixture(name='env')
-def __pack_storage_env(tmp_path: Path) -> Generator[PackStorageEnv, None, None]:
-	old_config = Config.get()
-	if DbAccess.is_initialized():
-		DbAccess.shutdown()
-
-	root = tmp_path / 'pack_storage'
-	pb_path = root / 'pb_files'
-	server_path = root / 'server'
-	world_path = server_path / 'world'
-	export_path = root / 'out.tar'
-
-	world_path.mkdir(parents=True)
-	(world_path / 'a.dat').write_bytes((b'a' * 9000 + b'b' * 9000) * 10)
-	(world_path / 'b.dat').write_bytes((b'c' * 7000 + b'd' * 7000) * 12)
-	(world_path / 'small.txt').write_text('hello pack', encoding='utf8')
-
-	config = Config.get_default()
-	set_config_instance(config)
-	config.storage_root = str(pb_path)
-	config.backup.source_root = str(server_path)
-	config.backup.targets = ['world']
-	config.backup.hash_method = HashMethod.xxh128
-	config.backup.compress_method = CompressMethod.plain
-	config.backup.compress_threshold = 1 << 60
-	config.backup.chunking_enabled = True
-	config.backup.chunking_rules = [
-		ChunkingRule(algorithm=ChunkMethod.fixed_4k, file_size_threshold=1, patterns=['**/*.dat']),
-	]
-	config.backup.pack_auto_compact_threshold = 0.75
-	DbAccess.init_memory_db()
-
-	try:
-		yield PackStorageEnv(root, pb_path, server_path, world_path, export_path)
-	finally:
-		if DbAccess.is_initialized():
-			DbAccess.shutdown()
-		set_config_instance(old_config)
-
-
-def __assert_pack_and_chunk_validate_ok() -> None:
-	__assert_pack_validate_ok()
-	assert ValidateChunksAction().run().bad == 0
-
-
-def __assert_pack_validate_ok() -> None:
-	__assert_pack_db_files_consistent()
-	assert ValidatePacksAction().run().bad == 0
-
-
-def __assert_pack_db_files_consistent() -> None:
-	with DbAccess.open_session() as session:
-		for pack in session.list_packs():
-			assert pack_utils.get_pack_path(pack.id).stat().st_size == pack.size
-			live_chunks = session.get_live_chunks_by_pack_id(pack.id)
-			assert sum(chunk.stored_size for chunk in live_chunks) == pack.live_size
-			assert len(live_chunks) == pack.live_entry_count
-			prev_end = 0
-			for chunk in live_chunks:
-				assert chunk.pack_offset >= prev_end
-				prev_end = chunk.pack_offset + chunk.stored_size
-				assert prev_end <= pack.size
-		for chunk in session.list_chunks():
-			assert chunk.pack_id > 0
-			assert chunk.pack_offset >= 0
-			assert chunk.stored_size >= 0
-
-
-def __create_backup() -> BackupInfo:
-	return CreateBackupAction(Operator.literal('test'), '').run()
-
-
 def __get_pack_stats() -> Dict[int, PackStats]:
 	with DbAccess.open_session() as session:
 		return {
@@ -149,9 +70,9 @@ def __write_test_chunk(session: DbSession, pack_writer: PackWriter, data: bytes)
 	return location
 
 
-def test_pack_create_compact_export_import_and_unknown_file_cleanup(env: PackStorageEnv) -> None:
-	backup = __create_backup()
-	__assert_pack_and_chunk_validate_ok()
+def test_pack_create_compact_export_import_and_unknown_file_cleanup(env: BackupEnv) -> None:
+	backup = backup_env.create_backup()
+	backup_env.assert_pack_and_chunk_validate_ok()
 
 	with DbAccess.open_session() as session:
 		pack_count_before = session.get_pack_count()
@@ -163,7 +84,7 @@ def test_pack_create_compact_export_import_and_unknown_file_cleanup(env: PackSto
 	delete_delta = DeleteBackupFileAction(backup.id, 'world/a.dat', allow_directory=False).run()
 	assert delete_delta.freed_disk_size > 0
 	assert delete_delta.packs.freed_size > 0
-	__assert_pack_and_chunk_validate_ok()
+	backup_env.assert_pack_and_chunk_validate_ok()
 	with DbAccess.open_session() as session:
 		pack_stats_after_delete = session.get_pack_overview_stats()
 	assert pack_stats_after_delete.size_sum <= pack_stats_before.size_sum
@@ -184,11 +105,11 @@ def test_pack_create_compact_export_import_and_unknown_file_cleanup(env: PackSto
 	DbAccess.init_memory_db()
 	imported_backup = ImportBackupAction(env.export_path, StandaloneBackupFormat.tar, ensure_meta=False).run()
 	assert imported_backup.id == 1
-	__assert_pack_and_chunk_validate_ok()
+	backup_env.assert_pack_and_chunk_validate_ok()
 
 
-def test_compact_all_packs_with_full_threshold_reclaims_only_dead_space(env: PackStorageEnv) -> None:
-	backup = __create_backup()
+def test_compact_all_packs_with_full_threshold_reclaims_only_dead_space(env: BackupEnv) -> None:
+	backup = backup_env.create_backup()
 	pack_stats_before_clean_compact = __get_pack_stats()
 	pack_paths_before_clean_compact = {
 		pack_id: pack_utils.get_pack_path(pack_id)
@@ -220,27 +141,27 @@ def test_compact_all_packs_with_full_threshold_reclaims_only_dead_space(env: Pac
 	assert manual_summary.freed_size > 0
 	for pack_info in dead_pack_infos:
 		assert not pack_info.file_path.exists()
-	__assert_pack_and_chunk_validate_ok()
+	backup_env.assert_pack_and_chunk_validate_ok()
 
 
-def test_new_backup_does_not_append_to_existing_packs(env: PackStorageEnv) -> None:
-	backup_1 = __create_backup()
+def test_new_backup_does_not_append_to_existing_packs(env: BackupEnv) -> None:
+	backup_1 = backup_env.create_backup()
 	pack_stats_before = __get_pack_stats()
 	assert len(pack_stats_before) > 0
 
 	(env.world_path / 'c.dat').write_bytes((b'e' * 11000 + b'f' * 11000) * 8)
-	backup_2 = __create_backup()
+	backup_2 = backup_env.create_backup()
 	assert backup_2.id > backup_1.id
 
 	pack_stats_after = __get_pack_stats()
 	assert len(pack_stats_after) > len(pack_stats_before)
 	for pack_id, old_stats in pack_stats_before.items():
 		assert pack_stats_after[pack_id] == old_stats
-	__assert_pack_and_chunk_validate_ok()
+	backup_env.assert_pack_and_chunk_validate_ok()
 
 
-def test_pack_file_name_is_derived_from_pack_id(env: PackStorageEnv) -> None:
-	__create_backup()
+def test_pack_file_name_is_derived_from_pack_id(env: BackupEnv) -> None:
+	backup_env.create_backup()
 
 	with DbAccess.open_session() as session:
 		packs = session.list_packs()
@@ -252,8 +173,8 @@ def test_pack_file_name_is_derived_from_pack_id(env: PackStorageEnv) -> None:
 			assert pack_info.file_path.is_file()
 
 
-def test_get_pack_by_file_name_prefix_matches_and_rejects_ambiguity(env: PackStorageEnv) -> None:
-	__create_backup()
+def test_get_pack_by_file_name_prefix_matches_and_rejects_ambiguity(env: BackupEnv) -> None:
+	backup_env.create_backup()
 
 	with DbAccess.open_session() as session:
 		prefix_to_pack_id: Dict[str, int] = {}
@@ -269,7 +190,7 @@ def test_get_pack_by_file_name_prefix_matches_and_rejects_ambiguity(env: PackSto
 			else:
 				prefix_to_pack_id[prefix] = location.pack_id
 		session.commit()
-	__assert_pack_validate_ok()
+	backup_env.assert_pack_validate_ok()
 
 	with DbAccess.open_session() as session:
 		pack = session.list_packs()[0]
@@ -378,8 +299,8 @@ def test_combined_chunks_reader_raises_eof_error_on_short_chunk() -> None:
 	reader.close()
 
 
-def test_scan_unknown_pack_files_keeps_known_derived_pack_file_names(env: PackStorageEnv) -> None:
-	__create_backup()
+def test_scan_unknown_pack_files_keeps_known_derived_pack_file_names(env: BackupEnv) -> None:
+	backup_env.create_backup()
 
 	with DbAccess.open_session() as session:
 		pack = session.list_packs()[0]
@@ -408,7 +329,7 @@ def test_scan_unknown_pack_files_keeps_known_derived_pack_file_names(env: PackSt
 	assert not unknown_path.exists()
 
 
-def test_pack_writer_rotates_after_current_pack_reaches_max_size(env: PackStorageEnv) -> None:
+def test_pack_writer_rotates_after_current_pack_reaches_max_size(env: BackupEnv) -> None:
 	entry_size = pack_constants.PACK_MAX_SIZE // 3 + 1
 	assert entry_size < pack_constants.PACK_DEDICATED_ENTRY_MIN_SIZE
 	data_1 = b'x' * entry_size
@@ -423,7 +344,7 @@ def test_pack_writer_rotates_after_current_pack_reaches_max_size(env: PackStorag
 		loc_4 = __write_test_chunk(session, pack_writer, b'w')
 		pack_writer.close()
 		session.commit()
-	__assert_pack_validate_ok()
+	backup_env.assert_pack_validate_ok()
 
 	assert loc_2.pack_id == loc_1.pack_id
 	assert loc_3.pack_id == loc_1.pack_id
@@ -444,7 +365,7 @@ def test_pack_writer_rotates_after_current_pack_reaches_max_size(env: PackStorag
 		assert pack_utils.get_pack_path(second_pack.id).stat().st_size == second_pack.size
 
 
-def test_large_entry_can_be_stored_as_dedicated_pack(env: PackStorageEnv) -> None:
+def test_large_entry_can_be_stored_as_dedicated_pack(env: BackupEnv) -> None:
 	data = b'x' * pack_constants.PACK_DEDICATED_ENTRY_MIN_SIZE
 	active_before_data = b'a'
 	active_after_data = b'b'
@@ -476,16 +397,16 @@ def test_large_entry_can_be_stored_as_dedicated_pack(env: PackStorageEnv) -> Non
 	read_data = ChunkIO(chunk_info).read_raw()
 	assert len(read_data) == len(data)
 	assert hash_utils.calc_bytes_hash(read_data) == data_hash
-	__assert_pack_validate_ok()
+	backup_env.assert_pack_validate_ok()
 
 
-def test_delete_backup_delta_includes_base_shrink_pack_compaction(env: PackStorageEnv) -> None:
+def test_delete_backup_delta_includes_base_shrink_pack_compaction(env: BackupEnv) -> None:
 	for i in range(12):
 		(env.world_path / 'keep_{}.txt'.format(i)).write_text('keep {}'.format(i), encoding='utf8')
-	backup_1 = __create_backup()
+	backup_1 = backup_env.create_backup()
 
 	(env.world_path / 'a.dat').unlink()
-	backup_2 = __create_backup()
+	backup_2 = backup_env.create_backup()
 	assert backup_2.fileset_id_base == backup_1.fileset_id_base
 
 	delete_result = DeleteBackupAction(backup_1.id).run()
@@ -493,11 +414,11 @@ def test_delete_backup_delta_includes_base_shrink_pack_compaction(env: PackStora
 	assert delete_result.delta.chunk_count > 0
 	assert delete_result.delta.freed_disk_size > 0
 	assert delete_result.delta.packs.freed_size > 0
-	__assert_pack_and_chunk_validate_ok()
+	backup_env.assert_pack_and_chunk_validate_ok()
 
 
-def test_delete_delta_counts_updated_packs_without_compact(env: PackStorageEnv) -> None:
-	backup = __create_backup()
+def test_delete_delta_counts_updated_packs_without_compact(env: BackupEnv) -> None:
+	backup = backup_env.create_backup()
 	Config.get().backup.pack_auto_compact_threshold = 0
 
 	delete_delta = DeleteBackupFileAction(backup.id, 'world/a.dat', allow_directory=False).run()
@@ -505,11 +426,11 @@ def test_delete_delta_counts_updated_packs_without_compact(env: PackStorageEnv)
 	assert delete_delta.packs.updated_pack_count > 0
 	assert delete_delta.packs.reclaimed_pack_count == 0
 	assert delete_delta.packs.changed_pack_count == delete_delta.packs.updated_pack_count
-	__assert_pack_and_chunk_validate_ok()
+	backup_env.assert_pack_and_chunk_validate_ok()
 
 
-def test_pack_validation_is_independent_from_chunk_objects_validation(env: PackStorageEnv) -> None:
-	__create_backup()
+def test_pack_validation_is_independent_from_chunk_objects_validation(env: BackupEnv) -> None:
+	backup_env.create_backup()
 	with DbAccess.open_session() as session:
 		pack = session.list_packs()[0]
 		pack.live_size += 1
@@ -524,8 +445,8 @@ def test_pack_validation_is_independent_from_chunk_objects_validation(env: PackS
 	assert result.affected_file_count == 0
 
 
-def test_migrate_compress_method_rewrites_pack_entries_by_pack(env: PackStorageEnv) -> None:
-	__create_backup()
+def test_migrate_compress_method_rewrites_pack_entries_by_pack(env: BackupEnv) -> None:
+	backup_env.create_backup()
 	with DbAccess.open_session() as session:
 		old_pack_file_names = {PackInfo.of(pack).file_name for pack in session.list_packs()}
 		old_pack_count = len(old_pack_file_names)
@@ -534,7 +455,7 @@ def test_migrate_compress_method_rewrites_pack_entries_by_pack(env: PackStorageE
 	Config.get().backup.compress_threshold = 0
 	diff = MigrateCompressMethodAction(CompressMethod.gzip).run()
 	assert diff.after != diff.before
-	__assert_pack_and_chunk_validate_ok()
+	backup_env.assert_pack_and_chunk_validate_ok()
 
 	with DbAccess.open_session() as session:
 		packs = session.list_packs()
@@ -542,3 +463,202 @@ def test_migrate_compress_method_rewrites_pack_entries_by_pack(env: PackStorageE
 		assert len(packs) == old_pack_count
 		assert all(PackInfo.of(pack).file_name not in old_pack_file_names for pack in packs)
 		assert all(chunk.compress == CompressMethod.gzip.name for chunk in session.list_chunks())
+
+
+def test_small_blobs_are_packed_and_reclaimed_with_backup(env: BackupEnv) -> None:
+	Config.get().backup.blob_pack_threshold = 4096
+	(env.world_path / 'small_copy.txt').write_text('hello pack', encoding='utf8')
+	(env.world_path / 'same_as_chunk.txt').write_bytes(b'a' * 4096)  # same content as the first chunk of a.dat
+	(env.world_path / 'large.txt').write_bytes(b'x' * 5000)
+	backup = backup_env.create_backup()
+	backup_env.assert_pack_and_chunk_validate_ok()
+	assert ValidateBlobsAction().run().bad == 0
+
+	with DbAccess.open_session() as session:
+		packed_blobs = session.list_blobs_by_storage_method(BlobStorageMethod.packed)
+		direct_blobs = session.list_blobs_by_storage_method(BlobStorageMethod.direct)
+		assert {blob.raw_size for blob in packed_blobs} == {len('hello pack'), 4096}
+		assert [blob.raw_size for blob in direct_blobs] == [5000]
+		packed_blob_hashes = [blob.hash for blob in packed_blobs]
+		assert all(chunk is not None for chunk in session.get_chunks_by_hashes_opt(packed_blob_hashes).values())
+	for blob_hash in packed_blob_hashes:
+		assert not blob_utils.get_blob_path(blob_hash).exists()
+
+	restore_path = env.root / 'restored'
+	failures = ExportBackupToDirectoryAction(backup.id, restore_path, restore_mode=True).run()
+	assert len(failures) == 0
+	for file_name in ['small.txt', 'small_copy.txt', 'same_as_chunk.txt', 'large.txt', 'a.dat']:
+		assert (restore_path / 'world' / file_name).read_bytes() == (env.world_path / file_name).read_bytes()
+
+	DeleteBackupFileAction(backup.id, 'world/a.dat', allow_directory=False).run()
+	backup_env.assert_pack_and_chunk_validate_ok()
+	assert ValidateBlobsAction().run().bad == 0
+
+	DeleteBackupAction(backup.id).run()
+	with DbAccess.open_session() as session:
+		assert session.get_blob_count() == 0
+		assert session.get_chunk_count() == 0
+		assert session.get_pack_overview_stats().live_size_sum == 0
+	backup_env.assert_pack_validate_ok()
+
+
+def test_packed_blob_chunk_lookups_are_batched(env: BackupEnv, monkeypatch: pytest.MonkeyPatch) -> None:
+	Config.get().backup.blob_pack_threshold = 4096
+	Config.get().backup.compress_method = CompressMethod.zstd
+	Config.get().backup.compress_threshold = 0
+	small_contents = [('small file {} '.format(i) * 20).encode('utf8') for i in range(50)]
+	for i, content in enumerate(small_contents):
+		(env.world_path / 'small_{}.txt'.format(i)).write_bytes(content)
+	small_hashes = {hash_utils.calc_bytes_hash(content) for content in small_contents}
+
+	lookup_sizes: List[int] = []
+	original_get_chunks_by_hashes_opt = DbSession.get_chunks_by_hashes_opt
+
+	def get_chunks_by_hashes_opt(self: DbSession, hashes: List[str]):
+		if len(small_hashes.intersection(hashes)) > 0:
+			lookup_sizes.append(len(hashes))
+		return original_get_chunks_by_hashes_opt(self, hashes)
+
+	monkeypatch.setattr(DbSession, 'get_chunks_by_hashes_opt', get_chunks_by_hashes_opt)
+	backup_env.create_backup()
+	monkeypatch.undo()
+
+	assert sum(lookup_sizes) >= len(small_hashes)
+	assert len(lookup_sizes) < len(small_hashes)
+	backup_env.assert_pack_and_chunk_validate_ok()
+	assert ValidateBlobsAction().run().bad == 0
+	with DbAccess.open_session() as session:
+		packed_blobs = session.list_blobs_by_storage_method(BlobStorageMethod.packed)
+		assert small_hashes.issubset({blob.hash for blob in packed_blobs})
+		# the compression is recorded on the chunk only
+		assert all(blob.compress == CompressMethod.plain.name for blob in packed_blobs)
+		chunks = session.get_chunks_by_hashes_opt(list(small_hashes))
+		assert all(chunk is not None and chunk.compress == CompressMethod.zstd.name for chunk in chunks.values())
+
+
+def test_backup_file_rows_match_orm_files(env: BackupEnv) -> None:
+	backup1 = backup_env.create_backup()
+	(env.world_path / 'small.txt').unlink()
+	(env.world_path / 'new.txt').write_text('new file', encoding='utf8')
+	backup2 = backup_env.create_backup()
+
+	def file_to_tuple(file) -> tuple:
+		return tuple(getattr(file, column.name) for column in schema.File.__table__.columns)
+
+	with DbAccess.open_session() as session:
+		for backup in [backup1, backup2]:
+			files = sorted(map(file_to_tuple, session.get_backup_files(backup.id)))
+			rows = session.get_backup_file_rows(backup.id)
+			assert all(isinstance(row, FileRow) for row in rows)
+			assert sorted(map(tuple, rows)) == files
+			db_backup = session.get_backup(backup.id)
+			for fileset_id in [db_backup.fileset_id_base, db_backup.fileset_id_delta]:
+				assert sorted(map(tuple, session.get_fileset_file_rows(fileset_id))) == sorted(map(file_to_tuple, session.get_fileset_files(fileset_id)))
+
+		paths = {row.path for row in session.get_backup_file_rows(backup2.id)}
+		assert 'world/new.txt' in paths
+		assert 'world/small.txt' not in paths
+
+
+def test_single_pass_chunks_are_discarded_if_blob_exists(env: BackupEnv) -> None:
+	content = b''.join(bytes([i]) * 4096 for i in range(10))
+	(env.world_path / 'c.bin').write_bytes(content)  # not chunked, stored as a direct blob
+	backup_env.create_backup()
+	with DbAccess.open_session() as session:
+		chunk_count = session.get_chunk_count()
+	pack_stats = __get_pack_stats()
+
+	# the chunks of c.dat are written in the single pass, then discarded since the blob already exists
+	(env.world_path / 'c.dat').write_bytes(content)
+	backup = backup_env.create_backup()
+	backup_env.assert_pack_and_chunk_validate_ok()
+	with DbAccess.open_session() as session:
+		assert session.get_chunk_count() == chunk_count
+		rows = {row.path: row for row in session.get_backup_file_rows(backup.id)}
+		assert rows['world/c.dat'].blob_hash == rows['world/c.bin'].blob_hash
+		assert rows['world/c.dat'].blob_storage_method == BlobStorageMethod.direct.value
+	new_pack_stats = {pack_id: stats for pack_id, stats in __get_pack_stats().items() if pack_id not in pack_stats}
+	assert sum(stats.entry_count for stats in new_pack_stats.values()) == 10
+	assert sum(stats.live_entry_count for stats in new_pack_stats.values()) == 0
+	assert sum(stats.live_size for stats in new_pack_stats.values()) == 0
+
+
+def test_ref_counts_follow_backup_changes_and_can_be_rebuilt(env: BackupEnv) -> None:
+	Config.get().backup.blob_pack_threshold = 4096
+	(env.world_path / 'same_as_chunk.txt').write_bytes(b'a' * 4096)  # packed blob sharing a chunk with a.dat
+	backup_1 = backup_env.create_backup()
+	(env.world_path / 'small_copy.txt').write_text('hello pack', encoding='utf8')
+	(env.world_path / 'b.dat').unlink()
+	backup_2 = backup_env.create_backup()
+	assert ValidateRefCountsAction().run().bad_count == 0
+
+	with DbAccess.open_session() as session:
+		small_blob = session.get_file_in_backup(backup_2.id, 'world/small.txt').blob_hash
+		assert session.get_blob_by_hash(small_blob).ref_count == 3  # small.txt x2, small_copy.txt
+		assert session.get_chunk_by_hash(session.get_file_in_backup(backup_2.id, 'world/same_as_chunk.txt').blob_hash).ref_count > 1
+		assert session.get_unreferenced_blob_count() == 0
+		assert session.get_unreferenced_chunk_count() == 0
+
+	DeleteBackupAction(backup_1.id).run()
+	assert ValidateRefCountsAction().run().bad_count == 0
+	DeleteBackupFileAction(backup_2.id, 'world/a.dat', allow_directory=False).run()
+	assert ValidateRefCountsAction().run().bad_count == 0
+	backup_env.assert_pack_and_chunk_validate_ok()
+
+	# a broken ref_count never leads to the deletion of alive objects, and can be rebuilt
+	with DbAccess.open_session() as session:
+		session.get_blob_by_hash(small_blob).ref_count = 0
+	result = ValidateRefCountsAction().run()
+	assert result.bad == {'blob': 1, 'chunk_group': 0, 'chunk': 0}
+	assert RebuildRefCountsAction().run() == {'blob': 1, 'chunk_group': 0, 'chunk': 0}
+	assert ValidateRefCountsAction().run().bad_count == 0
+
+	# prune rebuilds the reference counts before scanning, so drifted counts are fixed there too
+	with DbAccess.open_session() as session:
+		session.get_blob_by_hash(small_blob).ref_count = 0
+	assert ScanAndDeleteOrphanObjectsAction().run().total_orphan_count == 0
+	assert ValidateRefCountsAction().run().bad_count == 0
+	assert ValidateBlobsAction().run().bad == 0
+
+
+def test_ref_counts_do_not_depend_on_insert_order(env: BackupEnv) -> None:
+	backup_env.create_backup()
+	with DbAccess.open_session() as session:
+		conn = session.session.connection()
+		chunk_id, chunk_group_id = conn.execute(text('SELECT chunk_id, chunk_group_id FROM chunk_group_chunk_binding LIMIT 1')).one()
+		chunk_ref_count = conn.execute(text('SELECT ref_count FROM chunk WHERE id = :id'), {'id': chunk_id}).scalar_one()
+		chunk_group_ref_count = conn.execute(text('SELECT ref_count FROM chunk_group WHERE id = :id'), {'id': chunk_group_id}).scalar_one()
+		assert chunk_ref_count > 0 and chunk_group_ref_count > 0
+
+		# re-insert the chunk and the chunk group after their bindings
+		for table, obj_id in [('chunk', chunk_id), ('chunk_group', chunk_group_id)]:
+			conn.execute(text('CREATE TEMP TABLE tmp_{table} AS SELECT * FROM {table} WHERE id = :id'.format(table=table)), {'id': obj_id})
+			conn.execute(text('DELETE FROM {table} WHERE id = :id'.format(table=table)), {'id': obj_id})
+			conn.execute(text('UPDATE tmp_{table} SET ref_count = 0'.format(table=table)))
+			conn.execute(text('INSERT INTO {table} SELECT * FROM tmp_{table}'.format(table=table)))
+			conn.execute(text('DROP TABLE tmp_{table}'.format(table=table)))
+
+		assert conn.execute(text('SELECT ref_count FROM chunk WHERE id = :id'), {'id': chunk_id}).scalar_one() == chunk_ref_count
+		assert conn.execute(text('SELECT ref_count FROM chunk_group WHERE id = :id'), {'id': chunk_group_id}).scalar_one() == chunk_group_ref_count
+	assert ValidateRefCountsAction().run().bad_count == 0
+
+
+def test_delete_backups_in_one_batch(env: BackupEnv) -> None:
+	backup_1 = backup_env.create_backup()
+	(env.world_path / 'a.dat').write_bytes(b'e' * 50000)
+	backup_2 = backup_env.create_backup()
+	(env.world_path / 'b.dat').unlink()
+	backup_3 = backup_env.create_backup()
+
+	result = DeleteBackupsAction([backup_1.id, backup_2.id, 9999]).run()
+	assert [backup.id for backup in result.backups] == [backup_1.id, backup_2.id]
+	assert result.missing_backup_ids == [9999]
+	assert result.delta.blob_count > 0
+	backup_env.assert_pack_and_chunk_validate_ok()
+	assert ValidateBlobsAction().run().bad == 0
+	assert ValidateRefCountsAction().run().bad_count == 0
+
+	restore_path = env.root / 'restored'
+	assert len(ExportBackupToDirectoryAction(backup_3.id, restore_path, restore_mode=True).run()) == 0
+	assert sorted(p.name for p in (restore_path / 'world').iterdir()) == ['a.dat', 'small.txt']
+	assert (restore_path / 'world' / 'a.dat').read_bytes() == b'e' * 50000
@@ -72,10 +72,16 @@ class TestV4SchemaDDL(unittest.TestCase):
 		_assert_schema_matches(self, schema_utils.schema_from_metadata(_V4.Base.metadata), 'schema_ddl_v4.yml', exact_match=False)
 
 
+class TestV5SchemaDDL(unittest.TestCase):
+	def test_tables_and_indexes(self):
+		from prime_backup.db.migrations.migration_4_5 import _V5
+		_assert_schema_matches(self, schema_utils.schema_from_metadata(_V5.Base.metadata), 'schema_ddl_v5.yml', exact_match=False)
+
+
 class TestCurrentSchemaDDL(unittest.TestCase):
 	def test_tables_and_indexes(self):
 		from prime_backup.db.schema import Base as CurrentBase
-		_assert_schema_matches(self, schema_utils.schema_from_metadata(CurrentBase.metadata), 'schema_ddl_v4.yml', exact_match=True)
+		_assert_schema_matches(self, schema_utils.schema_from_metadata(CurrentBase.metadata), 'schema_ddl_v5.yml', exact_match=True)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,80 @@
+from typing import Dict, List, Optional
+
+import pytest
+
+from prime_backup.action.scrub_action import ScrubAction
+from prime_backup.action.validate_chunks_action import BadChunkItemType
+from prime_backup.db.access import DbAccess
+from prime_backup.db.session import DbSession
+from prime_backup.db.values import BlobStorageMethod
+from prime_backup.utils import blob_utils
+from tests import backup_env
+from tests.backup_env import BackupEnv
+
+
+def test_scrub_verifies_least_recently_verified_objects_first(env: BackupEnv) -> None:
+	backup_env.create_backup()
+
+	def get_last_verified() -> Dict[str, Optional[int]]:
+		with DbAccess.open_session() as session:
+			values = {f'pack{pack.id}': pack.last_verified for pack in session.list_packs()}
+			values.update({f'blob{blob.id}': blob.last_verified for blob in session.list_blobs_by_storage_method(BlobStorageMethod.direct)})
+			return values
+
+	assert set(get_last_verified().values()) == {None}
+	result = ScrubAction(size_ratio=1).run()
+	assert result.bad == 0 and result.size == result.size_budget > 0
+	assert None not in get_last_verified().values()
+
+	# a tiny budget still verifies 1 object, and the least recently verified ones are picked first
+	with DbAccess.open_session() as session:
+		session.update_packs_last_verified([pack.id for pack in session.list_packs()], 1)
+	result = ScrubAction(size_ratio=1e-6).run()
+	assert (result.pack_count, result.blob_count) == (1, 0)
+	assert 1 not in get_last_verified().values()
+
+	with DbAccess.open_session() as session:
+		blob = session.list_blobs_by_storage_method(BlobStorageMethod.direct)[0]
+		blob_id, blob_hash = blob.id, blob.hash
+		session.update_blobs_last_verified([blob_id], 1)
+	blob_utils.get_blob_path(blob_hash).write_bytes(b'corrupted')
+
+	result = ScrubAction(size_ratio=1e-6).run()
+	assert (result.pack_count, result.blob_count) == (0, 1)
+	assert [item.blob.id for item in result.blob_result.bad_blobs] == [blob_id]
+	assert get_last_verified()[f'blob{blob_id}'] == 1
+
+
+def test_scrub_pages_candidates_and_tolerates_orphan_chunks(env: BackupEnv, monkeypatch: pytest.MonkeyPatch) -> None:
+	(env.world_path / 'small2.txt').write_text('hello pack 2', encoding='utf8')
+	backup_env.create_backup()
+	monkeypatch.setattr(ScrubAction, 'CANDIDATE_BATCH_SIZE', 1)
+
+	with DbAccess.open_session() as session:
+		pack_ids = [pack.id for pack in session.list_packs()]
+		blob_ids = [blob.id for blob in session.list_blobs_by_storage_method(BlobStorageMethod.direct)]
+		assert len(pack_ids) > 0 and len(blob_ids) > 1
+		# a mix of never-verified and verified objects, with duplicated timestamps
+		session.update_packs_last_verified(pack_ids[:1], 5)
+		session.update_blobs_last_verified(blob_ids[:1], 5)
+
+	def list_all(list_func) -> List[int]:
+		ids: List[int] = []
+		after = None
+		while len(objects := list_func(limit=1, after=after)) > 0:
+			ids.append(objects[0].id)
+			after = (objects[0].last_verified, objects[0].id)
+		return ids
+
+	with DbAccess.open_session() as session:
+		assert list_all(session.list_packs_by_last_verified) == pack_ids[1:] + pack_ids[:1]
+		assert list_all(session.list_direct_blobs_by_last_verified) == blob_ids[1:] + blob_ids[:1]
+
+	# orphan chunks are reported, but their packs are still marked as verified
+	monkeypatch.setattr(DbSession, 'filtered_orphan_chunk_ids', lambda self, chunk_ids: chunk_ids)
+	result = ScrubAction(size_ratio=1).run()
+	assert result.pack_count == len(pack_ids) and result.blob_count == len(blob_ids)
+	assert result.chunk_result.bad > 0
+	assert set(result.chunk_result.group_bad_by_type().keys()) == {BadChunkItemType.orphan}
+	with DbAccess.open_session() as session:
+		assert all(pack.last_verified not in (None, 5) for pack in session.list_packs())
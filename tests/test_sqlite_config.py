@@ -0,0 +1,55 @@
+from typing import Dict
+
+import pytest
+from sqlalchemy import text
+
+from prime_backup.config.config import Config
+from prime_backup.config.database_config import SqliteConfig
+from prime_backup.db.access import DbAccess
+from tests import backup_env
+from tests.backup_env import BackupEnv
+
+
+def test_sqlite_pragmas_applied_to_file_db(env: BackupEnv) -> None:
+	DbAccess.shutdown()
+	config = Config.get()
+	config.database.sqlite = SqliteConfig.deserialize({
+		'journal_mode': 'wal',
+		'synchronous': 'normal',
+		'cache_size': -4096,
+		'mmap_size': 1048576,
+		'temp_store': 'memory',
+		'busy_timeout': '5s',
+	})
+	DbAccess.init(create=True, migrate=False)
+
+	def get_pragmas() -> Dict[str, object]:
+		with DbAccess.open_session() as session:
+			return {
+				name: session.session.execute(text('PRAGMA {}'.format(name))).scalar_one()
+				for name in ['journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store', 'busy_timeout']
+			}
+
+	assert get_pragmas() == {
+		'journal_mode': 'wal',
+		'synchronous': 1,  # NORMAL
+		'cache_size': -4096,
+		'mmap_size': 1048576,
+		'temp_store': 2,  # MEMORY
+		'busy_timeout': 5000,
+	}
+
+	backup_env.create_backup()
+	backup_env.assert_pack_and_chunk_validate_ok()
+	assert DbAccess.get_db_file_path().with_name(DbAccess.get_db_file_path().name + '-wal').exists()
+
+	# the pragmas are applied to every new connection, e.g. after the db is reopened
+	DbAccess.shutdown()
+	DbAccess.init(create=False, migrate=False)
+	assert get_pragmas()['synchronous'] == 1
+	with DbAccess.open_session() as session:
+		assert session.get_backup_count() == 1
+
+	for key, value in [('journal_mode', 'foo'), ('synchronous', 'bar'), ('mmap_size', -1), ('busy_timeout', '-1s')]:
+		with pytest.raises(ValueError):
+			SqliteConfig.deserialize({key: value})
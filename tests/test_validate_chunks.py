@@ -0,0 +1,52 @@
+from prime_backup.action.delete_backup_file_action import DeleteBackupFileAction
+from prime_backup.action.validate_chunks_action import ValidateChunksAction, BadChunkItemType
+from prime_backup.compressors import CompressMethod
+from prime_backup.config.config import Config
+from prime_backup.db.access import DbAccess
+from prime_backup.types.chunk_info import ChunkInfo
+from prime_backup.types.pack_info import PackInfo
+from prime_backup.utils import pack_utils
+from tests import backup_env
+from tests.backup_env import BackupEnv
+
+
+def test_chunk_validation_reads_packs_sequentially_and_finds_bad_entries(env: BackupEnv) -> None:
+	Config.get().backup.pack_auto_compact_threshold = 0
+	backup = backup_env.create_backup()
+	DeleteBackupFileAction(backup.id, 'world/b.dat', allow_directory=False).run()
+	result = ValidateChunksAction().run()
+	assert result.bad == 0 and result.ok == result.total
+	with DbAccess.open_session() as session:
+		pack = PackInfo.of(session.list_packs()[0])
+		assert result.pack_gap_size == pack.size - pack.live_size > 0
+		live_chunks = list(map(ChunkInfo.of, session.get_live_chunks_by_pack_id(pack.id)))
+		corrupted_chunk, overlapped_chunk = live_chunks[1], live_chunks[2]
+		session.create_and_add_chunk(
+			hash='0' * len(overlapped_chunk.hash),
+			compress=CompressMethod.plain.name,
+			raw_size=10,
+			stored_size=10,
+			pack_id=pack.id,
+			pack_offset=overlapped_chunk.pack_entry.offset + 1,
+		)
+		session.create_and_add_chunk(
+			hash='1' * len(overlapped_chunk.hash),
+			compress=CompressMethod.plain.name,
+			raw_size=10,
+			stored_size=10,
+			pack_id=pack.id + 100,
+			pack_offset=0,
+		)
+	with open(pack_utils.get_pack_path(pack.id), 'r+b') as f:
+		f.seek(corrupted_chunk.pack_entry.offset)
+		byte = f.read(1)[0]
+		f.seek(corrupted_chunk.pack_entry.offset)
+		f.write(bytes([byte ^ 0xFF]))
+
+	result = ValidateChunksAction().run()
+	assert result.validated == result.total
+	bad_types = {typ: [item.chunk.id for item in items] for typ, items in result.group_bad_by_type().items()}
+	assert bad_types.pop(BadChunkItemType.mismatched) == [corrupted_chunk.id]
+	assert len(bad_types.pop(BadChunkItemType.bad_pack_entry)) == 1
+	assert len(bad_types.pop(BadChunkItemType.missing_pack)) == 1
+	assert bad_types == {}
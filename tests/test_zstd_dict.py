@@ -0,0 +1,51 @@
+from prime_backup.action.export_backup_action_directory import ExportBackupToDirectoryAction
+from prime_backup.action.train_zstd_dict_action import TrainZstdDictAction
+from prime_backup.action.validate_blobs_action import ValidateBlobsAction
+from prime_backup.compressors import CompressMethod
+from prime_backup.config.config import Config
+from prime_backup.db.access import DbAccess
+from prime_backup.db.zstd_dict_cache import ZstdDictCache
+from tests import backup_env
+from tests.backup_env import BackupEnv
+
+
+def test_zstd_dict_compression(env: BackupEnv) -> None:
+	config = Config.get()
+	config.backup.compress_method = CompressMethod.zstd
+	config.backup.compress_threshold = 64
+	config.backup.zstd_dict_enabled = True
+
+	def write_player_data(seed: int):
+		for i in range(40):
+			text = '{{"uuid": "player-{}-{}", "health": {}, "inventory": ["stone", "dirt", "torch"], "pos": [{}, 64, {}]}}'.format(i, seed, i % 20, i * seed, i - seed)
+			(env.world_path / f'player_{i}.json').write_text(text * 3, encoding='utf8')
+
+	write_player_data(1)
+	backup_1 = backup_env.create_backup()
+	with DbAccess.open_session() as session:
+		assert 'zstd_dict' not in {blob.compress for blob in session.list_blobs()}
+
+	result = TrainZstdDictAction(dict_size=4096).run()
+	assert result.dict_id == 1 and ZstdDictCache.get_latest_id() == 1
+	assert result.sample_count >= 40
+
+	write_player_data(2)
+	backup_2 = backup_env.create_backup()
+	with DbAccess.open_session() as session:
+		compress_methods = {blob.compress for blob in session.list_blobs() if blob.raw_size <= config.backup.zstd_dict_threshold}
+		assert 'zstd_dict' in compress_methods
+	assert ValidateBlobsAction().run().bad == 0
+	backup_env.assert_pack_and_chunk_validate_ok()
+
+	# the dictionaries are loaded from the database, after the cache is gone
+	ZstdDictCache.reset()
+	for backup in [backup_1, backup_2]:
+		restore_path = env.root / 'restored_{}'.format(backup.id)
+		assert len(ExportBackupToDirectoryAction(backup.id, restore_path, restore_mode=True).run()) == 0
+	assert (restore_path / 'world' / 'player_3.json').read_text(encoding='utf8') == (env.world_path / 'player_3.json').read_text(encoding='utf8')
+
+	# the total size of the samples is capped
+	result = TrainZstdDictAction(dict_size=4096, max_sample_size_sum=20 * 1024).run()
+	assert result.dict_id == 2 and result.sample_size_sum <= 20 * 1024
+	with DbAccess.open_session() as session:
+		assert all(len(zstd_dict.data) > 0 for zstd_dict in session.list_zstd_dicts())